@@ -31,7 +31,8 @@ from usuarios.models import Perfil, SolicitudCambioRol
 from usuarios.solicitudes import GestorSolicitudCambioRol
 from proveedores.models import Proveedor
 from repartidores.models import Repartidor
-from pedidos.models import Pedido, EstadoPedido
+from pedidos.models import Pedido, EstadoPedido, ResumenPedidoHora
+from pedidos.resumen import inicio_dia
 from .models import Administrador, AccionAdministrativa, ConfiguracionSistema
 
 # Serializers
@@ -867,29 +868,30 @@ class DashboardAdminViewSet(viewsets.ViewSet):
             verificado=False, activo=True
         ).count()
 
-        # Pedidos
-        total_pedidos = Pedido.objects.count()
-        pedidos_hoy = Pedido.objects.filter(creado_en__date=hoy).count()
-        pedidos_activos = Pedido.objects.filter(
-            estado__in=[
-                EstadoPedido.CONFIRMADO,
-                EstadoPedido.EN_PREPARACION,
-                EstadoPedido.EN_RUTA,
-            ]
-        ).count()
-        pedidos_entregados = Pedido.objects.filter(
-            estado=EstadoPedido.ENTREGADO
-        ).count()
-
-        # Financiero
-        financiero = Pedido.objects.filter(estado=EstadoPedido.ENTREGADO).aggregate(
-            ingresos_totales=Sum("total"), ganancia_app_total=Sum("ganancia_app")
+        # Pedidos y financiero: acumulados horarios (no recorre los pedidos)
+        entregado = Q(estado=EstadoPedido.ENTREGADO)
+        del_dia = Q(hora__gte=inicio_dia(timezone.localdate()))
+
+        resumen = ResumenPedidoHora.objects.aggregate(
+            total_pedidos=Sum("pedidos"),
+            pedidos_hoy=Sum("pedidos", filter=del_dia),
+            pedidos_activos=Sum(
+                "pedidos",
+                filter=Q(
+                    estado__in=[
+                        EstadoPedido.CONFIRMADO,
+                        EstadoPedido.EN_PREPARACION,
+                        EstadoPedido.EN_RUTA,
+                    ]
+                ),
+            ),
+            pedidos_entregados=Sum("pedidos", filter=entregado),
+            ingresos_totales=Sum("total", filter=entregado),
+            ganancia_app_total=Sum("ganancia_app", filter=entregado),
+            ingresos_hoy=Sum("total", filter=entregado & del_dia),
+            ganancia_app_hoy=Sum("ganancia_app", filter=entregado & del_dia),
         )
 
-        financiero_hoy = Pedido.objects.filter(
-            estado=EstadoPedido.ENTREGADO, creado_en__date=hoy
-        ).aggregate(ingresos_hoy=Sum("total"), ganancia_app_hoy=Sum("ganancia_app"))
-
         # Solicitudes pendientes
         solicitudes_pendientes = SolicitudCambioRol.objects.filter(
             estado="PENDIENTE"
@@ -914,16 +916,16 @@ class DashboardAdminViewSet(viewsets.ViewSet):
                     "pendientes": repartidores_pendientes,
                 },
                 "pedidos": {
-                    "total": total_pedidos,
-                    "hoy": pedidos_hoy,
-                    "activos": pedidos_activos,
-                    "entregados": pedidos_entregados,
+                    "total": resumen["total_pedidos"] or 0,
+                    "hoy": resumen["pedidos_hoy"] or 0,
+                    "activos": resumen["pedidos_activos"] or 0,
+                    "entregados": resumen["pedidos_entregados"] or 0,
                 },
                 "financiero": {
-                    "ingresos_totales": financiero["ingresos_totales"] or 0,
-                    "ganancia_app_total": financiero["ganancia_app_total"] or 0,
-                    "ingresos_hoy": financiero_hoy["ingresos_hoy"] or 0,
-                    "ganancia_app_hoy": financiero_hoy["ganancia_app_hoy"] or 0,
+                    "ingresos_totales": resumen["ingresos_totales"] or 0,
+                    "ganancia_app_total": resumen["ganancia_app_total"] or 0,
+                    "ingresos_hoy": resumen["ingresos_hoy"] or 0,
+                    "ganancia_app_hoy": resumen["ganancia_app_hoy"] or 0,
                 },
                 "solicitudes": {
                     "pendientes": solicitudes_pendientes,
@@ -980,10 +982,7 @@ class DashboardAdminViewSet(viewsets.ViewSet):
                 }
             )
 
-        hace_60_min = timezone.now() - timezone.timedelta(minutes=60)
-        pedidos_retrasados = Pedido.objects.filter(
-            estado=EstadoPedido.EN_RUTA, actualizado_en__lt=hace_60_min
-        ).count()
+        pedidos_retrasados = Pedido.objects.con_retraso().count()
 
         if pedidos_retrasados > 0:
             alertas.append(
@@ -4,36 +4,28 @@ Signals para crear chats automáticamente
 
 ✅ FUNCIONALIDAD:
 - Cuando se asigna un repartidor a un pedido → Crea chats automáticamente
+  (suscrito a pedidos.transiciones, diferido vía outbox)
 - Pedido con Proveedor → 2 chats (cliente+proveedor)
 - Encargo Directo → 1 chat (solo cliente)
 """
 
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from pedidos.models import Pedido
+from pedidos import transiciones
 from .models import Chat
 import logging
 
 logger = logging.getLogger('chat')
 
 
-@receiver(post_save, sender=Pedido)
-def crear_chats_pedido(sender, instance, created, **kwargs):
+@transiciones.al_asignar_repartidor(diferido=True)
+def crear_chats_pedido(transicion):
     """
-    ✅ SIGNAL: Crea chats cuando se asigna un repartidor
+    ✅ Crea chats cuando se asigna un repartidor
 
     Se ejecuta cuando:
     - Se crea un pedido con repartidor asignado
     - Se actualiza un pedido y se le asigna un repartidor
     """
-
-    # Prevenir ejecución en fixtures/loaddata
-    if kwargs.get('raw', False):
-        return
-
-    # Verificar si tiene repartidor
-    if not instance.repartidor:
-        return
+    instance = transicion.pedido
 
     # Si el pedido ya tiene chats, no crear duplicados
     if instance.chats.exists():
@@ -178,6 +178,25 @@ EOF
             --log-level info
         ;;
         
+    gunicorn_seguimiento)
+        log "Iniciando Gunicorn para streams de seguimiento (SSE)..."
+
+        # Cada stream abierto ocupa un hilo esperando en Redis: se sirven
+        # aparte (proxy: /api/pedidos/<id>/seguimiento/ → este proceso) para
+        # no bloquear los workers de la API
+        exec gunicorn settings.wsgi:application \
+            --bind 0.0.0.0:8001 \
+            --workers 2 \
+            --threads ${SEGUIMIENTO_THREADS:-200} \
+            --worker-class gthread \
+            --worker-tmp-dir /dev/shm \
+            --timeout 60 \
+            --graceful-timeout 30 \
+            --access-logfile - \
+            --error-logfile - \
+            --log-level info
+        ;;
+
     test)
         log "Ejecutando tests..."
         exec python manage.py test "${@:2}"
@@ -202,6 +221,7 @@ EOF
         echo "  celery_beat    - Iniciar Celery beat"
         echo "  flower         - Iniciar Flower (monitor de Celery)"
         echo "  gunicorn       - Iniciar Gunicorn (producción)"
+        echo "  gunicorn_seguimiento - Gunicorn para streams de seguimiento (SSE)"
         echo "  test           - Ejecutar tests"
         echo "  shell          - Django shell"
         echo "  bash           - Bash shell"
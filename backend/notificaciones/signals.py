@@ -1,68 +1,43 @@
 # notificaciones/signals.py
 """
 Signals para envío automático de notificaciones
-✅ Detecta cambios de estado en pedidos
+✅ Suscritos a las transiciones de estado de pedidos (pedidos/transiciones.py)
+✅ Diferidos: se envían desde el outbox, fuera de la petición
 ✅ Envía notificaciones push + guarda en BD
 ✅ Mensajes personalizados por estado
 """
 
 import logging
-from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
-from pedidos.models import Pedido, EstadoPedido
+from pedidos.models import EstadoPedido
+from pedidos import transiciones
 
 logger = logging.getLogger('notificaciones')
 
 
-@receiver(pre_save, sender=Pedido)
-def detectar_cambio_estado_pedido(sender, instance, **kwargs):
+@transiciones.al_transicionar(desde=transiciones.CREADO, diferido=True)
+def enviar_notificacion_pedido_creado(transicion):
     """
-    ✅ Detecta cuando cambia el estado de un pedido
-
-    Guarda el estado anterior en una variable temporal
-    para compararlo después del guardado
+    ✅ Envía la notificación de pedido creado
     """
-    if instance.pk:
-        try:
-            # Obtener el estado anterior del pedido
-            pedido_anterior = Pedido.objects.get(pk=instance.pk)
-            instance._estado_anterior = pedido_anterior.estado
-        except Pedido.DoesNotExist:
-            instance._estado_anterior = None
-    else:
-        # Pedido nuevo, no hay estado anterior
-        instance._estado_anterior = None
-
-
-@receiver(post_save, sender=Pedido)
-def enviar_notificacion_cambio_estado(sender, instance, created, **kwargs):
+    _enviar_notificacion_pedido_creado(transicion.pedido)
+
+
+@transiciones.al_transicionar(diferido=True)
+def enviar_notificacion_cambio_estado(transicion):
     """
     ✅ Envía notificación cuando cambia el estado del pedido
 
     Args:
-        sender: Clase Pedido
-        instance: Instancia del pedido
-        created: Si es nuevo pedido
-        kwargs: Argumentos adicionales
+        transicion (Transicion): Pedido con su estado anterior y nuevo
     """
-    from notificaciones.services import crear_y_enviar_notificacion
-
-    # Si es un pedido nuevo (recién creado)
-    if created:
-        _enviar_notificacion_pedido_creado(instance)
-        return
-
-    # Si cambió el estado
-    estado_anterior = getattr(instance, '_estado_anterior', None)
-
-    if estado_anterior and estado_anterior != instance.estado:
-        logger.info(
-            f"📱 Cambio de estado detectado - Pedido #{instance.pk}: "
-            f"{estado_anterior} → {instance.estado}"
-        )
+    logger.info(
+        f"📱 Cambio de estado detectado - Pedido #{transicion.pedido.pk}: "
+        f"{transicion.anterior} → {transicion.nuevo}"
+    )
 
-        # Enviar notificación según el nuevo estado
-        _enviar_notificacion_por_estado(instance, estado_anterior)
+    # Enviar notificación según el nuevo estado (el pedido pudo avanzar
+    # desde que se encoló el evento)
+    _enviar_notificacion_por_estado(transicion.pedido, transicion.anterior, transicion.nuevo)
 
 
 def _enviar_notificacion_pedido_creado(pedido):
@@ -105,19 +80,20 @@ def _enviar_notificacion_pedido_creado(pedido):
         )
 
 
-def _enviar_notificacion_por_estado(pedido, estado_anterior):
+def _enviar_notificacion_por_estado(pedido, estado_anterior, estado_actual=None):
     """
     ✅ Envía notificación según el nuevo estado del pedido
 
     Args:
         pedido (Pedido): Instancia del pedido
         estado_anterior (str): Estado anterior del pedido
+        estado_actual (str): Estado notificado (default: el actual del pedido)
     """
     from notificaciones.services import crear_y_enviar_notificacion
 
     try:
         usuario = pedido.cliente.user
-        estado_actual = pedido.estado
+        estado_actual = estado_actual or pedido.estado
 
         # Preparar datos comunes
         datos_extra = {
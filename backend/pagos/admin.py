@@ -140,8 +140,7 @@ class MetodoPagoAdmin(admin.ModelAdmin):
 
     def total_pagos_hoy(self, obj):
         """Muestra total de pagos del día con este método"""
-        hoy = timezone.now().date()
-        count = obj.pagos.filter(creado_en__date=hoy).count()
+        count = obj.pagos.filter(dia_creado=timezone.localdate()).count()
         return f"{count} pagos"
     total_pagos_hoy.short_description = 'Pagos Hoy'
 
@@ -90,32 +90,31 @@ class PagoFilter(django_filters.FilterSet):
     # ==========================================================
 
     fecha_desde = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__gte',
+        field_name='dia_creado',
+        lookup_expr='gte',
         help_text='Fecha de creación desde (YYYY-MM-DD)'
     )
 
     fecha_hasta = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__lte',
+        field_name='dia_creado',
+        lookup_expr='lte',
         help_text='Fecha de creación hasta (YYYY-MM-DD)'
     )
 
     fecha_exacta = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date',
+        field_name='dia_creado',
         help_text='Fecha exacta (YYYY-MM-DD)'
     )
 
     fecha_completado_desde = django_filters.DateFilter(
-        field_name='fecha_completado',
-        lookup_expr='date__gte',
+        field_name='dia_completado',
+        lookup_expr='gte',
         help_text='Fecha de completado desde'
     )
 
     fecha_completado_hasta = django_filters.DateFilter(
-        field_name='fecha_completado',
-        lookup_expr='date__lte',
+        field_name='dia_completado',
+        lookup_expr='lte',
         help_text='Fecha de completado hasta'
     )
 
@@ -304,26 +303,23 @@ class PagoFilter(django_filters.FilterSet):
     def filter_hoy(self, queryset, name, value):
         """Filtra pagos de hoy"""
         if value:
-            hoy = timezone.now().date()
-            return queryset.filter(creado_en__date=hoy)
+            return queryset.filter(dia_creado=timezone.localdate())
         return queryset
 
     def filter_esta_semana(self, queryset, name, value):
         """Filtra pagos de esta semana"""
         if value:
             from datetime import timedelta
-            hoy = timezone.now().date()
+            hoy = timezone.localdate()
             inicio_semana = hoy - timedelta(days=hoy.weekday())
-            return queryset.filter(creado_en__date__gte=inicio_semana)
+            return queryset.filter(dia_creado__gte=inicio_semana)
         return queryset
 
     def filter_este_mes(self, queryset, name, value):
         """Filtra pagos de este mes"""
         if value:
-            hoy = timezone.now().date()
             return queryset.filter(
-                creado_en__year=hoy.year,
-                creado_en__month=hoy.month
+                dia_creado__gte=timezone.localdate().replace(day=1)
             )
         return queryset
 
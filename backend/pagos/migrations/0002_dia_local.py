@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-16 19:18
+
+import utils.fechas
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0001_initial'),
+        ('pedidos', '0007_resumen_horario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pago',
+            name='dia_completado',
+            field=models.GeneratedField(db_persist=True, expression=utils.fechas.DiaLocal('fecha_completado'), output_field=models.DateField(null=True), verbose_name='Día de Completado'),
+        ),
+        migrations.AddField(
+            model_name='pago',
+            name='dia_creado',
+            field=models.GeneratedField(db_persist=True, expression=utils.fechas.DiaLocal('creado_en'), output_field=models.DateField(), verbose_name='Día de Creación'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['dia_creado', 'estado'], name='pagos_dia_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['dia_completado'], name='pagos_dia_completado_idx'),
+        ),
+    ]
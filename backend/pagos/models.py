@@ -16,6 +16,7 @@ from django.core.exceptions import ValidationError
 from django.db.models import Q, Sum, Count
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+from utils.fechas import DiaLocal
 import uuid
 import logging
 
@@ -89,8 +90,7 @@ class PagoManager(models.Manager):
 
     def del_dia(self):
         """Pagos creados hoy"""
-        hoy = timezone.now().date()
-        return self.filter(creado_en__date=hoy)
+        return self.filter(dia_creado=timezone.localdate())
 
     def por_metodo(self, metodo):
         """
@@ -130,8 +130,7 @@ class PagoManager(models.Manager):
 
     def estadisticas_del_dia(self):
         """Estadísticas agregadas del día"""
-        hoy = timezone.now().date()
-        pagos_hoy = self.filter(creado_en__date=hoy)
+        pagos_hoy = self.filter(dia_creado=timezone.localdate())
 
         return pagos_hoy.aggregate(
             total_pagos=Count('id'),
@@ -412,6 +411,22 @@ class Pago(models.Model):
         help_text='Fecha en que se completó el pago'
     )
 
+    # Fechas locales (America/Guayaquil) calculadas por la BD, para filtrar
+    # por día con índice en lugar de creado_en__date
+    dia_creado = models.GeneratedField(
+        expression=DiaLocal('creado_en'),
+        output_field=models.DateField(),
+        db_persist=True,
+        verbose_name='Día de Creación'
+    )
+
+    dia_completado = models.GeneratedField(
+        expression=DiaLocal('fecha_completado'),
+        output_field=models.DateField(null=True),
+        db_persist=True,
+        verbose_name='Día de Completado'
+    )
+
     fecha_reembolso = models.DateTimeField(
         null=True,
         blank=True,
@@ -452,6 +467,8 @@ class Pago(models.Model):
             models.Index(fields=['referencia']),
             models.Index(fields=['pasarela_id_transaccion']),
             models.Index(fields=['estado', 'creado_en']),
+            models.Index(fields=['dia_creado', 'estado'], name='pagos_dia_creado_idx'),
+            models.Index(fields=['dia_completado'], name='pagos_dia_completado_idx'),
         ]
 
         constraints = [
@@ -1049,10 +1066,10 @@ class EstadisticasPago(models.Model):
             EstadisticasPago: Instancia creada/actualizada
         """
         if fecha is None:
-            fecha = timezone.now().date()
+            fecha = timezone.localdate()
 
         # Obtener pagos del día
-        pagos_dia = Pago.objects.filter(creado_en__date=fecha)
+        pagos_dia = Pago.objects.filter(dia_creado=fecha)
 
         # Calcular estadísticas
         stats = pagos_dia.aggregate(
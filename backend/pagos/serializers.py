@@ -56,8 +56,7 @@ class MetodoPagoSerializer(serializers.ModelSerializer):
 
     def get_total_pagos_hoy(self, obj):
         """Cuenta pagos del día con este método"""
-        hoy = timezone.now().date()
-        return obj.pagos.filter(creado_en__date=hoy).count()
+        return obj.pagos.filter(dia_creado=timezone.localdate()).count()
 
 
 class MetodoPagoListSerializer(serializers.ModelSerializer):
@@ -336,6 +336,8 @@ POST    /api/pagos/webhook/paymentez/
 Pagos:
     ?estado=completado
     ?metodo_pago__tipo=efectivo
+    ?fecha_exacta=2025-01-15          (día local, usa índice)
+    ?fecha_desde=2025-01-01&fecha_hasta=2025-01-31
     ?creado_en__date=2025-01-15
     ?creado_en__gte=2025-01-01
     ?creado_en__lte=2025-01-31
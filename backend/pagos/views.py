@@ -381,9 +381,9 @@ class PagoViewSet(viewsets.ModelViewSet):
         queryset = Pago.objects.all()
 
         if fecha_inicio:
-            queryset = queryset.filter(creado_en__date__gte=fecha_inicio)
+            queryset = queryset.filter(dia_creado__gte=fecha_inicio)
         if fecha_fin:
-            queryset = queryset.filter(creado_en__date__lte=fecha_fin)
+            queryset = queryset.filter(dia_creado__lte=fecha_fin)
 
         # Calcular estadísticas
         stats = queryset.aggregate(
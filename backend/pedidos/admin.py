@@ -21,7 +21,9 @@ from django.contrib import messages
 from django.http import HttpResponse
 from django.db.models import Q, Count, Sum
 
-from .models import Pedido, EstadoPedido, TipoPedido
+from .models import Pedido, EstadoPedido, TipoPedido, EventoPedido
+from . import lote
+from .lote import MAX_PEDIDOS
 
 logger = logging.getLogger(__name__)
 
@@ -235,63 +237,38 @@ class PedidoAdmin(admin.ModelAdmin):
         'mostrar_estadisticas',
     ]
 
-    def marcar_como_en_preparacion(self, request, queryset):
-        """✅ Marca los pedidos seleccionados como 'En preparación'"""
-        actualizados = 0
-        errores = []
-
-        for pedido in queryset:
-            try:
-                if pedido.tipo == TipoPedido.PROVEEDOR and pedido.estado == EstadoPedido.CONFIRMADO:
-                    pedido.marcar_en_preparacion()
-                    actualizados += 1
-                    logger.info(f"[ADMIN] Pedido #{pedido.id} marcado en preparación por {request.user.email}")
-                else:
-                    errores.append(f"Pedido #{pedido.id}: Estado o tipo inválido")
-            except Exception as e:
-                errores.append(f"Pedido #{pedido.id}: {str(e)}")
-                logger.error(f"[ADMIN] Error actualizando pedido #{pedido.id}: {e}")
-
-        if actualizados > 0:
-            self.message_user(
-                request,
-                f"✅ {actualizados} pedido(s) marcado(s) como 'En preparación'.",
-                level=messages.SUCCESS
-            )
-        if errores:
+    def _cambiar_estado_lote(self, request, queryset, nuevo_estado, etiqueta):
+        """Aplica el cambio a todo el queryset con pedidos.lote (un UPDATE por estado)"""
+        ids = list(queryset.values_list('id', flat=True)[:MAX_PEDIDOS + 1])
+        if len(ids) > MAX_PEDIDOS:
             self.message_user(
                 request,
-                f"⚠️ {len(errores)} error(es): {'; '.join(errores[:3])}",
+                f"⚠️ Seleccione como máximo {MAX_PEDIDOS} pedidos por acción.",
                 level=messages.WARNING
             )
+            return
 
-    marcar_como_en_preparacion.short_description = "🍳 Marcar como 'En preparación'"
-
-    def marcar_como_en_ruta(self, request, queryset):
-        """✅ Marca los pedidos seleccionados como 'En ruta'"""
-        actualizados = 0
-        errores = []
+        try:
+            resultado = lote.cambiar_estados(
+                dict.fromkeys(ids, nuevo_estado),
+                actor="admin",
+                motivo=f"Admin {request.user.email}",
+            )
+        except Exception as e:
+            logger.error(f"[ADMIN] Error en cambio de estado en lote: {e}", exc_info=True)
+            self.message_user(request, f"❌ Error: {e}", level=messages.ERROR)
+            return
 
-        for pedido in queryset:
-            try:
-                if not pedido.repartidor:
-                    errores.append(f"Pedido #{pedido.id}: Sin repartidor asignado")
-                    continue
-
-                if pedido.estado in [EstadoPedido.EN_PREPARACION, EstadoPedido.CONFIRMADO]:
-                    pedido.marcar_en_ruta()
-                    actualizados += 1
-                    logger.info(f"[ADMIN] Pedido #{pedido.id} marcado en ruta por {request.user.email}")
-                else:
-                    errores.append(f"Pedido #{pedido.id}: Estado inválido ({pedido.get_estado_display()})")
-            except Exception as e:
-                errores.append(f"Pedido #{pedido.id}: {str(e)}")
-                logger.error(f"[ADMIN] Error actualizando pedido #{pedido.id}: {e}")
+        actualizados = resultado['actualizados']
+        errores = [f"Pedido #{pedido_id}: {mensaje}" for pedido_id, mensaje in resultado['errores'].items()]
 
-        if actualizados > 0:
+        if actualizados:
+            logger.info(
+                f"[ADMIN] {len(actualizados)} pedido(s) → {nuevo_estado} por {request.user.email}"
+            )
             self.message_user(
                 request,
-                f"✅ {actualizados} pedido(s) marcado(s) como 'En ruta'.",
+                f"✅ {len(actualizados)} pedido(s) {etiqueta}.",
                 level=messages.SUCCESS
             )
         if errores:
@@ -301,84 +278,35 @@ class PedidoAdmin(admin.ModelAdmin):
                 level=messages.WARNING
             )
 
+    def marcar_como_en_preparacion(self, request, queryset):
+        """✅ Marca los pedidos seleccionados como 'En preparación'"""
+        self._cambiar_estado_lote(
+            request, queryset, EstadoPedido.EN_PREPARACION, "marcado(s) como 'En preparación'"
+        )
+
+    marcar_como_en_preparacion.short_description = "🍳 Marcar como 'En preparación'"
+
+    def marcar_como_en_ruta(self, request, queryset):
+        """✅ Marca los pedidos seleccionados como 'En ruta'"""
+        self._cambiar_estado_lote(
+            request, queryset, EstadoPedido.EN_RUTA, "marcado(s) como 'En ruta'"
+        )
+
     marcar_como_en_ruta.short_description = "🚴 Marcar como 'En ruta'"
 
     def marcar_como_entregado(self, request, queryset):
         """✅ Marca los pedidos seleccionados como 'Entregado'"""
-        actualizados = 0
-        errores = []
-
-        for pedido in queryset:
-            try:
-                if not pedido.repartidor:
-                    errores.append(f"Pedido #{pedido.id}: Sin repartidor")
-                    continue
-
-                if pedido.estado == EstadoPedido.EN_RUTA:
-                    pedido.marcar_entregado()
-                    actualizados += 1
-                    logger.info(f"[ADMIN] Pedido #{pedido.id} marcado entregado por {request.user.email}")
-                else:
-                    errores.append(f"Pedido #{pedido.id}: Debe estar 'En ruta'")
-            except Exception as e:
-                errores.append(f"Pedido #{pedido.id}: {str(e)}")
-                logger.error(f"[ADMIN] Error actualizando pedido #{pedido.id}: {e}")
-
-        if actualizados > 0:
-            self.message_user(
-                request,
-                f"✅ {actualizados} pedido(s) marcado(s) como 'Entregado'.",
-                level=messages.SUCCESS
-            )
-        if errores:
-            self.message_user(
-                request,
-                f"⚠️ {len(errores)} error(es): {'; '.join(errores[:3])}",
-                level=messages.WARNING
-            )
+        self._cambiar_estado_lote(
+            request, queryset, EstadoPedido.ENTREGADO, "marcado(s) como 'Entregado'"
+        )
 
     marcar_como_entregado.short_description = "✅ Marcar como 'Entregado'"
 
     def cancelar_pedidos_seleccionados(self, request, queryset):
         """✅ Cancela los pedidos seleccionados"""
-        cancelados = 0
-        errores = []
-
-        for pedido in queryset:
-            try:
-                # ✅ Usar el método del modelo si existe
-                if hasattr(pedido, 'puede_ser_cancelado'):
-                    if pedido.puede_ser_cancelado:
-                        pedido.cancelar("Cancelado desde admin", actor="admin")
-                        cancelados += 1
-                        logger.info(f"[ADMIN] Pedido #{pedido.id} cancelado por {request.user.email}")
-                    else:
-                        errores.append(f"Pedido #{pedido.id}: No puede cancelarse")
-                else:
-                    # Fallback: verificar estado manualmente
-                    if pedido.estado not in [EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO]:
-                        pedido.estado = EstadoPedido.CANCELADO
-                        pedido.cancelado_por = "admin"
-                        pedido.save()
-                        cancelados += 1
-                    else:
-                        errores.append(f"Pedido #{pedido.id}: Ya está {pedido.get_estado_display()}")
-            except Exception as e:
-                errores.append(f"Pedido #{pedido.id}: {str(e)}")
-                logger.error(f"[ADMIN] Error cancelando pedido #{pedido.id}: {e}")
-
-        if cancelados > 0:
-            self.message_user(
-                request,
-                f"✅ {cancelados} pedido(s) cancelado(s).",
-                level=messages.SUCCESS
-            )
-        if errores:
-            self.message_user(
-                request,
-                f"⚠️ {len(errores)} error(es): {'; '.join(errores[:3])}",
-                level=messages.WARNING
-            )
+        self._cambiar_estado_lote(
+            request, queryset, EstadoPedido.CANCELADO, "cancelado(s)"
+        )
 
     cancelar_pedidos_seleccionados.short_description = "❌ Cancelar pedidos seleccionados"
 
@@ -669,3 +597,39 @@ class PedidoAdmin(admin.ModelAdmin):
         css = {
             'all': ('admin/css/pedidos_admin.css',)
         }
+
+
+# ═══════════════════════════════════════════════════════════════════
+# OUTBOX (solo lectura)
+# ═══════════════════════════════════════════════════════════════════
+
+@admin.register(EventoPedido)
+class EventoPedidoAdmin(admin.ModelAdmin):
+    """Eventos del outbox de pedidos; permite reintentar los fallidos."""
+    list_display = (
+        'id', 'pedido', 'consumidor', 'estado_anterior', 'estado_nuevo',
+        'intentos', 'fallido', 'creado_en', 'procesado_en'
+    )
+    list_filter = ('fallido', ('procesado_en', admin.EmptyFieldListFilter), 'consumidor')
+    search_fields = ('clave', 'consumidor', 'pedido__id')
+    ordering = ('-id',)
+    raw_id_fields = ('pedido',)
+    date_hierarchy = 'creado_en'
+    readonly_fields = [f.name for f in EventoPedido._meta.fields]
+    actions = ['reintentar_eventos']
+
+    def has_add_permission(self, request):
+        return False
+
+    def reintentar_eventos(self, request, queryset):
+        """Vuelve a encolar los eventos seleccionados que no se procesaron con éxito."""
+        from .outbox import programar_drenado
+
+        reintentados = queryset.filter(Q(fallido=True) | Q(procesado_en__isnull=True)).update(
+            fallido=False, procesado_en=None, intentos=0, disponible_en=timezone.now()
+        )
+        programar_drenado()
+
+        self.message_user(request, f"🔁 {reintentados} eventos reencolados", messages.SUCCESS)
+
+    reintentar_eventos.short_description = "🔁 Reintentar eventos seleccionados"
@@ -0,0 +1,269 @@
+# pedidos/archivo.py
+"""
+Archivo de pedidos finalizados (almacenamiento frío).
+
+Los pedidos ENTREGADO o CANCELADO con más de DIAS_ARCHIVO días salen de la
+tabla activa `pedidos` hacia `pedidos_archivo`, junto con su historial
+(`pedidos_historial` → `pedidos_historial_archivo`). Así la tabla activa y
+sus índices solo crecen con los pedidos recientes.
+
+En Postgres ambas tablas de archivo están particionadas por mes sobre la
+fecha de creación del pedido:
+
+    pedidos_archivo_202601, pedidos_historial_archivo_202601
+
+`archivar` mueve los pedidos por lotes, cada lote en su propia transacción:
+
+1. Reserva los candidatos (SELECT ... FOR UPDATE SKIP LOCKED).
+2. Aplica a las filas que apuntan al pedido lo mismo que haría
+   `pedido.delete()`: borra chats y eventos del outbox ya procesados y deja
+   en NULL el pedido de notificaciones y trayectos.
+3. Mueve historial y pedidos con `WITH movidos AS (DELETE ... RETURNING)
+   INSERT INTO ... SELECT`, sin pasar las filas por Python.
+
+No se archivan pedidos con Pago (la relación es PROTECT) ni con eventos
+del outbox pendientes. El DELETE es SQL directo, sin señales: los
+acumulados de ResumenPedidoHora conservan a los pedidos archivados.
+
+Lectura: `obtener_pedido` busca en la tabla activa y, si el ID ya no está,
+en el archivo. En bases de datos que no son Postgres (desarrollo) el
+archivado es no-op; la lectura funciona igual.
+"""
+import logging
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+logger = logging.getLogger('pedidos')
+
+TABLA_PEDIDOS = 'pedidos_archivo'
+TABLA_HISTORIAL = 'pedidos_historial_archivo'
+
+TAMANO_LOTE = 500
+
+
+def dias_archivo():
+    """Antigüedad mínima para archivar (PEDIDOS_DIAS_ARCHIVO, default 90)."""
+    return getattr(settings, 'PEDIDOS_DIAS_ARCHIVO', 90)
+
+
+def habilitado():
+    """True si el archivo es una tabla particionada de Postgres."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [TABLA_PEDIDOS],
+        )
+        return cursor.fetchone() is not None
+
+
+# ==========================================================
+# PARTICIONES
+# ==========================================================
+def inicio_mes(momento):
+    """Día 1 00:00 UTC del mes que contiene `momento`."""
+    momento = momento.astimezone(dt_timezone.utc)
+    return momento.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def mes_siguiente(inicio):
+    return (inicio + timedelta(days=32)).replace(day=1)
+
+
+def crear_particiones(desde, hasta):
+    """
+    Crea en ambas tablas las particiones mensuales que faltan entre los
+    meses de `desde` y `hasta` (inclusive).
+
+    Returns:
+        list[str]: Nombres de las particiones creadas
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname IN (%s, %s)",
+            [TABLA_PEDIDOS, TABLA_HISTORIAL],
+        )
+        existentes = {fila[0] for fila in cursor.fetchall()}
+
+        creadas = []
+        mes = inicio_mes(desde)
+        while mes <= hasta:
+            fin = mes_siguiente(mes)
+            for tabla in (TABLA_PEDIDOS, TABLA_HISTORIAL):
+                nombre = f'{tabla}_{mes:%Y%m}'
+                if nombre in existentes:
+                    continue
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{nombre}" PARTITION OF "{tabla}" '
+                    f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{fin.isoformat()}')"
+                )
+                creadas.append(nombre)
+            mes = fin
+
+    if creadas:
+        logger.info(f"Particiones de archivo creadas: {', '.join(creadas)}")
+    return creadas
+
+
+# ==========================================================
+# ARCHIVADO
+# ==========================================================
+def _candidatos(limite):
+    from .models import EstadoPedido, EventoPedido, Pedido
+    from pagos.models import Pago
+
+    return (
+        Pedido.objects.filter(
+            estado__in=[EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO],
+            creado_en__lt=limite,
+        )
+        .filter(~Exists(Pago.objects.filter(pedido=OuterRef('pk'))))
+        .filter(~Exists(
+            EventoPedido.objects.filter(pedido=OuterRef('pk'), procesado_en__isnull=True)
+        ))
+        .order_by('creado_en', 'id')
+    )
+
+
+def _sql_mover():
+    from .models import HistorialPedido, Pedido
+
+    columnas = ', '.join(f'"{campo.column}"' for campo in Pedido._meta.concrete_fields)
+    pedidos = (
+        f'WITH movidos AS ('
+        f'DELETE FROM "{Pedido._meta.db_table}" WHERE "id" = ANY(%s) RETURNING {columnas}'
+        f') INSERT INTO "{TABLA_PEDIDOS}" ({columnas}, "archivado_en") '
+        f'SELECT {columnas}, %s FROM movidos'
+    )
+
+    campos = ['id', 'estado_anterior', 'estado_nuevo', 'fecha_cambio', 'usuario_id', 'observaciones']
+    historial = (
+        f'WITH movidos AS ('
+        f'DELETE FROM "{HistorialPedido._meta.db_table}" h USING "{Pedido._meta.db_table}" p '
+        f'WHERE p."id" = h."pedido_id" AND h."pedido_id" = ANY(%s) '
+        f'RETURNING h."pedido_id", p."creado_en", '
+        + ', '.join(f'h."{campo}"' for campo in campos)
+        + f') INSERT INTO "{TABLA_HISTORIAL}" ("pedido_id", "pedido_creado_en", '
+        + ', '.join(f'"{campo}"' for campo in campos)
+        + ') SELECT * FROM movidos'
+    )
+    return historial, pedidos
+
+
+def _archivar_lote(limite, tamano):
+    from .models import EventoPedido
+    from chat.models import Chat
+    from notificaciones.models import Notificacion
+    from repartidores.models import TrayectoComprimido
+
+    sql_historial, sql_pedidos = _sql_mover()
+
+    with transaction.atomic():
+        ids = list(
+            _candidatos(limite)
+            .select_for_update(skip_locked=True, of=('self',))
+            .values_list('id', flat=True)[:tamano]
+        )
+        if not ids:
+            return 0
+
+        # Lo mismo que haría pedido.delete() con cada relación
+        Chat.objects.filter(pedido_id__in=ids).delete()
+        EventoPedido.objects.filter(pedido_id__in=ids).delete()
+        Notificacion.objects.filter(pedido_id__in=ids).update(pedido=None)
+        TrayectoComprimido.objects.filter(pedido_id__in=ids).update(pedido=None)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql_historial, [ids])
+            cursor.execute(sql_pedidos, [ids, timezone.now()])
+            return cursor.rowcount
+
+
+def archivar(dias=None, tamano=TAMANO_LOTE, max_lotes=100):
+    """
+    Mueve al archivo los pedidos finalizados con más de `dias` días.
+
+    Returns:
+        dict | None: archivados y lotes; None si el archivo no está particionado
+    """
+    if not habilitado():
+        return None
+
+    from .models import Pedido
+
+    limite = timezone.now() - timedelta(days=dias if dias is not None else dias_archivo())
+
+    if not _candidatos(limite).exists():
+        return {'archivados': 0, 'lotes': 0}
+
+    # Las particiones se crean antes de los lotes (el DDL bloquea la tabla
+    # padre) y desde el pedido más antiguo, aunque aún no sea candidato:
+    # puede finalizar mientras corren los lotes
+    primero = Pedido.objects.order_by('creado_en').values_list('creado_en', flat=True).first()
+    crear_particiones(primero, limite)
+
+    archivados = lotes = 0
+    for _ in range(max_lotes):
+        movidos = _archivar_lote(limite, tamano)
+        if not movidos:
+            break
+        archivados += movidos
+        lotes += 1
+
+    if archivados:
+        logger.info(f"Archivo de pedidos: {archivados} pedidos en {lotes} lotes")
+    return {'archivados': archivados, 'lotes': lotes}
+
+
+# ==========================================================
+# LECTURA
+# ==========================================================
+def obtener_pedido(pedido_id, queryset=None):
+    """
+    Pedido de la tabla activa o, si ya se archivó, una instancia de solo
+    lectura con `archivado = True` (ver PedidoArchivado.como_pedido).
+
+    Args:
+        queryset: Queryset de Pedido para la búsqueda activa (select_related, ...)
+
+    Returns:
+        Pedido | None
+    """
+    from .models import Pedido, PedidoArchivado
+
+    queryset = Pedido.objects.all() if queryset is None else queryset
+    try:
+        return queryset.get(pk=pedido_id)
+    except Pedido.DoesNotExist:
+        pass
+
+    archivado = (
+        PedidoArchivado.objects
+        .select_related('cliente__user', 'proveedor', 'repartidor__user')
+        .filter(pk=pedido_id)
+        .first()
+    )
+    return archivado.como_pedido() if archivado else None
+
+
+def obtener_historial(pedido):
+    """Cambios de estado del pedido, de la tabla activa o del archivo."""
+    from .models import HistorialPedido, HistorialPedidoArchivado
+
+    if not getattr(pedido, 'archivado', False):
+        return list(HistorialPedido.objects.filter(pedido_id=pedido.pk))
+
+    # pedido_creado_en acota la búsqueda a la partición del mes
+    return list(HistorialPedidoArchivado.objects.filter(
+        pedido_id=pedido.pk,
+        pedido_creado_en=pedido.creado_en,
+    ))
@@ -0,0 +1,300 @@
+# pedidos/feed_disponibles.py
+"""
+Feed de pedidos disponibles para repartidores (Redis, versionado).
+
+Estructuras:
+- Sorted set con los IDs de pedidos disponibles (CONFIRMADO y sin
+  repartidor), con `creado_en` como score
+- Contador de versión: sube en 1 con cada alta o baja real del set
+- Registro de cambios (sorted set, score = versión, miembro
+  "<versión>:<+|->< id>"), recortado a MAX_CAMBIOS entradas
+
+Los consumidores de transiciones de pedidos/signals.py aplican las altas y
+bajas después del commit. El repartidor consulta con `since_version` y
+recibe solo los IDs agregados y quitados desde esa versión; si la versión
+ya salió del registro (o es de otra "época" de Redis) recibe el set
+completo. La tarea `pedidos.reconciliar_feed_disponibles` corrige cualquier
+desvío contra la base de datos.
+
+Si Redis no está disponible las funciones devuelven False/None y el
+llamador consulta la base de datos.
+"""
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('pedidos')
+
+PREFIJO = 'deliber:pedidos:disponibles'
+SET_KEY = f'{PREFIJO}:ids'
+VERSION_KEY = f'{PREFIJO}:version'
+CAMBIOS_KEY = f'{PREFIJO}:cambios'
+
+# Cambios que se conservan para responder con deltas
+MAX_CAMBIOS = 5000
+
+# Marca de construcción bajo demanda (una sola petición a la vez)
+CONSTRUYENDO_KEY = f'{PREFIJO}:construyendo'
+SEGUNDOS_CONSTRUCCION = 60
+
+# Aplica altas/bajas y registra cada cambio real con una versión nueva.
+# Si el contador no existe (Redis vacío) arranca en el timestamp en ms que
+# envía el llamador: así la versión sigue creciendo tras un reinicio y los
+# clientes con versiones viejas reciben el set completo.
+# ARGV: max_cambios, inicio, y luego tríos (op, id, score)
+_SCRIPT_APLICAR = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('SET', KEYS[2], ARGV[2])
+end
+local version = tonumber(redis.call('GET', KEYS[2]))
+for i = 3, #ARGV, 3 do
+    local cambio
+    if ARGV[i] == '+' then
+        cambio = redis.call('ZADD', KEYS[1], ARGV[i + 2], ARGV[i + 1])
+    else
+        cambio = redis.call('ZREM', KEYS[1], ARGV[i + 1])
+    end
+    if cambio == 1 then
+        version = redis.call('INCR', KEYS[2])
+        redis.call('ZADD', KEYS[3], version, version .. ':' .. ARGV[i] .. ARGV[i + 1])
+    end
+end
+redis.call('ZREMRANGEBYRANK', KEYS[3], 0, -(tonumber(ARGV[1]) + 1))
+return version
+"""
+
+# Devuelve {version} si no hay cambios, {version, 'delta', cambios...} o
+# {version, 'completo', ids...}. Sin contador devuelve {}.
+_SCRIPT_LEER = """
+local version = redis.call('GET', KEYS[2])
+if not version then
+    return {}
+end
+version = tonumber(version)
+local desde = tonumber(ARGV[1])
+if desde == version then
+    return {version}
+end
+if desde and desde < version then
+    local primero = redis.call('ZRANGE', KEYS[3], 0, 0, 'WITHSCORES')
+    if primero[2] and tonumber(primero[2]) <= desde + 1 then
+        local cambios = redis.call('ZRANGEBYSCORE', KEYS[3], '(' .. desde, '+inf')
+        table.insert(cambios, 1, 'delta')
+        table.insert(cambios, 1, version)
+        return cambios
+    end
+end
+local ids = redis.call('ZRANGE', KEYS[1], 0, -1)
+table.insert(ids, 1, 'completo')
+table.insert(ids, 1, version)
+return ids
+"""
+
+_scripts = {}
+
+
+def _conexion():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _script(conexion, nombre, fuente):
+    if nombre not in _scripts:
+        _scripts[nombre] = conexion.register_script(fuente)
+    return _scripts[nombre]
+
+
+def habilitado():
+    """El feed se puede desactivar con PEDIDOS_FEED_DISPONIBLES=False."""
+    return getattr(settings, 'PEDIDOS_FEED_DISPONIBLES', True)
+
+
+def es_disponible(pedido):
+    """Mismo criterio que PedidoManager.disponibles_para_repartidores()."""
+    from .models import EstadoPedido
+    return pedido.estado == EstadoPedido.CONFIRMADO and pedido.repartidor_id is None
+
+
+# ==========================================================
+# ESCRITURA
+# ==========================================================
+def _aplicar(operaciones):
+    """
+    Args:
+        operaciones (list[tuple]): (op, pedido_id, score) con op '+' o '-'
+
+    Returns:
+        int | None: Versión resultante; None si Redis no está disponible
+    """
+    if not habilitado():
+        return None
+
+    args = [MAX_CAMBIOS, int(time.time() * 1000)]
+    for op, pedido_id, score in operaciones:
+        args.extend([op, pedido_id, score])
+
+    try:
+        conexion = _conexion()
+        version = _script(conexion, 'aplicar', _SCRIPT_APLICAR)(
+            keys=[SET_KEY, VERSION_KEY, CAMBIOS_KEY],
+            args=args,
+            client=conexion,
+        )
+        return int(version)
+    except Exception as e:
+        logger.warning(f"Redis no disponible para el feed de pedidos: {e}")
+        return None
+
+
+def agregar(pedido_id, creado_en):
+    return _aplicar([('+', pedido_id, creado_en.timestamp())])
+
+
+def quitar(pedido_id):
+    return _aplicar([('-', pedido_id, 0)])
+
+
+def sincronizar(pedido):
+    """Agrega o quita el pedido según su estado actual."""
+    if es_disponible(pedido):
+        return agregar(pedido.pk, pedido.creado_en)
+    return quitar(pedido.pk)
+
+
+def sincronizar_varios(pedidos):
+    """`sincronizar` de varios pedidos en una sola llamada al script."""
+    return _aplicar([
+        ('+', pedido.pk, pedido.creado_en.timestamp()) if es_disponible(pedido) else ('-', pedido.pk, 0)
+        for pedido in pedidos
+    ])
+
+
+# ==========================================================
+# LECTURA
+# ==========================================================
+def leer(since_version=None):
+    """
+    Cambios del feed desde `since_version`.
+
+    Returns:
+        dict | None: {'version', 'completo', 'agregados', 'quitados'}.
+            Sin cambios, agregados y quitados van vacíos con la misma versión.
+            Con completo=True, `agregados` es el set entero y el cliente debe
+            reemplazar su lista. None si Redis no está disponible o el feed
+            aún no se ha construido.
+    """
+    if not habilitado():
+        return None
+
+    try:
+        conexion = _conexion()
+        resultado = _script(conexion, 'leer', _SCRIPT_LEER)(
+            keys=[SET_KEY, VERSION_KEY, CAMBIOS_KEY],
+            args=['' if since_version is None else since_version],
+            client=conexion,
+        )
+    except Exception as e:
+        logger.warning(f"Redis no disponible para el feed de pedidos: {e}")
+        return None
+
+    if not resultado:
+        return None
+
+    version = int(resultado[0])
+    tipo = resultado[1].decode() if len(resultado) > 1 else None
+    elementos = [e.decode() if isinstance(e, bytes) else e for e in resultado[2:]]
+
+    if tipo == 'completo':
+        return {
+            'version': version,
+            'completo': True,
+            'agregados': [int(pedido_id) for pedido_id in elementos],
+            'quitados': [],
+        }
+
+    # Gana el último cambio de cada pedido dentro de la ventana
+    ultimo = {}
+    for cambio in elementos:
+        _, operacion = cambio.split(':', 1)
+        ultimo[int(operacion[1:])] = operacion[0]
+
+    return {
+        'version': version,
+        'completo': False,
+        'agregados': [pid for pid, op in ultimo.items() if op == '+'],
+        'quitados': [pid for pid, op in ultimo.items() if op == '-'],
+    }
+
+
+# ==========================================================
+# RECONCILIACIÓN
+# ==========================================================
+def construir_si_falta():
+    """
+    Construye el feed cuando `leer` no lo encuentra (antes de la primera
+    reconciliación o tras vaciarse Redis). Solo una petición a la vez lo
+    construye; las demás responden desde la base de datos.
+
+    Returns:
+        bool: True si el feed quedó construido
+    """
+    if not habilitado():
+        return False
+
+    try:
+        if not _conexion().set(CONSTRUYENDO_KEY, 1, nx=True, ex=SEGUNDOS_CONSTRUCCION):
+            return False
+    except Exception as e:
+        logger.warning(f"Redis no disponible para el feed de pedidos: {e}")
+        return False
+
+    try:
+        return reconstruir() is not None
+    finally:
+        try:
+            _conexion().delete(CONSTRUYENDO_KEY)
+        except Exception:
+            pass
+
+
+def reconstruir():
+    """
+    Alinea el set de Redis con la base de datos aplicando solo las
+    diferencias (cada una genera su versión, así los deltas siguen siendo
+    válidos para los clientes).
+
+    Returns:
+        dict | None: agregados y quitados; None si Redis no está disponible
+    """
+    if not habilitado():
+        return None
+
+    from .models import Pedido
+
+    esperados = dict(
+        Pedido.objects.disponibles_para_repartidores()
+        .order_by()
+        .values_list('id', 'creado_en')
+    )
+
+    try:
+        actuales = {int(pid) for pid in _conexion().zrange(SET_KEY, 0, -1)}
+    except Exception as e:
+        logger.warning(f"Redis no disponible para el feed de pedidos: {e}")
+        return None
+
+    operaciones = [
+        ('+', pid, creado_en.timestamp())
+        for pid, creado_en in esperados.items() if pid not in actuales
+    ]
+    operaciones += [('-', pid, 0) for pid in actuales - esperados.keys()]
+
+    # Aunque no haya diferencias se crea el contador si falta
+    if _aplicar(operaciones) is None:
+        return None
+
+    return {
+        'agregados': sum(1 for op, _, _ in operaciones if op == '+'),
+        'quitados': sum(1 for op, _, _ in operaciones if op == '-'),
+    }
@@ -0,0 +1,284 @@
+# pedidos/geocercas.py
+"""
+Llegada automática a origen y destino (geocercas sobre el stream de ubicación).
+
+Índice en Redis, un hash por repartidor con las geocercas de sus pedidos
+activos:
+
+    deliber:pedidos:geocercas:<repartidor_id>
+        "<pedido_id>:origen"  → "lat,lon,radio"    (asignado, antes de salir en ruta)
+        "<pedido_id>:destino" → "lat,lon,radio"    (en ruta)
+
+Lo mantiene el consumidor de transiciones `sincronizar_geocercas`
+(pedidos/signals.py) después del commit. Cada ping de un repartidor
+OCUPADO se evalúa con un solo script Lua contra las geocercas de ese
+repartidor (normalmente una o dos): no hay consultas a la base de datos
+ni búsqueda sobre todos los pedidos. Una geocerca alcanzada queda marcada
+(",1") para avisar una sola vez.
+
+Cada llegada se publica como evento `llegada` en el canal de seguimiento
+del pedido (pedidos/seguimiento.py), con `punto` = "origen" o "destino".
+Con PEDIDOS_SEGUIMIENTO_BROKER="memoria" el índice vive en el proceso
+(tests y desarrollo sin Redis).
+"""
+import logging
+import math
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger('pedidos')
+
+PREFIJO = 'deliber:pedidos:geocercas'
+
+ORIGEN = 'origen'
+DESTINO = 'destino'
+
+# Un pedido activo no dura tanto; evita hashes huérfanos
+TTL_SEGUNDOS = 60 * 60 * 24
+
+METROS_POR_GRADO = 111320.0
+
+# ARGV: lat1, lon1, lat2, lon2, ... (pings en orden). Devuelve pares
+# (campo, índice del ping) de las geocercas alcanzadas por primera vez.
+_SCRIPT_EVALUAR = """
+local campos = redis.call('HGETALL', KEYS[1])
+if #campos == 0 then
+    return {}
+end
+local llegadas = {}
+for p = 1, #ARGV, 2 do
+    local lat = tonumber(ARGV[p])
+    local lon = tonumber(ARGV[p + 1])
+    local escala = 111320 * math.cos(math.rad(lat))
+    for i = 1, #campos, 2 do
+        local valor = campos[i + 1]
+        local glat, glon, radio, hecho = string.match(valor, '([^,]+),([^,]+),([^,]+),?(%d*)')
+        if hecho == '' then
+            local dy = (tonumber(glat) - lat) * 111320
+            local dx = (tonumber(glon) - lon) * escala
+            if dx * dx + dy * dy <= tonumber(radio) ^ 2 then
+                campos[i + 1] = valor .. ',1'
+                redis.call('HSET', KEYS[1], campos[i], campos[i + 1])
+                table.insert(llegadas, campos[i])
+                table.insert(llegadas, (p + 1) / 2)
+            end
+        end
+    end
+end
+return llegadas
+"""
+
+_script = None
+
+
+def _indice_key(repartidor_id):
+    return f'{PREFIJO}:{repartidor_id}'
+
+
+def radio_metros():
+    return getattr(settings, 'PEDIDOS_GEOCERCA_RADIO_METROS', 100)
+
+
+def _texto(valor):
+    return valor.decode() if isinstance(valor, bytes) else valor
+
+
+# ==========================================================
+# ÍNDICES
+# ==========================================================
+class _IndiceRedis:
+    def _conexion(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    def aplicar(self, cambios):
+        """cambios: {repartidor_id: (campos a quitar, {campo: valor} a agregar)}"""
+        pipe = self._conexion().pipeline(transaction=False)
+        for repartidor_id, (quitar, agregar) in cambios.items():
+            clave = _indice_key(repartidor_id)
+            if quitar:
+                pipe.hdel(clave, *quitar)
+            for campo, valor in agregar.items():
+                # HSETNX: no reactiva una geocerca ya alcanzada
+                pipe.hsetnx(clave, campo, valor)
+            if agregar:
+                pipe.expire(clave, TTL_SEGUNDOS)
+        pipe.execute()
+
+    def evaluar(self, repartidor_id, puntos):
+        global _script
+        conexion = self._conexion()
+        if _script is None:
+            _script = conexion.register_script(_SCRIPT_EVALUAR)
+
+        args = [coordenada for lat, lon in puntos for coordenada in (float(lat), float(lon))]
+        crudo = _script(keys=[_indice_key(repartidor_id)], args=args, client=conexion)
+        return [(_texto(crudo[i]), int(crudo[i + 1]) - 1) for i in range(0, len(crudo), 2)]
+
+
+class _IndiceMemoria:
+    """Índice del proceso actual: solo sirve con un único proceso (tests)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.geocercas = {}
+
+    def aplicar(self, cambios):
+        with self.lock:
+            for repartidor_id, (quitar, agregar) in cambios.items():
+                indice = self.geocercas.setdefault(repartidor_id, {})
+                for campo in quitar:
+                    indice.pop(campo, None)
+                for campo, valor in agregar.items():
+                    indice.setdefault(campo, valor)
+                if not indice:
+                    del self.geocercas[repartidor_id]
+
+    def evaluar(self, repartidor_id, puntos):
+        llegadas = []
+        with self.lock:
+            indice = self.geocercas.get(repartidor_id)
+            if not indice:
+                return llegadas
+
+            for posicion, (lat, lon) in enumerate(puntos):
+                escala = METROS_POR_GRADO * math.cos(math.radians(lat))
+                for campo, valor in indice.items():
+                    partes = valor.split(',')
+                    if len(partes) > 3:
+                        continue
+                    glat, glon, radio = map(float, partes)
+                    dy = (glat - lat) * METROS_POR_GRADO
+                    dx = (glon - lon) * escala
+                    if dx * dx + dy * dy <= radio * radio:
+                        indice[campo] = valor + ',1'
+                        llegadas.append((campo, posicion))
+        return llegadas
+
+
+_redis = _IndiceRedis()
+_memoria = _IndiceMemoria()
+
+
+def indice():
+    """Índice según PEDIDOS_SEGUIMIENTO_BROKER (mismo backend que el seguimiento)."""
+    if getattr(settings, 'PEDIDOS_SEGUIMIENTO_BROKER', 'redis') == 'memoria':
+        return _memoria
+    return _redis
+
+
+# ==========================================================
+# SINCRONIZACIÓN CON LOS PEDIDOS
+# ==========================================================
+def geocercas_pedido(pedido, radio=None):
+    """
+    Geocercas que corresponden al estado actual del pedido.
+
+    Returns:
+        dict: {campo: "lat,lon,radio"} (vacío si no tiene repartidor o ya terminó)
+    """
+    from .models import EstadoPedido
+
+    if not pedido.repartidor_id:
+        return {}
+
+    radio = radio or radio_metros()
+    if pedido.estado in (EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION):
+        lat, lon, punto = pedido.latitud_origen, pedido.longitud_origen, ORIGEN
+    elif pedido.estado == EstadoPedido.EN_RUTA:
+        lat, lon, punto = pedido.latitud_destino, pedido.longitud_destino, DESTINO
+    else:
+        return {}
+
+    if lat is None or lon is None:
+        return {}
+    return {f'{pedido.pk}:{punto}': f'{float(lat)},{float(lon)},{radio}'}
+
+
+def cambios(pedidos):
+    """
+    Cambios del índice para dejar las geocercas de los repartidores de
+    `pedidos` según su estado actual. Se arman dentro de la transacción y
+    se aplican tras el commit.
+
+    Returns:
+        dict: {repartidor_id: (campos a quitar, {campo: valor} a agregar)}
+    """
+    resultado = {}
+    radio = radio_metros()
+    for pedido in pedidos:
+        if not pedido.repartidor_id:
+            continue
+        agregar = geocercas_pedido(pedido, radio)
+        quitar, nuevas = resultado.setdefault(pedido.repartidor_id, ([], {}))
+        quitar.extend(
+            campo for campo in (f'{pedido.pk}:{ORIGEN}', f'{pedido.pk}:{DESTINO}')
+            if campo not in agregar
+        )
+        nuevas.update(agregar)
+    return resultado
+
+
+def aplicar(cambios_indice):
+    """
+    Aplica al índice los cambios de `cambios`.
+
+    Returns:
+        bool: False si el índice no está disponible
+    """
+    if not cambios_indice:
+        return True
+
+    try:
+        indice().aplicar(cambios_indice)
+        return True
+    except Exception as e:
+        logger.warning(f"Redis no disponible para las geocercas de pedidos: {e}")
+        return False
+
+
+# ==========================================================
+# EVALUACIÓN (en cada ping)
+# ==========================================================
+def evaluar(repartidor_id, puntos):
+    """
+    Evalúa los pings del repartidor contra sus geocercas y publica las
+    llegadas en el seguimiento de cada pedido.
+
+    Args:
+        puntos (list[tuple]): (latitud, longitud, timestamp) en orden
+
+    Returns:
+        list[dict]: Llegadas (pedido_id, punto, timestamp)
+    """
+    from . import seguimiento
+
+    if not puntos:
+        return []
+
+    try:
+        alcanzadas = indice().evaluar(repartidor_id, [(lat, lon) for lat, lon, _ in puntos])
+    except Exception as e:
+        logger.warning(f"Redis no disponible para las geocercas de pedidos: {e}")
+        return []
+
+    llegadas = []
+    for campo, posicion in alcanzadas:
+        pedido_id, punto = campo.split(':')
+        llegadas.append({
+            'tipo': 'llegada',
+            'pedido_id': int(pedido_id),
+            'repartidor_id': repartidor_id,
+            'punto': punto,
+            'timestamp': puntos[posicion][2],
+        })
+
+    if llegadas:
+        logger.info(
+            f"Llegadas del repartidor {repartidor_id}: "
+            + ', '.join(f"#{llegada['pedido_id']} {llegada['punto']}" for llegada in llegadas)
+        )
+        seguimiento.publicar_llegadas(llegadas)
+
+    return llegadas
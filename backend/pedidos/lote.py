@@ -0,0 +1,170 @@
+# pedidos/lote.py
+"""
+Cambios de estado masivos (acciones del admin y endpoint de proveedores).
+
+`cambiar_estados` aplica muchos cambios sin pasar por `pedido.save()` uno
+por uno:
+
+1. Bloquea todos los pedidos en una sola consulta (SELECT ... FOR UPDATE).
+2. Valida cada cambio en memoria con `validar_transicion_estado` y las
+   reglas de los métodos marcar_* / cancelar del modelo. Los inválidos se
+   devuelven como errores sin detener al resto del lote.
+3. Escribe un UPDATE por estado destino (bulk_update) con los mismos campos
+   que el método individual: fecha límite al salir en ruta, fecha y
+   comisiones al entregar, actor al cancelar.
+4. Emite todas las transiciones con `transiciones.emitir_lote`: historial
+   en un solo INSERT, acumulados horarios por celda, feed de disponibles en
+   una llamada a Redis y las filas de outbox (notificaciones) en un INSERT
+   con un único drenado.
+
+Tras el commit libera a los repartidores como marcar_entregado y cancelar.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import rutas, transiciones
+from .models import EstadoPedido, Pedido, TipoPedido
+
+logger = logging.getLogger('pedidos')
+
+MAX_PEDIDOS = 500
+
+# Estados a los que un proveedor puede pasar sus pedidos
+ESTADOS_PROVEEDOR = {EstadoPedido.EN_PREPARACION, EstadoPedido.CANCELADO}
+
+
+def _validar(pedido, nuevo, proveedor):
+    """Mensaje de error del cambio, o None si es válido."""
+    if pedido is None or (proveedor is not None and pedido.proveedor_id != proveedor.pk):
+        return "Pedido no encontrado."
+
+    if proveedor is not None and nuevo not in ESTADOS_PROVEEDOR:
+        return "El proveedor solo puede pasar pedidos a 'En preparación' o 'Cancelado'."
+
+    valida, mensaje = pedido.validar_transicion_estado(nuevo)
+    if not valida:
+        return mensaje
+
+    if nuevo == EstadoPedido.EN_PREPARACION and pedido.tipo != TipoPedido.PROVEEDOR:
+        return "Solo los pedidos de tipo 'Proveedor' pasan por preparación."
+
+    if nuevo == EstadoPedido.ENTREGADO and not pedido.repartidor_id:
+        return "No se puede entregar un pedido sin repartidor asignado."
+
+    return None
+
+
+def _campos(nuevo):
+    campos = ['estado', 'actualizado_en']
+    if nuevo == EstadoPedido.EN_PREPARACION:
+        campos.append('confirmado_por_proveedor')
+    elif nuevo == EstadoPedido.EN_RUTA:
+        campos.append('fecha_limite_entrega')
+    elif nuevo == EstadoPedido.ENTREGADO:
+        campos += ['fecha_entregado', 'comision_repartidor', 'comision_proveedor', 'ganancia_app']
+    elif nuevo == EstadoPedido.CANCELADO:
+        campos.append('cancelado_por')
+    return campos
+
+
+def _liberar_repartidores(entregados, cancelados):
+    from repartidores.models import Repartidor
+
+    ids = {pedido.repartidor_id for pedido in entregados + cancelados if pedido.repartidor_id}
+    if not ids:
+        return
+
+    with transaction.atomic():
+        # Los que aún llevan otros pedidos siguen ocupados (filas bloqueadas hasta el commit)
+        repartidores = Repartidor.objects.in_bulk(rutas.bloquear_libres(ids))
+
+        for pedidos, liberar in (
+            (entregados, lambda repartidor: repartidor.marcar_fuera_servicio("pedido completado")),
+            (cancelados, lambda repartidor: repartidor.marcar_disponible()),
+        ):
+            for repartidor_id in {pedido.repartidor_id for pedido in pedidos if pedido.repartidor_id}:
+                if repartidor_id not in repartidores:
+                    continue
+                try:
+                    with transaction.atomic():
+                        liberar(repartidores[repartidor_id])
+                except Exception as e:
+                    logger.warning(f"No se pudo actualizar estado del repartidor #{repartidor_id}: {e}")
+
+
+def cambiar_estados(cambios, actor, proveedor=None, motivo=''):
+    """
+    Aplica varios cambios de estado en una transacción.
+
+    Args:
+        cambios (dict): {pedido_id: nuevo_estado}
+        actor (str): Rol que hace el cambio (queda en cancelado_por): 'admin', 'proveedor'...
+        proveedor (Proveedor | None): Limita el lote a los pedidos de este proveedor
+        motivo (str): Motivo (se registra en el log)
+
+    Returns:
+        dict: actualizados (list[int]) y errores ({pedido_id: mensaje})
+    """
+    if len(cambios) > MAX_PEDIDOS:
+        raise ValueError(f"Máximo {MAX_PEDIDOS} pedidos por lote.")
+
+    errores = {}
+    por_estado = {}
+
+    with transaction.atomic():
+        pedidos = {
+            pedido.pk: pedido
+            # Solo se bloquean los pedidos; el select_related del manager
+            # trae repartidor y cliente en la misma consulta (LEFT JOIN)
+            for pedido in Pedido.objects.select_for_update(of=('self',)).filter(pk__in=cambios).order_by('pk')
+        }
+
+        for pedido_id, nuevo in cambios.items():
+            error = _validar(pedidos.get(pedido_id), nuevo, proveedor)
+            if error:
+                errores[pedido_id] = error
+            else:
+                por_estado.setdefault(nuevo, []).append(pedidos[pedido_id])
+
+        ahora = timezone.now()
+        emitidos = []
+
+        for nuevo, grupo in por_estado.items():
+            for pedido in grupo:
+                emitidos.append((pedido, pedido.estado, nuevo))
+                pedido.estado = nuevo
+                pedido.actualizado_en = ahora
+
+                if nuevo == EstadoPedido.EN_PREPARACION and proveedor is not None:
+                    pedido.confirmado_por_proveedor = True
+                elif nuevo == EstadoPedido.EN_RUTA:
+                    pedido.fecha_limite_entrega = pedido.calcular_fecha_limite(ahora)
+                elif nuevo == EstadoPedido.ENTREGADO:
+                    pedido.fecha_entregado = ahora
+                    pedido._distribuir_ganancias(guardar=False)
+                elif nuevo == EstadoPedido.CANCELADO:
+                    pedido.cancelado_por = actor
+
+                pedido._guardado = (nuevo, pedido.repartidor_id)
+
+            Pedido.objects.bulk_update(grupo, _campos(nuevo), batch_size=MAX_PEDIDOS)
+
+        transiciones.emitir_lote(emitidos)
+
+    actualizados = [pedido for grupo in por_estado.values() for pedido in grupo]
+    if actualizados:
+        logger.info(
+            f"✅ Cambio de estado en lote por {actor}: "
+            + ', '.join(f"{len(grupo)} → {nuevo}" for nuevo, grupo in por_estado.items())
+            + (f". Motivo: {motivo}" if motivo else '')
+        )
+
+    _liberar_repartidores(
+        por_estado.get(EstadoPedido.ENTREGADO, []),
+        por_estado.get(EstadoPedido.CANCELADO, []),
+    )
+
+    return {'actualizados': [pedido.pk for pedido in actualizados], 'errores': errores}
+
@@ -0,0 +1,295 @@
+"""
+==========================================
+ARCHIVO: backend/pedidos/management/commands/benchmark_aceptacion.py
+==========================================
+Benchmark de concurrencia de Pedido.aceptar_por_repartidor.
+
+Crea datos sintéticos (usuarios `bench-aceptacion-*`), los elimina al final
+y mide dos escenarios con N hilos (un repartidor por hilo):
+
+1. Todos los hilos aceptan el MISMO pedido a la vez: debe ganar uno solo.
+2. Los hilos compiten por M pedidos: cada pedido debe quedar con un único
+   repartidor y cada aceptación con su entrada de historial.
+
+Con --legado se repite con el flujo anterior (leer, comprobar, save) para
+comparar latencias y ver las dobles asignaciones.
+
+Requiere Postgres: SQLite serializa las escrituras y devuelve
+"database is locked" con varios hilos.
+
+Uso: python manage.py benchmark_aceptacion [--hilos 50] [--pedidos 500] [--legado]
+"""
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from authentication.models import User
+from pedidos.models import EstadoPedido, HistorialPedido, Pedido, TipoPedido
+from repartidores.models import EstadoRepartidor, Repartidor
+from usuarios.models import Perfil
+
+PREFIJO = 'bench-aceptacion'
+
+
+def _aceptar_legado(pedido, repartidor):
+    """Flujo anterior: lee la fila, comprueba en Python y guarda."""
+    pedido = Pedido.objects.get(pk=pedido.pk)
+    if pedido.repartidor_id is not None:
+        raise ValidationError("El pedido ya fue tomado por otro repartidor.")
+
+    with transaction.atomic():
+        pedido.repartidor = repartidor
+        pedido.aceptado_por_repartidor = True
+        pedido.estado = EstadoPedido.EN_RUTA
+        pedido.save(update_fields=['repartidor', 'aceptado_por_repartidor', 'estado', 'actualizado_en'])
+        repartidor.marcar_ocupado()
+
+
+def _aceptar(pedido, repartidor):
+    pedido.aceptar_por_repartidor(repartidor)
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia y correctitud de la aceptación concurrente de pedidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=50)
+        parser.add_argument('--pedidos', type=int, default=500)
+        parser.add_argument('--legado', action='store_true',
+                            help='Compara con el flujo anterior (leer-comprobar-guardar)')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        hilos = max(options['hilos'], 2)
+        total_pedidos = max(options['pedidos'], 1)
+        random.seed(options['semilla'])
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                "⚠️  SQLite serializa las escrituras: los resultados no son representativos"
+            ))
+
+        self.stdout.write("\n" + "="*70)
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 BENCHMARK ACEPTACIÓN - {hilos} hilos, 1 pedido y {total_pedidos} pedidos"
+        ))
+        self.stdout.write("="*70 + "\n")
+
+        modos = [('condicional', _aceptar)]
+        if options['legado']:
+            modos.append(('legado', _aceptar_legado))
+
+        self._limpiar()
+        try:
+            cliente, repartidores = self._crear_actores(hilos)
+            for nombre, aceptar in modos:
+                self._un_pedido(nombre, aceptar, cliente, repartidores)
+                self._muchos_pedidos(nombre, aceptar, cliente, repartidores, total_pedidos)
+        finally:
+            self._limpiar()
+
+        self.stdout.write("="*70 + "\n")
+
+    # ==========================================================
+    # DATOS SINTÉTICOS
+    # ==========================================================
+    def _crear_actores(self, hilos):
+        usuarios = User.objects.bulk_create([
+            User(
+                email=f'{PREFIJO}-{i}@example.com',
+                username=f'{PREFIJO}-{i}',
+                first_name='Bench',
+                last_name=str(i),
+                password='!',
+            )
+            for i in range(hilos + 1)
+        ])
+        usuarios = list(User.objects.filter(email__startswith=PREFIJO).order_by('id'))
+
+        cliente, _ = Perfil.objects.get_or_create(user=usuarios[0])
+        Repartidor.objects.bulk_create([
+            Repartidor(
+                user=usuario,
+                cedula=f'9{i:09d}',
+                telefono='0999999999',
+                verificado=True,
+                activo=True,
+                estado=EstadoRepartidor.DISPONIBLE,
+            )
+            for i, usuario in enumerate(usuarios[1:])
+        ])
+        repartidores = list(
+            Repartidor.objects.filter(user__email__startswith=PREFIJO).select_related('user').order_by('id')
+        )
+        return cliente, repartidores
+
+    def _crear_pedidos(self, cliente, cantidad):
+        Pedido.objects.bulk_create([
+            Pedido(
+                cliente=cliente,
+                tipo=TipoPedido.DIRECTO,
+                estado=EstadoPedido.CONFIRMADO,
+                descripcion='Pedido sintético de benchmark',
+                direccion_entrega='Dirección sintética de benchmark',
+                total=Decimal('10.00'),
+            )
+            for _ in range(cantidad)
+        ])
+        return list(
+            Pedido.objects.filter(cliente=cliente, repartidor__isnull=True).values_list('id', flat=True)
+        )
+
+    def _reiniciar(self, cliente, repartidores):
+        Pedido.objects.filter(cliente=cliente).delete()
+        Repartidor.objects.filter(pk__in=[r.pk for r in repartidores]).update(
+            estado=EstadoRepartidor.DISPONIBLE
+        )
+        for repartidor in repartidores:
+            repartidor.estado = EstadoRepartidor.DISPONIBLE
+
+    def _limpiar(self):
+        User.objects.filter(email__startswith=PREFIJO).delete()
+
+    # ==========================================================
+    # ESCENARIOS
+    # ==========================================================
+    def _ejecutar(self, repartidores, trabajo):
+        """Corre `trabajo(repartidor, barrera)` en un hilo por repartidor."""
+        barrera = threading.Barrier(len(repartidores))
+        resultados = [None] * len(repartidores)
+
+        def hilo(indice, repartidor):
+            try:
+                resultados[indice] = trabajo(repartidor, barrera)
+            finally:
+                connections.close_all()
+
+        inicio = time.perf_counter()
+        threads = [
+            threading.Thread(target=hilo, args=(i, r)) for i, r in enumerate(repartidores)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return resultados, time.perf_counter() - inicio
+
+    def _un_pedido(self, modo, aceptar, cliente, repartidores):
+        self._reiniciar(cliente, repartidores)
+        pedido_id = self._crear_pedidos(cliente, 1)[0]
+
+        def trabajo(repartidor, barrera):
+            pedido = Pedido.objects.get(pk=pedido_id)
+            barrera.wait()
+            inicio = time.perf_counter()
+            try:
+                aceptar(pedido, repartidor)
+                resultado = 'gano'
+            except ValidationError:
+                resultado = 'perdio'
+            except Exception as e:
+                resultado = f'error: {e}'
+            return resultado, time.perf_counter() - inicio, repartidor.pk
+
+        resultados, _ = self._ejecutar(repartidores, trabajo)
+
+        ganadores = [rid for resultado, _, rid in resultados if resultado == 'gano']
+        errores = [resultado for resultado, _, _ in resultados if resultado.startswith('error')]
+        pedido = Pedido.objects.get(pk=pedido_id)
+        ocupados = Repartidor.objects.filter(
+            pk__in=[r.pk for r in repartidores], estado=EstadoRepartidor.OCUPADO
+        ).count()
+        historial = HistorialPedido.objects.filter(pedido_id=pedido_id).count()
+
+        correcto = (
+            len(ganadores) == 1 and pedido.repartidor_id == ganadores[0]
+            and ocupados == 1 and historial == 1
+        )
+
+        self.stdout.write(self.style.HTTP_INFO(f"\n[{modo}] {len(repartidores)} hilos → 1 pedido"))
+        self._latencias([latencia for _, latencia, _ in resultados])
+        self.stdout.write(
+            f"  Ganadores reportados: {len(ganadores)} | Repartidor final: {pedido.repartidor_id} | "
+            f"Repartidores ocupados: {ocupados} | Historial: {historial} | Errores: {len(errores)}"
+        )
+        self._veredicto(correcto)
+
+    def _muchos_pedidos(self, modo, aceptar, cliente, repartidores, cantidad):
+        self._reiniciar(cliente, repartidores)
+        pedido_ids = self._crear_pedidos(cliente, cantidad)
+
+        def trabajo(repartidor, barrera):
+            orden = pedido_ids[:]
+            random.Random(repartidor.pk).shuffle(orden)
+            ganados, latencias, errores = [], [], 0
+
+            barrera.wait()
+            for pedido_id in orden:
+                pedido = Pedido.objects.get(pk=pedido_id)
+                inicio = time.perf_counter()
+                try:
+                    aceptar(pedido, repartidor)
+                    ganados.append(pedido_id)
+                    # Simula la entrega para volver a competir
+                    Repartidor.objects.filter(pk=repartidor.pk).update(estado=EstadoRepartidor.DISPONIBLE)
+                    repartidor.estado = EstadoRepartidor.DISPONIBLE
+                except ValidationError:
+                    pass
+                except Exception:
+                    errores += 1
+                latencias.append(time.perf_counter() - inicio)
+            return ganados, latencias, errores
+
+        resultados, duracion = self._ejecutar(repartidores, trabajo)
+
+        ganados = [pid for g, _, _ in resultados for pid in g]
+        latencias = [lat for _, lats, _ in resultados for lat in lats]
+        errores = sum(e for _, _, e in resultados)
+
+        sin_repartidor = Pedido.objects.filter(pk__in=pedido_ids, repartidor__isnull=True).count()
+        historial = HistorialPedido.objects.filter(pedido_id__in=pedido_ids).count()
+        dobles = len(ganados) - len(set(ganados))
+
+        correcto = (
+            len(ganados) == cantidad and dobles == 0 and sin_repartidor == 0 and historial == cantidad
+        )
+
+        self.stdout.write(self.style.HTTP_INFO(
+            f"\n[{modo}] {len(repartidores)} hilos → {cantidad} pedidos"
+        ))
+        self._latencias(latencias)
+        self.stdout.write(
+            f"  Intentos: {len(latencias)} en {duracion:.2f} s "
+            f"({cantidad / duracion:.0f} pedidos asignados/s)"
+        )
+        self.stdout.write(
+            f"  Aceptaciones reportadas: {len(ganados)} | Dobles asignaciones: {dobles} | "
+            f"Sin repartidor: {sin_repartidor} | Historial: {historial} | Errores: {errores}"
+        )
+        self._veredicto(correcto)
+
+    # ==========================================================
+    # SALIDA
+    # ==========================================================
+    def _latencias(self, latencias):
+        ms = sorted(latencia * 1000 for latencia in latencias)
+        if not ms:
+            return
+        p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+        p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+        self.stdout.write(
+            f"  Latencia: p50 {statistics.median(ms):.2f} ms | p95 {p95:.2f} ms | "
+            f"p99 {p99:.2f} ms | máx {ms[-1]:.2f} ms"
+        )
+
+    def _veredicto(self, correcto):
+        if correcto:
+            self.stdout.write(self.style.SUCCESS("  ✅ Correcto"))
+        else:
+            self.stdout.write(self.style.ERROR("  ❌ Inconsistencias detectadas"))
@@ -0,0 +1,124 @@
+"""
+==========================================
+ARCHIVO: backend/pedidos/management/commands/benchmark_geocercas.py
+==========================================
+Mide la evaluación de geocercas de llegada (pedidos/geocercas.py) en cada
+ping de ubicación, con repartidores y pedidos sintéticos alrededor de
+Guayaquil. No toca la base de datos: usa el índice configurado (Redis, o
+el de memoria con --memoria) con IDs a partir de ID_BASE y lo limpia al
+final.
+
+Cada repartidor tiene una geocerca de origen y otra de destino; los pings
+se mueven hacia ellas, así que una parte de ellos dispara llegadas.
+
+Uso: python manage.py benchmark_geocercas [--pings 20000] [--hilos 8] [--objetivo 2000]
+"""
+import statistics
+import threading
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from pedidos import geocercas
+
+# IDs sintéticos que no chocan con repartidores ni pedidos reales
+ID_BASE = 10 ** 9
+
+
+class Command(BaseCommand):
+    help = 'Mide pings/s y latencia de la evaluación de geocercas de llegada'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repartidores', type=int, default=2000)
+        parser.add_argument('--pings', type=int, default=20000)
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--objetivo', type=int, default=2000, help='Pings por segundo esperados')
+        parser.add_argument('--memoria', action='store_true', help='Índice en memoria en lugar de Redis')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        broker = 'memoria' if options['memoria'] else 'redis'
+        with override_settings(PEDIDOS_SEGUIMIENTO_BROKER=broker):
+            self._medir(broker, options)
+
+    def _medir(self, broker, options):
+        m = max(options['repartidores'], 1)
+        total = max(options['pings'], 1)
+        hilos = max(options['hilos'], 1)
+        rng = np.random.default_rng(options['semilla'])
+        radio = geocercas.radio_metros()
+
+        # ~25 km x 25 km alrededor del centro de Guayaquil
+        origenes = np.column_stack([rng.uniform(-2.30, -2.07, m), rng.uniform(-80.02, -79.80, m)])
+        destinos = np.column_stack([rng.uniform(-2.30, -2.07, m), rng.uniform(-80.02, -79.80, m)])
+        repartidores = ID_BASE + np.arange(m)
+
+        cambios = {
+            int(rid): ([], {
+                f'{ID_BASE + 2 * i}:{geocercas.ORIGEN}': f'{origenes[i, 0]},{origenes[i, 1]},{radio}',
+                f'{ID_BASE + 2 * i + 1}:{geocercas.DESTINO}': f'{destinos[i, 0]},{destinos[i, 1]},{radio}',
+            })
+            for i, rid in enumerate(repartidores)
+        }
+
+        # Pings: cada uno sobre el segmento origen → destino de su repartidor,
+        # con ruido de ~50 m; los extremos caen dentro de las geocercas
+        quien = rng.integers(0, m, total)
+        avance = np.where(rng.random(total) < 0.1, rng.integers(0, 2, total), rng.uniform(0.1, 0.9, total))
+        pings = origenes[quien] + (destinos[quien] - origenes[quien]) * avance[:, None]
+        pings += rng.normal(0, 0.0005, pings.shape)
+        ahora = timezone.now()
+
+        self.stdout.write("\n" + "="*70)
+        self.stdout.write(self.style.SUCCESS(
+            f"📍 BENCHMARK GEOCERCAS ({broker}) - {m} repartidores, {total} pings, {hilos} hilos"
+        ))
+        self.stdout.write("="*70 + "\n")
+
+        geocercas.indice().aplicar(cambios)
+        latencias = [[] for _ in range(hilos)]
+        llegadas = [0] * hilos
+
+        def trabajar(hilo):
+            for k in range(hilo, total, hilos):
+                inicio = time.perf_counter()
+                llegadas[hilo] += len(geocercas.evaluar(
+                    int(repartidores[quien[k]]), [(pings[k, 0], pings[k, 1], ahora)]
+                ))
+                latencias[hilo].append(time.perf_counter() - inicio)
+
+        try:
+            inicio = time.perf_counter()
+            trabajadores = [threading.Thread(target=trabajar, args=(h,)) for h in range(hilos)]
+            for trabajador in trabajadores:
+                trabajador.start()
+            for trabajador in trabajadores:
+                trabajador.join()
+            duracion = time.perf_counter() - inicio
+        finally:
+            geocercas.indice().aplicar({
+                rid: (list(agregar), {}) for rid, (_, agregar) in cambios.items()
+            })
+
+        todas = sorted(latencia * 1000 for lista in latencias for latencia in lista)
+        por_segundo = total / duracion
+
+        def percentil(p):
+            return todas[min(int(len(todas) * p), len(todas) - 1)]
+
+        self.stdout.write(f"  Pings/s:           {por_segundo:,.0f}")
+        self.stdout.write(f"  Latencia p50:      {statistics.median(todas):.3f} ms")
+        self.stdout.write(f"  Latencia p95:      {percentil(0.95):.3f} ms")
+        self.stdout.write(f"  Latencia p99:      {percentil(0.99):.3f} ms")
+        self.stdout.write(f"  Llegadas:          {sum(llegadas)}")
+
+        objetivo = options['objetivo']
+        if por_segundo >= objetivo:
+            self.stdout.write(self.style.SUCCESS(f"  ✅ Supera el objetivo de {objetivo} pings/s"))
+        else:
+            self.stdout.write(self.style.WARNING(f"  ⚠️  Por debajo del objetivo de {objetivo} pings/s"))
+
+        self.stdout.write("="*70 + "\n")
@@ -0,0 +1,52 @@
+"""
+==========================================
+ARCHIVO: backend/pedidos/management/commands/reconstruir_resumen_pedidos.py
+==========================================
+Recalcula ResumenPedidoHora desde los pedidos (activos y archivados), día
+por día. Se usa para la carga inicial de la tabla (o tras corregir datos a
+mano); la tarea `pedidos.reconciliar_resumen_horario` solo cubre las
+últimas horas.
+
+Uso: python manage.py reconstruir_resumen_pedidos [--dias 30]
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+
+from pedidos.models import Pedido, PedidoArchivado
+from pedidos.resumen import reconciliar
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el resumen horario de pedidos (ResumenPedidoHora)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int,
+                            help='Días hacia atrás (default: desde el primer pedido)')
+
+    def handle(self, *args, **options):
+        hasta = timezone.now() + timedelta(hours=1)
+
+        if options['dias']:
+            desde = hasta - timedelta(days=options['dias'])
+        else:
+            primeros = [
+                modelo.objects.order_by().aggregate(primero=Min('creado_en'))['primero']
+                for modelo in (Pedido, PedidoArchivado)
+            ]
+            desde = min((fecha for fecha in primeros if fecha), default=None)
+            if desde is None:
+                self.stdout.write("No hay pedidos.")
+                return
+
+        celdas = 0
+        while desde < hasta:
+            fin = min(desde + timedelta(days=1), hasta)
+            celdas += reconciliar(desde, fin)
+            desde = fin
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Resumen horario reconstruido: {celdas} celdas"
+        ))
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-16 18:34
+
+from django.db import migrations, models
+
+from utils.geo import codificar_geohash
+
+
+def calcular_geohash_existentes(apps, schema_editor):
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    pendientes = Pedido.objects.filter(
+        latitud_destino__isnull=False,
+        longitud_destino__isnull=False,
+        geohash_destino__isnull=True,
+    ).only('id', 'latitud_destino', 'longitud_destino')
+
+    lote = []
+    for pedido in pendientes.iterator(chunk_size=2000):
+        pedido.geohash_destino = codificar_geohash(pedido.latitud_destino, pedido.longitud_destino)
+        lote.append(pedido)
+        if len(lote) >= 2000:
+            Pedido.objects.bulk_update(lote, ['geohash_destino'])
+            lote = []
+
+    if lote:
+        Pedido.objects.bulk_update(lote, ['geohash_destino'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0003_historialpedido_metricaspedido_and_more'),
+        ('proveedores', '0003_accionadministrativa_proveedor_total_cambios_ruc_and_more'),
+        ('repartidores', '0001_initial'),
+        ('usuarios', '0006_solicitudcambiorol_motivo_reversion_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='geohash_destino',
+            field=models.CharField(blank=True, editable=False, help_text='Celda geohash del destino (se calcula al guardar)', max_length=12, null=True, verbose_name='Geohash Destino'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['geohash_destino'], name='pedidos_geohash_dest_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(calcular_geohash_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-16 18:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0004_pedido_geohash_destino'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(help_text='<evento>:<consumidor>', max_length=200, unique=True, verbose_name='Clave de Idempotencia')),
+                ('consumidor', models.CharField(max_length=150, verbose_name='Consumidor')),
+                ('estado_anterior', models.CharField(blank=True, choices=[('confirmado', 'Confirmado'), ('en_preparacion', 'En preparación'), ('en_ruta', 'En ruta'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], help_text='Vacío cuando el evento es la creación del pedido', max_length=20, null=True, verbose_name='Estado Anterior')),
+                ('estado_nuevo', models.CharField(choices=[('confirmado', 'Confirmado'), ('en_preparacion', 'En preparación'), ('en_ruta', 'En ruta'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=20, verbose_name='Estado Nuevo')),
+                ('repartidor_asignado', models.BooleanField(default=False)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Creado')),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now, help_text='No se procesa antes (reintentos y reservas del drenado)', verbose_name='Disponible Desde')),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('procesado_en', models.DateTimeField(blank=True, null=True, verbose_name='Procesado')),
+                ('fallido', models.BooleanField(default=False, help_text='Se agotaron los reintentos')),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_outbox', to='pedidos.pedido', verbose_name='Pedido')),
+            ],
+            options={
+                'verbose_name': 'Evento de Pedido (Outbox)',
+                'verbose_name_plural': 'Eventos de Pedidos (Outbox)',
+                'db_table': 'pedidos_outbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('procesado_en__isnull', True)), fields=['disponible_en'], name='outbox_pendientes_idx')],
+            },
+        ),
+    ]
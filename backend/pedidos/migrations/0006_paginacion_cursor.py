@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-16 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0005_outbox_eventos'),
+        ('proveedores', '0003_accionadministrativa_proveedor_total_cambios_ruc_and_more'),
+        ('repartidores', '0004_contadores_calificaciones'),
+        ('usuarios', '0006_solicitudcambiorol_motivo_reversion_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='pedido',
+            options={'ordering': ['-creado_en', '-id'], 'verbose_name': 'Pedido', 'verbose_name_plural': 'Pedidos'},
+        ),
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedidos_creado__7b0104_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedidos_cliente_e28e20_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedidos_proveed_5f2615_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedidos_reparti_99a976_idx',
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-creado_en', '-id'], name='pedidos_creado_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['cliente', '-creado_en', '-id'], name='pedidos_cliente_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['proveedor', '-creado_en', '-id'], name='pedidos_proveedor_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['repartidor', '-creado_en', '-id'], name='pedidos_repart_cursor_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-16 19:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0006_paginacion_cursor'),
+        ('proveedores', '0003_accionadministrativa_proveedor_total_cambios_ruc_and_more'),
+        ('repartidores', '0004_contadores_calificaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenPedidoHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField(help_text='Inicio de la hora de creación de los pedidos', verbose_name='Hora')),
+                ('estado', models.CharField(choices=[('confirmado', 'Confirmado'), ('en_preparacion', 'En preparación'), ('en_ruta', 'En ruta'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=20, verbose_name='Estado')),
+                ('tipo', models.CharField(choices=[('proveedor', 'Pedido de Proveedor'), ('directo', 'Encargo Directo')], max_length=20, verbose_name='Tipo de Pedido')),
+                ('pedidos', models.IntegerField(default=0, verbose_name='Pedidos')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total')),
+                ('ganancia_app', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Ganancia App')),
+                ('comision_repartidor', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Comisión Repartidor')),
+                ('comision_proveedor', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Comisión Proveedor')),
+                ('entregas_con_tiempo', models.IntegerField(default=0, help_text='Entregados con fecha de entrega (base del tiempo promedio)', verbose_name='Entregas con Tiempo')),
+                ('segundos_entrega', models.BigIntegerField(default=0, help_text='Suma de (fecha_entregado - creado_en)', verbose_name='Segundos de Entrega')),
+                ('actualizado_en', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Última Actualización')),
+                ('proveedor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='proveedores.proveedor', verbose_name='Proveedor')),
+                ('repartidor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repartidores.repartidor', verbose_name='Repartidor')),
+            ],
+            options={
+                'verbose_name': 'Resumen Horario de Pedidos',
+                'verbose_name_plural': 'Resúmenes Horarios de Pedidos',
+                'db_table': 'pedidos_resumen_hora',
+                'ordering': ['-hora'],
+                'indexes': [models.Index(fields=['proveedor', 'hora'], name='resumen_hora_proveedor_idx'), models.Index(fields=['repartidor', 'hora'], name='resumen_hora_repartidor_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hora', 'proveedor', 'repartidor', 'estado', 'tipo'), name='resumen_hora_celda_unica', nulls_distinct=False)],
+            },
+        ),
+    ]
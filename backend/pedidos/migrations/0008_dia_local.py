@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-16 19:18
+
+import utils.fechas
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0007_resumen_horario'),
+        ('proveedores', '0003_accionadministrativa_proveedor_total_cambios_ruc_and_more'),
+        ('repartidores', '0004_contadores_calificaciones'),
+        ('usuarios', '0006_solicitudcambiorol_motivo_reversion_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='dia_creado',
+            field=models.GeneratedField(db_persist=True, expression=utils.fechas.DiaLocal('creado_en'), output_field=models.DateField(), verbose_name='Día de Creación'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='dia_entregado',
+            field=models.GeneratedField(db_persist=True, expression=utils.fechas.DiaLocal('fecha_entregado'), output_field=models.DateField(null=True), verbose_name='Día de Entrega'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['dia_creado', 'estado'], name='pedidos_dia_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['dia_entregado'], name='pedidos_dia_entregado_idx'),
+        ),
+    ]
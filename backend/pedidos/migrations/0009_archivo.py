@@ -0,0 +1,146 @@
+# Generated by Django 5.1.7 on 2026-10-16 19:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def particionar_archivo(apps, schema_editor):
+    """
+    Recrea las tablas de archivo (vacías) como tablas particionadas por
+    mes de creación del pedido. Las particiones las crea pedidos/archivo.py
+    antes de cada archivado.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE "pedidos_archivo"')
+        cursor.execute('''
+            CREATE TABLE "pedidos_archivo" (
+                "id" bigint NOT NULL,
+                "cliente_id" bigint NOT NULL,
+                "proveedor_id" bigint NULL,
+                "repartidor_id" bigint NULL,
+                "tipo" varchar(20) NOT NULL,
+                "estado" varchar(20) NOT NULL,
+                "descripcion" text NOT NULL,
+                "total" numeric(8, 2) NOT NULL,
+                "direccion_origen" text NULL,
+                "latitud_origen" double precision NULL,
+                "longitud_origen" double precision NULL,
+                "direccion_entrega" text NOT NULL,
+                "latitud_destino" double precision NULL,
+                "longitud_destino" double precision NULL,
+                "geohash_destino" varchar(12) NULL,
+                "metodo_pago" varchar(30) NOT NULL,
+                "comision_repartidor" numeric(6, 2) NOT NULL,
+                "comision_proveedor" numeric(6, 2) NOT NULL,
+                "ganancia_app" numeric(6, 2) NOT NULL,
+                "creado_en" timestamp with time zone NOT NULL,
+                "actualizado_en" timestamp with time zone NOT NULL,
+                "fecha_entregado" timestamp with time zone NULL,
+                "dia_creado" date NOT NULL,
+                "dia_entregado" date NULL,
+                "aceptado_por_repartidor" boolean NOT NULL,
+                "confirmado_por_proveedor" boolean NOT NULL,
+                "cancelado_por" varchar(50) NULL,
+                "archivado_en" timestamp with time zone NOT NULL,
+                PRIMARY KEY ("id", "creado_en")
+            ) PARTITION BY RANGE ("creado_en")
+        ''')
+
+        cursor.execute('DROP TABLE "pedidos_historial_archivo"')
+        cursor.execute('''
+            CREATE TABLE "pedidos_historial_archivo" (
+                "id" bigint NOT NULL,
+                "pedido_id" bigint NOT NULL,
+                "pedido_creado_en" timestamp with time zone NOT NULL,
+                "estado_anterior" varchar(20) NOT NULL,
+                "estado_nuevo" varchar(20) NOT NULL,
+                "fecha_cambio" timestamp with time zone NOT NULL,
+                "usuario_id" bigint NULL,
+                "observaciones" text NOT NULL,
+                PRIMARY KEY ("id", "pedido_creado_en")
+            ) PARTITION BY RANGE ("pedido_creado_en")
+        ''')
+
+        # Los índices de Meta.indexes los crea Django al cerrar la migración
+        # (SQL diferido de CreateModel) sobre estas tablas y se propagan a
+        # cada partición
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0008_dia_local'),
+        ('proveedores', '0003_accionadministrativa_proveedor_total_cambios_ruc_and_more'),
+        ('repartidores', '0004_contadores_calificaciones'),
+        ('usuarios', '0006_solicitudcambiorol_motivo_reversion_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialPedidoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('pedido_id', models.BigIntegerField(verbose_name='Pedido')),
+                ('pedido_creado_en', models.DateTimeField(verbose_name='Creación del Pedido')),
+                ('estado_anterior', models.CharField(choices=[('confirmado', 'Confirmado'), ('en_preparacion', 'En preparación'), ('en_ruta', 'En ruta'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('confirmado', 'Confirmado'), ('en_preparacion', 'En preparación'), ('en_ruta', 'En ruta'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=20)),
+                ('fecha_cambio', models.DateTimeField(verbose_name='Fecha del Cambio')),
+                ('observaciones', models.TextField(blank=True)),
+                ('usuario', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuario que Realizó el Cambio')),
+            ],
+            options={
+                'verbose_name': 'Historial de Pedido Archivado',
+                'verbose_name_plural': 'Historial de Pedidos Archivados',
+                'db_table': 'pedidos_historial_archivo',
+                'ordering': ['-fecha_cambio'],
+                'indexes': [models.Index(fields=['pedido_id', '-fecha_cambio'], name='pedidos_hist_arch_pedido_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PedidoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('proveedor', 'Pedido de Proveedor'), ('directo', 'Encargo Directo')], max_length=20, verbose_name='Tipo de Pedido')),
+                ('estado', models.CharField(choices=[('confirmado', 'Confirmado'), ('en_preparacion', 'En preparación'), ('en_ruta', 'En ruta'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=20, verbose_name='Estado')),
+                ('descripcion', models.TextField(blank=True, verbose_name='Descripción')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Total')),
+                ('direccion_origen', models.TextField(blank=True, null=True, verbose_name='Dirección de Origen')),
+                ('latitud_origen', models.FloatField(blank=True, null=True)),
+                ('longitud_origen', models.FloatField(blank=True, null=True)),
+                ('direccion_entrega', models.TextField(verbose_name='Dirección de Entrega')),
+                ('latitud_destino', models.FloatField(blank=True, null=True)),
+                ('longitud_destino', models.FloatField(blank=True, null=True)),
+                ('geohash_destino', models.CharField(blank=True, max_length=12, null=True)),
+                ('metodo_pago', models.CharField(max_length=30, verbose_name='Método de Pago')),
+                ('comision_repartidor', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('comision_proveedor', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('ganancia_app', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('creado_en', models.DateTimeField(verbose_name='Fecha de Creación')),
+                ('actualizado_en', models.DateTimeField(verbose_name='Última Actualización')),
+                ('fecha_entregado', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Entrega')),
+                ('dia_creado', models.DateField(verbose_name='Día de Creación')),
+                ('dia_entregado', models.DateField(blank=True, null=True, verbose_name='Día de Entrega')),
+                ('aceptado_por_repartidor', models.BooleanField(default=False)),
+                ('confirmado_por_proveedor', models.BooleanField(default=False)),
+                ('cancelado_por', models.CharField(blank=True, max_length=50, null=True)),
+                ('archivado_en', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Archivado')),
+                ('cliente', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='usuarios.perfil', verbose_name='Cliente')),
+                ('proveedor', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='proveedores.proveedor', verbose_name='Proveedor')),
+                ('repartidor', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repartidores.repartidor', verbose_name='Repartidor')),
+            ],
+            options={
+                'verbose_name': 'Pedido Archivado',
+                'verbose_name_plural': 'Pedidos Archivados',
+                'db_table': 'pedidos_archivo',
+                'ordering': ['-creado_en', '-id'],
+                'indexes': [models.Index(fields=['cliente', '-creado_en'], name='pedidos_arch_cliente_idx'), models.Index(fields=['proveedor', '-creado_en'], name='pedidos_arch_proveedor_idx'), models.Index(fields=['repartidor', '-creado_en'], name='pedidos_arch_repart_idx')],
+            },
+        ),
+        migrations.RunPython(particionar_archivo, migrations.RunPython.noop),
+    ]
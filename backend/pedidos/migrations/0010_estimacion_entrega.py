@@ -0,0 +1,114 @@
+# Generated by Django 5.1.7 on 2026-10-16 20:05
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+from utils.geo import distancias_km_pares
+
+# Valores de Pedido al momento de la migración
+VELOCIDAD_PROMEDIO_KMH = 30
+MINUTOS_BASE = {'proveedor': 20, 'directo': 10}
+MINUTOS_LIMITE_SIN_ESTIMADO = 60
+
+
+def _precalcular(modelo, con_fecha_limite):
+    campos = ['distancia_estimada', 'tiempo_estimado_entrega']
+    if con_fecha_limite:
+        campos.append('fecha_limite_entrega')
+
+    pendientes = modelo.objects.only(
+        'id', 'tipo', 'estado', 'actualizado_en',
+        'latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino',
+        # bulk_update lee los campos que escribe: diferidos serían una consulta por fila
+        *campos,
+    ).order_by()
+
+    def guardar(lote):
+        con_coordenadas = [
+            p for p in lote
+            if None not in (p.latitud_origen, p.longitud_origen, p.latitud_destino, p.longitud_destino)
+        ]
+        distancias = distancias_km_pares(
+            [p.latitud_origen for p in con_coordenadas],
+            [p.longitud_origen for p in con_coordenadas],
+            [p.latitud_destino for p in con_coordenadas],
+            [p.longitud_destino for p in con_coordenadas],
+        ) if con_coordenadas else []
+        for pedido, distancia in zip(con_coordenadas, distancias):
+            pedido.distancia_estimada = round(float(distancia), 2)
+            if pedido.distancia_estimada:
+                pedido.tiempo_estimado_entrega = (
+                    int(pedido.distancia_estimada / VELOCIDAD_PROMEDIO_KMH * 60)
+                    + MINUTOS_BASE.get(pedido.tipo, MINUTOS_BASE['directo'])
+                )
+
+        # Antes la salida en ruta se aproximaba con actualizado_en
+        if con_fecha_limite:
+            for pedido in lote:
+                if pedido.estado == 'en_ruta':
+                    pedido.fecha_limite_entrega = pedido.actualizado_en + timedelta(
+                        minutes=pedido.tiempo_estimado_entrega or MINUTOS_LIMITE_SIN_ESTIMADO
+                    )
+
+        modelo.objects.bulk_update(lote, campos)
+
+    lote = []
+    for pedido in pendientes.iterator(chunk_size=2000):
+        lote.append(pedido)
+        if len(lote) >= 2000:
+            guardar(lote)
+            lote = []
+
+    if lote:
+        guardar(lote)
+
+
+def precalcular_existentes(apps, schema_editor):
+    _precalcular(apps.get_model('pedidos', 'Pedido'), con_fecha_limite=True)
+    _precalcular(apps.get_model('pedidos', 'PedidoArchivado'), con_fecha_limite=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0009_archivo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='distancia_estimada',
+            field=models.FloatField(blank=True, editable=False, help_text='Distancia en línea recta de origen a destino (se calcula al guardar)', null=True, verbose_name='Distancia Estimada (km)'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='tiempo_estimado_entrega',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Minutos estimados de entrega (se calcula al guardar)', null=True, verbose_name='Tiempo Estimado (min)'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='fecha_limite_entrega',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Desde este momento el pedido en ruta se considera retrasado', null=True, verbose_name='Fecha Límite de Entrega'),
+        ),
+        migrations.AddField(
+            model_name='pedidoarchivado',
+            name='distancia_estimada',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedidoarchivado',
+            name='tiempo_estimado_entrega',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedidoarchivado',
+            name='fecha_limite_entrega',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(precalcular_existentes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('estado', 'en_ruta')), fields=['fecha_limite_entrega'], name='pedidos_limite_en_ruta_idx'),
+        ),
+    ]
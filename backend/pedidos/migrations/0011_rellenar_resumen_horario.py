@@ -0,0 +1,90 @@
+# Generated by Django 5.1.7 on 2026-10-16 21:20
+
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+CLAVE = ('hora', 'proveedor_id', 'repartidor_id', 'estado', 'tipo')
+CEROS = {
+    'pedidos': 0,
+    'total': Decimal('0'),
+    'ganancia_app': Decimal('0'),
+    'comision_repartidor': Decimal('0'),
+    'comision_proveedor': Decimal('0'),
+    'entregas_con_tiempo': 0,
+    'duracion': timedelta(),
+}
+
+
+def rellenar_resumen(apps, schema_editor):
+    """
+    Construye ResumenPedidoHora con todos los pedidos existentes (activos
+    y archivados), igual que pedidos.resumen.reconciliar sin ventana.
+    Las celdas que ya se hubieran escrito por incrementos se reemplazan.
+    """
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    PedidoArchivado = apps.get_model('pedidos', 'PedidoArchivado')
+    ResumenPedidoHora = apps.get_model('pedidos', 'ResumenPedidoHora')
+
+    entregado = Q(estado='entregado')
+    con_tiempo = entregado & Q(fecha_entregado__isnull=False)
+
+    sumas = {}
+    for modelo in (Pedido, PedidoArchivado):
+        filas = (
+            modelo.objects.order_by()
+            .annotate(hora=TruncHour('creado_en', tzinfo=dt_timezone.utc))
+            .values(*CLAVE)
+            .annotate(
+                s_pedidos=Count('id'),
+                s_total=Sum('total'),
+                s_ganancia_app=Sum('ganancia_app', filter=entregado),
+                s_comision_repartidor=Sum('comision_repartidor', filter=entregado),
+                s_comision_proveedor=Sum('comision_proveedor', filter=entregado),
+                s_entregas_con_tiempo=Count('id', filter=con_tiempo),
+                s_duracion=Sum(
+                    ExpressionWrapper(F('fecha_entregado') - F('creado_en'), output_field=DurationField()),
+                    filter=con_tiempo,
+                ),
+            )
+        )
+        for fila in filas.iterator(chunk_size=2000):
+            celda = sumas.setdefault(tuple(fila[campo] for campo in CLAVE), dict(CEROS))
+            for campo, cero in CEROS.items():
+                celda[campo] += fila[f's_{campo}'] or cero
+
+    ahora = timezone.now()
+    ResumenPedidoHora.objects.all().delete()
+    ResumenPedidoHora.objects.bulk_create(
+        (
+            ResumenPedidoHora(
+                **dict(zip(CLAVE, clave)),
+                pedidos=suma['pedidos'],
+                total=suma['total'],
+                ganancia_app=suma['ganancia_app'],
+                comision_repartidor=suma['comision_repartidor'],
+                comision_proveedor=suma['comision_proveedor'],
+                entregas_con_tiempo=suma['entregas_con_tiempo'],
+                segundos_entrega=int(suma['duracion'].total_seconds()),
+                actualizado_en=ahora,
+            )
+            for clave, suma in sumas.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0010_estimacion_entrega'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_resumen, migrations.RunPython.noop),
+    ]
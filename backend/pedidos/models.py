@@ -10,7 +10,10 @@ Modelo de Pedidos con validaciones robustas y métodos optimizados.
 - Documentación completa
 - Logging mejorado
 """
-from django.db import models
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.db.models import Q, F, Count, Sum
@@ -18,6 +21,9 @@ from django.utils.functional import cached_property
 from usuarios.models import Perfil
 from repartidores.models import Repartidor, EstadoRepartidor
 from proveedores.models import Proveedor
+from utils.fechas import DiaLocal
+from utils.geo import codificar_geohash, distancia_haversine_km
+from . import rutas, tiempos_viaje, transiciones
 import logging
 
 logger = logging.getLogger('pedidos')
@@ -86,8 +92,7 @@ class PedidoManager(models.Manager):
 
     def del_dia(self):
         """Pedidos creados hoy"""
-        hoy = timezone.now().date()
-        return self.filter(creado_en__date=hoy)
+        return self.filter(dia_creado=timezone.localdate())
 
     def por_proveedor(self, proveedor_id):
         """Pedidos de un proveedor específico"""
@@ -101,19 +106,20 @@ class PedidoManager(models.Manager):
         """Pedidos de un cliente específico"""
         return self.filter(cliente_id=cliente_id)
 
-    def con_retraso(self, minutos=60):
+    def con_retraso(self, minutos=0, ahora=None):
         """
-        ✅ NUEVO: Pedidos en ruta con retraso
+        ✅ Pedidos en ruta que pasaron su fecha límite de entrega
+        (rango sobre el índice parcial pedidos_limite_en_ruta_idx)
 
         Args:
-            minutos (int): Minutos de tolerancia antes de considerar retraso
+            minutos (int): Minutos de tolerancia después de la fecha límite
+            ahora (datetime): Momento de referencia (por defecto, ahora)
         """
-        from datetime import timedelta
-        tiempo_limite = timezone.now() - timedelta(minutes=minutos)
+        tiempo_limite = (ahora or timezone.now()) - timedelta(minutes=minutos)
 
         return self.filter(
             estado=EstadoPedido.EN_RUTA,
-            actualizado_en__lt=tiempo_limite
+            fecha_limite_entrega__lt=tiempo_limite
         )
 
     def estadisticas_del_dia(self):
@@ -123,8 +129,7 @@ class PedidoManager(models.Manager):
         Returns:
             dict: Estadísticas completas
         """
-        hoy = timezone.now().date()
-        pedidos_hoy = self.filter(creado_en__date=hoy)
+        pedidos_hoy = self.filter(dia_creado=timezone.localdate())
 
         return pedidos_hoy.aggregate(
             total_pedidos=Count('id'),
@@ -264,6 +269,33 @@ class Pedido(models.Model):
         help_text='Longitud de la dirección de entrega'
     )
 
+    geohash_destino = models.CharField(
+        max_length=12,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Geohash Destino',
+        help_text='Celda geohash del destino (se calcula al guardar)'
+    )
+
+    # ✅ Distancia y tiempo estimado: se calculan al guardar cuando cambian
+    # coordenadas, tipo o estado (serializers y filtros leen la columna)
+    distancia_estimada = models.FloatField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Distancia Estimada (km)',
+        help_text='Distancia en línea recta de origen a destino (se calcula al guardar)'
+    )
+
+    tiempo_estimado_entrega = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Tiempo Estimado (min)',
+        help_text='Minutos estimados de entrega (se calcula al guardar)'
+    )
+
     # ==========================================================
     # PAGO Y COMISIONES
     # ==========================================================
@@ -319,6 +351,30 @@ class Pedido(models.Model):
         help_text='Fecha y hora en que se entregó el pedido'
     )
 
+    fecha_limite_entrega = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Fecha Límite de Entrega',
+        help_text='Desde este momento el pedido en ruta se considera retrasado'
+    )
+
+    # ✅ Fechas locales (America/Guayaquil) calculadas por la BD, para
+    # filtrar por día con índice en lugar de creado_en__date
+    dia_creado = models.GeneratedField(
+        expression=DiaLocal('creado_en'),
+        output_field=models.DateField(),
+        db_persist=True,
+        verbose_name='Día de Creación'
+    )
+
+    dia_entregado = models.GeneratedField(
+        expression=DiaLocal('fecha_entregado'),
+        output_field=models.DateField(null=True),
+        db_persist=True,
+        verbose_name='Día de Entrega'
+    )
+
     # ==========================================================
     # CONTROL DE ESTADO
     # ==========================================================
@@ -352,22 +408,39 @@ class Pedido(models.Model):
     # ==========================================================
     class Meta:
         db_table = 'pedidos'
-        ordering = ['-creado_en']
+        ordering = ['-creado_en', '-id']
         verbose_name = 'Pedido'
         verbose_name_plural = 'Pedidos'
 
         indexes = [
-            models.Index(fields=['-creado_en']),
+            # ✅ Índices de la paginación por cursor (creado_en, id), global
+            # y por cada listado de rol
+            models.Index(fields=['-creado_en', '-id'], name='pedidos_creado_id_idx'),
+            models.Index(fields=['cliente', '-creado_en', '-id'], name='pedidos_cliente_cursor_idx'),
+            models.Index(fields=['proveedor', '-creado_en', '-id'], name='pedidos_proveedor_cursor_idx'),
+            models.Index(fields=['repartidor', '-creado_en', '-id'], name='pedidos_repart_cursor_idx'),
             models.Index(fields=['estado']),
             models.Index(fields=['tipo']),
-            models.Index(fields=['cliente']),
-            models.Index(fields=['proveedor']),
-            models.Index(fields=['repartidor']),
             # ✅ Índice compuesto para búsquedas comunes
             models.Index(fields=['estado', 'repartidor']),
             models.Index(fields=['estado', 'creado_en']),
+            # ✅ Índices por día local
+            models.Index(fields=['dia_creado', 'estado'], name='pedidos_dia_creado_idx'),
+            models.Index(fields=['dia_entregado'], name='pedidos_dia_entregado_idx'),
+            # ✅ Detección de retrasos: rango sobre la fecha límite de los pedidos en ruta
+            models.Index(
+                fields=['fecha_limite_entrega'],
+                name='pedidos_limite_en_ruta_idx',
+                condition=Q(estado=EstadoPedido.EN_RUTA)
+            ),
             # ✅ Índice para búsquedas geográficas
             models.Index(fields=['latitud_destino', 'longitud_destino']),
+            # ✅ Índice por celda geohash (búsquedas por prefijo con LIKE)
+            models.Index(
+                fields=['geohash_destino'],
+                name='pedidos_geohash_dest_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
         ]
 
         constraints = [
@@ -400,6 +473,25 @@ class Pedido(models.Model):
             ),
         ]
 
+    # Estados desde los que un repartidor puede aceptar el pedido
+    ESTADOS_ACEPTABLES = (EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION)
+
+    # Reparto del total al entregar: {tipo: (repartidor, proveedor, app)}.
+    # También lo usa la tarea pedidos.recalcular_comisiones en SQL
+    PORCENTAJES_GANANCIAS = {
+        TipoPedido.PROVEEDOR: (Decimal('0.25'), Decimal('0.65'), Decimal('0.10')),
+        TipoPedido.DIRECTO: (Decimal('0.85'), Decimal('0'), Decimal('0.15')),
+    }
+
+    # Estimación de entrega: matriz de tiempos aprendida (pedidos/tiempos_viaje.py)
+    # Plazo en ruta cuando no hay tiempo estimado (sin coordenadas)
+    MINUTOS_LIMITE_SIN_ESTIMADO = 60
+
+    # Campos de los que dependen distancia, tiempo estimado y fecha límite
+    CAMPOS_ESTIMACION = {
+        'latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino', 'tipo', 'estado',
+    }
+
     # ==========================================================
     # MÉTODOS BÁSICOS
     # ==========================================================
@@ -412,6 +504,133 @@ class Pedido(models.Model):
             f"cliente={self.cliente_id} total={self.total}>"
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Estado y repartidor cargados: base de la transición que emite save()
+        instance = super().from_db(db, field_names, values)
+        if 'estado' in field_names and 'repartidor_id' in field_names:
+            instance._guardado = (instance.estado, instance.repartidor_id)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Mantiene sincronizados el geohash del destino, la distancia, el
+        tiempo estimado y la fecha límite con coordenadas y estado y, una
+        vez guardado, emite la transición de estado (pedidos.transiciones).
+        """
+        guardado = (transiciones.CREADO, None) if self._state.adding else self._estado_guardado()
+
+        self.geohash_destino = self._calcular_geohash_destino()
+        self._precalcular_entrega(guardado[0])
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            campos = set(update_fields)
+            if {'latitud_destino', 'longitud_destino'} & campos:
+                campos.add('geohash_destino')
+            if self.CAMPOS_ESTIMACION & campos:
+                campos |= {'distancia_estimada', 'tiempo_estimado_entrega', 'fecha_limite_entrega'}
+            kwargs['update_fields'] = campos
+
+        # Misma transacción para el pedido, sus consumidores síncronos y el outbox
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            self._emitir_transicion(guardado, kwargs.get('update_fields'))
+
+    def _estado_guardado(self):
+        """(estado, repartidor_id) en la base de datos antes de este guardado"""
+        guardado = getattr(self, '_guardado', None)
+        if guardado is not None:
+            return guardado
+
+        # Instancia cargada sin esos campos o construida a mano
+        fila = Pedido.objects.filter(pk=self.pk).values_list('estado', 'repartidor_id').first()
+        return fila or (transiciones.CREADO, None)
+
+    def _emitir_transicion(self, guardado, update_fields):
+        anterior, repartidor_anterior_id = guardado
+        campos = None if update_fields is None else set(update_fields)
+
+        nuevo = self.estado if campos is None or 'estado' in campos else anterior
+        repartidor_id = (
+            self.repartidor_id
+            if campos is None or {'repartidor', 'repartidor_id'} & campos
+            else repartidor_anterior_id
+        )
+
+        # Se actualiza antes de emitir: un consumidor que vuelva a guardar
+        # el pedido no repite la transición
+        self._guardado = (nuevo, repartidor_id)
+
+        transiciones.emitir(
+            self, anterior, nuevo,
+            repartidor_asignado=repartidor_anterior_id is None and repartidor_id is not None,
+        )
+
+    def _calcular_geohash_destino(self):
+        """Geohash del destino (None si no hay coordenadas)"""
+        if not self.tiene_ubicacion_completa:
+            return None
+
+        return codificar_geohash(
+            float(self.latitud_destino),
+            float(self.longitud_destino)
+        )
+
+    def _calcular_distancia(self):
+        """Distancia origen → destino en km (None si no hay coordenadas)"""
+        if not (self.tiene_ubicacion_completa and self.tiene_ubicacion_origen):
+            return None
+
+        distancia = distancia_haversine_km(
+            self.latitud_origen, self.longitud_origen,
+            self.latitud_destino, self.longitud_destino,
+        )
+        return round(distancia, 2)
+
+    def _calcular_tiempo_estimado(self):
+        """
+        Minutos estimados de entrega (None si no hay distancia): espera
+        típica del tipo de pedido más el viaje entre las celdas de origen
+        y destino según la matriz de tiempos.
+        """
+        if not self.distancia_estimada:
+            return None
+
+        viaje = tiempos_viaje.minutos_viaje_pares(
+            self.latitud_origen, self.longitud_origen,
+            self.latitud_destino, self.longitud_destino,
+            distancias_km=self.distancia_estimada,
+        )
+        return int(float(viaje)) + int(tiempos_viaje.minutos_espera(self.tipo))
+
+    def calcular_fecha_limite(self, desde):
+        """Fecha límite de un pedido que sale en ruta en `desde`"""
+        return desde + timedelta(
+            minutes=self.tiempo_estimado_entrega or self.MINUTOS_LIMITE_SIN_ESTIMADO
+        )
+
+    def _precalcular_entrega(self, estado_anterior):
+        """
+        Recalcula distancia y tiempo estimado. La fecha límite se fija al
+        salir en ruta, se corrige si el tiempo estimado cambia durante la
+        ruta y se conserva al entregar o cancelar.
+        """
+        tiempo_anterior = self.tiempo_estimado_entrega
+        self.distancia_estimada = self._calcular_distancia()
+        self.tiempo_estimado_entrega = self._calcular_tiempo_estimado()
+
+        if self.estado in (EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION):
+            self.fecha_limite_entrega = None
+        elif self.estado == EstadoPedido.EN_RUTA:
+            if estado_anterior != EstadoPedido.EN_RUTA or self.fecha_limite_entrega is None:
+                self.fecha_limite_entrega = self.calcular_fecha_limite(timezone.now())
+            elif self.tiempo_estimado_entrega != tiempo_anterior:
+                self.fecha_limite_entrega += timedelta(minutes=(
+                    (self.tiempo_estimado_entrega or self.MINUTOS_LIMITE_SIN_ESTIMADO)
+                    - (tiempo_anterior or self.MINUTOS_LIMITE_SIN_ESTIMADO)
+                ))
+
     # ==========================================================
     # ✅ VALIDACIONES
     # ==========================================================
@@ -476,61 +695,89 @@ class Pedido(models.Model):
 
     def aceptar_por_repartidor(self, repartidor):
         """
-        ✅ MEJORADO: Repartidor acepta el pedido con validaciones robustas
+        ✅ Repartidor acepta el pedido con un UPDATE condicional
+
+        La aceptación es un compare-and-set sobre la fila del pedido:
+
+            UPDATE pedidos SET repartidor_id = ..., estado = ...
+            WHERE id = ... AND repartidor_id IS NULL AND estado = <estado leído>
+
+        y el repartidor pasa a OCUPADO con otro UPDATE condicional en la misma
+        transacción. Con muchos repartidores aceptando a la vez, el conteo de
+        filas decide: gana exactamente uno y el resto recibe ValidationError
+        sin haber bloqueado ni releído la fila.
+
+        Si el repartidor ya está OCUPADO y se permiten varios pedidos por
+        repartidor, el pedido se suma a su ruta (ver pedidos/rutas.py).
 
         Args:
             repartidor (Repartidor): Instancia del repartidor que acepta
 
         Raises:
-            ValidationError: Si el pedido no puede ser aceptado
+            ValidationError: Si el pedido no puede ser aceptado o ya lo tomó otro
         """
-        # Validar estado del pedido
-        if self.estado in [EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO]:
+        # Validaciones en memoria: rechazan rápido los casos obvios
+        if self.estado not in self.ESTADOS_ACEPTABLES:
             raise ValidationError(
                 f"No se puede aceptar un pedido en estado '{self.get_estado_display()}'."
             )
 
-        # Validar que no esté ya asignado
-        if self.repartidor and self.repartidor != repartidor:
+        if self.repartidor_id and self.repartidor_id != repartidor.pk:
             raise ValidationError(
                 f"El pedido ya fue tomado por {self.repartidor.user.get_full_name()}."
             )
 
-        # Validar disponibilidad del repartidor
-        if repartidor.estado != EstadoRepartidor.DISPONIBLE:
+        if self.repartidor_id == repartidor.pk:
+            # Reintento del mismo repartidor: ya es suyo
+            return
+
+        if repartidor.estado != EstadoRepartidor.DISPONIBLE and not (
+            repartidor.estado == EstadoRepartidor.OCUPADO and rutas.acepta_varios()
+        ):
             raise ValidationError(
                 f"El repartidor no está disponible. Estado: {repartidor.get_estado_display()}"
             )
 
-        # Asignar repartidor
-        self.repartidor = repartidor
-        self.aceptado_por_repartidor = True
-
-        # Cambiar estado según tipo de pedido
-        if self.tipo == TipoPedido.PROVEEDOR:
-            self.estado = EstadoPedido.EN_PREPARACION
-            logger.info(
-                f"✅ Pedido #{self.pk} aceptado por repartidor {repartidor.user.email}. "
-                f"Estado: EN_PREPARACION"
-            )
-        else:
-            self.estado = EstadoPedido.EN_RUTA
-            logger.info(
-                f"✅ Pedido #{self.pk} (directo) aceptado por repartidor {repartidor.user.email}. "
-                f"Estado: EN_RUTA"
+        anterior = self.estado
+        nuevo = EstadoPedido.EN_PREPARACION if self.tipo == TipoPedido.PROVEEDOR else EstadoPedido.EN_RUTA
+        ahora = timezone.now()
+        fecha_limite = self.calcular_fecha_limite(ahora) if nuevo == EstadoPedido.EN_RUTA else None
+
+        with transaction.atomic():
+            ganado = Pedido.objects.filter(
+                pk=self.pk, repartidor__isnull=True, estado=anterior
+            ).update(
+                repartidor=repartidor,
+                aceptado_por_repartidor=True,
+                estado=nuevo,
+                actualizado_en=ahora,
+                fecha_limite_entrega=fecha_limite,
             )
 
-        self.save(update_fields=[
-            'repartidor',
-            'aceptado_por_repartidor',
-            'estado',
-            'actualizado_en'
-        ])
+            if not ganado:
+                if Pedido.objects.filter(pk=self.pk, repartidor=repartidor).exists():
+                    return
+                raise ValidationError("El pedido ya fue tomado por otro repartidor.")
+
+            # Si el repartidor ya no está disponible (ni puede sumarlo a su
+            # ruta) se deshace la aceptación
+            if not repartidor.ocupar_si_disponible():
+                rutas.validar_sumar(repartidor, self)
+                repartidor.estado = EstadoRepartidor.OCUPADO
 
-        # Marcar repartidor como ocupado
-        repartidor.marcar_ocupado()
+            self.repartidor = repartidor
+            self.aceptado_por_repartidor = True
+            self.estado = nuevo
+            self.actualizado_en = ahora
+            self.fecha_limite_entrega = fecha_limite
+            self._guardado = (nuevo, repartidor.pk)
 
-        # Notificar (se hace en signal)
+            transiciones.emitir(self, anterior, nuevo, repartidor_asignado=True)
+
+        logger.info(
+            f"✅ Pedido #{self.pk} aceptado por repartidor {repartidor.user.email}. "
+            f"Estado: {nuevo}"
+        )
 
     def confirmar_por_proveedor(self):
         """
@@ -564,7 +811,7 @@ class Pedido(models.Model):
             f"✅ Pedido #{self.pk} confirmado por proveedor {self.proveedor.nombre}"
         )
 
-        # Notificar (se hace en signal)
+        # Notificar (se hace en pedidos.transiciones)
 
     def marcar_en_preparacion(self):
         """
@@ -638,26 +885,35 @@ class Pedido(models.Model):
         self.estado = EstadoPedido.ENTREGADO
         self.fecha_entregado = timezone.now()
 
-        self.save(update_fields=['estado', 'fecha_entregado', 'actualizado_en'])
+        # Ganancias en el mismo guardado: la transición ya las lleva calculadas
+        self._distribuir_ganancias(guardar=False)
+
+        self.save(update_fields=[
+            'estado',
+            'fecha_entregado',
+            'comision_repartidor',
+            'comision_proveedor',
+            'ganancia_app',
+            'actualizado_en'
+        ])
 
         logger.info(
             f"✅ Pedido #{self.pk} marcado como ENTREGADO. "
             f"Repartidor: {self.repartidor.user.email}, Total: ${self.total}"
         )
 
-        # Liberar repartidor
+        # Liberar repartidor (si no lleva otros pedidos; fila bloqueada)
         if self.repartidor:
             try:
-                self.repartidor.marcar_fuera_servicio("pedido completado")
+                with transaction.atomic():
+                    if rutas.bloquear_libres([self.repartidor_id]):
+                        self.repartidor.marcar_fuera_servicio("pedido completado")
             except Exception as e:
                 logger.warning(
                     f"No se pudo actualizar estado del repartidor: {e}"
                 )
 
-        # Distribuir ganancias
-        self._distribuir_ganancias()
-
-        # Notificar (se hace en signal)
+        # Notificar (se hace en pedidos.transiciones)
 
     def cancelar(self, motivo, actor):
         """
@@ -687,40 +943,51 @@ class Pedido(models.Model):
             f"Motivo: {motivo}. Estado anterior: {estado_anterior}"
         )
 
-        # Liberar repartidor si estaba asignado
+        # Liberar repartidor si estaba asignado (y no lleva otros pedidos; fila bloqueada)
         if self.repartidor:
             try:
-                self.repartidor.marcar_disponible()
-                logger.info(
-                    f"✅ Repartidor {self.repartidor.user.email} liberado"
-                )
+                with transaction.atomic():
+                    if rutas.bloquear_libres([self.repartidor_id]):
+                        self.repartidor.marcar_disponible()
+                        logger.info(
+                            f"✅ Repartidor {self.repartidor.user.email} liberado"
+                        )
             except Exception as e:
                 logger.error(
                     f"Error al liberar repartidor: {e}"
                 )
 
-        # Notificar (se hace en signal)
+        # Notificar (se hace en pedidos.transiciones)
 
     # ==========================================================
     # ✅ LÓGICA DE NEGOCIO (MEJORADA)
     # ==========================================================
 
-    def _distribuir_ganancias(self):
+    def _distribuir_ganancias(self, guardar=True):
         """
         ✅ MEJORADO: Distribuye el total del pedido con validación
 
         Distribución:
         - Pedido de Proveedor: 25% repartidor, 65% proveedor, 10% app
         - Encargo Directo: 85% repartidor, 15% app
+
+        Args:
+            guardar (bool): Si es False solo calcula (lo guarda quien llama)
         """
-        total = float(self.total)
+        total = Decimal(str(self.total))
+        repartidor, proveedor, app = self.PORCENTAJES_GANANCIAS.get(
+            self.tipo, self.PORCENTAJES_GANANCIAS[TipoPedido.DIRECTO]
+        )
 
-        if self.tipo == TipoPedido.PROVEEDOR:
-            # 25% repartidor, 65% proveedor, 10% app
-            self.comision_repartidor = round(total * 0.25, 2)
-            self.comision_proveedor = round(total * 0.65, 2)
-            self.ganancia_app = round(total * 0.10, 2)
+        def parte(porcentaje):
+            # Mismo redondeo que ROUND(numeric, 2) de Postgres en recalcular_comisiones
+            return (total * porcentaje).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+        self.comision_repartidor = parte(repartidor)
+        self.comision_proveedor = parte(proveedor)
+        self.ganancia_app = parte(app)
+
+        if self.tipo == TipoPedido.PROVEEDOR:
             logger.info(
                 f"💰 Ganancias distribuidas (Proveedor) - Pedido #{self.pk}: "
                 f"Repartidor: ${self.comision_repartidor}, "
@@ -728,11 +995,6 @@ class Pedido(models.Model):
                 f"App: ${self.ganancia_app}"
             )
         else:
-            # Encargo directo: 85% repartidor, 15% app
-            self.comision_repartidor = round(total * 0.85, 2)
-            self.ganancia_app = round(total * 0.15, 2)
-            self.comision_proveedor = 0
-
             logger.info(
                 f"💰 Ganancias distribuidas (Directo) - Pedido #{self.pk}: "
                 f"Repartidor: ${self.comision_repartidor}, "
@@ -741,14 +1003,17 @@ class Pedido(models.Model):
 
         # ✅ Validar que la suma sea correcta (con tolerancia de 2 centavos)
         suma = self.comision_repartidor + self.comision_proveedor + self.ganancia_app
-        diferencia = abs(total - float(suma))
+        diferencia = abs(total - suma)
 
-        if diferencia > 0.02:
+        if diferencia > Decimal('0.02'):
             logger.warning(
                 f"⚠️ Discrepancia en distribución de ganancias - Pedido #{self.pk}: "
                 f"Total: ${total}, Suma: ${suma}, Diferencia: ${diferencia}"
             )
 
+        if not guardar:
+            return
+
         self.save(update_fields=[
             'comision_repartidor',
             'comision_proveedor',
@@ -831,80 +1096,20 @@ class Pedido(models.Model):
             self.longitud_origen is not None
         )
 
-    @cached_property
-    def distancia_estimada(self):
-        """
-        ✅ NUEVO: Calcula distancia aproximada entre origen y destino
-
-        Returns:
-            float: Distancia en kilómetros (None si no hay coordenadas)
-        """
-        if not (self.tiene_ubicacion_completa and self.tiene_ubicacion_origen):
-            return None
-
-        from math import radians, sin, cos, sqrt, atan2
-
-        # Radio de la Tierra en km
-        R = 6371.0
-
-        # Convertir a radianes
-        lat1 = radians(self.latitud_origen)
-        lon1 = radians(self.longitud_origen)
-        lat2 = radians(self.latitud_destino)
-        lon2 = radians(self.longitud_destino)
-
-        # Fórmula de Haversine
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        distancia = R * c
-        return round(distancia, 2)
-
-    @property
-    def tiempo_estimado_entrega(self):
-        """
-        ✅ NUEVO: Estima tiempo de entrega en minutos
-
-        Returns:
-            int: Minutos estimados (None si no se puede calcular)
-        """
-        distancia = self.distancia_estimada
-        if not distancia:
-            return None
-
-        # Estimación: 30 km/h promedio en ciudad
-        velocidad_promedio = 30  # km/h
-        tiempo_horas = distancia / velocidad_promedio
-        tiempo_minutos = int(tiempo_horas * 60)
-
-        # Agregar tiempo base según tipo
-        if self.tipo == TipoPedido.PROVEEDOR:
-            tiempo_minutos += 20  # 20 min preparación
-        else:
-            tiempo_minutos += 10  # 10 min encargo
-
-        return tiempo_minutos
-
     @property
     def esta_retrasado(self):
         """
-        ✅ NUEVO: Determina si el pedido está retrasado
+        ✅ Determina si el pedido está retrasado (en ruta y pasada su
+        fecha límite de entrega)
 
         Returns:
             bool: True si está retrasado
         """
-        if self.estado != EstadoPedido.EN_RUTA:
-            return False
-
-        # Calcular tiempo desde que salió en ruta
-        tiempo_en_ruta = timezone.now() - self.actualizado_en
-        minutos_transcurridos = tiempo_en_ruta.total_seconds() / 60
-
-        # Considerar retrasado si lleva más de 60 minutos
-        tiempo_limite = self.tiempo_estimado_entrega or 60
-        return minutos_transcurridos > tiempo_limite
+        return (
+            self.estado == EstadoPedido.EN_RUTA
+            and self.fecha_limite_entrega is not None
+            and timezone.now() > self.fecha_limite_entrega
+        )
 
     @property
     def porcentaje_comision_repartidor(self):
@@ -1029,7 +1234,7 @@ class Pedido(models.Model):
             )
 
         # Validaciones adicionales según estado destino
-        if nuevo_estado == EstadoPedido.EN_RUTA and not self.repartidor:
+        if nuevo_estado == EstadoPedido.EN_RUTA and not self.repartidor_id:
             return False, "No se puede marcar 'En ruta' sin repartidor asignado"
 
         return True, "Transición válida"
@@ -1044,7 +1249,7 @@ class Pedido(models.Model):
         """
         return cls.objects.aggregate(
             total_pedidos=Count('id'),
-            pedidos_hoy=Count('id', filter=Q(creado_en__date=timezone.now().date())),
+            pedidos_hoy=Count('id', filter=Q(dia_creado=timezone.localdate())),
             pedidos_activos=Count('id', filter=Q(
                 estado__in=[EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION, EstadoPedido.EN_RUTA]
             )),
@@ -1120,6 +1325,359 @@ class HistorialPedido(models.Model):
         )
 
 
+# ==========================================================
+# 📬 OUTBOX DE EFECTOS SECUNDARIOS
+# ==========================================================
+
+class EventoPedido(models.Model):
+    """
+    Outbox de las transiciones de pedidos.
+
+    Una fila por consumidor diferido y transición, escrita en la misma
+    transacción que el cambio de estado. La procesa por lotes la tarea
+    `pedidos.drenar_outbox` (entrega al menos una vez; ver pedidos/outbox.py).
+    """
+    clave = models.CharField(
+        max_length=200,
+        unique=True,
+        verbose_name='Clave de Idempotencia',
+        help_text='<evento>:<consumidor>'
+    )
+
+    pedido = models.ForeignKey(
+        Pedido,
+        on_delete=models.CASCADE,
+        related_name='eventos_outbox',
+        verbose_name='Pedido'
+    )
+
+    consumidor = models.CharField(
+        max_length=150,
+        verbose_name='Consumidor'
+    )
+
+    estado_anterior = models.CharField(
+        max_length=20,
+        choices=EstadoPedido.choices,
+        null=True,
+        blank=True,
+        verbose_name='Estado Anterior',
+        help_text='Vacío cuando el evento es la creación del pedido'
+    )
+
+    estado_nuevo = models.CharField(
+        max_length=20,
+        choices=EstadoPedido.choices,
+        verbose_name='Estado Nuevo'
+    )
+
+    repartidor_asignado = models.BooleanField(default=False)
+
+    creado_en = models.DateTimeField(default=timezone.now, verbose_name='Creado')
+
+    disponible_en = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Disponible Desde',
+        help_text='No se procesa antes (reintentos y reservas del drenado)'
+    )
+
+    intentos = models.PositiveSmallIntegerField(default=0)
+
+    procesado_en = models.DateTimeField(null=True, blank=True, verbose_name='Procesado')
+
+    fallido = models.BooleanField(
+        default=False,
+        help_text='Se agotaron los reintentos'
+    )
+
+    ultimo_error = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'pedidos_outbox'
+        ordering = ['id']
+        verbose_name = 'Evento de Pedido (Outbox)'
+        verbose_name_plural = 'Eventos de Pedidos (Outbox)'
+        indexes = [
+            models.Index(
+                fields=['disponible_en'],
+                name='outbox_pendientes_idx',
+                condition=Q(procesado_en__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Pedido #{self.pedido_id}: {self.estado_anterior} → {self.estado_nuevo} [{self.consumidor}]"
+
+
+# ==========================================================
+# 📊 RESUMEN HORARIO DE PEDIDOS (ROLLUP)
+# ==========================================================
+
+class ResumenPedidoHora(models.Model):
+    """
+    Acumulados por hora de creación × proveedor × repartidor × estado × tipo.
+
+    Cada transición de un pedido mueve su aporte de la celda anterior a la
+    nueva (ver pedidos/resumen.py), en la misma transacción. Los montos de
+    comisiones y el tiempo de entrega solo se acumulan en las celdas
+    ENTREGADO. La tarea `pedidos.reconciliar_resumen_horario` recalcula una
+    ventana desde los pedidos.
+    """
+    hora = models.DateTimeField(
+        verbose_name='Hora',
+        help_text='Inicio de la hora de creación de los pedidos'
+    )
+
+    proveedor = models.ForeignKey(
+        Proveedor,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Proveedor'
+    )
+
+    repartidor = models.ForeignKey(
+        Repartidor,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Repartidor'
+    )
+
+    estado = models.CharField(
+        max_length=20,
+        choices=EstadoPedido.choices,
+        verbose_name='Estado'
+    )
+
+    tipo = models.CharField(
+        max_length=20,
+        choices=TipoPedido.choices,
+        verbose_name='Tipo de Pedido'
+    )
+
+    pedidos = models.IntegerField(default=0, verbose_name='Pedidos')
+
+    total = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name='Total'
+    )
+
+    ganancia_app = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name='Ganancia App'
+    )
+
+    comision_repartidor = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name='Comisión Repartidor'
+    )
+
+    comision_proveedor = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name='Comisión Proveedor'
+    )
+
+    entregas_con_tiempo = models.IntegerField(
+        default=0,
+        verbose_name='Entregas con Tiempo',
+        help_text='Entregados con fecha de entrega (base del tiempo promedio)'
+    )
+
+    segundos_entrega = models.BigIntegerField(
+        default=0,
+        verbose_name='Segundos de Entrega',
+        help_text='Suma de (fecha_entregado - creado_en)'
+    )
+
+    actualizado_en = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Última Actualización'
+    )
+
+    class Meta:
+        db_table = 'pedidos_resumen_hora'
+        ordering = ['-hora']
+        verbose_name = 'Resumen Horario de Pedidos'
+        verbose_name_plural = 'Resúmenes Horarios de Pedidos'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hora', 'proveedor', 'repartidor', 'estado', 'tipo'],
+                name='resumen_hora_celda_unica',
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['proveedor', 'hora'], name='resumen_hora_proveedor_idx'),
+            models.Index(fields=['repartidor', 'hora'], name='resumen_hora_repartidor_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.hora:%Y-%m-%d %H}h {self.estado}/{self.tipo}: {self.pedidos}"
+
+
+# ==========================================================
+# 🗄️ ARCHIVO DE PEDIDOS (ALMACENAMIENTO FRÍO)
+# ==========================================================
+
+class PedidoArchivado(models.Model):
+    """
+    Pedidos finalizados que salieron de la tabla activa (ver
+    pedidos/archivo.py). Mismas columnas que Pedido, sin restricciones de
+    clave foránea. En Postgres la tabla está particionada por mes sobre
+    `creado_en`: la PK real es (id, creado_en).
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+
+    cliente = models.ForeignKey(
+        Perfil,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+        verbose_name='Cliente'
+    )
+
+    proveedor = models.ForeignKey(
+        Proveedor,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Proveedor'
+    )
+
+    repartidor = models.ForeignKey(
+        Repartidor,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Repartidor'
+    )
+
+    tipo = models.CharField(max_length=20, choices=TipoPedido.choices, verbose_name='Tipo de Pedido')
+    estado = models.CharField(max_length=20, choices=EstadoPedido.choices, verbose_name='Estado')
+    descripcion = models.TextField(blank=True, verbose_name='Descripción')
+    total = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Total')
+
+    direccion_origen = models.TextField(null=True, blank=True, verbose_name='Dirección de Origen')
+    latitud_origen = models.FloatField(null=True, blank=True)
+    longitud_origen = models.FloatField(null=True, blank=True)
+    direccion_entrega = models.TextField(verbose_name='Dirección de Entrega')
+    latitud_destino = models.FloatField(null=True, blank=True)
+    longitud_destino = models.FloatField(null=True, blank=True)
+    geohash_destino = models.CharField(max_length=12, null=True, blank=True)
+    distancia_estimada = models.FloatField(null=True, blank=True)
+    tiempo_estimado_entrega = models.PositiveIntegerField(null=True, blank=True)
+
+    metodo_pago = models.CharField(max_length=30, verbose_name='Método de Pago')
+    comision_repartidor = models.DecimalField(max_digits=6, decimal_places=2)
+    comision_proveedor = models.DecimalField(max_digits=6, decimal_places=2)
+    ganancia_app = models.DecimalField(max_digits=6, decimal_places=2)
+
+    creado_en = models.DateTimeField(verbose_name='Fecha de Creación')
+    actualizado_en = models.DateTimeField(verbose_name='Última Actualización')
+    fecha_entregado = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de Entrega')
+    fecha_limite_entrega = models.DateTimeField(null=True, blank=True)
+    # Copias de las columnas generadas de Pedido
+    dia_creado = models.DateField(verbose_name='Día de Creación')
+    dia_entregado = models.DateField(null=True, blank=True, verbose_name='Día de Entrega')
+
+    aceptado_por_repartidor = models.BooleanField(default=False)
+    confirmado_por_proveedor = models.BooleanField(default=False)
+    cancelado_por = models.CharField(max_length=50, null=True, blank=True)
+
+    archivado_en = models.DateTimeField(default=timezone.now, verbose_name='Archivado')
+
+    class Meta:
+        db_table = 'pedidos_archivo'
+        ordering = ['-creado_en', '-id']
+        verbose_name = 'Pedido Archivado'
+        verbose_name_plural = 'Pedidos Archivados'
+        indexes = [
+            models.Index(fields=['cliente', '-creado_en'], name='pedidos_arch_cliente_idx'),
+            models.Index(fields=['proveedor', '-creado_en'], name='pedidos_arch_proveedor_idx'),
+            models.Index(fields=['repartidor', '-creado_en'], name='pedidos_arch_repart_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido #{self.pk} (archivado) - {self.get_estado_display()}"
+
+    def como_pedido(self):
+        """
+        Instancia de Pedido (sin guardar) con los datos archivados, para
+        reutilizar serializers y permisos. Lleva `archivado = True`.
+        """
+        pedido = Pedido(**{
+            campo.attname: getattr(self, campo.attname)
+            for campo in Pedido._meta.concrete_fields
+        })
+        pedido._state.adding = False
+        pedido.archivado = True
+
+        # Conserva las relaciones ya cargadas con select_related
+        for relacion in ('cliente', 'proveedor', 'repartidor'):
+            if self._meta.get_field(relacion).is_cached(self):
+                setattr(pedido, relacion, getattr(self, relacion))
+        return pedido
+
+
+class HistorialPedidoArchivado(models.Model):
+    """
+    Historial de los pedidos archivados. Se particiona igual que
+    PedidoArchivado (por la fecha de creación del pedido) para que ambos
+    se consulten y se eliminen por los mismos meses.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+    pedido_id = models.BigIntegerField(verbose_name='Pedido')
+    pedido_creado_en = models.DateTimeField(verbose_name='Creación del Pedido')
+    estado_anterior = models.CharField(max_length=20, choices=EstadoPedido.choices)
+    estado_nuevo = models.CharField(max_length=20, choices=EstadoPedido.choices)
+    fecha_cambio = models.DateTimeField(verbose_name='Fecha del Cambio')
+
+    usuario = models.ForeignKey(
+        'authentication.User',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Usuario que Realizó el Cambio'
+    )
+
+    observaciones = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'pedidos_historial_archivo'
+        ordering = ['-fecha_cambio']
+        verbose_name = 'Historial de Pedido Archivado'
+        verbose_name_plural = 'Historial de Pedidos Archivados'
+        indexes = [
+            models.Index(fields=['pedido_id', '-fecha_cambio'], name='pedidos_hist_arch_pedido_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido #{self.pedido_id} (archivado): {self.estado_anterior} → {self.estado_nuevo}"
+
+
 # ==========================================================
 # 📈 MODELO OPCIONAL: MÉTRICAS DE PEDIDOS
 # ==========================================================
@@ -1196,25 +1754,34 @@ class MetricasPedido(models.Model):
         """
         ✅ NUEVO: Calcula y guarda métricas para una fecha
 
+        Suma las celdas de ResumenPedidoHora del día en lugar de recorrer
+        los pedidos.
+
         Args:
             fecha (date): Fecha a calcular (hoy por defecto)
 
         Returns:
             MetricasPedido: Instancia creada/actualizada
         """
+        from .resumen import inicio_dia
+
         if fecha is None:
-            fecha = timezone.now().date()
+            fecha = timezone.localdate()
 
-        # Obtener pedidos del día
-        pedidos_dia = Pedido.objects.filter(creado_en__date=fecha)
+        entregado = Q(estado=EstadoPedido.ENTREGADO)
 
         # Calcular métricas
-        stats = pedidos_dia.aggregate(
-            total_pedidos=Count('id'),
-            pedidos_entregados=Count('id', filter=Q(estado=EstadoPedido.ENTREGADO)),
-            pedidos_cancelados=Count('id', filter=Q(estado=EstadoPedido.CANCELADO)),
-            ingresos_dia=Sum('total', filter=Q(estado=EstadoPedido.ENTREGADO)),
-            ganancia_app=Sum('ganancia_app', filter=Q(estado=EstadoPedido.ENTREGADO)),
+        stats = ResumenPedidoHora.objects.filter(
+            hora__gte=inicio_dia(fecha),
+            hora__lt=inicio_dia(fecha + timedelta(days=1)),
+        ).aggregate(
+            total_pedidos=Sum('pedidos'),
+            pedidos_entregados=Sum('pedidos', filter=entregado),
+            pedidos_cancelados=Sum('pedidos', filter=Q(estado=EstadoPedido.CANCELADO)),
+            ingresos_dia=Sum('total', filter=entregado),
+            ganancia_app=Sum('ganancia_app', filter=entregado),
+            entregas_con_tiempo=Sum('entregas_con_tiempo'),
+            segundos_entrega=Sum('segundos_entrega'),
         )
 
         # Calcular ticket promedio
@@ -1224,17 +1791,8 @@ class MetricasPedido(models.Model):
             ticket_promedio = 0
 
         # Calcular tiempo promedio de entrega
-        pedidos_entregados = pedidos_dia.filter(
-            estado=EstadoPedido.ENTREGADO,
-            fecha_entregado__isnull=False
-        )
-
-        if pedidos_entregados.exists():
-            tiempos = []
-            for pedido in pedidos_entregados:
-                diff = pedido.fecha_entregado - pedido.creado_en
-                tiempos.append(diff.total_seconds() / 60)
-            tiempo_promedio = int(sum(tiempos) / len(tiempos))
+        if stats['entregas_con_tiempo']:
+            tiempo_promedio = int(stats['segundos_entrega'] / stats['entregas_con_tiempo'] / 60)
         else:
             tiempo_promedio = 0
 
@@ -0,0 +1,211 @@
+# pedidos/outbox.py
+"""
+Outbox transaccional de los efectos secundarios de pedidos.
+
+`transiciones.emitir` llama a `encolar` dentro de la transacción que guardó
+el pedido: se escribe una fila EventoPedido por consumidor diferido, con
+clave de idempotencia `<evento>:<consumidor>`. La petición solo espera el
+commit; las notificaciones push, chats y métricas las ejecuta
+`pedidos.drenar_outbox`:
+
+1. Reserva un lote de eventos pendientes (SELECT ... FOR UPDATE SKIP LOCKED)
+   moviendo su `disponible_en` al final de la reserva, así varios workers
+   pueden drenar a la vez sin pisarse.
+2. Ejecuta cada evento en su propia transacción junto con la marca de
+   procesado: los efectos en la base de datos quedan exactamente una vez.
+3. Si un worker muere a mitad de lote, la reserva vence y los eventos se
+   reintentan (al menos una vez); los consumidores con efectos externos
+   pueden usar `transicion.evento` para no repetirlos.
+
+Los errores se reintentan con espera exponencial hasta MAX_INTENTOS; luego
+el evento queda como fallido (visible en el admin).
+"""
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger('pedidos.outbox')
+
+TAMANO_LOTE = 100
+MAX_INTENTOS = 6
+
+# Reserva de un lote: si el worker no lo termina en este tiempo, se reintenta
+SEGUNDOS_RESERVA = 300
+
+# Espera antes del reintento n: SEGUNDOS_REINTENTO * 2^(n-1)
+SEGUNDOS_REINTENTO = 30
+
+# Un solo drenado inmediato programado a la vez
+CLAVE_PROGRAMADO = 'pedidos:outbox:programado'
+SEGUNDOS_PROGRAMADO = 2
+
+
+def encolar(transicion, consumidores):
+    """
+    Escribe una fila de outbox por consumidor diferido.
+
+    Args:
+        transicion (Transicion): Evento emitido por el pedido
+        consumidores (list[str]): Nombres de los consumidores diferidos
+    """
+    encolar_lote([(transicion, consumidor) for consumidor in consumidores])
+
+
+def encolar_lote(pendientes):
+    """
+    Escribe las filas de outbox de varias transiciones en un solo INSERT y
+    programa un único drenado.
+
+    Args:
+        pendientes (list[tuple]): (Transicion, nombre del consumidor diferido)
+    """
+    from .models import EventoPedido
+
+    EventoPedido.objects.bulk_create(
+        [
+            EventoPedido(
+                clave=f'{transicion.evento}:{consumidor}',
+                pedido_id=transicion.pedido.pk,
+                consumidor=consumidor,
+                estado_anterior=transicion.anterior,
+                estado_nuevo=transicion.nuevo,
+                repartidor_asignado=transicion.repartidor_asignado,
+            )
+            for transicion, consumidor in pendientes
+        ],
+        ignore_conflicts=True,
+    )
+
+    transaction.on_commit(programar_drenado)
+
+
+def programar_drenado():
+    """
+    Pide un drenado inmediato tras el commit. Si el broker no responde, lo
+    recoge la ejecución periódica de la tarea.
+    """
+    try:
+        if not cache.add(CLAVE_PROGRAMADO, 1, timeout=SEGUNDOS_PROGRAMADO):
+            return
+
+        from .tasks import drenar_outbox
+        drenar_outbox.apply_async(retry=False)
+    except Exception as e:
+        logger.warning(f"No se pudo programar el drenado del outbox: {e}")
+
+
+def _reservar(lote, ahora):
+    from .models import EventoPedido
+
+    with transaction.atomic():
+        ids = list(
+            EventoPedido.objects.select_for_update(skip_locked=True)
+            .filter(procesado_en__isnull=True, disponible_en__lte=ahora)
+            .order_by('id')
+            .values_list('id', flat=True)[:lote]
+        )
+        if ids:
+            EventoPedido.objects.filter(id__in=ids).update(
+                disponible_en=ahora + timedelta(seconds=SEGUNDOS_RESERVA)
+            )
+    return ids
+
+
+def _procesar(evento, pedido):
+    from .models import EventoPedido
+    from . import transiciones
+
+    transicion = transiciones.Transicion(
+        pedido,
+        evento.estado_anterior,
+        evento.estado_nuevo,
+        evento.repartidor_asignado,
+        evento.clave.split(':', 1)[0],
+    )
+
+    try:
+        with transaction.atomic():
+            transiciones.ejecutar_diferido(evento.consumidor, transicion)
+            EventoPedido.objects.filter(pk=evento.pk).update(
+                procesado_en=timezone.now(), intentos=evento.intentos + 1, ultimo_error=''
+            )
+        return True
+
+    except Exception as e:
+        intentos = evento.intentos + 1
+        fallido = intentos >= MAX_INTENTOS
+        EventoPedido.objects.filter(pk=evento.pk).update(
+            intentos=intentos,
+            ultimo_error=str(e)[:2000],
+            fallido=fallido,
+            procesado_en=timezone.now() if fallido else None,
+            disponible_en=timezone.now() + timedelta(seconds=SEGUNDOS_REINTENTO * 2 ** (intentos - 1)),
+        )
+        (logger.error if fallido else logger.warning)(
+            f"Outbox {evento.clave} (pedido #{evento.pedido_id}) intento {intentos}/{MAX_INTENTOS}: {e}"
+        )
+        return False
+
+
+def _descartar_huerfano(evento):
+    """Marca como fallido un evento cuyo pedido ya no está (eliminado o archivado)."""
+    from .models import EventoPedido
+
+    EventoPedido.objects.filter(pk=evento.pk).update(
+        intentos=evento.intentos + 1,
+        ultimo_error='Pedido no encontrado (eliminado o archivado)',
+        fallido=True,
+        procesado_en=timezone.now(),
+    )
+    logger.warning(f"Outbox {evento.clave}: el pedido #{evento.pedido_id} ya no existe, evento descartado")
+
+
+def drenar(lote=TAMANO_LOTE, max_lotes=10):
+    """
+    Procesa eventos pendientes por lotes.
+
+    Returns:
+        dict: procesados y errores
+    """
+    from .models import EventoPedido, Pedido
+
+    procesados = errores = 0
+
+    for _ in range(max_lotes):
+        ids = _reservar(lote, timezone.now())
+        if not ids:
+            break
+
+        eventos = list(EventoPedido.objects.filter(id__in=ids).order_by('id'))
+        pedidos = Pedido.objects.in_bulk({evento.pedido_id for evento in eventos})
+
+        for evento in eventos:
+            pedido = pedidos.get(evento.pedido_id)
+            if pedido is None:
+                _descartar_huerfano(evento)
+                errores += 1
+            elif _procesar(evento, pedido):
+                procesados += 1
+            else:
+                errores += 1
+
+        if len(ids) < lote:
+            break
+
+    if procesados or errores:
+        logger.info(f"Outbox drenado: {procesados} procesados, {errores} con error")
+    return {'procesados': procesados, 'errores': errores}
+
+
+def purgar(dias=7):
+    """Elimina los eventos procesados con éxito hace más de `dias` días."""
+    from .models import EventoPedido
+
+    eliminados, _ = EventoPedido.objects.filter(
+        fallido=False,
+        procesado_en__lt=timezone.now() - timedelta(days=dias),
+    ).delete()
+    return eliminados
@@ -0,0 +1,259 @@
+# pedidos/resumen.py
+"""
+Acumulados horarios de pedidos (ResumenPedidoHora).
+
+Cada pedido aporta a una sola celda (hora de creación, proveedor,
+repartidor, estado, tipo). El consumidor de transiciones de
+pedidos/signals.py llama a `registrar_transicion`, que resta el aporte de
+la celda anterior y lo suma en la nueva dentro de la transacción del
+cambio de estado, así los reportes leen unas pocas filas por hora en lugar
+de recorrer todos los pedidos.
+
+El aporte de un pedido es estable mientras no cambia de estado: `total`
+se fija al crearlo y las comisiones y la fecha de entrega se escriben en
+el mismo guardado que el paso a ENTREGADO. Lo que cambie por fuera de una
+transición (ediciones desde el admin, reasignaciones sin cambio de estado)
+lo corrige `reconciliar`, que recalcula una ventana desde los pedidos.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+def truncar_hora(momento):
+    """Inicio de la hora (UTC) en la que cae `momento`."""
+    return momento.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _celda(pedido, estado, repartidor_id):
+    return {
+        'hora': truncar_hora(pedido.creado_en),
+        'proveedor_id': pedido.proveedor_id,
+        'repartidor_id': repartidor_id,
+        'estado': estado,
+        'tipo': pedido.tipo,
+    }
+
+
+def _aporte(pedido, estado, signo):
+    from .models import EstadoPedido
+
+    aporte = {'pedidos': signo, 'total': signo * (pedido.total or Decimal('0'))}
+
+    if estado == EstadoPedido.ENTREGADO:
+        aporte['ganancia_app'] = signo * (pedido.ganancia_app or Decimal('0'))
+        aporte['comision_repartidor'] = signo * (pedido.comision_repartidor or Decimal('0'))
+        aporte['comision_proveedor'] = signo * (pedido.comision_proveedor or Decimal('0'))
+        if pedido.fecha_entregado:
+            aporte['entregas_con_tiempo'] = signo
+            aporte['segundos_entrega'] = signo * int(
+                (pedido.fecha_entregado - pedido.creado_en).total_seconds()
+            )
+
+    return aporte
+
+
+def _orden(celda):
+    """
+    Clave de orden de una celda (los None van primero). Las celdas se
+    actualizan siempre en este orden para que dos transacciones tomen los
+    bloqueos de filas en el mismo orden y no se bloqueen mutuamente.
+    """
+    return tuple((celda[campo] is not None, celda[campo]) for campo in _CLAVE)
+
+
+def _sumar(celda, aporte):
+    """UPDATE incremental de la celda; si no existe, la crea."""
+    from .models import ResumenPedidoHora
+
+    incrementos = {campo: F(campo) + valor for campo, valor in aporte.items()}
+    ahora = timezone.now()
+
+    if ResumenPedidoHora.objects.filter(**celda).update(**incrementos, actualizado_en=ahora):
+        return
+
+    try:
+        with transaction.atomic():
+            ResumenPedidoHora.objects.create(**celda, **aporte, actualizado_en=ahora)
+    except IntegrityError:
+        # Otra transacción creó la celda al mismo tiempo
+        ResumenPedidoHora.objects.filter(**celda).update(**incrementos, actualizado_en=ahora)
+
+
+# ==========================================================
+# ACTUALIZACIÓN INCREMENTAL
+# ==========================================================
+def registrar_transicion(transicion):
+    """Mueve el aporte del pedido de la celda anterior a la nueva."""
+    pedido = transicion.pedido
+
+    movimientos = [(
+        _celda(pedido, transicion.nuevo, pedido.repartidor_id),
+        _aporte(pedido, transicion.nuevo, 1),
+    )]
+    if not transicion.creado:
+        # Solo la asignación cambia el repartidor dentro de una transición
+        repartidor_anterior = None if transicion.repartidor_asignado else pedido.repartidor_id
+        movimientos.append((
+            _celda(pedido, transicion.anterior, repartidor_anterior),
+            _aporte(pedido, transicion.anterior, -1),
+        ))
+
+    for celda, aporte in sorted(movimientos, key=lambda movimiento: _orden(movimiento[0])):
+        _sumar(celda, aporte)
+
+
+def registrar_transiciones(lote):
+    """
+    `registrar_transicion` para un cambio masivo: los aportes se acumulan
+    por celda y cada celda se actualiza una sola vez.
+    """
+    celdas = {}
+    for transicion in lote:
+        pedido = transicion.pedido
+        movimientos = [(transicion.nuevo, pedido.repartidor_id, 1)]
+        if not transicion.creado:
+            repartidor_anterior = None if transicion.repartidor_asignado else pedido.repartidor_id
+            movimientos.append((transicion.anterior, repartidor_anterior, -1))
+
+        for estado, repartidor_id, signo in movimientos:
+            clave = tuple(_celda(pedido, estado, repartidor_id).items())
+            acumulado = celdas.setdefault(clave, {})
+            for campo, valor in _aporte(pedido, estado, signo).items():
+                acumulado[campo] = acumulado.get(campo, 0) + valor
+
+    for celda, aporte in sorted(
+        ((dict(clave), aporte) for clave, aporte in celdas.items()),
+        key=lambda item: _orden(item[0]),
+    ):
+        _sumar(celda, aporte)
+
+
+def restar_pedido(pedido):
+    """Quita el aporte de un pedido eliminado."""
+    _sumar(
+        _celda(pedido, pedido.estado, pedido.repartidor_id),
+        _aporte(pedido, pedido.estado, -1),
+    )
+
+
+# ==========================================================
+# RECONCILIACIÓN
+# ==========================================================
+_CLAVE = ('hora', 'proveedor_id', 'repartidor_id', 'estado', 'tipo')
+_CEROS = {
+    'pedidos': 0,
+    'total': Decimal('0'),
+    'ganancia_app': Decimal('0'),
+    'comision_repartidor': Decimal('0'),
+    'comision_proveedor': Decimal('0'),
+    'entregas_con_tiempo': 0,
+    'duracion': timedelta(),
+}
+
+
+def _agregar(queryset, desde, hasta):
+    """Sumas por celda de un queryset de Pedido o PedidoArchivado."""
+    from .models import EstadoPedido
+
+    entregado = Q(estado=EstadoPedido.ENTREGADO)
+    con_tiempo = entregado & Q(fecha_entregado__isnull=False)
+
+    return (
+        queryset.filter(creado_en__gte=desde, creado_en__lt=hasta)
+        .order_by()
+        .annotate(hora=TruncHour('creado_en', tzinfo=dt_timezone.utc))
+        .values(*_CLAVE)
+        .annotate(
+            s_pedidos=Count('id'),
+            s_total=Sum('total'),
+            s_ganancia_app=Sum('ganancia_app', filter=entregado),
+            s_comision_repartidor=Sum('comision_repartidor', filter=entregado),
+            s_comision_proveedor=Sum('comision_proveedor', filter=entregado),
+            s_entregas_con_tiempo=Count('id', filter=con_tiempo),
+            s_duracion=Sum(
+                ExpressionWrapper(F('fecha_entregado') - F('creado_en'), output_field=DurationField()),
+                filter=con_tiempo,
+            ),
+        )
+    )
+
+
+def reconciliar(desde, hasta):
+    """
+    Recalcula las celdas de las horas [desde, hasta) desde los pedidos,
+    incluidos los que ya pasaron al archivo (pedidos/archivo.py).
+
+    Returns:
+        int: Celdas escritas
+    """
+    from .models import Pedido, PedidoArchivado, ResumenPedidoHora
+
+    desde = truncar_hora(desde)
+    hasta = truncar_hora(hasta)
+    if hasta <= desde:
+        return 0
+
+    ahora = timezone.now()
+
+    # Se borra primero: los incrementos en curso sobre la ventana esperan
+    # al commit en lugar de perderse entre la lectura y la escritura
+    with transaction.atomic():
+        ResumenPedidoHora.objects.filter(hora__gte=desde, hora__lt=hasta).delete()
+
+        # Un pedido está en una sola de las dos tablas; sus celdas se suman
+        sumas = {}
+        for queryset in (Pedido.objects.all(), PedidoArchivado.objects.all()):
+            for fila in _agregar(queryset, desde, hasta):
+                celda = sumas.setdefault(tuple(fila[campo] for campo in _CLAVE), dict(_CEROS))
+                for campo, cero in _CEROS.items():
+                    celda[campo] += fila[f's_{campo}'] or cero
+
+        celdas = [
+            ResumenPedidoHora(
+                **dict(zip(_CLAVE, clave)),
+                pedidos=suma['pedidos'],
+                total=suma['total'],
+                ganancia_app=suma['ganancia_app'],
+                comision_repartidor=suma['comision_repartidor'],
+                comision_proveedor=suma['comision_proveedor'],
+                entregas_con_tiempo=suma['entregas_con_tiempo'],
+                segundos_entrega=int(suma['duracion'].total_seconds()),
+                actualizado_en=ahora,
+            )
+            for clave, suma in sumas.items()
+        ]
+        ResumenPedidoHora.objects.bulk_create(celdas, batch_size=1000)
+
+    return len(celdas)
+
+
+def reconciliar_horas(horas):
+    """
+    Reconcilia un conjunto de horas (inicios UTC), agrupando las
+    consecutivas en una sola ventana.
+
+    Returns:
+        int: Horas reconciliadas
+    """
+    horas = sorted(horas)
+    inicio = None
+    for i, hora in enumerate(horas):
+        inicio = inicio or hora
+        siguiente = hora + timedelta(hours=1)
+        if i + 1 == len(horas) or horas[i + 1] != siguiente:
+            reconciliar(inicio, siguiente)
+            inicio = None
+    return len(horas)
+
+
+# ==========================================================
+# LECTURA
+# ==========================================================
+def inicio_dia(fecha):
+    """Inicio del día `fecha` en la zona horaria local, para filtrar por `hora`."""
+    return timezone.make_aware(timezone.datetime.combine(fecha, timezone.datetime.min.time()))
@@ -0,0 +1,271 @@
+# pedidos/rutas.py
+"""
+Varios pedidos por repartidor y secuencia de paradas de su ruta.
+
+Con PEDIDOS_MAX_POR_REPARTIDOR > 1 un repartidor OCUPADO puede aceptar
+más pedidos mientras:
+- tenga menos de ese máximo de pedidos activos, y
+- el origen del pedido nuevo esté a menos de PEDIDOS_LOTE_RADIO_KM del
+  origen de alguno de sus pedidos activos (proveedores cercanos).
+
+La comprobación (`validar_sumar`) corre dentro de la transacción de la
+aceptación con la fila del repartidor bloqueada: dos aceptaciones
+simultáneas del mismo repartidor no superan el máximo. Al entregar o
+cancelar, `bloquear_libres` toma el mismo bloqueo antes de ver si el
+repartidor puede liberarse, así no se libera a uno que acaba de sumar un
+pedido. Con el valor por
+defecto (1) todo sigue como antes: un pedido por repartidor.
+
+`secuenciar` ordena las paradas de los pedidos activos (recoger en el
+origen si aún no salió en ruta, entregar en el destino) desde la posición
+del repartidor: vecino más cercano y mejora 2-opt sobre una matriz de
+distancias NumPy, respetando que cada recogida vaya antes que su entrega.
+La llegada a cada parada se estima con la matriz de tiempos de viaje
+(pedidos/tiempos_viaje.py) más MINUTOS_POR_PARADA en cada parada previa.
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from utils.geo import distancias_km_desde, matriz_distancias_km
+from . import tiempos_viaje
+
+logger = logging.getLogger('pedidos')
+
+RECOGER = 'recoger'
+ENTREGAR = 'entregar'
+
+# Minutos en cada parada (retirar o entregar) antes de seguir
+MINUTOS_POR_PARADA = 3
+
+# Pasadas completas de 2-opt sin mejora que cortan la búsqueda
+MAX_PASADAS_2OPT = 50
+
+
+def max_por_repartidor():
+    return getattr(settings, 'PEDIDOS_MAX_POR_REPARTIDOR', 1)
+
+
+def radio_lote_km():
+    return getattr(settings, 'PEDIDOS_LOTE_RADIO_KM', 2.0)
+
+
+def acepta_varios():
+    """True si un repartidor puede llevar más de un pedido a la vez."""
+    return max_por_repartidor() > 1
+
+
+# ==========================================================
+# PEDIDOS ACTIVOS DEL REPARTIDOR
+# ==========================================================
+def pedidos_activos(repartidor_id):
+    from .models import Pedido
+
+    return Pedido.objects.activos().filter(repartidor_id=repartidor_id)
+
+
+def repartidores_con_pedidos_activos(repartidor_ids):
+    from .models import Pedido
+
+    return set(
+        Pedido.objects.activos()
+        .filter(repartidor_id__in=repartidor_ids)
+        .order_by()
+        .values_list('repartidor_id', flat=True)
+        .distinct()
+    )
+
+
+def bloquear_libres(repartidor_ids):
+    """
+    Bloquea las filas de los repartidores y devuelve los que ya no llevan
+    pedidos activos (pueden liberarse). Debe llamarse dentro de la
+    transacción que los libera: una aceptación simultánea espera el
+    bloqueo en `validar_sumar` y, tras el commit, ya no los ve OCUPADO.
+
+    Returns:
+        set[int]: IDs de los repartidores sin pedidos activos
+    """
+    from repartidores.models import Repartidor
+
+    bloqueados = set(
+        Repartidor.objects.select_for_update()
+        .filter(pk__in=repartidor_ids)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    return bloqueados - repartidores_con_pedidos_activos(bloqueados)
+
+
+def validar_sumar(repartidor, pedido):
+    """
+    Comprueba que el repartidor OCUPADO puede sumar `pedido` a su ruta.
+    Debe llamarse dentro de la transacción de la aceptación (bloquea la
+    fila del repartidor hasta el commit).
+
+    Raises:
+        ValidationError: Si no acepta varios pedidos, llegó al máximo o el
+            pedido está lejos de los que ya lleva
+    """
+    from repartidores.models import EstadoRepartidor, Repartidor
+
+    if not acepta_varios():
+        raise ValidationError("El repartidor no está disponible.")
+
+    bloqueado = (
+        Repartidor.objects.select_for_update()
+        .filter(pk=repartidor.pk, estado=EstadoRepartidor.OCUPADO, activo=True, verificado=True)
+        .exists()
+    )
+    if not bloqueado:
+        raise ValidationError("El repartidor no está disponible.")
+
+    origenes = list(
+        pedidos_activos(repartidor.pk)
+        .exclude(pk=pedido.pk)
+        .order_by()
+        .values_list('latitud_origen', 'longitud_origen')
+    )
+
+    maximo = max_por_repartidor()
+    if len(origenes) >= maximo:
+        raise ValidationError(f"Ya llevas el máximo de {maximo} pedidos a la vez.")
+
+    conocidos = [(lat, lon) for lat, lon in origenes if lat is not None and lon is not None]
+    if conocidos and pedido.latitud_origen is not None and pedido.longitud_origen is not None:
+        lats, lons = zip(*conocidos)
+        cercano = distancias_km_desde(pedido.latitud_origen, pedido.longitud_origen, lats, lons).min()
+        if cercano > radio_lote_km():
+            raise ValidationError(
+                f"El pedido está a {cercano:.1f} km de los que ya llevas "
+                f"(máximo {radio_lote_km():g} km)."
+            )
+
+
+# ==========================================================
+# SECUENCIA DE PARADAS
+# ==========================================================
+def paradas_de(pedidos):
+    """
+    Paradas pendientes de los pedidos: recoger (si aún no salió en ruta y
+    tiene origen) y entregar (si tiene destino).
+
+    Returns:
+        tuple: (paradas [(pedido_id, accion, lat, lon)], {índice entrega: índice recogida})
+    """
+    from .models import EstadoPedido
+
+    paradas, requiere = [], {}
+    for pedido in pedidos:
+        recogida = None
+        if (
+            pedido.estado in (EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION)
+            and pedido.latitud_origen is not None and pedido.longitud_origen is not None
+        ):
+            recogida = len(paradas)
+            paradas.append((pedido.pk, RECOGER, float(pedido.latitud_origen), float(pedido.longitud_origen)))
+
+        if pedido.latitud_destino is not None and pedido.longitud_destino is not None:
+            if recogida is not None:
+                requiere[len(paradas)] = recogida
+            paradas.append((pedido.pk, ENTREGAR, float(pedido.latitud_destino), float(pedido.longitud_destino)))
+
+    return paradas, requiere
+
+
+def _factible(orden, requiere):
+    posicion = {parada: i for i, parada in enumerate(orden)}
+    return all(posicion[previa] < posicion[parada] for parada, previa in requiere.items())
+
+
+def _vecino_mas_cercano(distancias, requiere):
+    """Orden inicial: siempre la parada permitida más cercana (0 = inicio)."""
+    pendientes = set(range(len(distancias) - 1))
+    orden, actual = [], -1
+    while pendientes:
+        permitidas = [p for p in pendientes if requiere.get(p) is None or requiere[p] not in pendientes]
+        siguiente = min(permitidas, key=lambda p: distancias[actual + 1, p + 1])
+        orden.append(siguiente)
+        pendientes.discard(siguiente)
+        actual = siguiente
+    return orden
+
+
+def _mejorar_2opt(orden, distancias, requiere):
+    """
+    2-opt sobre un camino abierto desde el inicio: invierte tramos mientras
+    acorten la ruta y sigan respetando recogida antes de entrega.
+    """
+    n = len(orden)
+    for _ in range(MAX_PASADAS_2OPT):
+        mejorado = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                a = orden[i - 1] + 1 if i > 0 else 0
+                b, c = orden[i] + 1, orden[j] + 1
+                delta = distancias[a, c] - distancias[a, b]
+                if j + 1 < n:
+                    d = orden[j + 1] + 1
+                    delta += distancias[b, d] - distancias[c, d]
+
+                if delta < -1e-9:
+                    candidato = orden[:i] + orden[i:j + 1][::-1] + orden[j + 1:]
+                    if _factible(candidato, requiere):
+                        orden = candidato
+                        mejorado = True
+        if not mejorado:
+            break
+    return orden
+
+
+def secuenciar(lat, lon, pedidos):
+    """
+    Orden de paradas para los pedidos activos de un repartidor en (lat, lon).
+
+    Returns:
+        dict: paradas (en orden, con distancia del tramo y minutos de
+              llegada acumulados), distancia_total_km, minutos_total y
+              eta_minutos por pedido (llegada a su entrega)
+    """
+    paradas, requiere = paradas_de(pedidos)
+    if not paradas:
+        return {'paradas': [], 'distancia_total_km': 0.0, 'minutos_total': 0, 'eta_minutos': {}}
+
+    lats = np.array([lat] + [parada[2] for parada in paradas], dtype=float)
+    lons = np.array([lon] + [parada[3] for parada in paradas], dtype=float)
+    distancias = matriz_distancias_km(lats, lons, lats, lons)
+
+    orden = _mejorar_2opt(_vecino_mas_cercano(distancias, requiere), distancias, requiere)
+
+    # Tramos: inicio → primera parada → ... → última parada
+    puntos = [0] + [parada + 1 for parada in orden]
+    desde, hasta = np.array(puntos[:-1]), np.array(puntos[1:])
+    tramos_km = distancias[desde, hasta]
+    tramos_min = tiempos_viaje.minutos_viaje_pares(
+        lats[desde], lons[desde], lats[hasta], lons[hasta], distancias_km=tramos_km
+    )
+    llegadas = np.cumsum(tramos_min) + MINUTOS_POR_PARADA * np.arange(len(orden))
+
+    resultado = []
+    eta = {}
+    for k, indice in enumerate(orden):
+        pedido_id, accion, parada_lat, parada_lon = paradas[indice]
+        resultado.append({
+            'pedido_id': pedido_id,
+            'accion': accion,
+            'latitud': parada_lat,
+            'longitud': parada_lon,
+            'distancia_tramo_km': round(float(tramos_km[k]), 2),
+            'minutos_llegada': int(round(float(llegadas[k]))),
+        })
+        if accion == ENTREGAR:
+            eta[pedido_id] = int(round(float(llegadas[k])))
+
+    return {
+        'paradas': resultado,
+        'distancia_total_km': round(float(tramos_km.sum()), 2),
+        'minutos_total': int(round(float(llegadas[-1]))),
+        'eta_minutos': eta,
+    }
@@ -0,0 +1,472 @@
+# pedidos/seguimiento.py
+"""
+Seguimiento en vivo de pedidos (Server-Sent Events sobre Redis pub/sub).
+
+Canales:
+- `...:pedido:<id>`      → cambios de estado y asignación del pedido
+  (consumidor de transiciones en pedidos/signals.py, tras el commit) y
+  llegadas del repartidor a origen o destino (pedidos/geocercas.py)
+- `...:repartidor:<id>`  → posición del repartidor, como máximo una cada
+  INTERVALO_UBICACION segundos (Repartidor.actualizar_ubicacion)
+
+El stream de un pedido se suscribe a su canal y al de su repartidor: envía
+primero el estado actual y luego solo los cambios, en lugar de que la app
+consulte el detalle completo cada pocos segundos. Cada conexión dura como
+máximo DURACION segundos; el cliente reconecta solo (EventSource) y recibe
+de nuevo el estado actual. Al llegar a un estado final se envía `fin`.
+
+El estado actual se lee de la base de datos con la suscripción al canal
+del pedido ya confirmada: un cambio publicado mientras tanto llega por el
+canal o ya está en la lectura. Los mensajes de estado que la lectura ya
+incluye (timestamp no posterior a `actualizado_en`) se descartan.
+
+Con PEDIDOS_SEGUIMIENTO_BROKER="memoria" se usa un broker en memoria del
+proceso (tests y desarrollo sin Redis). Si Redis no está disponible las
+publicaciones devuelven False y el stream responde `error`: la app vuelve
+a consultar el detalle del pedido.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger('pedidos')
+
+PREFIJO = 'deliber:pedidos:seguimiento'
+
+# Comentario SSE para que proxies y clientes no corten la conexión
+LATIDO_SEGUNDOS = 15
+
+# Espera sugerida al cliente antes de reconectar
+REINTENTO_MS = 3000
+
+# Publica la posición solo si no se publicó otra en la ventana (SET NX PX)
+_SCRIPT_LIMITADO = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'PX', ARGV[1]) then
+    redis.call('PUBLISH', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+_script = None
+
+
+def canal_pedido(pedido_id):
+    return f'{PREFIJO}:pedido:{pedido_id}'
+
+
+def canal_repartidor(repartidor_id):
+    return f'{PREFIJO}:repartidor:{repartidor_id}'
+
+
+def _limite_key(repartidor_id):
+    return f'{PREFIJO}:limite:{repartidor_id}'
+
+
+def habilitado():
+    """El seguimiento se puede desactivar con PEDIDOS_SEGUIMIENTO=False."""
+    return getattr(settings, 'PEDIDOS_SEGUIMIENTO', True)
+
+
+def duracion():
+    return getattr(settings, 'PEDIDOS_SEGUIMIENTO_DURACION', 300)
+
+
+def intervalo_ubicacion():
+    return getattr(settings, 'PEDIDOS_SEGUIMIENTO_INTERVALO_UBICACION', 5)
+
+
+def _texto(valor):
+    return valor.decode() if isinstance(valor, bytes) else valor
+
+
+# ==========================================================
+# BROKERS
+# ==========================================================
+class _SuscripcionRedis:
+    # Espera máxima a que Redis confirme la suscripción inicial
+    SEGUNDOS_CONFIRMACION = 5
+
+    def __init__(self, conexion, canales):
+        self._pubsub = conexion.pubsub()
+        self._recibidos = deque()
+        self._pubsub.subscribe(*canales)
+        self._esperar_confirmacion(len(canales))
+
+    def _esperar_confirmacion(self, canales):
+        """
+        Bloquea hasta que Redis confirma la suscripción: desde ahí ningún
+        mensaje publicado se pierde. Los que lleguen mientras tanto se
+        guardan para `recibir`.
+        """
+        limite = time.monotonic() + self.SEGUNDOS_CONFIRMACION
+        confirmados = 0
+        while confirmados < canales:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise TimeoutError("Redis no confirmó la suscripción")
+            mensaje = self._pubsub.get_message(timeout=restante)
+            if not mensaje:
+                continue
+            if mensaje['type'] == 'subscribe':
+                confirmados += 1
+            elif mensaje['type'] == 'message':
+                self._recibidos.append((_texto(mensaje['channel']), _texto(mensaje['data'])))
+
+    def suscribir(self, canal):
+        self._pubsub.subscribe(canal)
+
+    def desuscribir(self, canal):
+        self._pubsub.unsubscribe(canal)
+
+    def recibir(self, timeout):
+        """(canal, datos) del siguiente mensaje, o None si vence el timeout."""
+        if self._recibidos:
+            return self._recibidos.popleft()
+
+        limite = time.monotonic() + timeout
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return None
+            mensaje = self._pubsub.get_message(timeout=restante)
+            if mensaje and mensaje['type'] == 'message':
+                return _texto(mensaje['channel']), _texto(mensaje['data'])
+
+    def cerrar(self):
+        self._pubsub.close()
+
+
+class _BrokerRedis:
+    def _conexion(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    def publicar_varios(self, mensajes):
+        pipe = self._conexion().pipeline(transaction=False)
+        for canal, datos in mensajes:
+            pipe.publish(canal, datos)
+        pipe.execute()
+
+    def publicar_limitado(self, clave, segundos, canal, datos):
+        global _script
+        conexion = self._conexion()
+        if _script is None:
+            _script = conexion.register_script(_SCRIPT_LIMITADO)
+        return bool(_script(keys=[clave, canal], args=[int(segundos * 1000), datos], client=conexion))
+
+    def suscribir(self, canales):
+        return _SuscripcionRedis(self._conexion(), canales)
+
+
+class _SuscripcionMemoria:
+    def __init__(self, broker, canales):
+        self._broker = broker
+        self._cola = queue.Queue()
+        self._canales = set()
+        for canal in canales:
+            self.suscribir(canal)
+
+    def suscribir(self, canal):
+        with self._broker.lock:
+            self._broker.colas[canal].add(self._cola)
+        self._canales.add(canal)
+
+    def desuscribir(self, canal):
+        with self._broker.lock:
+            self._broker.colas[canal].discard(self._cola)
+        self._canales.discard(canal)
+
+    def recibir(self, timeout):
+        try:
+            return self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cerrar(self):
+        for canal in list(self._canales):
+            self.desuscribir(canal)
+
+
+class _BrokerMemoria:
+    """Broker del proceso actual: solo sirve con un único proceso (tests)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.colas = defaultdict(set)
+        self._limites = {}
+
+    def publicar_varios(self, mensajes):
+        for canal, datos in mensajes:
+            with self.lock:
+                colas = list(self.colas.get(canal, ()))
+            for cola in colas:
+                cola.put((canal, datos))
+
+    def publicar_limitado(self, clave, segundos, canal, datos):
+        ahora = time.monotonic()
+        with self.lock:
+            if self._limites.get(clave, 0) > ahora:
+                return False
+            self._limites[clave] = ahora + segundos
+        self.publicar_varios([(canal, datos)])
+        return True
+
+    def suscribir(self, canales):
+        return _SuscripcionMemoria(self, canales)
+
+
+_redis = _BrokerRedis()
+_memoria = _BrokerMemoria()
+
+
+def broker():
+    """Broker configurado en PEDIDOS_SEGUIMIENTO_BROKER ("redis" o "memoria")."""
+    if getattr(settings, 'PEDIDOS_SEGUIMIENTO_BROKER', 'redis') == 'memoria':
+        return _memoria
+    return _redis
+
+
+# ==========================================================
+# PUBLICACIÓN
+# ==========================================================
+def mensaje_estado(transicion):
+    """
+    Datos de una transición para el stream. Se arman dentro de la
+    transacción y se publican tras el commit.
+    """
+    pedido = transicion.pedido
+    return {
+        'tipo': 'estado',
+        'pedido_id': pedido.pk,
+        'anterior': transicion.anterior,
+        'estado': transicion.nuevo,
+        'repartidor_id': pedido.repartidor_id,
+        'evento': transicion.evento,
+        'timestamp': pedido.actualizado_en,
+    }
+
+
+def publicar_estados(mensajes):
+    """
+    Publica cambios de estado en los canales de sus pedidos (un solo
+    round-trip a Redis para todo el lote).
+
+    Returns:
+        bool: False si el broker no está disponible
+    """
+    if not habilitado() or not mensajes:
+        return False
+
+    try:
+        broker().publicar_varios([
+            (canal_pedido(mensaje['pedido_id']), json.dumps(mensaje, cls=DjangoJSONEncoder))
+            for mensaje in mensajes
+        ])
+        return True
+    except Exception as e:
+        logger.warning(f"Redis no disponible para el seguimiento de pedidos: {e}")
+        return False
+
+
+def publicar_llegadas(llegadas):
+    """
+    Publica llegadas del repartidor (geocercas) en los canales de sus pedidos.
+
+    Returns:
+        bool: False si el broker no está disponible
+    """
+    if not habilitado() or not llegadas:
+        return False
+
+    try:
+        broker().publicar_varios([
+            (canal_pedido(llegada['pedido_id']), json.dumps(llegada, cls=DjangoJSONEncoder))
+            for llegada in llegadas
+        ])
+        return True
+    except Exception as e:
+        logger.warning(f"Redis no disponible para el seguimiento de pedidos: {e}")
+        return False
+
+
+def publicar_ubicacion(repartidor_id, lat, lon, when):
+    """
+    Publica la posición del repartidor si no se publicó otra en los últimos
+    INTERVALO_UBICACION segundos.
+
+    Returns:
+        bool: True si se publicó
+    """
+    if not habilitado():
+        return False
+
+    datos = json.dumps({
+        'tipo': 'ubicacion',
+        'repartidor_id': repartidor_id,
+        'latitud': float(lat),
+        'longitud': float(lon),
+        'timestamp': when,
+    }, cls=DjangoJSONEncoder)
+
+    try:
+        return broker().publicar_limitado(
+            _limite_key(repartidor_id), intervalo_ubicacion(), canal_repartidor(repartidor_id), datos
+        )
+    except Exception as e:
+        logger.warning(f"Redis no disponible para el seguimiento de pedidos: {e}")
+        return False
+
+
+# ==========================================================
+# STREAM
+# ==========================================================
+def evento_sse(nombre, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _ubicacion_actual(repartidor_id):
+    from repartidores import ubicacion_viva
+
+    en_vivo = ubicacion_viva.obtener(repartidor_id)
+    return en_vivo and {'tipo': 'ubicacion', 'repartidor_id': repartidor_id, **en_vivo}
+
+
+def _estado_actual(pedido):
+    """
+    Relee estado, repartidor y actualizado_en del pedido y cierra la
+    conexión: el resto del stream solo usa Redis.
+    """
+    from django.db import connection
+    from .models import Pedido
+
+    try:
+        actual = (
+            Pedido.objects.filter(pk=pedido.pk)
+            .values('estado', 'repartidor_id', 'actualizado_en')
+            .first()
+        )
+    finally:
+        connection.close()
+
+    if actual is None:
+        return pedido.estado, pedido.repartidor_id, pedido.actualizado_en
+    return actual['estado'], actual['repartidor_id'], actual['actualizado_en']
+
+
+def _ya_incluido(mensaje, actualizado_en):
+    """True si el cambio de estado es anterior o igual a la lectura inicial."""
+    momento = mensaje.get('timestamp') and parse_datetime(mensaje['timestamp'])
+    if not momento or not actualizado_en:
+        return False
+    # DjangoJSONEncoder publica milisegundos: comparar con la misma precisión
+    return momento <= actualizado_en.replace(microsecond=actualizado_en.microsecond // 1000 * 1000)
+
+
+def eventos(pedido, segundos=None):
+    """
+    Generador del stream SSE de un pedido.
+
+    Emite `estado` con la situación actual (y `ubicacion` si el repartidor
+    tiene posición en vivo), después cada cambio de estado, posición del
+    repartidor asignado y `llegada` a origen o destino, con un latido cada LATIDO_SEGUNDOS. Termina con
+    `fin` cuando el pedido llega a un estado final; al vencer la duración
+    solo cierra la conexión y el cliente reconecta.
+
+    Args:
+        pedido (Pedido): El de la vista (ya autorizado); el estado se relee
+            después de suscribirse
+        segundos (int | None): Duración máxima; por defecto DURACION
+    """
+    from .models import EstadoPedido
+
+    finales = (EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO)
+
+    suscripcion = None
+    try:
+        # Primero la suscripción, después la lectura: así no se pierde un
+        # cambio publicado entre ambas
+        if pedido.estado not in finales and habilitado():
+            try:
+                suscripcion = broker().suscribir([canal_pedido(pedido.pk)])
+            except Exception as e:
+                logger.warning(f"Redis no disponible para el seguimiento de pedidos: {e}")
+
+        estado, repartidor_id, actualizado_en = _estado_actual(pedido)
+
+        if suscripcion is not None and repartidor_id and estado not in finales:
+            suscripcion.suscribir(canal_repartidor(repartidor_id))
+
+        yield f"retry: {REINTENTO_MS}\n\n"
+        yield evento_sse('estado', {
+            'tipo': 'estado',
+            'pedido_id': pedido.pk,
+            'anterior': None,
+            'estado': estado,
+            'repartidor_id': repartidor_id,
+            'evento': None,
+            'timestamp': actualizado_en,
+        })
+
+        if estado in finales:
+            yield evento_sse('fin', {'pedido_id': pedido.pk, 'estado': estado})
+            return
+
+        if suscripcion is None:
+            yield evento_sse('error', {'error': "Seguimiento en vivo no disponible."})
+            return
+
+        if repartidor_id:
+            ubicacion = _ubicacion_actual(repartidor_id)
+            if ubicacion:
+                yield evento_sse('ubicacion', ubicacion)
+
+        limite = time.monotonic() + (segundos or duracion())
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+
+            recibido = suscripcion.recibir(min(LATIDO_SEGUNDOS, restante))
+            if recibido is None:
+                yield ": latido\n\n"
+                continue
+
+            canal, datos = recibido
+            mensaje = json.loads(datos)
+
+            if mensaje['tipo'] == 'ubicacion':
+                if mensaje['repartidor_id'] == repartidor_id:
+                    yield evento_sse('ubicacion', mensaje)
+                continue
+
+            if mensaje['tipo'] == 'llegada':
+                yield evento_sse('llegada', mensaje)
+                continue
+
+            if _ya_incluido(mensaje, actualizado_en):
+                continue
+
+            if mensaje['repartidor_id'] != repartidor_id:
+                if repartidor_id:
+                    suscripcion.desuscribir(canal_repartidor(repartidor_id))
+                repartidor_id = mensaje['repartidor_id']
+                if repartidor_id:
+                    suscripcion.suscribir(canal_repartidor(repartidor_id))
+
+            estado = mensaje['estado']
+            yield evento_sse('estado', mensaje)
+
+            if estado in finales:
+                yield evento_sse('fin', {'pedido_id': pedido.pk, 'estado': estado})
+                return
+    finally:
+        if suscripcion is not None:
+            suscripcion.cerrar()
@@ -15,9 +15,10 @@ from django.core.exceptions import ValidationError as DjangoValidationError
 from decimal import Decimal
 import re
 
+from . import rutas
 from .models import Pedido, EstadoPedido, TipoPedido
 from usuarios.models import Perfil
-from repartidores.models import Repartidor
+from repartidores.models import EstadoRepartidor, Repartidor
 from proveedores.models import Proveedor
 
 
@@ -566,6 +567,35 @@ class PedidoEstadoUpdateSerializer(serializers.Serializer):
         return instance
 
 
+# ==========================================================
+# 📦 CAMBIO DE ESTADO EN LOTE
+# ==========================================================
+class PedidoCambioLoteSerializer(serializers.Serializer):
+    """Un cambio del lote: pedido y estado destino"""
+
+    pedido_id = serializers.IntegerField(min_value=1)
+    nuevo_estado = serializers.ChoiceField(choices=EstadoPedido.choices)
+
+
+class PedidoEstadoLoteSerializer(serializers.Serializer):
+    """Cambios de estado masivos (se validan pedido por pedido en pedidos.lote)"""
+
+    cambios = PedidoCambioLoteSerializer(many=True, allow_empty=False)
+    motivo = serializers.CharField(max_length=500, required=False, allow_blank=True, default='')
+
+    def validate_cambios(self, value):
+        from .lote import MAX_PEDIDOS
+
+        if len(value) > MAX_PEDIDOS:
+            raise serializers.ValidationError(f"Máximo {MAX_PEDIDOS} pedidos por lote.")
+
+        ids = [cambio['pedido_id'] for cambio in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Cada pedido puede aparecer una sola vez.")
+
+        return value
+
+
 # ==========================================================
 # 🛵 ACEPTACIÓN DEL PEDIDO (REPARTIDOR) - MEJORADO
 # ==========================================================
@@ -583,7 +613,9 @@ class PedidoAceptarRepartidorSerializer(serializers.Serializer):
                 f"Repartidor con ID {value} no encontrado."
             )
 
-        if not repartidor.disponible:
+        if repartidor.estado != EstadoRepartidor.DISPONIBLE and not (
+            repartidor.estado == EstadoRepartidor.OCUPADO and rutas.acepta_varios()
+        ):
             raise serializers.ValidationError(
                 f"El repartidor '{repartidor.user.get_full_name()}' no está disponible. "
                 f"Estado actual: {repartidor.estado}"
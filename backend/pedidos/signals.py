@@ -1,451 +1,338 @@
 # pedidos/signals.py (CORREGIDO Y SINCRONIZADO)
 """
-Señales para la aplicación de Pedidos.
-
-✅ CORRECCIONES APLICADAS:
-- Eliminados accesos a campos inexistentes (total_pedidos, total_ventas, comision_total)
-- Implementado cálculo dinámico de estadísticas
-- Protección contra recursión infinita
-- Manejo robusto de errores
-- Logging mejorado
+Señales y consumidores de transiciones para la aplicación de Pedidos.
+
+Los cambios de estado ya no se detectan con post_save/pre_save: el modelo
+emite un evento por transición (ver pedidos/transiciones.py) y aquí se
+suscriben los consumidores de pedidos:
+
+- Creación            → log + aviso a administradores + métricas   (outbox)
+- Cualquier cambio    → log + HistorialPedido
+- Repartidor asignado → log + aviso al cliente                     (outbox)
+- → ENTREGADO         → contador de entregas del repartidor
+                        + agradecimiento/calificación/métricas     (outbox)
+- → CANCELADO         → log + avisos + analytics                   (outbox)
+- Cualquier cambio    → acumulados de ResumenPedidoHora (reportes)
+- Cualquier cambio    → alta/baja en el feed de disponibles (Redis, tras el commit)
+- Cualquier cambio    → stream de seguimiento del pedido (Redis pub/sub, tras el commit)
+
+Los marcados (outbox) son diferidos: se ejecutan en `pedidos.drenar_outbox`
+después del commit, no dentro de la petición. Los síncronos tienen además
+una versión por lotes para los cambios masivos (pedidos/lote.py).
+
+Las notificaciones al cliente por estado viven en notificaciones/signals.py
+y la creación de chats en chat/signals.py.
 """
-from django.db.models.signals import post_save, pre_save, post_delete
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from django.db.models import Count, Sum, F
+from django.db.models import Count, F, Sum
 import logging
 
-from .models import Pedido, EstadoPedido, TipoPedido
+from .models import Pedido, EstadoPedido
+from . import transiciones
 
 logger = logging.getLogger('pedidos.signals')
 
 
 # ==========================================================
-# 🔒 PROTECCIÓN CONTRA RECURSIÓN
+# 📊 AUDITORÍA Y LOGGING
 # ==========================================================
-# Flag global para evitar recursión infinita en signals
-_signals_en_proceso = set()
 
+@transiciones.al_transicionar(desde=transiciones.CREADO, diferido=True)
+def pedido_creado(transicion):
+    """Registra el pedido nuevo y avisa a los administradores."""
+    pedido = transicion.pedido
 
-def esta_procesando(signal_name, instance_id):
-    """Verifica si un signal ya está siendo procesado"""
-    key = f"{signal_name}_{instance_id}"
-    return key in _signals_en_proceso
+    logger.info(
+        f"[PEDIDO CREADO] #{pedido.id} - "
+        f"Tipo: {pedido.get_tipo_display()} - "
+        f"Cliente: {pedido.cliente.user.email} - "
+        f"Total: ${pedido.total} - "
+        f"Estado: {pedido.get_estado_display()}"
+    )
 
+    try:
+        from notificaciones.services import notificar_admin_nuevo_pedido
+        notificar_admin_nuevo_pedido(pedido)
+    except ImportError:
+        logger.debug("Módulo de notificaciones no disponible")
+    except Exception as e:
+        logger.warning(f"Error al notificar admin: {e}")
 
-def marcar_procesando(signal_name, instance_id):
-    """Marca un signal como en proceso"""
-    key = f"{signal_name}_{instance_id}"
-    _signals_en_proceso.add(key)
+    try:
+        from analytics.services import actualizar_metricas
+        actualizar_metricas('pedidos_hoy', incremento=1)
+        actualizar_metricas('ventas_hoy', incremento=float(pedido.total))
+    except ImportError:
+        logger.debug("Sistema de analytics no disponible")
+    except Exception as e:
+        logger.error(f"Error al actualizar métricas: {e}")
 
 
-def desmarcar_procesando(signal_name, instance_id):
-    """Desmarca un signal como procesado"""
-    key = f"{signal_name}_{instance_id}"
-    _signals_en_proceso.discard(key)
+@transiciones.al_transicionar()
+def registrar_cambio_estado(transicion):
+    """Registra cada cambio de estado en HistorialPedido."""
+    from .models import HistorialPedido
 
+    pedido = transicion.pedido
 
-# ==========================================================
-# 📊 SEÑALES DE AUDITORÍA Y LOGGING
-# ==========================================================
+    logger.info(
+        f"[CAMBIO DE ESTADO] Pedido #{pedido.id}: "
+        f"{EstadoPedido(transicion.anterior).label} → "
+        f"{pedido.get_estado_display()}"
+    )
 
-@receiver(post_save, sender=Pedido)
-def pedido_creado_o_actualizado(sender, instance, created, **kwargs):
-    """
-    ✅ CORREGIDO: Evita recursión y logging mejorado
+    HistorialPedido.objects.create(
+        pedido=pedido,
+        estado_anterior=transicion.anterior,
+        estado_nuevo=transicion.nuevo,
+        fecha_cambio=timezone.now()
+    )
 
-    Se ejecuta cada vez que se crea o actualiza un pedido.
-    Útil para logging, auditoría y notificaciones.
-    """
-    # ✅ Prevenir recursión
-    if esta_procesando('post_save_audit', instance.id):
-        return
 
-    try:
-        marcar_procesando('post_save_audit', instance.id)
-
-        if created:
-            logger.info(
-                f"[PEDIDO CREADO] #{instance.id} - "
-                f"Tipo: {instance.get_tipo_display()} - "
-                f"Cliente: {instance.cliente.user.email} - "
-                f"Total: ${instance.total} - "
-                f"Estado: {instance.get_estado_display()}"
-            )
+@transiciones.por_lote(registrar_cambio_estado)
+def registrar_cambios_estado(lote):
+    """Historial de un cambio masivo en un solo INSERT."""
+    from .models import HistorialPedido
 
-            # Notificar a administradores sobre nuevo pedido
-            try:
-                from notificaciones.services import notificar_admin_nuevo_pedido
-                notificar_admin_nuevo_pedido(instance)
-            except ImportError:
-                logger.debug("Módulo de notificaciones no disponible")
-            except Exception as e:
-                logger.warning(f"Error al notificar admin: {e}")
-        else:
-            logger.info(
-                f"[PEDIDO ACTUALIZADO] #{instance.id} - "
-                f"Estado: {instance.get_estado_display()}"
-            )
-    finally:
-        desmarcar_procesando('post_save_audit', instance.id)
+    ahora = timezone.now()
+    HistorialPedido.objects.bulk_create([
+        HistorialPedido(
+            pedido=transicion.pedido,
+            estado_anterior=transicion.anterior,
+            estado_nuevo=transicion.nuevo,
+            fecha_cambio=ahora,
+        )
+        for transicion in lote
+    ])
 
+    logger.info(f"[CAMBIO DE ESTADO] {len(lote)} pedidos en lote")
 
-@receiver(pre_save, sender=Pedido)
-def validar_cambio_estado(sender, instance, **kwargs):
-    """
-    ✅ CORREGIDO: Logging mejorado y protección contra recursión
 
-    Se ejecuta antes de guardar un pedido.
-    Valida cambios de estado y registra el historial.
-    """
-    # ✅ Prevenir recursión
-    if esta_procesando('pre_save_validate', instance.id or 0):
-        return
+@transiciones.al_asignar_repartidor(diferido=True)
+def repartidor_asignado(transicion):
+    """Registra la asignación del repartidor y avisa al cliente."""
+    pedido = transicion.pedido
 
-    if not instance.pk:  # Pedido nuevo
-        return
+    logger.info(
+        f"[REPARTIDOR ASIGNADO] Pedido #{pedido.id} → "
+        f"{pedido.repartidor.user.get_full_name()}"
+    )
 
     try:
-        marcar_procesando('pre_save_validate', instance.id)
+        from notificaciones.services import notificar_cliente_repartidor_asignado
+        notificar_cliente_repartidor_asignado(pedido)
+    except ImportError:
+        logger.debug("Servicio de notificaciones no disponible")
+    except Exception as e:
+        logger.warning(f"Error al notificar cliente: {e}")
 
-        pedido_anterior = Pedido.objects.get(pk=instance.pk)
 
-        # Detectar cambio de estado
-        if pedido_anterior.estado != instance.estado:
-            logger.info(
-                f"[CAMBIO DE ESTADO] Pedido #{instance.id}: "
-                f"{pedido_anterior.get_estado_display()} → "
-                f"{instance.get_estado_display()}"
-            )
+# ==========================================================
+# 📊 RESUMEN HORARIO (REPORTES)
+# ==========================================================
 
-            # Registrar en historial si existe el modelo
-            try:
-                from .models import HistorialPedido
-                HistorialPedido.objects.create(
-                    pedido=instance,
-                    estado_anterior=pedido_anterior.estado,
-                    estado_nuevo=instance.estado,
-                    fecha_cambio=timezone.now()
-                )
-                logger.debug(f"Historial de cambio registrado para pedido #{instance.id}")
-            except ImportError:
-                logger.debug("Modelo HistorialPedido no disponible")
-            except Exception as e:
-                logger.warning(f"Error al registrar historial: {e}")
-
-        # Detectar asignación de repartidor
-        if not pedido_anterior.repartidor and instance.repartidor:
-            logger.info(
-                f"[REPARTIDOR ASIGNADO] Pedido #{instance.id} → "
-                f"{instance.repartidor.user.get_full_name()}"
-            )
+@transiciones.al_transicionar(desde=[transiciones.CREADO, transiciones.CUALQUIERA])
+@transiciones.al_asignar_repartidor
+def actualizar_resumen_horario(transicion):
+    """Mueve el aporte del pedido entre celdas de ResumenPedidoHora."""
+    from . import resumen
+    resumen.registrar_transicion(transicion)
 
-            # Notificar al cliente
-            try:
-                from notificaciones.services import notificar_cliente_repartidor_asignado
-                notificar_cliente_repartidor_asignado(instance)
-            except ImportError:
-                logger.debug("Servicio de notificaciones no disponible")
-            except Exception as e:
-                logger.warning(f"Error al notificar cliente: {e}")
 
-    except Pedido.DoesNotExist:
-        logger.warning(f"No se pudo obtener pedido anterior con ID {instance.pk}")
-    finally:
-        desmarcar_procesando('pre_save_validate', instance.id)
+@transiciones.por_lote(actualizar_resumen_horario)
+def actualizar_resumen_horario_lote(lote):
+    from . import resumen
+    resumen.registrar_transiciones(lote)
 
 
 # ==========================================================
-# 📦 SEÑALES DE ESTADO ENTREGADO (CORREGIDO)
+# 🛵 FEED DE PEDIDOS DISPONIBLES
 # ==========================================================
 
-@receiver(post_save, sender=Pedido)
-def procesar_pedido_entregado(sender, instance, created, **kwargs):
+@transiciones.al_transicionar(desde=[transiciones.CREADO, transiciones.CUALQUIERA])
+@transiciones.al_asignar_repartidor
+def actualizar_feed_disponibles(transicion):
     """
-    ✅ CORREGIDO: Eliminados accesos a campos inexistentes
-
-    Ejecuta lógica adicional cuando un pedido es marcado como entregado.
-    Ahora calcula estadísticas dinámicamente en lugar de actualizar campos.
+    Agrega o quita el pedido del feed de disponibles (Redis) después del
+    commit, para que los repartidores no vean pedidos que no existen.
     """
-    # ✅ Prevenir recursión y procesar solo pedidos entregados
-    if created or instance.estado != EstadoPedido.ENTREGADO:
-        return
+    from . import feed_disponibles
 
-    if esta_procesando('entregado', instance.id):
-        return
+    pedido = transicion.pedido
+    if feed_disponibles.es_disponible(pedido):
+        pedido_id, creado_en = pedido.pk, pedido.creado_en
+        transaction.on_commit(lambda: feed_disponibles.agregar(pedido_id, creado_en))
+    else:
+        pedido_id = pedido.pk
+        transaction.on_commit(lambda: feed_disponibles.quitar(pedido_id))
 
-    # Verificar que no se haya procesado antes
-    if not instance.fecha_entregado:
-        return
 
-    tiempo_desde_entrega = timezone.now() - instance.fecha_entregado
+@transiciones.por_lote(actualizar_feed_disponibles)
+def actualizar_feed_disponibles_lote(lote):
+    """Todo el lote en una sola llamada a Redis, después del commit."""
+    from . import feed_disponibles
 
-    # Solo procesar si fue marcado recientemente (últimos 10 segundos)
-    if tiempo_desde_entrega.total_seconds() > 10:
-        return
+    pedidos = [transicion.pedido for transicion in lote]
+    transaction.on_commit(lambda: feed_disponibles.sincronizar_varios(pedidos))
 
-    try:
-        marcar_procesando('entregado', instance.id)
 
-        logger.info(
-            f"[PEDIDO ENTREGADO] #{instance.id} - "
-            f"Repartidor: {instance.repartidor.user.get_full_name() if instance.repartidor else 'N/A'} - "
-            f"Comisión: ${instance.comision_repartidor}"
-        )
+# ==========================================================
+# 📡 SEGUIMIENTO EN VIVO
+# ==========================================================
 
-        # ✅ CORREGIDO: Actualizar estadísticas del repartidor
-        if instance.repartidor:
-            try:
-                repartidor = instance.repartidor
-
-                # ✅ Usar método que SÍ existe en el modelo
-                repartidor.incrementar_entregas(unidades=1)
-
-                # ✅ NUEVO: Calcular estadísticas dinámicamente
-                estadisticas_repartidor = Pedido.objects.filter(
-                    repartidor=repartidor,
-                    estado=EstadoPedido.ENTREGADO
-                ).aggregate(
-                    total_entregas=Count('id'),
-                    total_comisiones=Sum('comision_repartidor')
-                )
-
-                logger.info(
-                    f"[ESTADÍSTICAS REPARTIDOR] {repartidor.user.email} - "
-                    f"Entregas completadas: {repartidor.entregas_completadas} - "
-                    f"Total histórico: {estadisticas_repartidor['total_entregas']} - "
-                    f"Comisiones acumuladas: ${estadisticas_repartidor['total_comisiones'] or 0}"
-                )
-
-            except AttributeError as e:
-                logger.error(
-                    f"Error al acceder al repartidor del pedido #{instance.id}: {e}"
-                )
-            except Exception as e:
-                logger.warning(
-                    f"No se pudieron actualizar estadísticas del repartidor: {e}"
-                )
-
-        # ✅ CORREGIDO: Calcular estadísticas del proveedor dinámicamente
-        if instance.proveedor:
-            try:
-                proveedor = instance.proveedor
-
-                # ✅ NUEVO: Calcular estadísticas sin campos adicionales
-                estadisticas_proveedor = Pedido.objects.filter(
-                    proveedor=proveedor,
-                    estado=EstadoPedido.ENTREGADO
-                ).aggregate(
-                    total_pedidos=Count('id'),
-                    total_ventas=Sum('total'),
-                    comision_total=Sum('comision_proveedor')
-                )
-
-                logger.info(
-                    f"[ESTADÍSTICAS PROVEEDOR] {proveedor.nombre} - "
-                    f"Pedidos entregados: {estadisticas_proveedor['total_pedidos']} - "
-                    f"Ventas totales: ${estadisticas_proveedor['total_ventas'] or 0} - "
-                    f"Comisiones: ${estadisticas_proveedor['comision_total'] or 0}"
-                )
-
-            except AttributeError as e:
-                logger.error(
-                    f"Error al acceder al proveedor del pedido #{instance.id}: {e}"
-                )
-            except Exception as e:
-                logger.warning(
-                    f"No se pudieron calcular estadísticas del proveedor: {e}"
-                )
-
-        # Enviar notificación de agradecimiento al cliente
-        try:
-            from notificaciones.services import enviar_agradecimiento_cliente
-            enviar_agradecimiento_cliente(instance)
-        except ImportError:
-            logger.debug("Servicio de agradecimiento no disponible")
-        except Exception as e:
-            logger.warning(f"Error al enviar agradecimiento: {e}")
+@transiciones.al_transicionar()
+@transiciones.al_asignar_repartidor
+def publicar_seguimiento(transicion):
+    """Publica el cambio en el stream del pedido después del commit."""
+    from . import seguimiento
 
-        # Solicitar calificación del servicio
-        try:
-            from calificaciones.services import solicitar_calificacion
-            solicitar_calificacion(instance)
-        except ImportError:
-            logger.debug("Servicio de calificaciones no disponible")
-        except Exception as e:
-            logger.warning(f"Error al solicitar calificación: {e}")
+    mensaje = seguimiento.mensaje_estado(transicion)
+    transaction.on_commit(lambda: seguimiento.publicar_estados([mensaje]))
 
-    finally:
-        desmarcar_procesando('entregado', instance.id)
 
+@transiciones.por_lote(publicar_seguimiento)
+def publicar_seguimiento_lote(lote):
+    from . import seguimiento
 
-# ==========================================================
-# ❌ SEÑALES DE PEDIDO CANCELADO (MEJORADO)
-# ==========================================================
+    mensajes = [seguimiento.mensaje_estado(transicion) for transicion in lote]
+    transaction.on_commit(lambda: seguimiento.publicar_estados(mensajes))
 
-@receiver(post_save, sender=Pedido)
-def procesar_pedido_cancelado(sender, instance, created, **kwargs):
-    """
-    ✅ MEJORADO: Manejo robusto de cancelación
 
-    Ejecuta lógica cuando un pedido es cancelado.
-    """
-    # Solo procesar cancelaciones, no creaciones
-    if created or instance.estado != EstadoPedido.CANCELADO:
-        return
+@transiciones.al_transicionar()
+@transiciones.al_asignar_repartidor
+def sincronizar_geocercas(transicion):
+    """Ajusta las geocercas de llegada del repartidor después del commit."""
+    from . import geocercas
 
-    # ✅ Prevenir recursión
-    if esta_procesando('cancelado', instance.id):
-        return
+    cambios = geocercas.cambios([transicion.pedido])
+    if cambios:
+        transaction.on_commit(lambda: geocercas.aplicar(cambios))
 
-    try:
-        marcar_procesando('cancelado', instance.id)
 
-        logger.warning(
-            f"[PEDIDO CANCELADO] #{instance.id} - "
-            f"Cancelado por: {instance.cancelado_por or 'No especificado'} - "
-            f"Cliente: {instance.cliente.user.email} - "
-            f"Estado anterior: detectado en pre_save"
-        )
+@transiciones.por_lote(sincronizar_geocercas)
+def sincronizar_geocercas_lote(lote):
+    from . import geocercas
 
-        # ✅ Liberar repartidor si estaba asignado
-        if instance.repartidor:
-            try:
-                repartidor = instance.repartidor
-
-                # Asegurarse de que el repartidor quede disponible
-                if not repartidor.disponible:
-                    repartidor.marcar_disponible()
-                    logger.info(
-                        f"✅ Repartidor {repartidor.user.email} liberado tras "
-                        f"cancelación del pedido #{instance.id}"
-                    )
-                else:
-                    logger.debug(
-                        f"Repartidor {repartidor.user.email} ya estaba disponible"
-                    )
-
-            except AttributeError as e:
-                logger.error(f"Error al acceder al repartidor: {e}")
-            except Exception as e:
-                logger.error(f"Error al liberar repartidor: {e}")
-
-        # Notificar a las partes involucradas
-        try:
-            from notificaciones.services import notificar_cancelacion
-            notificar_cancelacion(instance)
-        except ImportError:
-            logger.debug("Servicio de notificaciones no disponible")
-        except Exception as e:
-            logger.warning(f"Error al notificar cancelación: {e}")
-
-        # Registrar en sistema de analíticas
-        try:
-            from analytics.services import registrar_cancelacion
-            registrar_cancelacion(instance)
-        except ImportError:
-            logger.debug("Sistema de analytics no disponible")
-        except Exception as e:
-            logger.warning(f"Error al registrar en analytics: {e}")
-
-    finally:
-        desmarcar_procesando('cancelado', instance.id)
+    cambios = geocercas.cambios([transicion.pedido for transicion in lote])
+    if cambios:
+        transaction.on_commit(lambda: geocercas.aplicar(cambios))
 
 
 # ==========================================================
-# 🔔 SEÑALES DE NOTIFICACIONES POR ESTADO (MEJORADO)
+# 📦 PEDIDO ENTREGADO
 # ==========================================================
 
-@receiver(post_save, sender=Pedido)
-def notificar_cambios_estado(sender, instance, created, **kwargs):
+@transiciones.al_transicionar(hacia=EstadoPedido.ENTREGADO)
+def sumar_entrega_repartidor(transicion):
     """
-    ✅ MEJORADO: Evita notificaciones duplicadas
-
-    Envía notificaciones push/email según el estado del pedido.
+    Suma la entrega al repartidor en la misma transacción que el cambio
+    de estado (la transición → ENTREGADO ocurre una sola vez por pedido).
     """
-    # No notificar en creación (ya se hace en otro signal)
-    if created:
-        return
+    pedido = transicion.pedido
+    if pedido.repartidor_id:
+        pedido.repartidor.incrementar_entregas(unidades=1)
 
-    # ✅ Prevenir recursión y notificaciones duplicadas
-    if esta_procesando('notificar', instance.id):
-        return
 
-    try:
-        marcar_procesando('notificar', instance.id)
+@transiciones.por_lote(sumar_entrega_repartidor)
+def sumar_entregas_repartidores(lote):
+    """Un UPDATE por cantidad de entregas (normalmente uno para todo el lote)."""
+    from repartidores.models import Repartidor
 
-        from notificaciones.services import enviar_notificacion_estado
+    entregas = Counter(
+        transicion.pedido.repartidor_id for transicion in lote if transicion.pedido.repartidor_id
+    )
+    por_cantidad = defaultdict(list)
+    for repartidor_id, cantidad in entregas.items():
+        por_cantidad[cantidad].append(repartidor_id)
+
+    ahora = timezone.now()
+    for cantidad, repartidor_ids in por_cantidad.items():
+        Repartidor.objects.filter(pk__in=repartidor_ids).update(
+            entregas_completadas=F('entregas_completadas') + cantidad,
+            actualizado_en=ahora,
+        )
 
-        # Mapeo de estados a mensajes
-        mensajes_estado = {
-            EstadoPedido.CONFIRMADO: "Tu pedido ha sido confirmado 📦",
-            EstadoPedido.EN_PREPARACION: "Tu pedido está siendo preparado 👨‍🍳",
-            EstadoPedido.EN_RUTA: "Tu pedido está en camino 🚚",
-            EstadoPedido.ENTREGADO: "¡Tu pedido ha sido entregado! 🎉",
-            EstadoPedido.CANCELADO: "Tu pedido ha sido cancelado ❌",
-        }
 
-        mensaje = mensajes_estado.get(instance.estado)
-        if mensaje:
-            enviar_notificacion_estado(
-                usuario=instance.cliente.user,
-                pedido=instance,
-                mensaje=mensaje
-            )
-            logger.debug(
-                f"Notificación enviada para pedido #{instance.id}: {mensaje}"
-            )
+@transiciones.al_transicionar(hacia=EstadoPedido.ENTREGADO, diferido=True)
+def procesar_pedido_entregado(transicion):
+    """Procesos post-entrega: agradecimiento, calificación y métricas."""
+    pedido = transicion.pedido
+
+    logger.info(
+        f"[PEDIDO ENTREGADO] #{pedido.id} - "
+        f"Repartidor: {pedido.repartidor.user.get_full_name() if pedido.repartidor else 'N/A'} - "
+        f"Comisión: ${pedido.comision_repartidor}"
+    )
 
+    # Enviar notificación de agradecimiento al cliente
+    try:
+        from notificaciones.services import enviar_agradecimiento_cliente
+        enviar_agradecimiento_cliente(pedido)
     except ImportError:
-        logger.debug("Servicio de notificaciones no disponible")
+        logger.debug("Servicio de agradecimiento no disponible")
+    except Exception as e:
+        logger.warning(f"Error al enviar agradecimiento: {e}")
+
+    # Solicitar calificación del servicio
+    try:
+        from calificaciones.services import solicitar_calificacion
+        solicitar_calificacion(pedido)
+    except ImportError:
+        logger.debug("Servicio de calificaciones no disponible")
+    except Exception as e:
+        logger.warning(f"Error al solicitar calificación: {e}")
+
+    try:
+        from analytics.services import actualizar_metricas
+        actualizar_metricas('pedidos_entregados', incremento=1)
+    except ImportError:
+        logger.debug("Sistema de analytics no disponible")
     except Exception as e:
-        logger.error(f"Error al enviar notificación: {e}")
-    finally:
-        desmarcar_procesando('notificar', instance.id)
+        logger.error(f"Error al actualizar métricas: {e}")
 
 
 # ==========================================================
-# 📈 SEÑALES DE MÉTRICAS Y ANALYTICS (MEJORADO)
+# ❌ PEDIDO CANCELADO
 # ==========================================================
 
-@receiver(post_save, sender=Pedido)
-def actualizar_metricas_tiempo_real(sender, instance, created, **kwargs):
+@transiciones.al_transicionar(hacia=EstadoPedido.CANCELADO, diferido=True)
+def procesar_pedido_cancelado(transicion):
     """
-    ✅ MEJORADO: Actualización segura de métricas
-
-    Actualiza métricas en tiempo real para el dashboard.
+    Avisa y registra la cancelación. La liberación del repartidor la hace
+    Pedido.cancelar().
     """
-    # ✅ Prevenir recursión
-    if esta_procesando('metricas', instance.id):
-        return
-
-    try:
-        marcar_procesando('metricas', instance.id)
+    pedido = transicion.pedido
 
-        from analytics.services import actualizar_metricas
-
-        if created:
-            # Incrementar contador de pedidos del día
-            actualizar_metricas('pedidos_hoy', incremento=1)
-            actualizar_metricas('ventas_hoy', incremento=float(instance.total))
-            logger.debug(
-                f"Métricas actualizadas para nuevo pedido #{instance.id}"
-            )
+    logger.warning(
+        f"[PEDIDO CANCELADO] #{pedido.id} - "
+        f"Cancelado por: {pedido.cancelado_por or 'No especificado'} - "
+        f"Cliente: {pedido.cliente.user.email} - "
+        f"Estado anterior: {transicion.anterior}"
+    )
 
-        # Actualizar métricas por estado
-        if instance.estado == EstadoPedido.ENTREGADO:
-            actualizar_metricas('pedidos_entregados', incremento=1)
-            logger.debug(f"Métrica de pedidos entregados actualizada")
-        elif instance.estado == EstadoPedido.CANCELADO:
-            actualizar_metricas('pedidos_cancelados', incremento=1)
-            logger.debug(f"Métrica de pedidos cancelados actualizada")
+    # Notificar a las partes involucradas
+    try:
+        from notificaciones.services import notificar_cancelacion
+        notificar_cancelacion(pedido)
+    except ImportError:
+        logger.debug("Servicio de notificaciones no disponible")
+    except Exception as e:
+        logger.warning(f"Error al notificar cancelación: {e}")
 
+    # Registrar en sistema de analíticas
+    try:
+        from analytics.services import registrar_cancelacion, actualizar_metricas
+        registrar_cancelacion(pedido)
+        actualizar_metricas('pedidos_cancelados', incremento=1)
     except ImportError:
         logger.debug("Sistema de analytics no disponible")
     except Exception as e:
-        logger.error(f"Error al actualizar métricas: {e}")
-    finally:
-        desmarcar_procesando('metricas', instance.id)
+        logger.warning(f"Error al registrar en analytics: {e}")
 
 
 # ==========================================================
@@ -460,6 +347,16 @@ def pedido_eliminado(sender, instance, **kwargs):
     Registra cuando un pedido es eliminado del sistema.
     NOTA: Solo admins deberían poder eliminar pedidos.
     """
+    from . import feed_disponibles, resumen
+
+    pedido_id = instance.id
+    transaction.on_commit(lambda: feed_disponibles.quitar(pedido_id))
+
+    try:
+        resumen.restar_pedido(instance)
+    except Exception as e:
+        logger.error(f"Error al descontar pedido #{pedido_id} del resumen horario: {e}")
+
     logger.warning(
         f"[PEDIDO ELIMINADO] #{instance.id} - "
         f"Estado: {instance.get_estado_display()} - "
@@ -550,20 +447,13 @@ def verificar_pedidos_retrasados():
     Función que puede ser llamada por un cron job o tarea de Celery
     para verificar pedidos retrasados.
     """
-    from datetime import timedelta
-
-    # Buscar pedidos en ruta por más de 60 minutos
-    tiempo_limite = timezone.now() - timedelta(minutes=60)
-
     try:
-        pedidos_retrasados = Pedido.objects.filter(
-            estado=EstadoPedido.EN_RUTA,
-            actualizado_en__lt=tiempo_limite
-        ).select_related('cliente__user', 'repartidor__user')
+        # Pedidos en ruta que pasaron su fecha límite (rango sobre índice)
+        pedidos_retrasados = Pedido.objects.con_retraso().iterator(chunk_size=500)
 
         contador = 0
         for pedido in pedidos_retrasados:
-            tiempo_retraso = (timezone.now() - pedido.actualizado_en).total_seconds() / 60
+            tiempo_retraso = (timezone.now() - pedido.fecha_limite_entrega).total_seconds() / 60
 
             # Emitir señal personalizada
             pedido_retrasado.send(
@@ -28,6 +28,8 @@ from django.db.models import Q, Count, Sum, Avg
 from datetime import timedelta
 import logging
 
+from utils.tareas import TAMANO_LOTE, medir, repartir
+
 logger = logging.getLogger('pedidos.tasks')
 
 
@@ -38,8 +40,9 @@ logger = logging.getLogger('pedidos.tasks')
 @shared_task(name='pedidos.verificar_pedidos_retrasados')
 def verificar_pedidos_retrasados():
     """
-    Verifica pedidos que están en ruta por más tiempo del esperado.
-    Se ejecuta cada 15 minutos.
+    Verifica pedidos en ruta que pasaron su fecha límite de entrega
+    (consulta de rango sobre un índice). Se ejecuta cada 15 minutos. Solo
+    lee los IDs y reparte el aviso en lotes (`pedidos.avisar_pedidos_retrasados`).
 
     Configurar en celery beat:
     CELERY_BEAT_SCHEDULE = {
@@ -49,79 +52,130 @@ def verificar_pedidos_retrasados():
         },
     }
     """
-    from .models import Pedido, EstadoPedido
-    from .signals import pedido_retrasado
+    from .models import Pedido
 
-    tiempo_limite = timezone.now() - timedelta(minutes=45)
+    tiempo_limite = timezone.now()
 
-    pedidos = Pedido.objects.filter(
-        estado=EstadoPedido.EN_RUTA,
-        actualizado_en__lt=tiempo_limite
-    ).select_related('cliente__user', 'repartidor__user')
+    with medir('pedidos.verificar_pedidos_retrasados') as resultado:
+        ids = (
+            Pedido.objects.con_retraso(ahora=tiempo_limite)
+            .order_by()
+            .values_list('id', flat=True)
+            .iterator(chunk_size=TAMANO_LOTE)
+        )
+        resultado['pedidos_retrasados'], resultado['lotes'] = repartir(
+            avisar_pedidos_retrasados, ids, tiempo_limite=tiempo_limite.isoformat()
+        )
 
-    contador = 0
-    for pedido in pedidos:
-        tiempo_retraso = (timezone.now() - pedido.actualizado_en).total_seconds() / 60
+    return resultado
 
-        logger.warning(
-            f"Pedido #{pedido.id} retrasado {int(tiempo_retraso)} minutos"
-        )
 
-        # Emitir señal personalizada
-        pedido_retrasado.send(
-            sender=Pedido,
-            pedido=pedido,
-            tiempo_retraso=int(tiempo_retraso)
-        )
+@shared_task(name='pedidos.avisar_pedidos_retrasados')
+def avisar_pedidos_retrasados(pedido_ids, tiempo_limite):
+    """
+    Emite `pedido_retrasado` para un lote de pedidos, con los minutos
+    transcurridos desde su fecha límite. Vuelve a filtrar por estado: los
+    que se entregaron mientras el lote esperaba se omiten.
+    """
+    from datetime import datetime
+    from .models import Pedido
+    from .signals import pedido_retrasado
 
-        contador += 1
+    with medir('pedidos.avisar_pedidos_retrasados') as resultado:
+        resultado['lote'] = len(pedido_ids)
+        pedidos = Pedido.objects.con_retraso(
+            ahora=datetime.fromisoformat(tiempo_limite)
+        ).filter(id__in=pedido_ids)
 
-    logger.info(f"Verificación completada: {contador} pedidos retrasados encontrados")
-    return {'pedidos_retrasados': contador}
+        ahora = timezone.now()
+        avisados = 0
+        for pedido in pedidos:
+            tiempo_retraso = int((ahora - pedido.fecha_limite_entrega).total_seconds() / 60)
+
+            logger.warning(f"Pedido #{pedido.id} retrasado {tiempo_retraso} minutos")
+
+            # Emitir señal personalizada
+            pedido_retrasado.send(
+                sender=Pedido,
+                pedido=pedido,
+                tiempo_retraso=tiempo_retraso
+            )
+            avisados += 1
+
+        resultado['avisados'] = avisados
+
+    return resultado
 
 
 @shared_task(name='pedidos.verificar_pedidos_sin_repartidor')
 def verificar_pedidos_sin_repartidor():
     """
     Verifica pedidos confirmados que llevan más de 10 minutos
-    sin ser aceptados por un repartidor.
+    sin ser aceptados por un repartidor y los pasa a la asignación
+    automática (ofertas por rondas a los repartidores más cercanos)
+    en lotes (`pedidos.asignar_pedidos_sin_repartidor`).
     Se ejecuta cada 5 minutos.
     """
     from .models import Pedido, EstadoPedido
 
     tiempo_limite = timezone.now() - timedelta(minutes=10)
 
-    pedidos = Pedido.objects.filter(
-        estado=EstadoPedido.CONFIRMADO,
-        repartidor__isnull=True,
-        creado_en__lt=tiempo_limite
-    ).select_related('cliente__user')
+    with medir('pedidos.verificar_pedidos_sin_repartidor') as resultado:
+        pedidos = Pedido.objects.filter(
+            estado=EstadoPedido.CONFIRMADO,
+            repartidor__isnull=True,
+            creado_en__lt=tiempo_limite
+        )
 
-    contador = pedidos.count()
+        ids = pedidos.order_by().values_list('id', flat=True).iterator(chunk_size=TAMANO_LOTE)
+        contador, resultado['lotes'] = repartir(asignar_pedidos_sin_repartidor, ids)
+        resultado['pedidos_sin_asignar'] = contador
 
-    if contador > 0:
-        logger.warning(
-            f"Hay {contador} pedidos sin asignar por más de 10 minutos"
-        )
+        if contador > 0:
+            logger.warning(
+                f"Hay {contador} pedidos sin asignar por más de 10 minutos"
+            )
 
-        # Notificar a administradores
-        try:
-            from notificaciones.services import notificar_admin_pedidos_sin_asignar
-            notificar_admin_pedidos_sin_asignar(pedidos)
-        except ImportError:
-            pass
+            # Notificar a administradores
+            try:
+                from notificaciones.services import notificar_admin_pedidos_sin_asignar
+                notificar_admin_pedidos_sin_asignar(pedidos)
+            except ImportError:
+                pass
+
+    return resultado
 
-        # Aumentar incentivo para repartidores (opcional)
-        for pedido in pedidos:
-            logger.info(f"Pedido #{pedido.id} esperando asignación")
 
-    return {'pedidos_sin_asignar': contador}
+@shared_task(name='pedidos.asignar_pedidos_sin_repartidor')
+def asignar_pedidos_sin_repartidor(pedido_ids):
+    """Pasa un lote de pedidos sin repartidor a la asignación automática."""
+    from repartidores.asignacion import iniciar_asignacion
+    from .models import Pedido, EstadoPedido
+
+    with medir('pedidos.asignar_pedidos_sin_repartidor') as resultado:
+        resultado['lote'] = len(pedido_ids)
+        pendientes = Pedido.objects.filter(
+            id__in=pedido_ids,
+            estado=EstadoPedido.CONFIRMADO,
+            repartidor__isnull=True
+        ).values_list('id', flat=True)
+
+        despachados = 0
+        for pedido_id in pendientes:
+            if iniciar_asignacion(pedido_id):
+                despachados += 1
+                logger.info(f"Pedido #{pedido_id} enviado a asignación automática")
+
+        resultado['enviados_a_asignacion'] = despachados
+
+    return resultado
 
 
 @shared_task(name='pedidos.limpiar_pedidos_antiguos_cancelados')
 def limpiar_pedidos_antiguos_cancelados():
     """
-    Archiva o elimina pedidos cancelados con más de 90 días.
+    Mueve al archivo particionado los pedidos entregados o cancelados con
+    más de PEDIDOS_DIAS_ARCHIVO días (ver pedidos/archivo.py).
     Se ejecuta diariamente a las 3 AM.
 
     Configurar en celery beat:
@@ -132,29 +186,19 @@ def limpiar_pedidos_antiguos_cancelados():
         },
     }
     """
-    from .models import Pedido, EstadoPedido
-
-    fecha_limite = timezone.now() - timedelta(days=90)
-
-    pedidos_antiguos = Pedido.objects.filter(
-        estado=EstadoPedido.CANCELADO,
-        creado_en__lt=fecha_limite
-    )
-
-    cantidad = pedidos_antiguos.count()
+    from . import archivo
 
-    # Opción 1: Archivar en otra tabla
-    # for pedido in pedidos_antiguos:
-    #     PedidoArchivado.objects.create_from_pedido(pedido)
+    resultado = archivo.archivar()
 
-    # Opción 2: Eliminar directamente (comentado por seguridad)
-    # pedidos_antiguos.delete()
+    if resultado is None:
+        logger.info("Archivo de pedidos no particionado (no es Postgres); no se archiva")
+        return {'archivados': 0}
 
     logger.info(
-        f"Limpieza programada: {cantidad} pedidos cancelados antiguos encontrados"
+        f"Archivo de pedidos: {resultado['archivados']} pedidos movidos "
+        f"en {resultado['lotes']} lotes"
     )
-
-    return {'pedidos_antiguos': cantidad}
+    return resultado
 
 
 # ==========================================================
@@ -382,10 +426,28 @@ def sincronizar_estado_con_proveedor(pedido_id):
 def recalcular_comisiones():
     """
     Recalcula las comisiones de todos los pedidos entregados
-    que no tengan comisiones calculadas.
+    que no tengan comisiones calculadas, con un UPDATE por lote de IDs
+    (Pedido.PORCENTAJES_GANANCIAS, como Pedido._distribuir_ganancias; el
+    ROUND de numeric en Postgres redondea la mitad hacia arriba, igual que
+    ROUND_HALF_UP en Python). Después
+    reconcilia las horas afectadas de ResumenPedidoHora, que acumula las
+    comisiones de los entregados.
     Se ejecuta semanalmente.
     """
-    from .models import Pedido, EstadoPedido
+    from django.db.models import Case, F, Value, When
+    from django.db.models.functions import Round
+    from utils.tareas import en_lotes
+    from .models import Pedido, EstadoPedido, TipoPedido
+    from . import resumen
+
+    def porcentaje(parte):
+        return Round(
+            F('total') * Case(
+                When(tipo=TipoPedido.PROVEEDOR, then=Value(Pedido.PORCENTAJES_GANANCIAS[TipoPedido.PROVEEDOR][parte])),
+                default=Value(Pedido.PORCENTAJES_GANANCIAS[TipoPedido.DIRECTO][parte]),
+            ),
+            2,
+        )
 
     pedidos_sin_comisiones = Pedido.objects.filter(
         estado=EstadoPedido.ENTREGADO,
@@ -394,16 +456,28 @@ def recalcular_comisiones():
         ganancia_app=0
     )
 
-    contador = 0
-    for pedido in pedidos_sin_comisiones:
-        try:
-            pedido._distribuir_ganancias()
-            contador += 1
-            logger.info(f"Comisiones recalculadas para pedido #{pedido.id}")
-        except Exception as e:
-            logger.error(f"Error al recalcular comisiones del pedido #{pedido.id}: {e}")
+    with medir('pedidos.recalcular_comisiones') as resultado:
+        filas = (
+            pedidos_sin_comisiones.order_by()
+            .values_list('id', 'creado_en')
+            .iterator(chunk_size=TAMANO_LOTE)
+        )
+
+        contador = 0
+        horas = set()
+        for lote in en_lotes(filas):
+            contador += pedidos_sin_comisiones.filter(id__in=[pid for pid, _ in lote]).update(
+                comision_repartidor=porcentaje(0),
+                comision_proveedor=porcentaje(1),
+                ganancia_app=porcentaje(2),
+                actualizado_en=timezone.now(),
+            )
+            horas.update(resumen.truncar_hora(creado_en) for _, creado_en in lote)
+
+        resultado['pedidos_actualizados'] = contador
+        resultado['horas_reconciliadas'] = resumen.reconciliar_horas(horas)
 
-    return {'pedidos_actualizados': contador}
+    return resultado
 
 
 @shared_task(name='pedidos.actualizar_cache_estadisticas')
@@ -422,7 +496,7 @@ def actualizar_cache_estadisticas():
                 estado__in=[EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION, EstadoPedido.EN_RUTA]
             ).count(),
             'pedidos_hoy': Pedido.objects.filter(
-                creado_en__date=timezone.now().date()
+                dia_creado=timezone.localdate()
             ).count(),
         }
 
@@ -435,6 +509,140 @@ def actualizar_cache_estadisticas():
         return {'error': str(e)}
 
 
+# ==========================================================
+# 📬 OUTBOX DE EFECTOS SECUNDARIOS
+# ==========================================================
+
+@shared_task(name='pedidos.drenar_outbox')
+def drenar_outbox():
+    """
+    Procesa los eventos pendientes del outbox de pedidos (notificaciones,
+    chats, métricas). Se programa tras cada commit con eventos y, como
+    respaldo para reintentos y broker caído, cada 15 segundos.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'drenar-outbox-pedidos': {
+            'task': 'pedidos.drenar_outbox',
+            'schedule': 15.0,
+        },
+    }
+    """
+    from .outbox import drenar
+    return drenar()
+
+
+@shared_task(name='pedidos.purgar_outbox')
+def purgar_outbox(dias=7):
+    """
+    Elimina los eventos del outbox procesados con éxito hace más de `dias`.
+    Se ejecuta diariamente.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'purgar-outbox-pedidos': {
+            'task': 'pedidos.purgar_outbox',
+            'schedule': crontab(hour=4, minute=30),
+        },
+    }
+    """
+    from .outbox import purgar
+
+    eliminados = purgar(dias)
+    logger.info(f"Outbox purgado: {eliminados} eventos eliminados")
+    return {'eliminados': eliminados}
+
+
+# ==========================================================
+# 🛵 FEED DE PEDIDOS DISPONIBLES
+# ==========================================================
+
+@shared_task(name='pedidos.reconciliar_feed_disponibles')
+def reconciliar_feed_disponibles():
+    """
+    Alinea el feed de pedidos disponibles en Redis con la base de datos
+    (altas/bajas perdidas, Redis reiniciado). Se ejecuta cada 5 minutos.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'reconciliar-feed-disponibles': {
+            'task': 'pedidos.reconciliar_feed_disponibles',
+            'schedule': 300.0,
+        },
+    }
+    """
+    from .feed_disponibles import reconstruir
+
+    resultado = reconstruir()
+    if resultado is None:
+        return {'error': 'Redis no disponible'}
+
+    if resultado['agregados'] or resultado['quitados']:
+        logger.warning(
+            f"Feed de disponibles corregido: {resultado['agregados']} agregados, "
+            f"{resultado['quitados']} quitados"
+        )
+    return resultado
+
+
+# ==========================================================
+# 📊 RESUMEN HORARIO DE PEDIDOS
+# ==========================================================
+
+@shared_task(name='pedidos.reconciliar_resumen_horario')
+def reconciliar_resumen_horario(horas=48):
+    """
+    Recalcula ResumenPedidoHora de las últimas `horas` horas desde los
+    pedidos (corrige ediciones hechas por fuera de las transiciones).
+    Se ejecuta cada hora.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'reconciliar-resumen-horario': {
+            'task': 'pedidos.reconciliar_resumen_horario',
+            'schedule': crontab(minute=15),
+        },
+    }
+    """
+    from .resumen import reconciliar
+
+    hasta = timezone.now() + timedelta(hours=1)
+    celdas = reconciliar(hasta - timedelta(hours=horas + 1), hasta)
+
+    logger.info(f"Resumen horario reconciliado: {celdas} celdas en {horas} horas")
+    return {'celdas': celdas}
+
+
+# ==========================================================
+# ⏱️ MATRIZ DE TIEMPOS DE VIAJE
+# ==========================================================
+
+@shared_task(name='pedidos.reconstruir_matriz_tiempos', soft_time_limit=60 * 30, time_limit=60 * 40)
+def reconstruir_matriz_tiempos():
+    """
+    Reconstruye la matriz de tiempos de viaje entre celdas geohash con las
+    entregas de los últimos PEDIDOS_MATRIZ_TIEMPOS_DIAS días y la publica
+    para los workers. Se ejecuta cada noche; recorre muchas entregas, por
+    eso tiene un límite de tiempo propio.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'reconstruir-matriz-tiempos': {
+            'task': 'pedidos.reconstruir_matriz_tiempos',
+            'schedule': crontab(hour=3, minute=30),
+        },
+    }
+    """
+    from .tiempos_viaje import construir
+
+    resultado = construir()
+    return {
+        'version': resultado['version'],
+        'muestras': resultado['muestras'],
+        'pares': resultado['pares'],
+    }
+
+
 # ==========================================================
 # 🛠️ FUNCIONES AUXILIARES
 # ==========================================================
@@ -1,3 +1,509 @@
-from django.test import TestCase
+from datetime import timedelta
+from threading import Barrier, Thread
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from authentication.models import User
+from proveedores.models import Proveedor
+from repartidores.models import EstadoRepartidor, Repartidor
+
+from . import archivo, lote, outbox, transiciones
+from .models import EstadoPedido, EventoPedido, HistorialPedido, Pedido, TipoPedido
+
+
+# ==========================================================
+# DATOS DE PRUEBA
+# ==========================================================
+def crear_cliente(n=1):
+    user = User.objects.create_user(
+        username=f'cliente{n}',
+        email=f'cliente{n}@deliber.test',
+        password='Clave12345',
+        first_name='Cliente',
+        last_name=f'{n}',
+    )
+    return user.perfil_usuario
+
+
+def crear_repartidor(n=1):
+    # Rol USUARIO: la señal de rol REPARTIDOR crearía otro Repartidor
+    user = User.objects.create_user(
+        username=f'repartidor{n}',
+        email=f'repartidor{n}@deliber.test',
+        password='Clave12345',
+        first_name='Repartidor',
+        last_name=f'{n}',
+    )
+    return Repartidor.objects.create(
+        user=user,
+        cedula=f'{n:010d}',
+        telefono='0991234567',
+        estado=EstadoRepartidor.DISPONIBLE,
+        verificado=True,
+    )
+
+
+def crear_proveedor(n=1):
+    return Proveedor.objects.create(nombre=f'Proveedor {n}', ruc=f'{n:013d}')
+
+
+def crear_pedido(cliente, proveedor=None, **campos):
+    return Pedido.objects.create(
+        cliente=cliente,
+        proveedor=proveedor,
+        tipo=TipoPedido.PROVEEDOR if proveedor else TipoPedido.DIRECTO,
+        descripcion='Pedido de prueba',
+        direccion_entrega='Av. Amazonas y Colón',
+        total=10,
+        **campos,
+    )
+
+
+class SuscripcionesMixin:
+    """Registra consumidores de prueba y los quita al terminar cada test."""
+
+    def suscribir(self, desde=transiciones.CUALQUIERA, hacia=transiciones.CUALQUIERA, diferido=False):
+        llamadas = []
+
+        def consumidor(transicion):
+            llamadas.append(transicion)
+
+        transiciones.al_transicionar(desde=desde, hacia=hacia, diferido=diferido)(consumidor)
+        self.addCleanup(self._desuscribir, consumidor)
+        return consumidor, llamadas
+
+    def suscribir_asignacion(self):
+        llamadas = []
+
+        def consumidor(transicion):
+            llamadas.append(transicion)
+
+        transiciones.al_asignar_repartidor(consumidor)
+        self.addCleanup(self._desuscribir, consumidor)
+        return llamadas
+
+    @staticmethod
+    def _desuscribir(consumidor):
+        for registrados in transiciones._consumidores.values():
+            if consumidor in registrados:
+                registrados.remove(consumidor)
+        if consumidor in transiciones._al_asignar:
+            transiciones._al_asignar.remove(consumidor)
+        transiciones._diferidos.pop(transiciones.nombre(consumidor), None)
+
+
+# ==========================================================
+# TRANSICIONES
+# ==========================================================
+class TransicionesTests(SuscripcionesMixin, TestCase):
+
+    def setUp(self):
+        self.cliente = crear_cliente()
+        self.proveedor = crear_proveedor()
+
+    def test_creacion_emite_una_vez_y_no_cuenta_como_cambio(self):
+        _, creados = self.suscribir(desde=transiciones.CREADO)
+        _, cambios = self.suscribir()
+
+        pedido = crear_pedido(self.cliente, self.proveedor)
+
+        self.assertEqual(len(creados), 1)
+        self.assertIsNone(creados[0].anterior)
+        self.assertEqual(creados[0].nuevo, EstadoPedido.CONFIRMADO)
+        self.assertEqual(cambios, [])
+
+        pedido.descripcion = 'Sin cebolla'
+        pedido.save()
+        self.assertEqual(len(creados), 1)
+        self.assertEqual(cambios, [])
+
+    def test_cada_transicion_suscrita_se_emite_una_vez_por_guardado(self):
+        pedido = crear_pedido(self.cliente, self.proveedor)
+        # Suscrito por dos claves que coinciden: se ejecuta una sola vez
+        _, llamadas = self.suscribir(
+            desde=[EstadoPedido.CONFIRMADO, transiciones.CUALQUIERA],
+            hacia=EstadoPedido.EN_PREPARACION,
+        )
+
+        pedido.estado = EstadoPedido.EN_PREPARACION
+        pedido.save()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(
+            (llamadas[0].anterior, llamadas[0].nuevo),
+            (EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION),
+        )
+
+        pedido.save()
+        pedido.save(update_fields=['descripcion'])
+        self.assertEqual(len(llamadas), 1)
+
+        # Una instancia cargada de nuevo parte del estado guardado
+        Pedido.objects.get(pk=pedido.pk).save()
+        self.assertEqual(len(llamadas), 1)
+
+    def test_consumidor_que_vuelve_a_guardar_no_repite_la_transicion(self):
+        pedido = crear_pedido(self.cliente, self.proveedor)
+        llamadas = []
+
+        def reguardar(transicion):
+            llamadas.append(transicion)
+            transicion.pedido.descripcion = 'Actualizado por el consumidor'
+            transicion.pedido.save()
+
+        transiciones.al_transicionar(hacia=EstadoPedido.CANCELADO)(reguardar)
+        self.addCleanup(self._desuscribir, reguardar)
+
+        pedido.estado = EstadoPedido.CANCELADO
+        pedido.save()
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(
+            HistorialPedido.objects.filter(pedido=pedido, estado_nuevo=EstadoPedido.CANCELADO).count(), 1
+        )
+
+    def test_update_fields_sin_estado_no_emite(self):
+        pedido = crear_pedido(self.cliente, self.proveedor)
+        _, llamadas = self.suscribir()
+
+        pedido.estado = EstadoPedido.EN_PREPARACION
+        pedido.save(update_fields=['descripcion'])
+
+        self.assertEqual(llamadas, [])
+        self.assertEqual(
+            Pedido.objects.filter(pk=pedido.pk).values_list('estado', flat=True).get(),
+            EstadoPedido.CONFIRMADO,
+        )
+
+
+# ==========================================================
+# OUTBOX
+# ==========================================================
+class OutboxTests(SuscripcionesMixin, TestCase):
+
+    def setUp(self):
+        self.pedido = crear_pedido(crear_cliente(), crear_proveedor())
+        self.consumidores = []
+
+    def _diferido(self, fallos=0):
+        """Consumidor diferido que falla las primeras `fallos` veces."""
+        llamadas = []
+
+        def consumidor(transicion):
+            llamadas.append(transicion)
+            if len(llamadas) <= fallos:
+                raise RuntimeError(f'fallo {len(llamadas)}')
+
+        transiciones.al_transicionar(hacia=EstadoPedido.CANCELADO, diferido=True)(consumidor)
+        self.addCleanup(self._desuscribir, consumidor)
+        self.consumidores.append(transiciones.nombre(consumidor))
+        return consumidor, llamadas
+
+    def _cancelar(self):
+        self.pedido.estado = EstadoPedido.CANCELADO
+        self.pedido.save()
+        # Solo los eventos de los consumidores del test
+        EventoPedido.objects.exclude(consumidor__in=self.consumidores).delete()
+
+    def _evento(self, consumidor):
+        return EventoPedido.objects.get(consumidor=transiciones.nombre(consumidor))
+
+    def _vencer_espera(self):
+        EventoPedido.objects.update(disponible_en=timezone.now())
+
+    def test_el_diferido_se_encola_y_no_se_ejecuta_en_el_guardado(self):
+        consumidor, llamadas = self._diferido()
+
+        self._cancelar()
+
+        self.assertEqual(llamadas, [])
+        evento = self._evento(consumidor)
+        self.assertEqual(evento.pedido_id, self.pedido.pk)
+        self.assertEqual(
+            (evento.estado_anterior, evento.estado_nuevo),
+            (EstadoPedido.CONFIRMADO, EstadoPedido.CANCELADO),
+        )
+        self.assertIsNone(evento.procesado_en)
+
+    def test_encolar_dos_veces_el_mismo_evento_es_idempotente(self):
+        consumidor, _ = self._diferido()
+        transicion = transiciones.Transicion(
+            self.pedido, EstadoPedido.CONFIRMADO, EstadoPedido.CANCELADO, False, 'evento-repetido'
+        )
+
+        outbox.encolar(transicion, [transiciones.nombre(consumidor)])
+        outbox.encolar(transicion, [transiciones.nombre(consumidor)])
+
+        self.assertEqual(EventoPedido.objects.filter(clave__startswith='evento-repetido:').count(), 1)
+
+    def test_drenar_procesa_una_sola_vez(self):
+        consumidor, llamadas = self._diferido()
+        self._cancelar()
+
+        self.assertEqual(outbox.drenar(), {'procesados': 1, 'errores': 0})
+        self._vencer_espera()
+        self.assertEqual(outbox.drenar(), {'procesados': 0, 'errores': 0})
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(llamadas[0].pedido.pk, self.pedido.pk)
+        evento = self._evento(consumidor)
+        self.assertIsNotNone(evento.procesado_en)
+        self.assertEqual(evento.intentos, 1)
+        self.assertFalse(evento.fallido)
+
+    def test_error_se_reintenta_con_espera(self):
+        consumidor, llamadas = self._diferido(fallos=1)
+        self._cancelar()
+
+        self.assertEqual(outbox.drenar(), {'procesados': 0, 'errores': 1})
+        evento = self._evento(consumidor)
+        self.assertIsNone(evento.procesado_en)
+        self.assertEqual(evento.intentos, 1)
+        self.assertEqual(evento.ultimo_error, 'fallo 1')
+        self.assertGreater(evento.disponible_en, timezone.now())
+
+        # Antes de la espera no se reintenta
+        self.assertEqual(outbox.drenar(), {'procesados': 0, 'errores': 0})
+
+        self._vencer_espera()
+        self.assertEqual(outbox.drenar(), {'procesados': 1, 'errores': 0})
+        evento.refresh_from_db()
+        self.assertIsNotNone(evento.procesado_en)
+        self.assertEqual(evento.intentos, 2)
+        self.assertEqual(evento.ultimo_error, '')
+        self.assertEqual(len(llamadas), 2)
+
+    def test_tras_max_intentos_queda_fallido(self):
+        consumidor, llamadas = self._diferido(fallos=outbox.MAX_INTENTOS + 1)
+        self._cancelar()
+
+        for _ in range(outbox.MAX_INTENTOS):
+            self._vencer_espera()
+            outbox.drenar()
+
+        evento = self._evento(consumidor)
+        self.assertTrue(evento.fallido)
+        self.assertIsNotNone(evento.procesado_en)
+        self.assertEqual(evento.intentos, outbox.MAX_INTENTOS)
+
+        self._vencer_espera()
+        self.assertEqual(outbox.drenar(), {'procesados': 0, 'errores': 0})
+        self.assertEqual(len(llamadas), outbox.MAX_INTENTOS)
+
+
+# ==========================================================
+# ACEPTACIÓN POR REPARTIDOR
+# ==========================================================
+class AceptacionTests(SuscripcionesMixin, TestCase):
+
+    def setUp(self):
+        self.pedido = crear_pedido(crear_cliente(), crear_proveedor())
+        self.primero = crear_repartidor(1)
+        self.segundo = crear_repartidor(2)
+
+    def test_gana_un_solo_repartidor(self):
+        asignaciones = self.suscribir_asignacion()
+        # Copia leída antes de la primera aceptación: no ve al ganador
+        copia = Pedido.objects.get(pk=self.pedido.pk)
+
+        self.pedido.aceptar_por_repartidor(self.primero)
+        with self.assertRaisesMessage(ValidationError, 'ya fue tomado por otro repartidor'):
+            copia.aceptar_por_repartidor(self.segundo)
+
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        self.assertEqual(pedido.repartidor_id, self.primero.pk)
+        self.assertEqual(pedido.estado, EstadoPedido.EN_PREPARACION)
+        self.assertEqual(len(asignaciones), 1)
+
+        self.primero.refresh_from_db()
+        self.segundo.refresh_from_db()
+        self.assertEqual(self.primero.estado, EstadoRepartidor.OCUPADO)
+        self.assertEqual(self.segundo.estado, EstadoRepartidor.DISPONIBLE)
+
+    def test_repartidor_no_disponible_no_toma_el_pedido(self):
+        Repartidor.objects.filter(pk=self.segundo.pk).update(estado=EstadoRepartidor.FUERA_SERVICIO)
+        self.segundo.refresh_from_db()
+
+        with self.assertRaises(ValidationError):
+            self.pedido.aceptar_por_repartidor(self.segundo)
+
+        self.assertIsNone(Pedido.objects.get(pk=self.pedido.pk).repartidor_id)
+
+
+class AceptacionConcurrenteTests(TransactionTestCase):
+
+    HILOS = 5
+
+    def test_aceptaciones_simultaneas_tienen_un_ganador(self):
+        pedido = crear_pedido(crear_cliente(), crear_proveedor())
+        repartidores = [crear_repartidor(n) for n in range(1, self.HILOS + 1)]
+        barrera = Barrier(self.HILOS)
+        resultados = {}
+
+        def aceptar(repartidor):
+            try:
+                copia = Pedido.objects.get(pk=pedido.pk)
+                barrera.wait()
+                copia.aceptar_por_repartidor(repartidor)
+                resultados[repartidor.pk] = True
+            except ValidationError:
+                resultados[repartidor.pk] = False
+            except Exception as e:
+                resultados[repartidor.pk] = e
+            finally:
+                connection.close()
+
+        hilos = [Thread(target=aceptar, args=(repartidor,)) for repartidor in repartidores]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(resultados), self.HILOS)
+        self.assertTrue(all(isinstance(resultado, bool) for resultado in resultados.values()), resultados)
+        ganadores = [pk for pk, gano in resultados.items() if gano]
+        self.assertEqual(len(ganadores), 1)
+
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).repartidor_id, ganadores[0])
+        self.assertEqual(
+            set(Repartidor.objects.filter(estado=EstadoRepartidor.OCUPADO).values_list('pk', flat=True)),
+            set(ganadores),
+        )
+
+
+# ==========================================================
+# CAMBIOS DE ESTADO EN LOTE
+# ==========================================================
+class CambioEstadosLoteTests(SuscripcionesMixin, TestCase):
+
+    def setUp(self):
+        self.cliente = crear_cliente()
+        self.proveedor = crear_proveedor()
+
+    def _estado(self, pedido):
+        return Pedido.objects.filter(pk=pedido.pk).values_list('estado', flat=True).get()
+
+    def test_rechaza_transiciones_invalidas_sin_detener_el_lote(self):
+        valido = crear_pedido(self.cliente, self.proveedor)
+        salto = crear_pedido(self.cliente, self.proveedor)
+        final = crear_pedido(self.cliente, self.proveedor, estado=EstadoPedido.CANCELADO)
+        _, llamadas = self.suscribir(hacia=EstadoPedido.EN_PREPARACION)
+
+        resultado = lote.cambiar_estados(
+            {
+                valido.pk: EstadoPedido.EN_PREPARACION,
+                salto.pk: EstadoPedido.ENTREGADO,
+                final.pk: EstadoPedido.EN_PREPARACION,
+                0: EstadoPedido.CANCELADO,
+            },
+            actor='admin',
+        )
+
+        self.assertEqual(resultado['actualizados'], [valido.pk])
+        self.assertEqual(set(resultado['errores']), {salto.pk, final.pk, 0})
+        self.assertIn("No se puede cambiar de", resultado['errores'][salto.pk])
+        self.assertIn("No se puede cambiar desde el estado", resultado['errores'][final.pk])
+        self.assertEqual(resultado['errores'][0], "Pedido no encontrado.")
+
+        self.assertEqual(self._estado(valido), EstadoPedido.EN_PREPARACION)
+        self.assertEqual(self._estado(salto), EstadoPedido.CONFIRMADO)
+        self.assertEqual(self._estado(final), EstadoPedido.CANCELADO)
+
+        # Una transición por pedido actualizado
+        self.assertEqual([transicion.pedido.pk for transicion in llamadas], [valido.pk])
+        self.assertEqual(HistorialPedido.objects.filter(pedido=valido).count(), 1)
+        self.assertFalse(HistorialPedido.objects.filter(pedido__in=[salto, final]).exists())
+
+    def test_en_ruta_sin_repartidor_es_invalido(self):
+        pedido = crear_pedido(self.cliente, self.proveedor, estado=EstadoPedido.EN_PREPARACION)
+
+        resultado = lote.cambiar_estados({pedido.pk: EstadoPedido.EN_RUTA}, actor='admin')
+
+        self.assertEqual(resultado['actualizados'], [])
+        self.assertIn(pedido.pk, resultado['errores'])
+        self.assertEqual(self._estado(pedido), EstadoPedido.EN_PREPARACION)
+
+    def test_proveedor_solo_cambia_sus_pedidos_y_estados_permitidos(self):
+        propio = crear_pedido(self.cliente, self.proveedor)
+        ajeno = crear_pedido(self.cliente, crear_proveedor(2))
+        a_ruta = crear_pedido(self.cliente, self.proveedor)
+
+        resultado = lote.cambiar_estados(
+            {
+                propio.pk: EstadoPedido.CANCELADO,
+                ajeno.pk: EstadoPedido.CANCELADO,
+                a_ruta.pk: EstadoPedido.EN_RUTA,
+            },
+            actor='proveedor',
+            proveedor=self.proveedor,
+        )
+
+        self.assertEqual(resultado['actualizados'], [propio.pk])
+        self.assertEqual(resultado['errores'][ajeno.pk], "Pedido no encontrado.")
+        self.assertIn("solo puede pasar pedidos", resultado['errores'][a_ruta.pk])
+        self.assertEqual(self._estado(ajeno), EstadoPedido.CONFIRMADO)
+        self.assertEqual(
+            Pedido.objects.filter(pk=propio.pk).values_list('cancelado_por', flat=True).get(), 'proveedor'
+        )
+
+    def test_limite_de_pedidos_por_lote(self):
+        with self.assertRaises(ValueError):
+            lote.cambiar_estados(
+                {pk: EstadoPedido.CANCELADO for pk in range(1, lote.MAX_PEDIDOS + 2)}, actor='admin'
+            )
+
+
+# ==========================================================
+# ARCHIVO
+# ==========================================================
+class ArchivoTests(TestCase):
+
+    def setUp(self):
+        self.cliente = crear_cliente()
+        self.proveedor = crear_proveedor()
+
+    def _finalizado(self, dias):
+        pedido = crear_pedido(self.cliente, self.proveedor)
+        pedido.estado = EstadoPedido.CANCELADO
+        pedido.save()
+        Pedido.objects.filter(pk=pedido.pk).update(creado_en=timezone.now() - timedelta(days=dias))
+        return Pedido.objects.get(pk=pedido.pk)
+
+    def test_archivar_y_obtener_pedido(self):
+        viejo = self._finalizado(dias=archivo.dias_archivo() + 10)
+        reciente = self._finalizado(dias=1)
+
+        self.assertEqual(archivo.archivar(), {'archivados': 1, 'lotes': 1})
+
+        self.assertFalse(Pedido.objects.filter(pk=viejo.pk).exists())
+        self.assertFalse(HistorialPedido.objects.filter(pedido_id=viejo.pk).exists())
+
+        archivado = archivo.obtener_pedido(viejo.pk)
+        self.assertTrue(archivado.archivado)
+        for campo in ('estado', 'tipo', 'total', 'cliente_id', 'proveedor_id',
+                      'direccion_entrega', 'creado_en', 'cancelado_por'):
+            self.assertEqual(getattr(archivado, campo), getattr(viejo, campo), campo)
+        self.assertEqual(archivado.cliente.pk, self.cliente.pk)
+
+        historial = archivo.obtener_historial(archivado)
+        self.assertEqual(
+            [(fila.estado_anterior, fila.estado_nuevo) for fila in historial],
+            [(EstadoPedido.CONFIRMADO, EstadoPedido.CANCELADO)],
+        )
+
+        activo = archivo.obtener_pedido(reciente.pk)
+        self.assertEqual(activo.pk, reciente.pk)
+        self.assertFalse(getattr(activo, 'archivado', False))
+
+    def test_no_archiva_pedidos_activos_ni_recientes(self):
+        activo = crear_pedido(self.cliente, self.proveedor)
+        Pedido.objects.filter(pk=activo.pk).update(creado_en=timezone.now() - timedelta(days=365))
+        self._finalizado(dias=1)
+
+        self.assertEqual(archivo.archivar(), {'archivados': 0, 'lotes': 0})
+        self.assertEqual(archivo.obtener_pedido(activo.pk).pk, activo.pk)
+
+    def test_obtener_pedido_inexistente(self):
+        self.assertIsNone(archivo.obtener_pedido(0))
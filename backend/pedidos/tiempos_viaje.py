@@ -0,0 +1,404 @@
+# pedidos/tiempos_viaje.py
+"""
+Matriz de tiempos de viaje aprendida entre celdas geohash.
+
+Reemplaza la regla fija de 30 km/h por los minutos que realmente tardan
+las entregas entre dos zonas. Se construye cada noche
+(pedidos.reconstruir_matriz_tiempos) con los pedidos entregados de los
+últimos DIAS días:
+
+- Pedido: celda de origen → celda de destino, desde la salida en ruta
+  (HistorialPedido) hasta fecha_entregado. La espera previa (creado_en →
+  en ruta) se acumula aparte por tipo de pedido.
+- HistorialUbicacion: hasta MAX_PUNTOS_POR_ENTREGA posiciones del
+  repartidor durante la ruta, celda de la posición → celda de destino,
+  con los minutos que faltaban para entregar.
+
+Cada par de celdas guarda la mediana de sus muestras (con al menos
+MIN_MUESTRAS) en dos niveles: geohash 6 (~1,2 × 0,6 km) y geohash 5
+(~5 × 5 km) para los pares con pocos datos. Los pares son arrays NumPy
+ordenados (clave = origen << bits | destino) guardados como .npy: los
+workers los abren con mmap y cada consulta es una búsqueda binaria, sin
+cargar la matriz en memoria de cada proceso.
+
+Archivos en PEDIDOS_MATRIZ_TIEMPOS_DIR (compartido entre web y Celery):
+
+    v20261016T023000/meta.json, claves_6.npy, minutos_6.npy, ...
+    actual -> v20261016T023000
+
+El enlace `actual` se reemplaza de forma atómica; los workers lo revisan
+cada RECARGA_SEGUNDOS. Sin matriz (o para pares sin datos) se usa la
+distancia en línea recta a la velocidad aprendida, o VELOCIDAD_KMH.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from utils.geo import distancia_haversine_km, distancias_km_pares, geohash_enteros
+
+logger = logging.getLogger('pedidos')
+
+# Niveles de la matriz, del más fino al más grueso
+PRECISIONES = (6, 5)
+
+# Pares con menos muestras no entran en la matriz
+MIN_MUESTRAS = 3
+
+# Posiciones del repartidor que se toman de cada entrega
+MAX_PUNTOS_POR_ENTREGA = 10
+
+# Muestras fuera de este rango (minutos) se descartan como ruido
+MINUTOS_MIN, MINUTOS_MAX = 1, 180
+
+# Valores por defecto mientras no hay matriz
+VELOCIDAD_KMH = 30
+MINUTOS_ESPERA = {'proveedor': 20, 'directo': 10}
+
+RECARGA_SEGUNDOS = 300
+VERSIONES_CONSERVADAS = 2
+TAMANO_LOTE = 1000
+
+ENLACE_ACTUAL = 'actual'
+
+
+def directorio():
+    return str(getattr(
+        settings, 'PEDIDOS_MATRIZ_TIEMPOS_DIR', os.path.join(settings.BASE_DIR, 'datos', 'matriz_tiempos')
+    ))
+
+
+def dias():
+    """Días de entregas con los que se construye (PEDIDOS_MATRIZ_TIEMPOS_DIAS, default 30)."""
+    return getattr(settings, 'PEDIDOS_MATRIZ_TIEMPOS_DIAS', 30)
+
+
+# ==========================================================
+# CONSULTA
+# ==========================================================
+class _Matriz:
+    """Una versión de la matriz abierta con mmap."""
+
+    def __init__(self, ruta):
+        with open(os.path.join(ruta, 'meta.json')) as archivo:
+            meta = json.load(archivo)
+
+        self.ruta = ruta
+        self.generada_en = meta['generada_en']
+        self.velocidad_kmh = meta.get('velocidad_kmh') or VELOCIDAD_KMH
+        self.espera = meta.get('minutos_espera', {})
+        self.niveles = [
+            (
+                precision,
+                np.load(os.path.join(ruta, f'claves_{precision}.npy'), mmap_mode='r'),
+                np.load(os.path.join(ruta, f'minutos_{precision}.npy'), mmap_mode='r'),
+            )
+            for precision in meta['precisiones']
+        ]
+
+    def buscar(self, lats1, lons1, lats2, lons2):
+        """Minutos por par (NaN si el par no está en ningún nivel)."""
+        resultado = np.full(np.broadcast(np.asarray(lats1), np.asarray(lats2)).shape, np.nan)
+
+        for precision, claves, minutos in self.niveles:
+            faltan = np.isnan(resultado)
+            if not faltan.any() or not len(claves):
+                break
+
+            buscadas = (
+                (geohash_enteros(lats1, lons1, precision) << (5 * precision))
+                | geohash_enteros(lats2, lons2, precision)
+            )
+            posiciones = np.minimum(np.searchsorted(claves, buscadas), len(claves) - 1)
+            encontradas = faltan & (claves[posiciones] == buscadas)
+            resultado[encontradas] = minutos[posiciones[encontradas]]
+
+        return resultado
+
+
+_cargada = None
+_revisada = None
+
+
+def matriz():
+    """
+    Versión actual de la matriz, o None si todavía no se construyó. Vuelve
+    a mirar el enlace `actual` cada RECARGA_SEGUNDOS.
+    """
+    global _cargada, _revisada
+
+    ahora = time.monotonic()
+    if _revisada is not None and ahora - _revisada < RECARGA_SEGUNDOS:
+        return _cargada
+    _revisada = ahora
+
+    ruta = os.path.realpath(os.path.join(directorio(), ENLACE_ACTUAL))
+    if _cargada is not None and _cargada.ruta == ruta:
+        return _cargada
+
+    try:
+        _cargada = _Matriz(ruta)
+    except FileNotFoundError:
+        _cargada = None
+    except Exception as e:
+        logger.error(f"No se pudo abrir la matriz de tiempos {ruta}: {e}")
+        _cargada = None
+    return _cargada
+
+
+def minutos_viaje_pares(lats1, lons1, lats2, lons2, distancias_km=None):
+    """
+    Minutos de viaje por par i: (lats1[i], lons1[i]) → (lats2[i], lons2[i]).
+    Acepta broadcasting (un origen contra muchos destinos).
+
+    Returns:
+        np.ndarray: Minutos (float) por par
+    """
+    actual = matriz()
+    if distancias_km is None:
+        distancias_km = distancias_km_pares(lats1, lons1, lats2, lons2)
+    distancias_km = np.asarray(distancias_km, dtype=float)
+
+    velocidad = actual.velocidad_kmh if actual else VELOCIDAD_KMH
+    estimados = distancias_km / velocidad * 60
+    if actual is None:
+        return estimados
+
+    aprendidos = actual.buscar(lats1, lons1, lats2, lons2)
+    return np.where(np.isnan(aprendidos), estimados, aprendidos)
+
+
+def minutos_viaje(lat1, lon1, lat2, lon2):
+    """Minutos de viaje entre dos puntos (None si faltan coordenadas)."""
+    distancia = distancia_haversine_km(lat1, lon1, lat2, lon2)
+    if distancia is None:
+        return None
+
+    return float(minutos_viaje_pares(
+        float(lat1), float(lon1), float(lat2), float(lon2), distancias_km=distancia
+    ))
+
+
+def minutos_espera(tipo):
+    """Minutos típicos desde la creación hasta la salida en ruta."""
+    actual = matriz()
+    if actual and tipo in actual.espera:
+        return actual.espera[tipo]
+    return MINUTOS_ESPERA.get(tipo, MINUTOS_ESPERA['directo'])
+
+
+# ==========================================================
+# CONSTRUCCIÓN
+# ==========================================================
+def _minutos(desde, hasta):
+    return (hasta - desde).total_seconds() / 60
+
+
+def _posiciones(repartidor_ids, desde, hasta):
+    """Posiciones por repartidor: {id: ([timestamps], [(lat, lon)])}."""
+    from repartidores.models import HistorialUbicacion
+
+    posiciones = defaultdict(lambda: ([], []))
+    filas = (
+        HistorialUbicacion.objects
+        .filter(repartidor_id__in=repartidor_ids, timestamp__range=(desde, hasta))
+        .order_by('repartidor_id', 'timestamp')
+        .values_list('repartidor_id', 'timestamp', 'latitud', 'longitud')
+    )
+    for repartidor_id, timestamp, lat, lon in filas.iterator(chunk_size=5000):
+        tiempos, puntos = posiciones[repartidor_id]
+        tiempos.append(timestamp)
+        puntos.append((lat, lon))
+    return posiciones
+
+
+def _muestras_lote(lote, muestras, esperas):
+    """Agrega a `muestras` y `esperas` las de un lote de entregas."""
+    from .models import EstadoPedido, HistorialPedido
+
+    salidas = dict(
+        HistorialPedido.objects
+        .filter(pedido_id__in=[fila[0] for fila in lote], estado_nuevo=EstadoPedido.EN_RUTA)
+        .order_by('fecha_cambio')
+        .values_list('pedido_id', 'fecha_cambio')
+    )
+
+    # Posiciones de los repartidores en la ventana del lote (ordenado por
+    # entrega); las rutas anómalas no estiran la ventana
+    en_ruta = [
+        fila for fila in lote
+        if fila[0] in salidas and fila[4] and _minutos(salidas[fila[0]], fila[3]) <= MINUTOS_MAX
+    ]
+    posiciones = _posiciones(
+        {fila[4] for fila in en_ruta},
+        min(salidas[fila[0]] for fila in en_ruta),
+        max(fila[3] for fila in en_ruta),
+    ) if en_ruta else {}
+
+    for pedido_id, tipo, creado_en, entregado, repartidor_id, lat_o, lon_o, lat_d, lon_d in lote:
+        salida = salidas.get(pedido_id)
+        if salida is None:
+            continue
+
+        esperas[tipo].append(_minutos(creado_en, salida))
+
+        if lat_o is not None and lon_o is not None:
+            muestras.append((lat_o, lon_o, lat_d, lon_d, _minutos(salida, entregado)))
+
+        tiempos, puntos = posiciones.get(repartidor_id, ((), ()))
+        inicio, fin = bisect_left(tiempos, salida), bisect_right(tiempos, entregado)
+        paso = max((fin - inicio) // MAX_PUNTOS_POR_ENTREGA, 1)
+        for i in range(inicio, fin, paso):
+            muestras.append((*puntos[i], lat_d, lon_d, _minutos(tiempos[i], entregado)))
+
+
+def recolectar_muestras(desde):
+    """
+    Muestras de viaje de las entregas desde `desde`.
+
+    Returns:
+        tuple: (array (n, 5) lat_o, lon_o, lat_d, lon_d, minutos;
+                {tipo: [minutos de espera]})
+    """
+    from .models import EstadoPedido, Pedido
+
+    entregas = (
+        Pedido.objects
+        .filter(
+            estado=EstadoPedido.ENTREGADO,
+            fecha_entregado__gte=desde,
+            latitud_destino__isnull=False,
+            longitud_destino__isnull=False,
+        )
+        .order_by('fecha_entregado')
+        .values_list(
+            'id', 'tipo', 'creado_en', 'fecha_entregado', 'repartidor_id',
+            'latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino',
+        )
+    )
+
+    muestras = []
+    esperas = defaultdict(list)
+    lote = []
+    for fila in entregas.iterator(chunk_size=TAMANO_LOTE):
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            _muestras_lote(lote, muestras, esperas)
+            lote = []
+
+    if lote:
+        _muestras_lote(lote, muestras, esperas)
+
+    muestras = np.array(muestras, dtype=float).reshape(-1, 5)
+    validas = (muestras[:, 4] >= MINUTOS_MIN) & (muestras[:, 4] <= MINUTOS_MAX)
+    return muestras[validas], esperas
+
+
+def agregar_pares(muestras, precision):
+    """
+    Mediana de minutos por par de celdas con al menos MIN_MUESTRAS.
+
+    Returns:
+        tuple: (claves int64 ordenadas, minutos float32)
+    """
+    claves = (
+        (geohash_enteros(muestras[:, 0], muestras[:, 1], precision) << (5 * precision))
+        | geohash_enteros(muestras[:, 2], muestras[:, 3], precision)
+    )
+
+    orden = np.lexsort((muestras[:, 4], claves))
+    claves, minutos = claves[orden], muestras[orden, 4]
+
+    unicas, inicios, cantidades = np.unique(claves, return_index=True, return_counts=True)
+    suficientes = cantidades >= MIN_MUESTRAS
+    unicas, inicios, cantidades = unicas[suficientes], inicios[suficientes], cantidades[suficientes]
+
+    # Mediana inferior y superior de cada grupo (ya ordenado por minutos)
+    medianas = (minutos[inicios + (cantidades - 1) // 2] + minutos[inicios + cantidades // 2]) / 2
+    return unicas.astype(np.int64), medianas.astype(np.float32)
+
+
+def _velocidad(muestras):
+    """Mediana de km/h de los viajes de al menos 1 km (None sin datos)."""
+    distancias = distancias_km_pares(muestras[:, 0], muestras[:, 1], muestras[:, 2], muestras[:, 3])
+    largos = distancias >= 1
+    if largos.sum() < MIN_MUESTRAS:
+        return None
+    velocidades = distancias[largos] / (muestras[largos, 4] / 60)
+    return round(float(np.clip(np.median(velocidades), 5, 80)), 1)
+
+
+def _publicar(base, nombre):
+    """Apunta `actual` a la versión nueva y borra las más viejas."""
+    temporal = os.path.join(base, f'.{ENLACE_ACTUAL}.{nombre}')
+    os.symlink(nombre, temporal)
+    os.replace(temporal, os.path.join(base, ENLACE_ACTUAL))
+
+    # Los workers con una versión borrada abierta siguen leyéndola (mmap)
+    # hasta la próxima recarga
+    versiones = sorted(
+        entrada for entrada in os.listdir(base)
+        if entrada.startswith('v') and os.path.isdir(os.path.join(base, entrada))
+    )
+    for vieja in versiones[:-VERSIONES_CONSERVADAS]:
+        shutil.rmtree(os.path.join(base, vieja), ignore_errors=True)
+
+
+def construir(dias_historial=None):
+    """
+    Construye y publica una versión nueva de la matriz.
+
+    Returns:
+        dict: muestras, pares por precisión y velocidad aprendida
+    """
+    generada_en = timezone.now()
+    muestras, esperas = recolectar_muestras(
+        generada_en - timedelta(days=dias_historial or dias())
+    )
+
+    base = directorio()
+    nombre = f'v{generada_en:%Y%m%dT%H%M%S}'
+    ruta = os.path.join(base, nombre)
+    os.makedirs(ruta, exist_ok=True)
+
+    pares = {}
+    for precision in PRECISIONES:
+        claves, minutos = agregar_pares(muestras, precision)
+        np.save(os.path.join(ruta, f'claves_{precision}.npy'), claves)
+        np.save(os.path.join(ruta, f'minutos_{precision}.npy'), minutos)
+        pares[precision] = len(claves)
+
+    minutos_espera = {
+        tipo: round(float(np.median(valores)), 1)
+        for tipo, valores in (
+            (tipo, [v for v in valores if 0 <= v <= MINUTOS_MAX]) for tipo, valores in esperas.items()
+        )
+        if len(valores) >= MIN_MUESTRAS
+    }
+
+    meta = {
+        'generada_en': generada_en.isoformat(),
+        'muestras': len(muestras),
+        'precisiones': list(PRECISIONES),
+        'pares': pares,
+        'velocidad_kmh': _velocidad(muestras),
+        'minutos_espera': minutos_espera,
+    }
+    with open(os.path.join(ruta, 'meta.json'), 'w') as archivo:
+        json.dump(meta, archivo)
+
+    _publicar(base, nombre)
+
+    logger.info(
+        f"Matriz de tiempos {nombre}: {len(muestras)} muestras, pares {pares}, "
+        f"velocidad {meta['velocidad_kmh']} km/h"
+    )
+    return {'version': nombre, **meta}
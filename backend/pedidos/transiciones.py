@@ -0,0 +1,252 @@
+# pedidos/transiciones.py
+"""
+Despachador de transiciones de estado de Pedido.
+
+Reemplaza a los receptores post_save/pre_save de Pedido: el modelo guarda
+el estado con el que se cargó (`Pedido.from_db`) y, al guardarse, emite un
+único evento `Transicion` con el estado anterior y el nuevo. Los consumidores
+se suscriben solo a las transiciones que les interesan:
+
+    from pedidos import transiciones
+    from pedidos.models import EstadoPedido
+
+    @transiciones.al_transicionar(hacia=EstadoPedido.ENTREGADO)
+    def premiar_repartidor(transicion):
+        ...
+
+    @transiciones.al_transicionar(desde=transiciones.CREADO)
+    def pedido_nuevo(transicion):
+        ...
+
+    @transiciones.al_asignar_repartidor(diferido=True)
+    def crear_chats(transicion):
+        ...
+
+Un guardado que no cambia el estado ni asigna repartidor no ejecuta nada.
+
+Los consumidores síncronos corren dentro de la transacción del guardado,
+cada uno en su savepoint: sus errores se registran y no afectan al resto
+ni al pedido. Los efectos secundarios lentos (push, chats, métricas) se
+suscriben con `diferido=True`: en lugar de ejecutarse se escribe una fila
+de outbox en la misma transacción y los procesa `pedidos.drenar_outbox`
+(ver pedidos/outbox.py).
+
+Cambios masivos (pedidos/lote.py) emiten todas sus transiciones con
+`emitir_lote`: un consumidor síncrono con versión por lotes
+(`@transiciones.por_lote(consumidor)`) se ejecuta una sola vez con la
+lista completa y las filas de outbox de todo el lote se escriben en un
+único INSERT.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from django.db import transaction
+
+logger = logging.getLogger('pedidos.transiciones')
+
+# Estado "anterior" de un pedido recién creado
+CREADO = None
+
+# Comodín para `desde` / `hacia`
+CUALQUIERA = '*'
+
+
+class Transicion(NamedTuple):
+    """Evento de cambio de estado de un pedido."""
+    pedido: object
+    anterior: Optional[str]
+    nuevo: str
+    repartidor_asignado: bool = False
+    # Identificador del evento (base de las claves de idempotencia del outbox)
+    evento: Optional[str] = None
+
+    @property
+    def creado(self):
+        return self.anterior is CREADO
+
+    @property
+    def cambio_estado(self):
+        return self.anterior != self.nuevo
+
+
+# (desde, hacia) -> [consumidores]
+_consumidores = defaultdict(list)
+_al_asignar = []
+
+# nombre -> consumidor, para los que se ejecutan desde el outbox
+_diferidos = {}
+
+# nombre -> versión por lotes de un consumidor síncrono
+_por_lote = {}
+
+
+def nombre(consumidor):
+    return f'{consumidor.__module__}.{consumidor.__qualname__}'
+
+
+def _registrar_diferido(funcion, diferido):
+    if diferido:
+        _diferidos[nombre(funcion)] = funcion
+
+
+def es_diferido(consumidor):
+    return _diferidos.get(nombre(consumidor)) is consumidor
+
+
+def al_transicionar(desde=CUALQUIERA, hacia=CUALQUIERA, diferido=False):
+    """
+    Decorador: suscribe una función a las transiciones `desde` → `hacia`.
+
+    `desde` y `hacia` aceptan un estado, una lista de estados o CUALQUIERA;
+    `desde=CREADO` corresponde a la creación del pedido (CUALQUIERA no la
+    incluye). Con `diferido=True` se ejecuta desde el outbox, después del
+    commit y fuera de la petición.
+    """
+    origenes = desde if isinstance(desde, (list, tuple, set)) else [desde]
+    destinos = hacia if isinstance(hacia, (list, tuple, set)) else [hacia]
+
+    def decorador(funcion):
+        for origen in origenes:
+            for destino in destinos:
+                if funcion not in _consumidores[(origen, destino)]:
+                    _consumidores[(origen, destino)].append(funcion)
+        _registrar_diferido(funcion, diferido)
+        return funcion
+
+    return decorador
+
+
+def al_asignar_repartidor(funcion=None, diferido=False):
+    """
+    Decorador: suscribe una función a la asignación de repartidor.
+
+    Se usa como `@al_asignar_repartidor` o `@al_asignar_repartidor(diferido=True)`.
+    """
+    def decorador(funcion):
+        if funcion not in _al_asignar:
+            _al_asignar.append(funcion)
+        _registrar_diferido(funcion, diferido)
+        return funcion
+
+    return decorador(funcion) if funcion is not None else decorador
+
+
+def por_lote(consumidor):
+    """
+    Decorador: registra la versión por lotes de un consumidor síncrono.
+    `emitir_lote` la llama una vez con la lista de transiciones que le
+    corresponden en lugar de llamar al consumidor por cada una.
+    """
+    def decorador(funcion):
+        _por_lote[nombre(consumidor)] = funcion
+        return funcion
+
+    return decorador
+
+
+def consumidores(transicion):
+    """Consumidores a ejecutar para una transición, sin duplicados y en orden."""
+    encontrados = []
+
+    if transicion.cambio_estado:
+        origenes = (transicion.anterior, CUALQUIERA) if not transicion.creado else (CREADO,)
+        for origen in origenes:
+            for destino in (transicion.nuevo, CUALQUIERA):
+                encontrados.extend(_consumidores.get((origen, destino), ()))
+
+    if transicion.repartidor_asignado:
+        encontrados.extend(_al_asignar)
+
+    return list(dict.fromkeys(encontrados))
+
+
+def _ejecutar(consumidor, argumento, descripcion):
+    """Ejecuta un consumidor síncrono en su savepoint; registra el error."""
+    try:
+        with transaction.atomic():
+            consumidor(argumento)
+    except Exception as e:
+        logger.error(f"Error en {nombre(consumidor)} ({descripcion}): {e}", exc_info=True)
+
+
+def emitir(pedido, anterior, nuevo, repartidor_asignado=False):
+    """
+    Ejecuta los consumidores síncronos y encola en el outbox los diferidos.
+    Debe llamarse dentro de la transacción que guardó el pedido.
+
+    Returns:
+        Transicion | None: El evento emitido (None si no hubo cambios)
+    """
+    transicion = Transicion(pedido, anterior, nuevo, repartidor_asignado, uuid.uuid4().hex)
+    if not transicion.cambio_estado and not repartidor_asignado:
+        return None
+
+    diferidos = []
+    for consumidor in consumidores(transicion):
+        if es_diferido(consumidor):
+            diferidos.append(nombre(consumidor))
+            continue
+        _ejecutar(consumidor, transicion, f"pedido #{pedido.pk}: {anterior} → {nuevo}")
+
+    if diferidos:
+        from .outbox import encolar
+        encolar(transicion, diferidos)
+
+    return transicion
+
+
+def emitir_lote(cambios):
+    """
+    Emite las transiciones de varios pedidos guardados juntos (sin
+    asignación de repartidor). Debe llamarse dentro de la transacción que
+    los guardó.
+
+    Args:
+        cambios (list[tuple]): (pedido, anterior, nuevo)
+
+    Returns:
+        list[Transicion]: Los eventos emitidos
+    """
+    emitidas = []
+    por_consumidor = defaultdict(list)
+
+    for pedido, anterior, nuevo in cambios:
+        transicion = Transicion(pedido, anterior, nuevo, False, uuid.uuid4().hex)
+        if not transicion.cambio_estado:
+            continue
+        emitidas.append(transicion)
+        for consumidor in consumidores(transicion):
+            por_consumidor[consumidor].append(transicion)
+
+    diferidos = []
+    for consumidor, lote in por_consumidor.items():
+        if es_diferido(consumidor):
+            diferidos.extend((transicion, nombre(consumidor)) for transicion in lote)
+            continue
+
+        version_lote = _por_lote.get(nombre(consumidor))
+        if version_lote is not None:
+            _ejecutar(version_lote, lote, f"lote de {len(lote)} pedidos")
+            continue
+
+        for transicion in lote:
+            _ejecutar(
+                consumidor, transicion,
+                f"pedido #{transicion.pedido.pk}: {transicion.anterior} → {transicion.nuevo}",
+            )
+
+    if diferidos:
+        from .outbox import encolar_lote
+        encolar_lote(diferidos)
+
+    return emitidas
+
+
+def ejecutar_diferido(nombre_consumidor, transicion):
+    """Ejecuta un consumidor diferido (lo llama el drenado del outbox)."""
+    consumidor = _diferidos.get(nombre_consumidor)
+    if consumidor is None:
+        raise LookupError(f"Consumidor diferido no registrado: {nombre_consumidor}")
+    consumidor(transicion)
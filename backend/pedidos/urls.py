@@ -15,7 +15,31 @@ urlpatterns = [
     ),
     # GET: Lista pedidos según rol del usuario
     # POST: Crea un nuevo pedido (solo clientes)
-    # Query params opcionales: ?estado=confirmado&tipo=proveedor&page=1
+    # Query params opcionales: ?estado=confirmado&tipo=proveedor&cursor=...
+    # Paginación por cursor; ?paginacion=numerada o ?page=N para el panel web
+
+    # ==========================================================
+    # 🛵 FEED DE PEDIDOS DISPONIBLES (REPARTIDOR)
+    # ==========================================================
+    path(
+        "disponibles/feed/",
+        views.feed_pedidos_disponibles,
+        name="feed_pedidos_disponibles"
+    ),
+    # GET: Pedidos disponibles por deltas (Redis)
+    # Query params: ?since_version=N → agregados/quitados desde N, 304 si no hay cambios
+
+    # ==========================================================
+    # 📦 CAMBIO DE ESTADO EN LOTE (PROVEEDOR / ADMIN)
+    # ==========================================================
+    path(
+        "estado-lote/",
+        views.cambiar_estado_lote,
+        name="cambiar_estado_lote"
+    ),
+    # POST: Cambia el estado de varios pedidos (máx. 500) en una transacción
+    # Body: {"cambios": [{"pedido_id": 1, "nuevo_estado": "en_ruta"}], "motivo": "..."}
+    # Permisos: admin, o proveedor sobre sus pedidos (en_preparacion / cancelado)
 
     # ==========================================================
     # 🔍 DETALLE DEL PEDIDO
@@ -27,6 +51,19 @@ urlpatterns = [
     ),
     # GET: Obtiene información completa de un pedido específico
     # Permisos: cliente dueño, proveedor, repartidor asignado o admin
+    # Los pedidos antiguos se leen del archivo (respuesta con "archivado": true)
+
+    # ==========================================================
+    # 📡 SEGUIMIENTO EN VIVO (SSE)
+    # ==========================================================
+    path(
+        "<int:pedido_id>/seguimiento/",
+        views.seguimiento_pedido,
+        name="seguimiento_pedido"
+    ),
+    # GET (Accept: text/event-stream): estado actual y luego cada cambio de
+    # estado y posición del repartidor. Eventos: estado, ubicacion, fin, error
+    # Permisos: los mismos que el detalle
 
     # ==========================================================
     # 🛵 ACEPTACIÓN DEL PEDIDO (REPARTIDOR)
@@ -83,7 +120,7 @@ urlpatterns = [
         views.ver_ganancias_pedido,
         name="ver_ganancias_pedido"
     ),
-    # GET: Muestra la distribución de comisiones del pedido
+    # GET: Muestra la distribución de comisiones del pedido (también archivados)
     # Permisos: proveedor del pedido, repartidor asignado o admin
 
     # ==========================================================
@@ -143,8 +180,10 @@ ENDPOINTS DISPONIBLES:
 
 1. GET /api/pedidos/
    - Lista todos los pedidos según el rol del usuario
-   - Filtros: ?estado=confirmado&tipo=proveedor&page=1&page_size=20
-   - Respuesta: Lista paginada de pedidos
+   - Filtros: ?estado=confirmado&tipo=proveedor&page_size=20
+   - Respuesta: {"next", "previous", "results"} paginada por cursor
+     (seguir la URL de "next")
+   - ?paginacion=numerada o ?page=N: paginación numerada con "count"
 
 2. POST /api/pedidos/
    - Crea un nuevo pedido (solo clientes)
@@ -180,6 +219,21 @@ ENDPOINTS DISPONIBLES:
 8. GET /api/pedidos/{id}/ganancias/
    - Ver distribución de comisiones
 
+9. GET /api/pedidos/disponibles/feed/?since_version=N
+   - Pedidos disponibles para repartidores por deltas
+   - Respuesta: {"version", "completo", "agregados": [...], "quitados": [ids]}
+   - 304 si no hubo cambios desde N
+
+10. POST /api/pedidos/estado-lote/
+   - Cambia el estado de varios pedidos (admin o proveedor)
+   - Body: {"cambios": [{"pedido_id": 1, "nuevo_estado": "entregado"}], "motivo": "..."}
+   - Respuesta: {"actualizados": [ids], "errores": [{"pedido_id", "error"}]}
+
+11. GET /api/pedidos/{id}/seguimiento/
+   - Stream Server-Sent Events (Accept: text/event-stream)
+   - Eventos: estado, ubicacion (máx. una cada 5 s), fin (estado final), error
+   - La conexión se cierra cada 5 minutos; el cliente reconecta
+
 ==========================================================
 ESTADOS DEL PEDIDO:
 - confirmado: Pedido creado, esperando aceptación
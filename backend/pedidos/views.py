@@ -10,17 +10,21 @@ Views para la gestión de pedidos.
 - Try-except en accesos a modelos relacionados
 """
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db import connection, transaction
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import StreamingHttpResponse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.throttling import UserRateThrottle
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 import logging
 
+from repartidores.permissions import IsRepartidor
 from .models import Pedido, EstadoPedido, TipoPedido
+from . import archivo, lote
 from .serializers import (
     PedidoCreateSerializer,
     PedidoListSerializer,
@@ -29,6 +33,7 @@ from .serializers import (
     PedidoConfirmarProveedorSerializer,
     PedidoCancelacionSerializer,
     PedidoEstadoUpdateSerializer,
+    PedidoEstadoLoteSerializer,
     PedidoGananciasSerializer,
 )
 
@@ -43,6 +48,20 @@ class PedidoThrottle(UserRateThrottle):
     rate = "60/hour"
 
 
+class EventStreamRenderer(BaseRenderer):
+    """
+    Acepta `Accept: text/event-stream` en la negociación de DRF; los
+    errores se envían como un evento `error`.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        from .seguimiento import evento_sse
+        return evento_sse('error', data).encode(self.charset)
+
+
 class StandardPagination(PageNumberPagination):
     """Paginación estándar para listados"""
     page_size = 10
@@ -50,6 +69,30 @@ class StandardPagination(PageNumberPagination):
     max_page_size = 50
 
 
+class PedidoCursorPagination(CursorPagination):
+    """
+    Paginación por cursor sobre (creado_en, id): cada página parte del
+    último pedido de la anterior usando el índice, sin OFFSET ni COUNT.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-creado_en', '-id')
+
+
+def obtener_paginador(request):
+    """
+    Cursor por defecto. La paginación numerada (con total de resultados)
+    queda para el panel web: ?paginacion=numerada o ?page=N.
+    """
+    if (
+        request.query_params.get('paginacion') == 'numerada'
+        or 'page' in request.query_params
+    ):
+        return StandardPagination()
+    return PedidoCursorPagination()
+
+
 # ==========================================================
 # 🔐 FUNCIONES AUXILIARES DE PERMISOS (CORREGIDAS)
 # ==========================================================
@@ -102,6 +145,33 @@ def verificar_permiso_admin(user):
     return user.is_staff or user.is_superuser
 
 
+def motivo_acceso_pedido(user, pedido):
+    """
+    Por qué el usuario puede ver el pedido: admin, cliente dueño, proveedor
+    o repartidor asignado. None si no tiene acceso.
+    """
+    if verificar_permiso_admin(user):
+        return "admin"
+
+    if not hasattr(user, 'perfil'):
+        return None
+
+    # Cliente dueño del pedido
+    if (user.perfil.rol.upper() == 'CLIENTE' and
+        pedido.cliente_id == user.perfil.id):
+        return "cliente_dueño"
+
+    # Proveedor del pedido
+    if verificar_permiso_proveedor(user, pedido):
+        return "proveedor_asignado"
+
+    # Repartidor asignado
+    if verificar_permiso_repartidor(user, pedido):
+        return "repartidor_asignado"
+
+    return None
+
+
 # ==========================================================
 # 📦 CREAR Y LISTAR PEDIDOS (CORREGIDO)
 # ==========================================================
@@ -287,17 +357,17 @@ def pedidos_view(request):
             pedidos = pedidos.filter(tipo=tipo)
             logger.debug(f"Filtrando por tipo: {tipo}")
 
-        # ✅ Paginación
-        paginator = StandardPagination()
+        # ✅ Paginación (cursor por defecto, numerada para el panel web)
+        paginator = obtener_paginador(request)
         page = paginator.paginate_queryset(
-            pedidos.order_by('-creado_en'),
+            pedidos.order_by('-creado_en', '-id'),
             request
         )
 
         serializer = PedidoListSerializer(page, many=True)
 
         logger.info(
-            f"✅ Usuario {user.email} consultó {pedidos.count()} pedidos"
+            f"✅ Usuario {user.email} consultó {len(page)} pedidos"
         )
 
         return paginator.get_paginated_response(serializer.data)
@@ -313,6 +383,99 @@ def pedidos_view(request):
         )
 
 
+# ==========================================================
+# 🛵 FEED DE PEDIDOS DISPONIBLES (REPARTIDOR)
+# ==========================================================
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsRepartidor])
+def feed_pedidos_disponibles(request):
+    """
+    Pedidos disponibles para repartidores, por deltas.
+
+    - Sin `since_version` (o con una versión que ya no está en el registro
+      de cambios) responde el set completo con `completo: true`.
+    - Con `since_version` igual a la versión actual responde 304.
+    - En otro caso responde los pedidos agregados (serializados) y los IDs
+      quitados desde esa versión.
+
+    Si el feed aún no existe se construye en la petición. Si Redis no está
+    disponible se responden desde la base de datos los pedidos más
+    recientes (como máximo una página grande) con `version: null`.
+    """
+    from . import feed_disponibles
+
+    since_version = request.query_params.get('since_version')
+    if since_version is not None:
+        try:
+            since_version = int(since_version)
+        except ValueError:
+            return Response(
+                {"error": "since_version debe ser un entero."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    try:
+        cambios = feed_disponibles.leer(since_version)
+        if cambios is None and feed_disponibles.construir_si_falta():
+            cambios = feed_disponibles.leer(since_version)
+
+        if cambios is None:
+            # Redis caído (o feed en construcción por otra petición): se
+            # responde desde la BD, limitado como el listado de pedidos
+            limite = StandardPagination.max_page_size
+            pedidos = list(
+                Pedido.objects.disponibles_para_repartidores().order_by('-creado_en')[:limite + 1]
+            )
+            return Response({
+                "version": None,
+                "completo": True,
+                "agregados": PedidoListSerializer(pedidos[:limite], many=True).data,
+                "quitados": [],
+                "truncado": len(pedidos) > limite,
+            })
+
+        etag = f'"{cambios["version"]}"'
+
+        if (
+            not cambios['completo']
+            and not cambios['agregados']
+            and not cambios['quitados']
+        ):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        # Un pedido del feed que ya no está disponible en la BD se informa como
+        # quitado (la baja en Redis llega tras el commit)
+        pedidos = list(
+            Pedido.objects.disponibles_para_repartidores()
+            .filter(id__in=cambios['agregados'])
+            .order_by('-creado_en')
+        )
+        vigentes = {pedido.id for pedido in pedidos}
+        quitados = cambios['quitados'] + [
+            pedido_id for pedido_id in cambios['agregados'] if pedido_id not in vigentes
+        ]
+
+        return Response(
+            {
+                "version": cambios['version'],
+                "completo": cambios['completo'],
+                "agregados": PedidoListSerializer(pedidos, many=True).data,
+                "quitados": [] if cambios['completo'] else quitados,
+            },
+            headers={'ETag': etag}
+        )
+
+    except Exception as e:
+        logger.error(
+            f"Error al consultar feed de pedidos disponibles: {e}",
+            exc_info=True
+        )
+        return Response(
+            {"error": "Error interno al obtener pedidos disponibles."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 # ==========================================================
 # 🔍 DETALLE DE PEDIDO (CORREGIDO)
 # ==========================================================
@@ -324,45 +487,29 @@ def pedido_detalle(request, pedido_id):
 
     Muestra los detalles completos de un pedido.
     Solo accesible por: cliente dueño, proveedor, repartidor asignado o admin.
+    Los pedidos archivados se leen del archivo (`archivado: true`).
     """
     try:
-        pedido = get_object_or_404(
+        pedido = archivo.obtener_pedido(
+            pedido_id,
             Pedido.objects.select_related(
                 'cliente__user',
                 'proveedor',
                 'repartidor__user'
             ),
-            id=pedido_id
         )
+        if pedido is None:
+            return Response(
+                {"error": "Pedido no encontrado."},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
         user = request.user
 
         # ✅ Verificar permisos con funciones corregidas
-        tiene_permiso = False
-        motivo_permiso = ""
+        motivo_permiso = motivo_acceso_pedido(user, pedido)
 
-        if verificar_permiso_admin(user):
-            tiene_permiso = True
-            motivo_permiso = "admin"
-
-        elif hasattr(user, 'perfil'):
-            # Cliente dueño del pedido
-            if (user.perfil.rol.upper() == 'CLIENTE' and
-                pedido.cliente_id == user.perfil.id):
-                tiene_permiso = True
-                motivo_permiso = "cliente_dueño"
-
-            # Proveedor del pedido
-            elif verificar_permiso_proveedor(user, pedido):
-                tiene_permiso = True
-                motivo_permiso = "proveedor_asignado"
-
-            # Repartidor asignado
-            elif verificar_permiso_repartidor(user, pedido):
-                tiene_permiso = True
-                motivo_permiso = "repartidor_asignado"
-
-        if not tiene_permiso:
+        if not motivo_permiso:
             logger.warning(
                 f"❌ Usuario {user.email} intentó acceder al pedido #{pedido_id} "
                 f"sin permiso"
@@ -377,8 +524,9 @@ def pedido_detalle(request, pedido_id):
             f"como {motivo_permiso}"
         )
 
-        serializer = PedidoDetailSerializer(pedido)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = PedidoDetailSerializer(pedido).data
+        data['archivado'] = getattr(pedido, 'archivado', False)
+        return Response(data, status=status.HTTP_200_OK)
 
     except Exception as e:
         logger.error(
@@ -391,6 +539,61 @@ def pedido_detalle(request, pedido_id):
         )
 
 
+# ==========================================================
+# 📡 SEGUIMIENTO EN VIVO (SSE)
+# ==========================================================
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def seguimiento_pedido(request, pedido_id):
+    """
+    Stream Server-Sent Events del pedido: estado actual y luego cada cambio
+    de estado y posición del repartidor (ver pedidos/seguimiento.py).
+
+    Reemplaza la consulta periódica del detalle: los permisos se verifican
+    una vez al conectar y cada evento llega por Redis pub/sub, sin volver a
+    leer ni serializar el pedido. La conexión se cierra tras
+    PEDIDOS_SEGUIMIENTO_DURACION segundos y el cliente reconecta; con el
+    evento `fin` (estado final) o `error` el cliente no debe reconectar.
+    """
+    from . import seguimiento
+
+    pedido = (
+        Pedido.objects
+        .only('id', 'estado', 'cliente_id', 'proveedor_id', 'repartidor_id', 'actualizado_en')
+        .filter(pk=pedido_id)
+        .first()
+    )
+    if pedido is None:
+        return Response(
+            {"error": "Pedido no encontrado."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if not motivo_acceso_pedido(request.user, pedido):
+        logger.warning(
+            f"❌ Usuario {request.user.email} intentó seguir el pedido #{pedido_id} "
+            f"sin permiso"
+        )
+        return Response(
+            {"error": "No tiene permiso para ver este pedido."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    # El stream solo lee Redis (y relee el estado una vez al suscribirse):
+    # no retener una conexión a Postgres por cliente
+    connection.close()
+
+    respuesta = StreamingHttpResponse(
+        seguimiento.eventos(pedido),
+        content_type=EventStreamRenderer.media_type
+    )
+    respuesta['Cache-Control'] = 'no-cache'
+    # Nginx: enviar cada evento sin acumularlo en el buffer del proxy
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+
 # ==========================================================
 # 🛵 ACEPTAR PEDIDO (REPARTIDOR) - CORREGIDO
 # ==========================================================
@@ -450,8 +653,8 @@ def aceptar_pedido_repartidor(request, pedido_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        with transaction.atomic():
-            serializer.save()
+        # La aceptación es atómica en el modelo (UPDATE condicional)
+        serializer.save()
 
         logger.info(
             f"✅ Pedido #{pedido.id} aceptado por repartidor {user.email} "
@@ -652,6 +855,65 @@ def cambiar_estado_pedido(request, pedido_id):
         )
 
 
+# ==========================================================
+# 📦 CAMBIO DE ESTADO EN LOTE (PROVEEDOR / ADMIN)
+# ==========================================================
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def cambiar_estado_lote(request):
+    """
+    Cambia el estado de varios pedidos en una sola transacción.
+
+    Admin: cualquier pedido. Proveedor: solo los suyos, hacia 'En
+    preparación' o 'Cancelado'. Los cambios inválidos vuelven en "errores"
+    y no impiden aplicar el resto.
+    """
+    user = request.user
+
+    if verificar_permiso_admin(user):
+        actor, proveedor = "admin", None
+    elif verificar_permiso_proveedor(user):
+        actor, proveedor = "proveedor", user.proveedor
+    else:
+        return Response(
+            {"error": "Solo proveedores o administradores pueden cambiar pedidos en lote."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    serializer = PedidoEstadoLoteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    datos = serializer.validated_data
+
+    try:
+        resultado = lote.cambiar_estados(
+            {cambio['pedido_id']: cambio['nuevo_estado'] for cambio in datos['cambios']},
+            actor=actor,
+            proveedor=proveedor,
+            motivo=datos['motivo'],
+        )
+    except Exception as e:
+        logger.error(f"Error inesperado en cambio de estado en lote: {e}", exc_info=True)
+        return Response(
+            {"error": "Error interno al cambiar estados."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    logger.info(
+        f"📦 Cambio de estado en lote por {user.email} (rol: {actor}): "
+        f"{len(resultado['actualizados'])} actualizados, {len(resultado['errores'])} con error"
+    )
+
+    return Response({
+        "actualizados": resultado['actualizados'],
+        "errores": [
+            {"pedido_id": pedido_id, "error": mensaje}
+            for pedido_id, mensaje in resultado['errores'].items()
+        ],
+    }, status=status.HTTP_200_OK)
+
+
 # ==========================================================
 # 🚫 CANCELACIÓN DEL PEDIDO (CORREGIDO)
 # ==========================================================
@@ -762,7 +1024,12 @@ def ver_ganancias_pedido(request, pedido_id):
     """
     try:
         user = request.user
-        pedido = get_object_or_404(Pedido, id=pedido_id)
+        pedido = archivo.obtener_pedido(pedido_id)
+        if pedido is None:
+            return Response(
+                {"error": "Pedido no encontrado."},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
         # ✅ Verificar permisos con funciones corregidas
         tiene_permiso = False
@@ -8,7 +8,7 @@ from django.db.models import Count, Avg
 from .models import (
     Repartidor, RepartidorVehiculo, HistorialUbicacion,
     RepartidorEstadoLog, CalificacionRepartidor, CalificacionCliente,
-    EstadoRepartidor
+    EstadoRepartidor, TrayectoComprimido
 )
 
 
@@ -228,6 +228,24 @@ class HistorialUbicacionAdmin(admin.ModelAdmin):
     mapa.short_description = "Mapa"
 
 
+# ============================
+# TrayectoComprimidoAdmin (solo lectura)
+# ============================
+@admin.register(TrayectoComprimido)
+class TrayectoComprimidoAdmin(admin.ModelAdmin):
+    list_display = ("id", "repartidor", "pedido", "inicio", "fin", "puntos_originales", "puntos_comprimidos")
+    list_filter = (("inicio", admin.DateFieldListFilter),)
+    search_fields = ("repartidor__user__email",)
+    ordering = ("-inicio",)
+    list_select_related = ("repartidor__user",)
+    raw_id_fields = ("repartidor", "pedido")
+    date_hierarchy = "inicio"
+    readonly_fields = [f.name for f in TrayectoComprimido._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
 # ============================
 # RepartidorVehiculoAdmin
 # ============================
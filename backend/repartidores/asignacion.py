@@ -0,0 +1,348 @@
+# repartidores/asignacion.py
+"""
+Asignación automática de pedidos a repartidores cercanos.
+
+- Índice espacial en memoria (buckets geohash) con los repartidores
+  DISPONIBLE, verificados y activos, reconstruido periódicamente a partir
+  de las posiciones en vivo (Redis) o, si no hay, de la base de datos
+- Búsqueda de los k repartidores más cercanos a un punto
+- Puntaje por distancia y calificación promedio
+- Ofertas por rondas: cada ronda notifica a los mejores candidatos que
+  aún no recibieron el pedido (ni lo rechazaron) y amplía el radio
+- Los rechazos se guardan aparte y sobreviven a las rondas; al agotarlas
+  se pausa el pedido PAUSA_AGOTADO_SEGUNDOS antes de volver a empezar
+"""
+import logging
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.geo import (
+    bounding_box,
+    celdas_geohash_en_bbox,
+    codificar_geohash,
+    distancias_km_desde,
+)
+from . import ubicacion_viva
+
+logger = logging.getLogger('repartidores')
+
+# Celdas de ~5 km: pocas celdas por búsqueda y pocos repartidores por celda
+PRECISION_BUCKET = 5
+
+# Cada cuánto se reconstruye el índice en cada proceso
+TTL_INDICE_SEGUNDOS = 15
+
+# Posiciones más viejas que esto no se consideran
+ANTIGUEDAD_MAXIMA_POSICION = timedelta(minutes=15)
+
+# Radios de búsqueda crecientes (km)
+RADIOS_BUSQUEDA_KM = (2.0, 5.0, 10.0, 20.0)
+
+# Peso de la calificación frente a la distancia en el puntaje
+PESO_CALIFICACION = 0.3
+
+# Ofertas por rondas
+CANDIDATOS_POR_RONDA = 3
+MAX_RONDAS = 5
+SEGUNDOS_ENTRE_RONDAS = 45
+TTL_OFERTAS_SEGUNDOS = 60 * 60
+
+# Un rechazo dura lo que el pedido pendiente (se borra al asignarlo o cancelarlo)
+TTL_RECHAZOS_SEGUNDOS = 60 * 60 * 24
+
+# Tras agotar las rondas, el monitor no vuelve a empezar hasta pasado este tiempo
+PAUSA_AGOTADO_SEGUNDOS = 60 * 15
+
+Candidato = namedtuple('Candidato', 'repartidor_id distancia_km calificacion puntaje')
+
+
+# ==========================================================
+# ÍNDICE ESPACIAL
+# ==========================================================
+class IndiceRepartidores:
+    """Repartidores disponibles agrupados por celda geohash."""
+
+    def __init__(self, posiciones):
+        """
+        Args:
+            posiciones: iterable de (repartidor_id, lat, lon, calificacion)
+        """
+        buckets = defaultdict(list)
+        for posicion in posiciones:
+            buckets[codificar_geohash(posicion[1], posicion[2], PRECISION_BUCKET)].append(posicion)
+
+        # Cada celda guarda columnas NumPy: ids, latitudes, longitudes, calificaciones
+        self.buckets = {
+            celda: tuple(np.array(columna, dtype=float) for columna in zip(*filas))
+            for celda, filas in buckets.items()
+        }
+        self.total = sum(len(filas) for filas in buckets.values())
+
+    def _en_radio(self, lat, lon, radio_km, excluir):
+        celdas = [
+            self.buckets[celda]
+            for celda in celdas_geohash_en_bbox(*bounding_box(lat, lon, radio_km), PRECISION_BUCKET)
+            if celda in self.buckets
+        ]
+        if not celdas:
+            return []
+
+        ids, lats, lons, calificaciones = (np.concatenate(columna) for columna in zip(*celdas))
+        distancias = distancias_km_desde(lat, lon, lats, lons)
+
+        mascara = distancias <= radio_km
+        if excluir:
+            mascara &= ~np.isin(ids, list(excluir))
+
+        return [
+            (float(distancia), int(rid), float(calificacion))
+            for distancia, rid, calificacion in zip(
+                distancias[mascara], ids[mascara], calificaciones[mascara]
+            )
+        ]
+
+    def cercanos(self, lat, lon, k, radio_max_km=RADIOS_BUSQUEDA_KM[-1], excluir=()):
+        """
+        Los k repartidores más cercanos a (lat, lon) dentro de `radio_max_km`.
+
+        Busca en radios crecientes: si un radio ya contiene k repartidores,
+        son exactamente los k más cercanos y no hace falta seguir.
+
+        Returns:
+            list[tuple]: (distancia_km, repartidor_id, calificacion), ordenados
+        """
+        excluir = set(excluir)
+        encontrados = []
+
+        for radio in RADIOS_BUSQUEDA_KM:
+            radio = min(radio, radio_max_km)
+            encontrados = self._en_radio(lat, lon, radio, excluir)
+            if len(encontrados) >= k or radio >= radio_max_km:
+                break
+
+        encontrados.sort()
+        return encontrados[:k]
+
+
+_indice = None
+_indice_creado = 0.0
+
+
+def posiciones_disponibles():
+    """Posiciones de repartidores elegibles: Redis si hay, si no la BD."""
+    from .models import Repartidor, EstadoRepartidor
+
+    limite = timezone.now() - ANTIGUEDAD_MAXIMA_POSICION
+
+    filas = list(
+        Repartidor.objects.filter(
+            estado=EstadoRepartidor.DISPONIBLE,
+            verificado=True,
+            activo=True,
+        ).values_list('id', 'latitud', 'longitud', 'ultima_localizacion', 'calificacion_promedio')
+    )
+
+    en_vivo = ubicacion_viva.obtener_varios(fila[0] for fila in filas)
+
+    for rid, lat, lon, ultima, calificacion in filas:
+        vivo = en_vivo.get(rid)
+        if vivo and (ultima is None or vivo['timestamp'] >= ultima):
+            lat, lon, ultima = vivo['latitud'], vivo['longitud'], vivo['timestamp']
+
+        if lat is None or lon is None or ultima is None or ultima < limite:
+            continue
+
+        yield rid, lat, lon, float(calificacion)
+
+
+def obtener_indice(forzar=False):
+    """Índice del proceso; se reconstruye cada TTL_INDICE_SEGUNDOS."""
+    global _indice, _indice_creado
+
+    ahora = time.monotonic()
+    if forzar or _indice is None or ahora - _indice_creado > TTL_INDICE_SEGUNDOS:
+        _indice = IndiceRepartidores(posiciones_disponibles())
+        _indice_creado = ahora
+        logger.debug(f"Índice de repartidores reconstruido: {_indice.total} disponibles")
+
+    return _indice
+
+
+# ==========================================================
+# CANDIDATOS
+# ==========================================================
+def punto_de_recogida(pedido):
+    """Punto al que debe llegar primero el repartidor: origen, o destino si no hay."""
+    if pedido.latitud_origen is not None and pedido.longitud_origen is not None:
+        return pedido.latitud_origen, pedido.longitud_origen
+    if pedido.latitud_destino is not None and pedido.longitud_destino is not None:
+        return pedido.latitud_destino, pedido.longitud_destino
+    return None
+
+
+def puntuar(distancia_km, calificacion, radio_km):
+    """Puntaje del candidato (menor es mejor): distancia relativa y calificación."""
+    return distancia_km / radio_km + PESO_CALIFICACION * (5.0 - calificacion) / 5.0
+
+
+def buscar_candidatos(pedido, k=CANDIDATOS_POR_RONDA, radio_km=RADIOS_BUSQUEDA_KM[-1], excluir=()):
+    """
+    Los mejores k repartidores disponibles para el pedido.
+
+    Se toman los 2k más cercanos y se reordenan por puntaje, para que
+    un repartidor algo más lejos pero mejor calificado pueda ganar.
+
+    Returns:
+        list[Candidato]: Ordenados por puntaje
+    """
+    punto = punto_de_recogida(pedido)
+    if punto is None:
+        return []
+
+    cercanos = obtener_indice().cercanos(*punto, k=2 * k, radio_max_km=radio_km, excluir=excluir)
+
+    candidatos = [
+        Candidato(rid, round(distancia, 3), calificacion, puntuar(distancia, calificacion, radio_km))
+        for distancia, rid, calificacion in cercanos
+    ]
+    candidatos.sort(key=lambda c: c.puntaje)
+    return candidatos[:k]
+
+
+# ==========================================================
+# OFERTAS POR RONDAS
+# ==========================================================
+def _ofertas_key(pedido_id):
+    return f'asignacion:pedido:{pedido_id}:ofertados'
+
+
+def _ronda_key(pedido_id):
+    return f'asignacion:pedido:{pedido_id}:ronda'
+
+
+def _rechazos_key(pedido_id):
+    return f'asignacion:pedido:{pedido_id}:rechazos'
+
+
+def _pausa_key(pedido_id):
+    return f'asignacion:pedido:{pedido_id}:pausa'
+
+
+def repartidores_excluidos(pedido_id):
+    """Repartidores que ya recibieron la oferta en estas rondas o la rechazaron."""
+    claves = cache.get_many([_ofertas_key(pedido_id), _rechazos_key(pedido_id)])
+    return {rid for repartidor_ids in claves.values() for rid in repartidor_ids}
+
+
+def _agregar(clave, repartidor_ids, ttl):
+    actuales = set(cache.get(clave, ()))
+    actuales.update(repartidor_ids)
+    cache.set(clave, list(actuales), ttl)
+
+
+def marcar_ofertados(pedido_id, repartidor_ids):
+    """Registra repartidores que ya recibieron la oferta en las rondas actuales."""
+    _agregar(_ofertas_key(pedido_id), repartidor_ids, TTL_OFERTAS_SEGUNDOS)
+
+
+def registrar_rechazo(pedido_id, repartidor_id):
+    """Un repartidor que rechaza el pedido no vuelve a recibir la oferta."""
+    _agregar(_rechazos_key(pedido_id), [repartidor_id], TTL_RECHAZOS_SEGUNDOS)
+
+
+def notificar_oferta(pedido, repartidor, distancia_km, ronda=None):
+    """Notifica al repartidor que tiene un pedido disponible cerca."""
+    from notificaciones.services import crear_y_enviar_notificacion
+
+    datos_extra = {
+        'accion': 'oferta_pedido',
+        'pedido_id': str(pedido.pk),
+        'distancia_km': str(distancia_km),
+    }
+    if ronda is not None:
+        datos_extra['ronda'] = str(ronda)
+
+    crear_y_enviar_notificacion(
+        usuario=repartidor.user,
+        titulo="Nuevo pedido cerca de ti",
+        mensaje=f"Pedido #{pedido.pk} a {distancia_km:.1f} km",
+        tipo='repartidor',
+        pedido=pedido,
+        datos_extra=datos_extra,
+    )
+
+
+def iniciar_asignacion(pedido_id):
+    """
+    Arranca las rondas de ofertas del pedido si no hay unas en curso ni
+    está en pausa tras agotarlas.
+
+    Returns:
+        bool: True si se programó la primera ronda
+    """
+    if cache.get(_pausa_key(pedido_id)):
+        return False
+
+    if not cache.add(_ronda_key(pedido_id), 0, TTL_OFERTAS_SEGUNDOS):
+        return False
+
+    from .tasks import ofrecer_pedido
+    ofrecer_pedido.delay(pedido_id, 1)
+    return True
+
+
+def ofrecer_en_ronda(pedido, ronda):
+    """
+    Envía la oferta del pedido a los mejores candidatos de la ronda.
+
+    El radio crece con cada ronda. Retorna los candidatos notificados.
+    """
+    from .models import Repartidor
+
+    radio = RADIOS_BUSQUEDA_KM[min(ronda, len(RADIOS_BUSQUEDA_KM)) - 1]
+    excluidos = repartidores_excluidos(pedido.pk)
+    candidatos = buscar_candidatos(pedido, radio_km=radio, excluir=excluidos)
+
+    if not candidatos:
+        logger.info(f"Pedido #{pedido.pk}: sin candidatos en ronda {ronda} (radio {radio} km)")
+        return []
+
+    repartidores = Repartidor.objects.select_related('user').in_bulk(
+        [c.repartidor_id for c in candidatos]
+    )
+
+    for candidato in candidatos:
+        repartidor = repartidores.get(candidato.repartidor_id)
+        if repartidor is not None:
+            notificar_oferta(pedido, repartidor, candidato.distancia_km, ronda)
+
+    marcar_ofertados(pedido.pk, [c.repartidor_id for c in candidatos])
+    cache.set(_ronda_key(pedido.pk), ronda, TTL_OFERTAS_SEGUNDOS)
+
+    logger.info(
+        f"Pedido #{pedido.pk}: ronda {ronda} ofrecida a "
+        f"{[c.repartidor_id for c in candidatos]}"
+    )
+    return candidatos
+
+
+def finalizar_asignacion(pedido_id, agotado=False):
+    """
+    Limpia el estado de las rondas.
+
+    Args:
+        agotado (bool): True si se acabaron las rondas sin aceptación: se
+            conservan los rechazos y el pedido queda en pausa. Si False
+            (pedido aceptado o cancelado) se borra todo.
+    """
+    cache.delete_many([_ofertas_key(pedido_id), _ronda_key(pedido_id)])
+
+    if agotado:
+        cache.set(_pausa_key(pedido_id), 1, PAUSA_AGOTADO_SEGUNDOS)
+    else:
+        cache.delete_many([_rechazos_key(pedido_id), _pausa_key(pedido_id)])
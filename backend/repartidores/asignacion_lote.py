@@ -0,0 +1,294 @@
+# repartidores/asignacion_lote.py
+"""
+Asignación global por lotes de pedidos pendientes a repartidores.
+
+Cada pasada toma todos los pedidos CONFIRMADO sin repartidor y todos los
+repartidores disponibles, arma una matriz de costos (distancia menos una
+bonificación por tiempo de espera del pedido) y resuelve la asignación
+completa de una vez:
+
+- scipy.optimize.linear_sum_assignment si scipy está instalado
+- Algoritmo húngaro propio (NumPy) si no lo está
+- Voraz sobre la matriz ordenada cuando el problema es demasiado grande
+
+A diferencia de asignar pedido por pedido, evita que un repartidor cruce
+la ciudad porque el más cercano ya se lo llevó otro pedido.
+"""
+import logging
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.geo import matriz_distancias_km
+from . import asignacion
+
+logger = logging.getLogger('repartidores')
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Pares más lejanos que esto no se asignan
+RADIO_MAX_KM = 10.0
+
+# Bonificación (km equivalentes) por cada minuto de espera del pedido,
+# con tope, para que los pedidos más antiguos ganen a los recién creados
+KM_POR_MINUTO_ESPERA = 0.1
+ESPERA_MAXIMA_MINUTOS = 30
+
+# Costo de los pares no permitidos (lejanos, ya ofrecidos o rechazados)
+COSTO_INFACTIBLE = 1e6
+
+# Tamaño máximo (lado menor) para los solvers exactos
+LIMITE_SCIPY = 3000
+LIMITE_HUNGARO = 1000
+
+# Un repartidor que recibió una oferta no entra en las siguientes pasadas
+# durante este tiempo (para que pueda aceptarla)
+SEGUNDOS_RESERVA_REPARTIDOR = 45
+
+_LOCK_KEY = 'asignacion:lote:lock'
+
+
+# ==========================================================
+# MATRIZ DE COSTOS
+# ==========================================================
+def matriz_costos(pedidos, repartidores, excluidos=None, radio_max_km=RADIO_MAX_KM):
+    """
+    Matriz de costos pedidos x repartidores.
+
+    Args:
+        pedidos: lista de (pedido_id, lat, lon, minutos_espera)
+        repartidores: lista de (repartidor_id, lat, lon, calificacion)
+        excluidos: {pedido_id: set(repartidor_id)} pares no permitidos
+
+    Returns:
+        tuple: (costos, distancias) como arrays NumPy
+    """
+    distancias = matriz_distancias_km(
+        [p[1] for p in pedidos], [p[2] for p in pedidos],
+        [r[1] for r in repartidores], [r[2] for r in repartidores],
+    )
+
+    espera = np.minimum(np.array([p[3] for p in pedidos], dtype=float), ESPERA_MAXIMA_MINUTOS)
+    costos = distancias - (KM_POR_MINUTO_ESPERA * espera)[:, None]
+    costos[distancias > radio_max_km] = COSTO_INFACTIBLE
+
+    if excluidos:
+        columna = {r[0]: j for j, r in enumerate(repartidores)}
+        for i, pedido in enumerate(pedidos):
+            for rid in excluidos.get(pedido[0], ()):
+                if rid in columna:
+                    costos[i, columna[rid]] = COSTO_INFACTIBLE
+
+    return costos, distancias
+
+
+# ==========================================================
+# SOLVERS
+# ==========================================================
+def resolver_hungaro(costos):
+    """
+    Asignación de costo mínimo (algoritmo húngaro con potenciales).
+
+    O(n² m) con el bucle interno vectorizado. Acepta matrices
+    rectangulares: se asignan tantos pares como el lado menor.
+
+    Returns:
+        tuple: (filas, columnas) como arrays de índices
+    """
+    costos = np.asarray(costos, dtype=float)
+    transpuesta = costos.shape[0] > costos.shape[1]
+    if transpuesta:
+        costos = costos.T
+
+    n, m = costos.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    fila_de_columna = np.zeros(m + 1, dtype=int)
+    camino = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        fila_de_columna[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        usado = np.zeros(m + 1, dtype=bool)
+
+        while True:
+            usado[j0] = True
+            i0 = fila_de_columna[j0]
+            libres = ~usado
+
+            reducidos = costos[i0 - 1] - u[i0] - v[1:]
+            mejora = libres[1:] & (reducidos < minv[1:])
+            minv[1:][mejora] = reducidos[mejora]
+            camino[1:][mejora] = j0
+
+            candidatos = np.where(libres, minv, np.inf)
+            j1 = int(np.argmin(candidatos))
+            delta = candidatos[j1]
+
+            u[fila_de_columna[usado]] += delta
+            v[usado] -= delta
+            minv[libres] -= delta
+
+            j0 = j1
+            if fila_de_columna[j0] == 0:
+                break
+
+        while j0:
+            j1 = camino[j0]
+            fila_de_columna[j0] = fila_de_columna[j1]
+            j0 = j1
+
+    columnas = np.nonzero(fila_de_columna[1:])[0]
+    filas = fila_de_columna[1:][columnas] - 1
+
+    if transpuesta:
+        filas, columnas = columnas, filas
+
+    orden = np.argsort(filas)
+    return filas[orden], columnas[orden]
+
+
+def resolver_voraz(costos):
+    """Asignación voraz: recorre los pares del más barato al más caro."""
+    costos = np.asarray(costos, dtype=float)
+    n, m = costos.shape
+    fila_usada = np.zeros(n, dtype=bool)
+    columna_usada = np.zeros(m, dtype=bool)
+    filas, columnas = [], []
+
+    for plano in np.argsort(costos, axis=None, kind='stable'):
+        i, j = divmod(int(plano), m)
+        if fila_usada[i] or columna_usada[j]:
+            continue
+        fila_usada[i] = columna_usada[j] = True
+        filas.append(i)
+        columnas.append(j)
+        if len(filas) == min(n, m):
+            break
+
+    return np.array(filas, dtype=int), np.array(columnas, dtype=int)
+
+
+def resolver_asignacion(costos):
+    """
+    Elige el solver según el tamaño y lo disponible.
+
+    Returns:
+        tuple: (filas, columnas, nombre_solver), sin pares infactibles
+    """
+    lado = min(costos.shape)
+
+    if lado == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), 'vacio'
+
+    if linear_sum_assignment is not None and lado <= LIMITE_SCIPY:
+        filas, columnas = linear_sum_assignment(costos)
+        solver = 'scipy'
+    elif lado <= LIMITE_HUNGARO:
+        filas, columnas = resolver_hungaro(costos)
+        solver = 'hungaro'
+    else:
+        filas, columnas = resolver_voraz(costos)
+        solver = 'voraz'
+
+    factibles = costos[filas, columnas] < COSTO_INFACTIBLE
+    return filas[factibles], columnas[factibles], solver
+
+
+# ==========================================================
+# PASADA DE ASIGNACIÓN
+# ==========================================================
+def _reserva_key(repartidor_id):
+    return f'asignacion:repartidor:{repartidor_id}:reservado'
+
+
+def _pedidos_pendientes():
+    from pedidos.models import Pedido
+
+    ahora = timezone.now()
+    pendientes = []
+
+    filas = Pedido.objects.disponibles_para_repartidores().values_list(
+        'id', 'latitud_origen', 'longitud_origen',
+        'latitud_destino', 'longitud_destino', 'creado_en',
+    )
+
+    for pid, lat_o, lon_o, lat_d, lon_d, creado in filas:
+        if lat_o is not None and lon_o is not None:
+            lat, lon = lat_o, lon_o
+        elif lat_d is not None and lon_d is not None:
+            lat, lon = lat_d, lon_d
+        else:
+            continue
+        espera = (ahora - creado).total_seconds() / 60
+        pendientes.append((pid, lat, lon, espera))
+
+    return pendientes
+
+
+def asignar_pendientes():
+    """
+    Ejecuta una pasada de asignación global y ofrece cada pedido a su
+    repartidor asignado.
+
+    Returns:
+        dict: Resumen de la pasada
+    """
+    from pedidos.models import Pedido
+    from .models import Repartidor
+
+    pedidos = _pedidos_pendientes()
+    if not pedidos:
+        return {'pedidos': 0, 'repartidores': 0, 'asignados': 0}
+
+    repartidores = list(asignacion.posiciones_disponibles())
+    reservados = cache.get_many([_reserva_key(r[0]) for r in repartidores])
+    repartidores = [r for r in repartidores if _reserva_key(r[0]) not in reservados]
+
+    if not repartidores:
+        return {'pedidos': len(pedidos), 'repartidores': 0, 'asignados': 0}
+
+    excluidos = {p[0]: asignacion.repartidores_excluidos(p[0]) for p in pedidos}
+    costos, distancias = matriz_costos(pedidos, repartidores, excluidos)
+    filas, columnas, solver = resolver_asignacion(costos)
+
+    pares = [(pedidos[i][0], repartidores[j][0], round(float(distancias[i, j]), 3))
+             for i, j in zip(filas, columnas)]
+
+    pedidos_bd = Pedido.objects.in_bulk([p[0] for p in pares])
+    repartidores_bd = Repartidor.objects.select_related('user').in_bulk([p[1] for p in pares])
+
+    for pedido_id, repartidor_id, distancia in pares:
+        pedido = pedidos_bd.get(pedido_id)
+        repartidor = repartidores_bd.get(repartidor_id)
+        if pedido is None or repartidor is None:
+            continue
+        asignacion.notificar_oferta(pedido, repartidor, distancia)
+        asignacion.marcar_ofertados(pedido_id, [repartidor_id])
+
+    cache.set_many(
+        {_reserva_key(p[1]): p[0] for p in pares},
+        SEGUNDOS_RESERVA_REPARTIDOR,
+    )
+
+    return {
+        'pedidos': len(pedidos),
+        'repartidores': len(repartidores),
+        'asignados': len(pares),
+        'solver': solver,
+    }
+
+
+def ejecutar_pasada(timeout=60):
+    """Como asignar_pendientes, pero sin pasadas solapadas entre workers."""
+    if not cache.add(_LOCK_KEY, 1, timeout):
+        return None
+    try:
+        return asignar_pendientes()
+    finally:
+        cache.delete(_LOCK_KEY)
@@ -0,0 +1,87 @@
+"""
+==========================================
+ARCHIVO: backend/repartidores/management/commands/benchmark_asignacion.py
+==========================================
+Mide el tiempo de la asignación por lotes con datos sintéticos
+(pedidos y repartidores aleatorios alrededor de Guayaquil).
+No toca la base de datos.
+
+Uso: python manage.py benchmark_asignacion [--pedidos 500] [--repartidores 500]
+"""
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from repartidores import asignacion_lote
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de resolución de la asignación por lotes (NxM)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedidos', type=int, default=500)
+        parser.add_argument('--repartidores', type=int, default=500)
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        n = options['pedidos']
+        m = options['repartidores']
+        repeticiones = max(options['repeticiones'], 1)
+        rng = np.random.default_rng(options['semilla'])
+
+        # ~25 km x 25 km alrededor del centro de Guayaquil
+        pedidos = [
+            (i, lat, lon, espera)
+            for i, (lat, lon, espera) in enumerate(zip(
+                rng.uniform(-2.30, -2.07, n),
+                rng.uniform(-80.02, -79.80, n),
+                rng.uniform(0, 40, n),
+            ))
+        ]
+        repartidores = [
+            (j, lat, lon, 5.0)
+            for j, (lat, lon) in enumerate(zip(
+                rng.uniform(-2.30, -2.07, m),
+                rng.uniform(-80.02, -79.80, m),
+            ))
+        ]
+
+        self.stdout.write("\n" + "="*70)
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 BENCHMARK ASIGNACIÓN POR LOTES - {n} pedidos x {m} repartidores"
+        ))
+        self.stdout.write("="*70 + "\n")
+
+        inicio = time.perf_counter()
+        costos, distancias = asignacion_lote.matriz_costos(pedidos, repartidores)
+        self.stdout.write(f"  Matriz de costos: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+        solvers = [('voraz', asignacion_lote.resolver_voraz)]
+        if min(n, m) <= asignacion_lote.LIMITE_HUNGARO:
+            solvers.insert(0, ('hungaro', asignacion_lote.resolver_hungaro))
+        if asignacion_lote.linear_sum_assignment is not None:
+            solvers.insert(0, ('scipy', asignacion_lote.linear_sum_assignment))
+        else:
+            self.stdout.write(self.style.WARNING("  ⚠️  scipy no instalado: se omite linear_sum_assignment"))
+
+        self.stdout.write("\n" + "-"*70)
+        self.stdout.write(f"  {'solver':<10}{'mejor (ms)':>12}{'km totales':>14}{'km promedio':>14}{'km máximo':>12}")
+
+        for nombre, solver in solvers:
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                filas, columnas = solver(costos)
+                tiempos.append(time.perf_counter() - inicio)
+
+            factibles = costos[filas, columnas] < asignacion_lote.COSTO_INFACTIBLE
+            km = distancias[filas[factibles], columnas[factibles]]
+
+            self.stdout.write(
+                f"  {nombre:<10}{min(tiempos) * 1000:>12.1f}{km.sum():>14.1f}"
+                f"{km.mean():>14.2f}{km.max():>12.2f}"
+            )
+
+        self.stdout.write("="*70 + "\n")
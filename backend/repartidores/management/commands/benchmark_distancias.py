@@ -0,0 +1,104 @@
+"""
+==========================================
+ARCHIVO: backend/repartidores/management/commands/benchmark_distancias.py
+==========================================
+Compara el cálculo de distancias Haversine punto a punto (math) contra
+las funciones vectorizadas de utils.geo (NumPy). No toca la base de datos.
+
+Uso: python manage.py benchmark_distancias [--puntos 10000]
+"""
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from utils.geo import (
+    bounding_box,
+    distancia_haversine_km,
+    distancias_km_desde,
+    distancias_km_pares,
+    filtrar_por_radio,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compara distancias escalares (math) contra vectorizadas (NumPy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puntos', type=int, default=10000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def _medir(self, funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return min(tiempos) * 1000, resultado
+
+    def handle(self, *args, **options):
+        n = options['puntos']
+        repeticiones = max(options['repeticiones'], 1)
+        rng = np.random.default_rng(options['semilla'])
+
+        lat0, lon0 = -2.19, -79.89
+        lats = rng.uniform(-2.30, -2.07, n)
+        lons = rng.uniform(-80.02, -79.80, n)
+        lats_destino = rng.uniform(-2.30, -2.07, n)
+        lons_destino = rng.uniform(-80.02, -79.80, n)
+        lista_lats, lista_lons = lats.tolist(), lons.tolist()
+        lista_lats_destino, lista_lons_destino = lats_destino.tolist(), lons_destino.tolist()
+
+        self.stdout.write("\n" + "="*70)
+        self.stdout.write(self.style.SUCCESS(f"📏 BENCHMARK DISTANCIAS - {n} puntos"))
+        self.stdout.write("="*70 + "\n")
+        self.stdout.write(f"  {'caso':<34}{'escalar (ms)':>13}{'numpy (ms)':>12}{'x':>8}")
+
+        casos = [
+            (
+                'Uno a muchos',
+                lambda: [distancia_haversine_km(lat0, lon0, la, lo)
+                         for la, lo in zip(lista_lats, lista_lons)],
+                lambda: distancias_km_desde(lat0, lon0, lats, lons),
+            ),
+            (
+                'Pares (origen -> destino)',
+                lambda: [distancia_haversine_km(a, b, c, d) for a, b, c, d in zip(
+                    lista_lats, lista_lons, lista_lats_destino, lista_lons_destino)],
+                lambda: distancias_km_pares(lats, lons, lats_destino, lons_destino),
+            ),
+            (
+                'Radio 5 km ordenado (mapa)',
+                lambda: self._radio_escalar(lat0, lon0, lista_lats, lista_lons, 5.0),
+                lambda: filtrar_por_radio(lat0, lon0, lats, lons, 5.0),
+            ),
+        ]
+
+        for nombre, escalar, vectorizado in casos:
+            ms_escalar, _ = self._medir(escalar, repeticiones)
+            ms_numpy, _ = self._medir(vectorizado, repeticiones)
+            self.stdout.write(
+                f"  {nombre:<34}{ms_escalar:>13.2f}{ms_numpy:>12.2f}{ms_escalar / ms_numpy:>8.1f}"
+            )
+
+        # Verificar que ambos caminos coinciden
+        escalar = np.array([distancia_haversine_km(lat0, lon0, la, lo)
+                            for la, lo in zip(lista_lats, lista_lons)])
+        diferencia = np.abs(escalar - distancias_km_desde(lat0, lon0, lats, lons)).max()
+        self.stdout.write("\n" + "-"*70)
+        self.stdout.write(f"  Diferencia máxima escalar vs numpy: {diferencia:.2e} km")
+        self.stdout.write("="*70 + "\n")
+
+    @staticmethod
+    def _radio_escalar(lat0, lon0, lats, lons, radio_km):
+        lat_min, lat_max, lon_min, lon_max = bounding_box(lat0, lon0, radio_km)
+        dentro = []
+        for i, (la, lo) in enumerate(zip(lats, lons)):
+            if not (lat_min <= la <= lat_max and lon_min <= lo <= lon_max):
+                continue
+            distancia = distancia_haversine_km(lat0, lon0, la, lo)
+            if distancia <= radio_km:
+                dentro.append((distancia, i))
+        dentro.sort()
+        return dentro
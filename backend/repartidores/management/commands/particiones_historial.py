@@ -0,0 +1,51 @@
+"""
+==========================================
+ARCHIVO: backend/repartidores/management/commands/particiones_historial.py
+==========================================
+Administra las particiones semanales de HistorialUbicacion.
+
+Uso:
+    python manage.py particiones_historial                 # lista y crea las que faltan
+    python manage.py particiones_historial --semanas 8     # crea 8 semanas por delante
+    python manage.py particiones_historial --purgar        # aplica además la retención
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from repartidores import particiones
+
+
+class Command(BaseCommand):
+    help = 'Crea (y opcionalmente purga) las particiones semanales del historial de ubicaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semanas', type=int, default=particiones.SEMANAS_ADELANTE,
+                            help='Semanas a crear por delante de la actual')
+        parser.add_argument('--purgar', action='store_true',
+                            help='Comprime y elimina las particiones fuera de la retención')
+
+    def handle(self, *args, **options):
+        if not particiones.habilitado():
+            raise CommandError(
+                f"La tabla {particiones.TABLA} no está particionada (¿Postgres y migraciones aplicadas?)"
+            )
+
+        self.stdout.write("\n" + "="*70)
+        self.stdout.write(self.style.SUCCESS("🗂️  PARTICIONES DEL HISTORIAL DE UBICACIONES"))
+        self.stdout.write("="*70 + "\n")
+
+        creadas = particiones.crear_particiones(semanas_adelante=options['semanas'])
+        for nombre in creadas:
+            self.stdout.write(self.style.SUCCESS(f"  ✅ Creada: {nombre}"))
+        particiones.crear_particion_default()
+
+        if options['purgar']:
+            from repartidores.trayectos import purgar_historial
+            resultado = purgar_historial()
+            self.stdout.write(self.style.WARNING(
+                f"  🗑️  Particiones eliminadas por retención: {resultado['particiones']}"
+            ))
+
+        self.stdout.write("\n" + "-"*70)
+        for nombre, inicio, fin in particiones.listar_particiones():
+            self.stdout.write(f"  • {nombre}: {inicio:%Y-%m-%d} → {fin:%Y-%m-%d}")
+        self.stdout.write("="*70 + "\n")
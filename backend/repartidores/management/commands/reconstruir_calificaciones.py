@@ -0,0 +1,30 @@
+"""
+==========================================
+ARCHIVO: backend/repartidores/management/commands/reconstruir_calificaciones.py
+==========================================
+Reconstruye desde cero los contadores de calificaciones de los repartidores
+(total, suma, promedio y cantidad por estrella) a partir de
+CalificacionRepartidor. Útil si se editaron calificaciones con
+queryset.update() o directamente en la base de datos.
+
+Uso: python manage.py reconstruir_calificaciones [--repartidor ID ...]
+"""
+from django.core.management.base import BaseCommand
+
+from repartidores.models import Repartidor
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los contadores de calificaciones de los repartidores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repartidor', type=int, nargs='+', dest='repartidores',
+                            help='IDs de repartidores (default: todos)')
+
+    def handle(self, *args, **options):
+        ids = options['repartidores']
+        actualizados = Repartidor.reconstruir_contadores_calificaciones(ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Contadores de calificaciones reconstruidos para {actualizados} repartidores"
+        ))
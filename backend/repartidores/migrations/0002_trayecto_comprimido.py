@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-16 18:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0004_pedido_geohash_destino'),
+        ('repartidores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrayectoComprimido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('polyline', models.TextField(help_text='Coordenadas codificadas (Google polyline, precisión 5).')),
+                ('tiempos', models.TextField(help_text='Segundos desde `inicio` de cada punto, codificados por diferencias.')),
+                ('puntos_originales', models.PositiveIntegerField()),
+                ('puntos_comprimidos', models.PositiveIntegerField()),
+                ('tolerancia_m', models.FloatField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('pedido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trayectos', to='pedidos.pedido')),
+                ('repartidor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trayectos', to='repartidores.repartidor')),
+            ],
+            options={
+                'verbose_name': 'Trayecto Comprimido',
+                'verbose_name_plural': 'Trayectos Comprimidos',
+                'db_table': 'repartidores_trayecto_comprimido',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(fields=['repartidor', 'inicio'], name='repartidore_reparti_823bec_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('pedido__isnull', False)), fields=('pedido',), name='trayecto_unico_por_pedido'), models.UniqueConstraint(condition=models.Q(('pedido__isnull', True)), fields=('repartidor', 'inicio'), name='trayecto_unico_por_hora')],
+            },
+        ),
+    ]
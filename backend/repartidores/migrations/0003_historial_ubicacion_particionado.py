@@ -0,0 +1,142 @@
+# Generated by Django 5.1.7 on 2026-10-16 18:45
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import migrations, models
+
+
+TABLA = 'repartidores_historial_ubicacion'
+ANTERIOR = 'repartidores_historial_ubicacion_old'
+SEMANAS_ADELANTE = 4
+
+
+def _inicio_semana(momento):
+    momento = momento.astimezone(dt_timezone.utc)
+    lunes = momento - timedelta(days=momento.weekday())
+    return lunes.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def particionar_historial(apps, schema_editor):
+    """
+    Convierte el historial en una tabla particionada por semana:
+    renombra la tabla actual, crea la particionada con sus particiones,
+    copia los datos y elimina la anterior.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLA}" RENAME TO "{ANTERIOR}"')
+
+        cursor.execute(f'''
+            CREATE TABLE "{TABLA}" (
+                "id" bigint GENERATED BY DEFAULT AS IDENTITY,
+                "latitud" double precision NOT NULL,
+                "longitud" double precision NOT NULL,
+                "timestamp" timestamp with time zone NOT NULL,
+                "repartidor_id" bigint NOT NULL
+                    REFERENCES "repartidores" ("id") DEFERRABLE INITIALLY DEFERRED,
+                CONSTRAINT "hist_lat_ec" CHECK ("latitud" >= -5.0 AND "latitud" <= 2.0),
+                CONSTRAINT "hist_lon_ec" CHECK ("longitud" >= -92.0 AND "longitud" <= -75.0),
+                PRIMARY KEY ("id", "timestamp")
+            ) PARTITION BY RANGE ("timestamp")
+        ''')
+
+        # Una partición por semana desde el punto más antiguo hasta unas semanas por delante
+        cursor.execute(f'SELECT MIN("timestamp") FROM "{ANTERIOR}"')
+        ahora = datetime.now(dt_timezone.utc)
+        semana = _inicio_semana(cursor.fetchone()[0] or ahora)
+        ultima = _inicio_semana(ahora) + timedelta(weeks=SEMANAS_ADELANTE)
+
+        while semana <= ultima:
+            fin = semana + timedelta(days=7)
+            cursor.execute(
+                f'CREATE TABLE "{TABLA}_{semana:%Y%m%d}" PARTITION OF "{TABLA}" '
+                f"FOR VALUES FROM ('{semana.isoformat()}') TO ('{fin.isoformat()}')"
+            )
+            semana = fin
+
+        cursor.execute(f'''
+            INSERT INTO "{TABLA}" ("id", "latitud", "longitud", "timestamp", "repartidor_id")
+            SELECT "id", "latitud", "longitud", "timestamp", "repartidor_id" FROM "{ANTERIOR}"
+        ''')
+        cursor.execute(f'DROP TABLE "{ANTERIOR}"')
+
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{TABLA}\"', 'id'), "
+            f'COALESCE((SELECT MAX("id") FROM "{TABLA}"), 0) + 1, false)'
+        )
+
+        # Índices sobre la tabla padre: se propagan a cada partición
+        cursor.execute(
+            f'CREATE INDEX "repartidore_reparti_ef720c_idx" ON "{TABLA}" ("repartidor_id", "timestamp")'
+        )
+        cursor.execute(
+            f'CREATE INDEX "hist_ubic_timestamp_brin" ON "{TABLA}" USING brin ("timestamp")'
+        )
+
+
+def desparticionar_historial(apps, schema_editor):
+    """Vuelve a una tabla normal con los índices B-tree originales."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLA}" RENAME TO "{ANTERIOR}"')
+        cursor.execute(f'''
+            CREATE TABLE "{TABLA}" (
+                "id" bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                "latitud" double precision NOT NULL,
+                "longitud" double precision NOT NULL,
+                "timestamp" timestamp with time zone NOT NULL,
+                "repartidor_id" bigint NOT NULL
+                    REFERENCES "repartidores" ("id") DEFERRABLE INITIALLY DEFERRED,
+                CONSTRAINT "hist_lat_ec" CHECK ("latitud" >= -5.0 AND "latitud" <= 2.0),
+                CONSTRAINT "hist_lon_ec" CHECK ("longitud" >= -92.0 AND "longitud" <= -75.0)
+            )
+        ''')
+        cursor.execute(f'''
+            INSERT INTO "{TABLA}" ("id", "latitud", "longitud", "timestamp", "repartidor_id")
+            SELECT "id", "latitud", "longitud", "timestamp", "repartidor_id" FROM "{ANTERIOR}"
+        ''')
+        cursor.execute(f'DROP TABLE "{ANTERIOR}" CASCADE')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{TABLA}\"', 'id'), "
+            f'COALESCE((SELECT MAX("id") FROM "{TABLA}"), 0) + 1, false)'
+        )
+        cursor.execute(
+            f'CREATE INDEX "repartidore_reparti_ef720c_idx" ON "{TABLA}" ("repartidor_id", "timestamp")'
+        )
+        cursor.execute(f'CREATE INDEX "repartidore_timesta_fd3fce_idx" ON "{TABLA}" ("timestamp")')
+        cursor.execute(f'CREATE INDEX ON "{TABLA}" ("repartidor_id")')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repartidores', '0002_trayecto_comprimido'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(particionar_historial, desparticionar_historial),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='historialubicacion',
+                    name='repartidore_timesta_fd3fce_idx',
+                ),
+                migrations.AlterField(
+                    model_name='historialubicacion',
+                    name='repartidor',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='historial_ubicaciones', to='repartidores.repartidor'),
+                ),
+                migrations.AddIndex(
+                    model_name='historialubicacion',
+                    index=django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='hist_ubic_timestamp_brin'),
+                ),
+            ],
+        ),
+    ]
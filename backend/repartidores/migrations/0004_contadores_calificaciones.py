@@ -0,0 +1,89 @@
+# Generated by Django 5.1.7 on 2026-10-16 18:47
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def _campo_estrellas(estrellas):
+    return 'calificaciones_1_estrella' if estrellas == 1 else f'calificaciones_{estrellas}_estrellas'
+
+
+def calcular_contadores_existentes(apps, schema_editor):
+    """Llena los contadores con las calificaciones ya registradas."""
+    Repartidor = apps.get_model('repartidores', 'Repartidor')
+    CalificacionRepartidor = apps.get_model('repartidores', 'CalificacionRepartidor')
+
+    agregados = CalificacionRepartidor.objects.values('repartidor_id').annotate(
+        total=Count('id'),
+        suma=Sum('puntuacion'),
+        **{
+            _campo_estrellas(e): Count('id', filter=Q(puntuacion__gte=e, puntuacion__lt=e + 1))
+            for e in range(1, 6)
+        },
+    )
+
+    campos = ['total_calificaciones', 'suma_calificaciones', 'calificacion_promedio'] + [
+        _campo_estrellas(e) for e in range(1, 6)
+    ]
+    lote = []
+    for fila in agregados.iterator():
+        repartidor = Repartidor(pk=fila['repartidor_id'])
+        repartidor.total_calificaciones = fila['total']
+        repartidor.suma_calificaciones = fila['suma'] or Decimal('0')
+        repartidor.calificacion_promedio = round(repartidor.suma_calificaciones / fila['total'], 2)
+        for e in range(1, 6):
+            setattr(repartidor, _campo_estrellas(e), fila[_campo_estrellas(e)])
+        lote.append(repartidor)
+
+        if len(lote) >= 1000:
+            Repartidor.objects.bulk_update(lote, campos)
+            lote = []
+
+    Repartidor.objects.bulk_update(lote, campos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repartidores', '0003_historial_ubicacion_particionado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repartidor',
+            name='calificaciones_1_estrella',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='repartidor',
+            name='calificaciones_2_estrellas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='repartidor',
+            name='calificaciones_3_estrellas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='repartidor',
+            name='calificaciones_4_estrellas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='repartidor',
+            name='calificaciones_5_estrellas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='repartidor',
+            name='suma_calificaciones',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='repartidor',
+            name='total_calificaciones',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(calcular_contadores_existentes, migrations.RunPython.noop),
+    ]
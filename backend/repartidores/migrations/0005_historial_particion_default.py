@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2026-10-16 21:10
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import migrations
+
+
+TABLA = 'repartidores_historial_ubicacion'
+SEMANAS_ADELANTE = 12
+
+
+def _inicio_semana(momento):
+    momento = momento.astimezone(dt_timezone.utc)
+    lunes = momento - timedelta(days=momento.weekday())
+    return lunes.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def crear_particion_default(apps, schema_editor):
+    """
+    Crea las semanas que falten hasta SEMANAS_ADELANTE y la partición
+    DEFAULT, para que un INSERT no falle si la tarea de mantenimiento de
+    particiones deja de correr.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [f'"{TABLA}"'])
+        if cursor.fetchone()[0] is None:
+            return
+
+        # Las semanas van antes que DEFAULT: con DEFAULT vacía no hay filas que mover
+        semana = _inicio_semana(datetime.now(dt_timezone.utc))
+        ultima = semana + timedelta(weeks=SEMANAS_ADELANTE)
+        while semana <= ultima:
+            fin = semana + timedelta(days=7)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{TABLA}_{semana:%Y%m%d}" PARTITION OF "{TABLA}" '
+                f"FOR VALUES FROM ('{semana.isoformat()}') TO ('{fin.isoformat()}')"
+            )
+            semana = fin
+
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{TABLA}_default" PARTITION OF "{TABLA}" DEFAULT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repartidores', '0004_contadores_calificaciones'),
+    ]
+
+    operations = [
+        # Sin reversa destructiva: DEFAULT puede tener puntos y 0003 copia
+        # desde la tabla padre al desparticionar
+        migrations.RunPython(crear_particion_default, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-16 22:05
+
+from django.db import migrations
+
+
+NOMBRE = 'volcar-ubicaciones'
+TAREA = 'repartidores.volcar_ubicaciones'
+SEGUNDOS = 5
+
+
+def programar_volcado(apps, schema_editor):
+    """
+    Programa en django-celery-beat el volcado de ubicaciones de Redis a
+    Postgres: con UBICACION_WRITE_BEHIND los pings solo llegan a la base
+    de datos a través de esta tarea. No toca una entrada ya existente.
+    """
+    IntervalSchedule = apps.get_model('django_celery_beat', 'IntervalSchedule')
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    intervalo, _ = IntervalSchedule.objects.get_or_create(every=SEGUNDOS, period='seconds')
+    PeriodicTask.objects.get_or_create(
+        name=NOMBRE,
+        defaults={
+            'task': TAREA,
+            'interval': intervalo,
+            'enabled': True,
+            'description': 'Vuelca a Postgres las ubicaciones acumuladas en Redis',
+        },
+    )
+
+
+def desprogramar_volcado(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTask.objects.filter(name=NOMBRE, task=TAREA).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repartidores', '0005_historial_particion_default'),
+        ('django_celery_beat', '0019_alter_periodictasks_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(programar_volcado, desprogramar_volcado),
+    ]
@@ -1,15 +1,20 @@
 # repartidores/models.py
 from django.db import models
-from django.db.models import Q, F
+from django.contrib.postgres.indexes import BrinIndex
+from django.db.models import Q, F, Case, When, Value, ExpressionWrapper
+from django.db.models.functions import Round
+from django.db.models.lookups import GreaterThan
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from authentication.models import User
+from decimal import Decimal
 import logging  # ✅ AGREGAR
 # Ajusta este import a tu proyecto real
 from authentication.models import User
+from . import ubicacion_viva
 logger = logging.getLogger('repartidores')  # ✅ AGREGAR
 
 
@@ -77,6 +82,15 @@ class Repartidor(TimeStampedModel):
         validators=[MinValueValidator(0), MaxValueValidator(5)]
     )
 
+    # Contadores de calificaciones (se actualizan con F() en cada alta/cambio/baja)
+    total_calificaciones = models.PositiveIntegerField(default=0)
+    suma_calificaciones = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+    calificaciones_1_estrella = models.PositiveIntegerField(default=0)
+    calificaciones_2_estrellas = models.PositiveIntegerField(default=0)
+    calificaciones_3_estrellas = models.PositiveIntegerField(default=0)
+    calificaciones_4_estrellas = models.PositiveIntegerField(default=0)
+    calificaciones_5_estrellas = models.PositiveIntegerField(default=0)
+
     class Meta:
         db_table = 'repartidores'
         verbose_name = 'Repartidor'
@@ -136,6 +150,33 @@ class Repartidor(TimeStampedModel):
         self.save(update_fields=['estado', 'actualizado_en'])
         RepartidorEstadoLog.log(self, antes=anterior, despues=self.estado, motivo="pedido asignado/aceptado")
 
+    def ocupar_si_disponible(self, motivo="pedido asignado/aceptado"):
+        """
+        Pasa a OCUPADO con un UPDATE condicional: solo si en la base de datos
+        sigue DISPONIBLE, activo y verificado. Sin lecturas previas ni bloqueos
+        explícitos; con varias aceptaciones simultáneas gana una sola.
+
+        Returns:
+            bool: True si este llamado hizo el cambio
+        """
+        ahora = timezone.now()
+        ocupado = Repartidor.objects.filter(
+            pk=self.pk,
+            estado=EstadoRepartidor.DISPONIBLE,
+            activo=True,
+            verificado=True,
+        ).update(estado=EstadoRepartidor.OCUPADO, actualizado_en=ahora)
+
+        if not ocupado:
+            return False
+
+        self.estado = EstadoRepartidor.OCUPADO
+        self.actualizado_en = ahora
+        RepartidorEstadoLog.log(
+            self, antes=EstadoRepartidor.DISPONIBLE, despues=EstadoRepartidor.OCUPADO, motivo=motivo
+        )
+        return True
+
     def marcar_fuera_servicio(self, motivo="manual/timeout"):
         """Marca al repartidor como fuera de servicio."""
         anterior = self.estado
@@ -143,28 +184,111 @@ class Repartidor(TimeStampedModel):
         self.save(update_fields=['estado', 'actualizado_en'])
         RepartidorEstadoLog.log(self, antes=anterior, despues=self.estado, motivo=motivo)
 
-    # ---------- Ubicación
-    def actualizar_ubicacion(self, lat, lon, when=None, save_historial=True):
+    @classmethod
+    def desconectar_inactivos(cls, limite, motivo="sin ubicación (timeout)"):
         """
-        Actualiza la ubicación del repartidor.
-        Solo repartidores activos y verificados pueden actualizar ubicación.
+        Pasa a FUERA_SERVICIO, en una sola sentencia, a todos los repartidores
+        DISPONIBLE cuya última ubicación (o último cambio, si nunca enviaron
+        una) es anterior a `limite`. Los OCUPADO no se tocan.
+
+        Se descartan antes los que tienen una posición reciente en Redis
+        todavía no volcada a la base de datos.
+
+        Returns:
+            list[int]: IDs de los repartidores desconectados
         """
+        from django.db import connection
+
+        candidatos = list(
+            cls.objects.filter(estado=EstadoRepartidor.DISPONIBLE).filter(
+                Q(ultima_localizacion__lt=limite)
+                | Q(ultima_localizacion__isnull=True, actualizado_en__lt=limite)
+            ).values_list('id', flat=True)
+        )
+        if not candidatos:
+            return []
+
+        en_vivo = ubicacion_viva.obtener_varios(candidatos)
+        candidatos = [
+            rid for rid in candidatos
+            if rid not in en_vivo or en_vivo[rid]['timestamp'] < limite
+        ]
+        if not candidatos:
+            return []
+
+        tabla = connection.ops.quote_name(cls._meta.db_table)
+        marcadores = ', '.join(['%s'] * len(candidatos))
+        ahora = timezone.now()
+
+        # La condición se repite en el UPDATE por si alguno envió un ping entre medio
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {tabla} SET estado = %s, actualizado_en = %s "
+                f"WHERE id IN ({marcadores}) AND estado = %s "
+                f"AND COALESCE(ultima_localizacion, actualizado_en) < %s "
+                f"RETURNING id",
+                [EstadoRepartidor.FUERA_SERVICIO, ahora, *candidatos,
+                 EstadoRepartidor.DISPONIBLE, limite],
+            )
+            desconectados = [fila[0] for fila in cursor.fetchall()]
+
+        RepartidorEstadoLog.objects.bulk_create([
+            RepartidorEstadoLog(
+                repartidor_id=rid,
+                estado_anterior=EstadoRepartidor.DISPONIBLE,
+                estado_nuevo=EstadoRepartidor.FUERA_SERVICIO,
+                motivo=motivo,
+                timestamp=ahora,
+            )
+            for rid in desconectados
+        ], batch_size=1000)
+
+        ubicacion_viva.eliminar(desconectados)
+        return desconectados
+
+    # ---------- Ubicación
+    def _validar_puede_actualizar_ubicacion(self):
+        """Solo repartidores activos y verificados pueden reportar ubicación."""
         if not self.activo:
             raise ValidationError("No puedes actualizar ubicación: tu cuenta está desactivada.")
 
         if not self.verificado:
             raise ValidationError("No puedes actualizar ubicación: no estás verificado.")
 
-        # Validar rangos de Ecuador
+    @staticmethod
+    def _validar_coordenadas(lat, lon):
+        """Valida rangos de Ecuador."""
         if not (-5.0 <= lat <= 2.0):
             raise ValidationError(f"Latitud fuera del rango de Ecuador: {lat}")
 
         if not (-92.0 <= lon <= -75.0):
             raise ValidationError(f"Longitud fuera del rango de Ecuador: {lon}")
 
+    def actualizar_ubicacion(self, lat, lon, when=None, save_historial=True):
+        """
+        Actualiza la ubicación del repartidor.
+        Solo repartidores activos y verificados pueden actualizar ubicación.
+
+        La posición se escribe primero en Redis (ubicacion_viva) y la tarea
+        `repartidores.volcar_ubicaciones` la persiste por lotes. Si Redis no
+        está disponible se escribe directamente en la base de datos.
+        """
+        self._validar_puede_actualizar_ubicacion()
+        self._validar_coordenadas(lat, lon)
+
         self.latitud = float(lat)
         self.longitud = float(lon)
         self.ultima_localizacion = when or timezone.now()
+
+        self._publicar_seguimiento(self.latitud, self.longitud, self.ultima_localizacion)
+        self._evaluar_geocercas([(self.latitud, self.longitud, self.ultima_localizacion)])
+
+        if ubicacion_viva.registrar(
+            self.pk, self.latitud, self.longitud, self.ultima_localizacion,
+            guardar_historial=save_historial
+        ):
+            return
+
         self.save(update_fields=['latitud', 'longitud', 'ultima_localizacion', 'actualizado_en'])
 
         if save_historial:
@@ -175,6 +299,112 @@ class Repartidor(TimeStampedModel):
                 timestamp=self.ultima_localizacion,
             )
 
+    def registrar_ubicaciones_lote(self, puntos):
+        """
+        Registra un lote de ubicaciones acumuladas por la app.
+
+        Inserta todo el historial con un solo bulk_create y actualiza la
+        ubicación actual una sola vez con el punto más reciente (solo si es
+        más nuevo que la última ubicación conocida).
+
+        Args:
+            puntos (list[tuple]): (latitud, longitud, timestamp)
+
+        Returns:
+            int: Cantidad de puntos registrados
+        """
+        self._validar_puede_actualizar_ubicacion()
+
+        if not puntos:
+            return 0
+
+        for lat, lon, _ in puntos:
+            self._validar_coordenadas(lat, lon)
+
+        puntos = sorted(puntos, key=lambda punto: punto[2])
+
+        HistorialUbicacion.objects.bulk_create([
+            HistorialUbicacion(
+                repartidor=self,
+                latitud=float(lat),
+                longitud=float(lon),
+                timestamp=when,
+            )
+            for lat, lon, when in puntos
+        ])
+
+        lat, lon, when = puntos[-1]
+        actualizado = Repartidor.objects.filter(
+            Q(ultima_localizacion__isnull=True) | Q(ultima_localizacion__lt=when),
+            pk=self.pk,
+        ).update(
+            latitud=float(lat),
+            longitud=float(lon),
+            ultima_localizacion=when,
+            actualizado_en=timezone.now(),
+        )
+
+        if actualizado:
+            self.latitud = float(lat)
+            self.longitud = float(lon)
+            self.ultima_localizacion = when
+
+        # La posición en vivo refleja el punto más reciente (ya persistido)
+        ubicacion_viva.registrar(self.pk, lat, lon, when, encolar=False)
+        self._publicar_seguimiento(lat, lon, when)
+        self._evaluar_geocercas(puntos)
+
+        return len(puntos)
+
+    def _publicar_seguimiento(self, lat, lon, when):
+        """Posición para el seguimiento en vivo de sus pedidos (limitada por repartidor)."""
+        from pedidos import seguimiento
+        seguimiento.publicar_ubicacion(self.pk, lat, lon, when)
+
+    def _evaluar_geocercas(self, puntos):
+        """
+        Llegadas a origen o destino de sus pedidos (pedidos/geocercas.py).
+        Sin pedido asignado no está OCUPADO y no hay nada que evaluar.
+        """
+        if self.estado != EstadoRepartidor.OCUPADO:
+            return []
+
+        from pedidos import geocercas
+        return geocercas.evaluar(self.pk, puntos)
+
+    def obtener_ubicacion_actual(self):
+        """
+        Posición más reciente conocida: Redis si está disponible,
+        si no la última guardada en la base de datos.
+
+        Returns:
+            dict | None: latitud, longitud, timestamp
+        """
+        return self.ubicacion_mas_reciente(ubicacion_viva.obtener(self.pk))
+
+    def ubicacion_mas_reciente(self, en_vivo):
+        """
+        Entre la posición en vivo ya leída de Redis (o None) y la guardada
+        en la base de datos, la más reciente. Para listas, con las
+        posiciones de `ubicacion_viva.obtener_varios`.
+
+        Returns:
+            dict | None: latitud, longitud, timestamp
+        """
+        if en_vivo and (
+            self.ultima_localizacion is None or en_vivo['timestamp'] >= self.ultima_localizacion
+        ):
+            return en_vivo
+
+        if self.latitud is None or self.longitud is None:
+            return None
+
+        return {
+            'latitud': self.latitud,
+            'longitud': self.longitud,
+            'timestamp': self.ultima_localizacion,
+        }
+
     # ---------- Métricas
     def incrementar_entregas(self, unidades=1):
         """Incrementa el contador de entregas completadas de forma atómica."""
@@ -187,12 +417,113 @@ class Repartidor(TimeStampedModel):
         )
         self.refresh_from_db(fields=['entregas_completadas'])
 
+    # ---------- Calificaciones (contadores)
+    CAMPOS_CALIFICACIONES = [
+        'total_calificaciones', 'suma_calificaciones', 'calificacion_promedio',
+        'calificaciones_1_estrella', 'calificaciones_2_estrellas', 'calificaciones_3_estrellas',
+        'calificaciones_4_estrellas', 'calificaciones_5_estrellas',
+    ]
+
+    @staticmethod
+    def campo_estrellas(puntuacion):
+        """Contador de la puntuación (las medias estrellas cuentan en la inferior)."""
+        estrellas = min(max(int(puntuacion), 1), 5)
+        return 'calificaciones_1_estrella' if estrellas == 1 else f'calificaciones_{estrellas}_estrellas'
+
+    def registrar_calificacion(self, nueva=None, anterior=None):
+        """
+        Actualiza los contadores de calificaciones en un solo UPDATE atómico.
+
+        Args:
+            nueva: Puntuación nueva (None si se eliminó la calificación)
+            anterior: Puntuación previa (None si es una calificación nueva)
+        """
+        if nueva == anterior:
+            return
+
+        delta_total = (nueva is not None) - (anterior is not None)
+        delta_suma = Decimal(nueva or 0) - Decimal(anterior or 0)
+
+        cambios = {}
+        if anterior is not None:
+            campo = self.campo_estrellas(anterior)
+            cambios[campo] = F(campo) - 1
+        if nueva is not None:
+            campo = self.campo_estrellas(nueva)
+            cambios[campo] = (cambios[campo] + 1) if campo in cambios else F(campo) + 1
+
+        nuevo_total = F('total_calificaciones') + delta_total
+        nueva_suma = F('suma_calificaciones') + delta_suma
+
+        actualizados = Repartidor.objects.filter(pk=self.pk).update(
+            total_calificaciones=nuevo_total,
+            suma_calificaciones=nueva_suma,
+            calificacion_promedio=Case(
+                When(GreaterThan(nuevo_total, 0), then=Round(
+                    ExpressionWrapper(nueva_suma / nuevo_total, output_field=models.DecimalField()), 2
+                )),
+                default=Value(Decimal('5.00')),
+                output_field=models.DecimalField(),
+            ),
+            actualizado_en=timezone.now(),
+            **cambios,
+        )
+        # El repartidor pudo haberse eliminado (borrado en cascada de sus calificaciones)
+        if actualizados:
+            self.refresh_from_db(fields=self.CAMPOS_CALIFICACIONES)
+
+    @classmethod
+    def reconstruir_contadores_calificaciones(cls, repartidor_ids=None):
+        """
+        Recalcula desde cero los contadores de calificaciones.
+
+        Args:
+            repartidor_ids: Limitar a estos repartidores (None = todos)
+
+        Returns:
+            int: Repartidores actualizados
+        """
+        calificaciones = CalificacionRepartidor.objects.all()
+        repartidores = cls.objects.only('id', *cls.CAMPOS_CALIFICACIONES)
+        if repartidor_ids is not None:
+            calificaciones = calificaciones.filter(repartidor_id__in=repartidor_ids)
+            repartidores = repartidores.filter(pk__in=repartidor_ids)
+
+        agregados = {
+            fila['repartidor_id']: fila
+            for fila in calificaciones.values('repartidor_id').annotate(
+                total=models.Count('id'),
+                suma=models.Sum('puntuacion'),
+                **{
+                    cls.campo_estrellas(estrellas): models.Count(
+                        'id', filter=Q(puntuacion__gte=estrellas, puntuacion__lt=estrellas + 1)
+                    )
+                    for estrellas in range(1, 6)
+                },
+            )
+        }
+
+        cambiados = []
+        for repartidor in repartidores.iterator(chunk_size=1000):
+            fila = agregados.get(repartidor.pk, {})
+            repartidor.total_calificaciones = fila.get('total', 0)
+            repartidor.suma_calificaciones = fila.get('suma') or Decimal('0')
+            repartidor.calificacion_promedio = (
+                round(repartidor.suma_calificaciones / repartidor.total_calificaciones, 2)
+                if repartidor.total_calificaciones else Decimal('5.00')
+            )
+            for estrellas in range(1, 6):
+                campo = cls.campo_estrellas(estrellas)
+                setattr(repartidor, campo, fila.get(campo, 0))
+            cambiados.append(repartidor)
+
+        cls.objects.bulk_update(cambiados, cls.CAMPOS_CALIFICACIONES, batch_size=1000)
+        return len(cambiados)
+
     def recalcular_calificacion_promedio(self):
-        """Recalcula el promedio de calificaciones recibidas."""
-        agg = self.calificaciones.aggregate(avg=models.Avg('puntuacion'))
-        promedio = round(float(agg['avg'] or 5.0), 2)
-        self.calificacion_promedio = promedio
-        self.save(update_fields=['calificacion_promedio', 'actualizado_en'])
+        """Recalcula desde cero los contadores y el promedio de este repartidor."""
+        Repartidor.reconstruir_contadores_calificaciones([self.pk])
+        self.refresh_from_db(fields=self.CAMPOS_CALIFICACIONES)
 
 
 # ==============================
@@ -233,7 +564,15 @@ class RepartidorVehiculo(TimeStampedModel):
 # Historial de ubicaciones
 # ==============================
 class HistorialUbicacion(models.Model):
-    repartidor = models.ForeignKey(Repartidor, on_delete=models.CASCADE, related_name='historial_ubicaciones')
+    """
+    Puntos crudos de ubicación. En Postgres la tabla está particionada
+    por semana sobre `timestamp` (ver repartidores/particiones.py): la PK
+    real es (id, timestamp) y la retención elimina particiones completas.
+    """
+    # Sin índice propio: lo cubre el índice (repartidor, timestamp)
+    repartidor = models.ForeignKey(
+        Repartidor, on_delete=models.CASCADE, related_name='historial_ubicaciones', db_index=False
+    )
     latitud = models.FloatField()
     longitud = models.FloatField()
     timestamp = models.DateTimeField(default=timezone.now)
@@ -245,7 +584,8 @@ class HistorialUbicacion(models.Model):
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['repartidor', 'timestamp']),
-            models.Index(fields=['timestamp']),
+            # BRIN: los puntos llegan en orden de tiempo, el índice ocupa unas pocas páginas
+            BrinIndex(fields=['timestamp'], name='hist_ubic_timestamp_brin'),
         ]
         constraints = [
             models.CheckConstraint(
@@ -262,6 +602,71 @@ class HistorialUbicacion(models.Model):
         return f"{self.repartidor_id} @ {self.timestamp:%Y-%m-%d %H:%M:%S}"
 
 
+# ==============================
+# Trayectos comprimidos (Douglas-Peucker + polyline)
+# ==============================
+class TrayectoComprimido(models.Model):
+    """
+    Trayecto de un repartidor simplificado y codificado como polyline.
+    Uno por entrega (pedido) o, fuera de entregas, uno por hora.
+    Reemplaza a los puntos crudos de HistorialUbicacion pasada la retención.
+    """
+    repartidor = models.ForeignKey(Repartidor, on_delete=models.CASCADE, related_name='trayectos')
+    pedido = models.ForeignKey(
+        'pedidos.Pedido', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='trayectos',
+    )
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField()
+
+    polyline = models.TextField(help_text="Coordenadas codificadas (Google polyline, precisión 5).")
+    tiempos = models.TextField(help_text="Segundos desde `inicio` de cada punto, codificados por diferencias.")
+    puntos_originales = models.PositiveIntegerField()
+    puntos_comprimidos = models.PositiveIntegerField()
+    tolerancia_m = models.FloatField()
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'repartidores_trayecto_comprimido'
+        verbose_name = 'Trayecto Comprimido'
+        verbose_name_plural = 'Trayectos Comprimidos'
+        ordering = ['-inicio']
+        indexes = [
+            models.Index(fields=['repartidor', 'inicio']),
+        ]
+        constraints = [
+            # Un trayecto por entrega
+            models.UniqueConstraint(
+                fields=['pedido'],
+                condition=Q(pedido__isnull=False),
+                name='trayecto_unico_por_pedido',
+            ),
+            # Un trayecto horario por repartidor y hora
+            models.UniqueConstraint(
+                fields=['repartidor', 'inicio'],
+                condition=Q(pedido__isnull=True),
+                name='trayecto_unico_por_hora',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.repartidor_id} {self.inicio:%Y-%m-%d %H:%M} ({self.puntos_comprimidos} pts)"
+
+    def como_dict(self):
+        """Payload para la API: polyline + tiempos, sin decodificar."""
+        return {
+            'id': self.pk,
+            'pedido_id': self.pedido_id,
+            'inicio': self.inicio.isoformat(),
+            'fin': self.fin.isoformat(),
+            'polyline': self.polyline,
+            'tiempos': self.tiempos,
+            'puntos': self.puntos_comprimidos,
+            'puntos_originales': self.puntos_originales,
+        }
+
+
 # ==============================
 # Log de cambios de estado (auditoría)
 # ==============================
@@ -332,10 +737,12 @@ class CalificacionRepartidor(TimeStampedModel):
     def __str__(self):
         return f"{self.repartidor_id}/{self.pedido_id} → {self.puntuacion}"
 
-    def save(self, *args, **kwargs):
-        """Al guardar, recalcula automáticamente el promedio del repartidor."""
-        super().save(*args, **kwargs)
-        self.repartidor.recalcular_calificacion_promedio()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Recordar la puntuación cargada para actualizar los contadores por diferencia
+        instance = super().from_db(db, field_names, values)
+        instance._puntuacion_anterior = instance.__dict__.get('puntuacion')
+        return instance
 
 
 class CalificacionCliente(TimeStampedModel):
@@ -0,0 +1,171 @@
+# repartidores/particiones.py
+"""
+Particiones semanales de HistorialUbicacion (Postgres, PARTITION BY RANGE).
+
+La tabla `repartidores_historial_ubicacion` está particionada por
+`timestamp`, una partición por semana (lunes 00:00 UTC a lunes siguiente):
+
+    repartidores_historial_ubicacion_20261012
+
+- `crear_particiones` crea por adelantado las semanas que faltan
+  (tarea diaria `repartidores.mantener_particiones_historial` o el
+  comando `particiones_historial`).
+- La partición DEFAULT (`..._default`) recibe los puntos de semanas que
+  todavía no tienen partición, así un INSERT nunca falla aunque la tarea
+  deje de correr. Al crear una semana, sus puntos salen de DEFAULT hacia
+  la partición nueva.
+- `eliminar_particiones_antiguas` aplica la retención con DROP TABLE
+  de semanas completas en lugar de un DELETE masivo.
+
+En bases de datos que no son Postgres (desarrollo) todo es no-op.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+logger = logging.getLogger('repartidores')
+
+TABLA = 'repartidores_historial_ubicacion'
+
+# Semanas que se crean por delante de la actual
+SEMANAS_ADELANTE = 12
+
+PARTICION_DEFAULT = f'{TABLA}_default'
+
+
+def habilitado():
+    """True si la tabla de historial es una tabla particionada de Postgres."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [TABLA],
+        )
+        return cursor.fetchone() is not None
+
+
+def inicio_semana(momento):
+    """Lunes 00:00 UTC de la semana que contiene `momento`."""
+    momento = momento.astimezone(dt_timezone.utc)
+    lunes = momento - timedelta(days=momento.weekday())
+    return lunes.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def nombre_particion(inicio):
+    return f'{TABLA}_{inicio:%Y%m%d}'
+
+
+def listar_particiones():
+    """
+    Particiones existentes.
+
+    Returns:
+        list[tuple]: (nombre, inicio, fin) ordenadas por inicio
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s",
+            [TABLA],
+        )
+        nombres = [fila[0] for fila in cursor.fetchall()]
+
+    particiones = []
+    for nombre in nombres:
+        try:
+            inicio = datetime.strptime(nombre.rsplit('_', 1)[1], '%Y%m%d').replace(tzinfo=dt_timezone.utc)
+        except (IndexError, ValueError):
+            continue
+        particiones.append((nombre, inicio, inicio + timedelta(days=7)))
+
+    return sorted(particiones, key=lambda p: p[1])
+
+
+def crear_particiones(desde=None, semanas_adelante=SEMANAS_ADELANTE, ahora=None):
+    """
+    Crea las particiones semanales desde `desde` (default: semana actual)
+    hasta `semanas_adelante` semanas después de la actual.
+
+    Returns:
+        list[str]: Nombres de las particiones creadas
+    """
+    ahora = ahora or datetime.now(dt_timezone.utc)
+    semana = inicio_semana(desde or ahora)
+    ultima = inicio_semana(ahora) + timedelta(weeks=semanas_adelante)
+
+    existentes = {nombre for nombre, _, _ in listar_particiones()}
+    creadas = []
+
+    while semana <= ultima:
+        nombre = nombre_particion(semana)
+        if nombre not in existentes:
+            _crear_particion(nombre, semana, semana + timedelta(days=7))
+            creadas.append(nombre)
+        semana += timedelta(weeks=1)
+
+    if creadas:
+        logger.info(f"Particiones de historial creadas: {', '.join(creadas)}")
+    return creadas
+
+
+def crear_particion_default():
+    """Crea la partición DEFAULT si no existe."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{PARTICION_DEFAULT}" PARTITION OF "{TABLA}" DEFAULT')
+
+
+def _crear_particion(nombre, inicio, fin):
+    """
+    Crea la partición de [inicio, fin). Si existe DEFAULT, la semana se
+    arma como tabla suelta con los puntos que DEFAULT tenga en ese rango y
+    luego se adjunta (ATTACH falla si DEFAULT conserva filas del rango).
+    """
+    rango = f"FROM ('{inicio.isoformat()}') TO ('{fin.isoformat()}')"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [f'"{PARTICION_DEFAULT}"'])
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS "{nombre}" PARTITION OF "{TABLA}" FOR VALUES {rango}')
+            return
+
+        cursor.execute(
+            f'CREATE TABLE "{nombre}" (LIKE "{TABLA}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f'WITH movidos AS ('
+            f'DELETE FROM "{PARTICION_DEFAULT}" WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *'
+            f') INSERT INTO "{nombre}" SELECT * FROM movidos',
+            [inicio, fin],
+        )
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} puntos movidos de {PARTICION_DEFAULT} a {nombre}")
+        cursor.execute(f'ALTER TABLE "{TABLA}" ATTACH PARTITION "{nombre}" FOR VALUES {rango}')
+
+
+def eliminar_particiones_antiguas(limite):
+    """
+    Elimina (DROP TABLE) las particiones cuyo rango termina antes de `limite`.
+
+    Returns:
+        list[str]: Nombres de las particiones eliminadas
+    """
+    eliminadas = []
+    with connection.cursor() as cursor:
+        for nombre, _, fin in listar_particiones():
+            if fin <= limite:
+                cursor.execute(f'DROP TABLE IF EXISTS "{nombre}"')
+                eliminadas.append(nombre)
+
+        # Puntos viejos que cayeron en DEFAULT (semanas sin partición)
+        cursor.execute("SELECT to_regclass(%s)", [f'"{PARTICION_DEFAULT}"'])
+        if cursor.fetchone()[0] is not None:
+            cursor.execute(f'DELETE FROM "{PARTICION_DEFAULT}" WHERE "timestamp" < %s', [limite])
+
+    if eliminadas:
+        logger.info(f"Particiones de historial eliminadas: {', '.join(eliminadas)}")
+    return eliminadas
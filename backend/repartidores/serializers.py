@@ -2,9 +2,13 @@ from rest_framework import serializers
 from django.core.validators import RegexValidator
 from django.utils import timezone
 from django.conf import settings
-from math import radians, cos, sin, sqrt, atan2
 from decimal import Decimal
+from datetime import timedelta
 
+from pedidos import tiempos_viaje
+from utils.geo import distancia_haversine_km
+
+from . import ubicacion_viva
 from .models import (
     Repartidor,
     RepartidorVehiculo,
@@ -31,21 +35,8 @@ def calcular_distancia(lat1, lon1, lat2, lon2):
     Returns:
         float: Distancia en kilómetros, o None si faltan datos
     """
-    if not all([lat1, lon1, lat2, lon2]):
-        return None
-
-    try:
-        R = 6371.0  # radio de la Tierra en km
-        dlat = radians(float(lat2) - float(lat1))
-        dlon = radians(float(lon2) - float(lon1))
-
-        a = (sin(dlat / 2)**2 +
-             cos(radians(float(lat1))) * cos(radians(float(lat2))) * sin(dlon / 2)**2)
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        return round(R * c, 2)
-    except (ValueError, TypeError):
-        return None
+    distancia = distancia_haversine_km(lat1, lon1, lat2, lon2)
+    return round(distancia, 2) if distancia is not None else None
 
 
 # ==========================================================
@@ -253,7 +244,7 @@ class RepartidorPerfilSerializer(serializers.ModelSerializer):
 
     def get_total_calificaciones(self, obj):
         """Retorna el total de calificaciones recibidas."""
-        return obj.calificaciones.count()
+        return obj.total_calificaciones
 
 
 # ==========================================================
@@ -347,9 +338,53 @@ class RepartidorUbicacionSerializer(serializers.Serializer):
         return data
 
 
+class RepartidorUbicacionPuntoSerializer(RepartidorUbicacionSerializer):
+    """Punto con timestamp, registrado por la app mientras acumula ubicaciones."""
+    timestamp = serializers.DateTimeField()
+
+    def validate_timestamp(self, value):
+        """No acepta puntos del futuro ni demasiado antiguos."""
+        ahora = timezone.now()
+
+        if value > ahora + timedelta(minutes=1):
+            raise serializers.ValidationError("El timestamp no puede estar en el futuro.")
+
+        if value < ahora - timedelta(hours=24):
+            raise serializers.ValidationError("El timestamp tiene más de 24 horas.")
+
+        return value
+
+
+class RepartidorUbicacionLoteSerializer(serializers.Serializer):
+    """Lote de ubicaciones enviado por la app (cada 15–30 s o al reconectar)."""
+    puntos = RepartidorUbicacionPuntoSerializer(many=True, allow_empty=False)
+
+    MAX_PUNTOS = 500
+
+    def validate_puntos(self, value):
+        if len(value) > self.MAX_PUNTOS:
+            raise serializers.ValidationError(
+                f"Máximo {self.MAX_PUNTOS} puntos por lote."
+            )
+        return value
+
+
 # ==========================================================
 # ✅ PERFIL PÚBLICO (CLIENTE VE AL REPARTIDOR) - ACTUALIZADO
 # ==========================================================
+class RepartidorPublicoListSerializer(serializers.ListSerializer):
+    """Lee las posiciones en vivo de toda la lista en un solo pipeline de Redis."""
+
+    def to_representation(self, data):
+        repartidores = list(data.all() if hasattr(data, 'all') else data)
+        en_vivo = ubicacion_viva.obtener_varios(repartidor.pk for repartidor in repartidores)
+        self.child._ubicaciones.update({
+            repartidor.pk: repartidor.ubicacion_mas_reciente(en_vivo.get(repartidor.pk))
+            for repartidor in repartidores
+        })
+        return super().to_representation(repartidores)
+
+
 class RepartidorPublicoSerializer(serializers.ModelSerializer):
     nombre = serializers.CharField(source='user.get_full_name', read_only=True)
     foto_perfil = serializers.SerializerMethodField()  # ✅ Cambiado a SerializerMethodField
@@ -366,6 +401,32 @@ class RepartidorPublicoSerializer(serializers.ModelSerializer):
             'latitud', 'longitud', 'ultima_localizacion',
             'tipo_vehiculo_activo', 'placa_vehiculo_activa'
         ]
+        list_serializer_class = RepartidorPublicoListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # {repartidor_id: posición}; con many=True la llena la lista de una vez
+        self._ubicaciones = {}
+
+    def ubicacion(self, obj):
+        """Posición actual del repartidor, leída una sola vez por serializer."""
+        if obj.pk not in self._ubicaciones:
+            self._ubicaciones[obj.pk] = obj.obtener_ubicacion_actual()
+        return self._ubicaciones[obj.pk]
+
+    def to_representation(self, obj):
+        """La posición se toma de la ubicación en vivo (Redis) si es más reciente."""
+        data = super().to_representation(obj)
+
+        ubicacion = self.ubicacion(obj)
+        if ubicacion:
+            data['latitud'] = ubicacion['latitud']
+            data['longitud'] = ubicacion['longitud']
+            data['ultima_localizacion'] = serializers.DateTimeField().to_representation(
+                ubicacion['timestamp']
+            )
+
+        return data
 
     def get_foto_perfil(self, obj):
         """✅ Construye URL completa para foto_perfil"""
@@ -402,10 +463,11 @@ class RepartidorPublicoDistanciaSerializer(RepartidorPublicoSerializer):
         lon_cliente = self.context.get('lon_cliente')
 
         if lat_cliente is not None and lon_cliente is not None:
-            if obj.latitud and obj.longitud:
+            ubicacion = self.ubicacion(obj)
+            if ubicacion:
                 return calcular_distancia(
-                    obj.latitud,
-                    obj.longitud,
+                    ubicacion['latitud'],
+                    ubicacion['longitud'],
                     lat_cliente,
                     lon_cliente
                 )
@@ -413,15 +475,18 @@ class RepartidorPublicoDistanciaSerializer(RepartidorPublicoSerializer):
         return None
 
     def get_tiempo_estimado_minutos(self, obj):
-        """Estima tiempo de llegada en minutos (velocidad promedio 30 km/h)."""
-        distancia = self.get_distancia_cliente(obj)
-
-        if distancia is not None:
-            # Velocidad promedio en ciudad: 30 km/h
-            velocidad_kmh = 30
-            tiempo_horas = distancia / velocidad_kmh
-            tiempo_minutos = int(tiempo_horas * 60)
-            return max(tiempo_minutos, 1)  # Mínimo 1 minuto
+        """Estima tiempo de llegada en minutos (matriz de tiempos aprendida)."""
+        lat_cliente = self.context.get('lat_cliente')
+        lon_cliente = self.context.get('lon_cliente')
+
+        if lat_cliente is not None and lon_cliente is not None:
+            ubicacion = self.ubicacion(obj)
+            if ubicacion:
+                minutos = tiempos_viaje.minutos_viaje(
+                    ubicacion['latitud'], ubicacion['longitud'], lat_cliente, lon_cliente
+                )
+                if minutos is not None:
+                    return max(int(minutos), 1)  # Mínimo 1 minuto
 
         return None
 
@@ -1,5 +1,5 @@
 # repartidores/signals.py
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 import logging
@@ -20,17 +20,31 @@ logger = logging.getLogger('repartidores')
 @receiver(post_save, sender=CalificacionRepartidor)
 def actualizar_calificacion_repartidor(sender, instance, created, **kwargs):
     """
-    Cuando se crea o actualiza una calificación, recalcula
-    automáticamente el promedio del repartidor.
+    Cuando se crea o actualiza una calificación, ajusta los contadores
+    del repartidor (sin volver a promediar todas las calificaciones).
     """
+    anterior = None if created else getattr(instance, '_puntuacion_anterior', None)
+
     if created:
         logger.info(
             f"Nueva calificación para repartidor {instance.repartidor_id}: "
             f"{instance.puntuacion} estrellas"
         )
+    elif anterior is None:
+        # Instancia no cargada desde la BD: no se conoce el valor previo
+        instance.repartidor.recalcular_calificacion_promedio()
+        instance._puntuacion_anterior = instance.puntuacion
+        return
+
+    instance.repartidor.registrar_calificacion(nueva=instance.puntuacion, anterior=anterior)
+    instance._puntuacion_anterior = instance.puntuacion
+
 
-    # Recalcular promedio
-    instance.repartidor.recalcular_calificacion_promedio()
+@receiver(post_delete, sender=CalificacionRepartidor)
+def descontar_calificacion_repartidor(sender, instance, **kwargs):
+    """Al eliminar una calificación, la descuenta de los contadores."""
+    anterior = getattr(instance, '_puntuacion_anterior', instance.puntuacion)
+    Repartidor(pk=instance.repartidor_id).registrar_calificacion(nueva=None, anterior=anterior)
 
 
 # ==========================================================
@@ -0,0 +1,328 @@
+# repartidores/tasks.py
+"""
+Tareas asíncronas con Celery para la aplicación de Repartidores.
+
+Las tareas periódicas se configuran en Django Admin > Periodic Tasks
+(django-celery-beat, DatabaseScheduler).
+"""
+from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+
+logger = logging.getLogger('repartidores.tasks')
+
+
+# ==========================================================
+# 📍 UBICACIÓN EN VIVO (WRITE-BEHIND)
+# ==========================================================
+
+@shared_task(name='repartidores.volcar_ubicaciones')
+def volcar_ubicaciones(tamano_lote=5000, max_lotes=20):
+    """
+    Vuelca a Postgres las ubicaciones acumuladas en Redis.
+    Se ejecuta cada 5 segundos.
+
+    Por cada lote:
+    - Un bulk_create de HistorialUbicacion con todos los puntos
+    - Un bulk_update de Repartidor con el punto más reciente de cada uno
+      (solo si es más nuevo que el guardado)
+
+    Cada lote queda reservado en Redis hasta que se confirma el guardado;
+    al empezar, se reencolan las reservas de workers que murieron.
+
+    La entrada de celery beat (DatabaseScheduler) la crea la migración
+    repartidores 0006_programar_volcado_ubicaciones; equivale a:
+    CELERY_BEAT_SCHEDULE = {
+        'volcar-ubicaciones': {
+            'task': 'repartidores.volcar_ubicaciones',
+            'schedule': 5.0,
+        },
+    }
+    """
+    from . import ubicacion_viva
+
+    total_puntos = 0
+    total_repartidores = 0
+
+    try:
+        ubicacion_viva.recuperar_reservas_vencidas()
+    except Exception as e:
+        logger.error(f"No se pudieron recuperar reservas de ubicaciones en Redis: {e}")
+
+    for _ in range(max_lotes):
+        try:
+            reserva, puntos = ubicacion_viva.extraer_pendientes(tamano_lote)
+        except Exception as e:
+            logger.error(f"No se pudieron leer ubicaciones pendientes de Redis: {e}")
+            break
+
+        if not puntos:
+            break
+
+        try:
+            total_repartidores += _persistir_ubicaciones(puntos)
+        except Exception as e:
+            logger.error(f"Error al volcar {len(puntos)} ubicaciones: {e}", exc_info=True)
+            ubicacion_viva.devolver_pendientes(reserva)
+            break
+
+        # Solo tras el INSERT: si el worker muere antes, la reserva vence y se reintenta
+        ubicacion_viva.confirmar_pendientes(reserva)
+        total_puntos += len(puntos)
+
+        if len(puntos) < tamano_lote:
+            break
+
+    if total_puntos:
+        logger.info(
+            f"Ubicaciones volcadas: {total_puntos} puntos de "
+            f"{total_repartidores} repartidores"
+        )
+
+    return {'puntos': total_puntos, 'repartidores': total_repartidores}
+
+
+def _persistir_ubicaciones(puntos):
+    """Escribe un lote de puntos de Redis en Postgres. Retorna repartidores actualizados."""
+    from .models import Repartidor, HistorialUbicacion
+
+    ultimos = {}
+    historial = []
+
+    for punto in puntos:
+        when = datetime.fromtimestamp(punto['ts'], tz=dt_timezone.utc)
+        rid = punto['r']
+
+        if punto.get('h', 1):
+            historial.append(HistorialUbicacion(
+                repartidor_id=rid,
+                latitud=punto['lat'],
+                longitud=punto['lon'],
+                timestamp=when,
+            ))
+
+        if rid not in ultimos or when > ultimos[rid][2]:
+            ultimos[rid] = (punto['lat'], punto['lon'], when)
+
+    with transaction.atomic():
+        repartidores = list(
+            Repartidor.objects.filter(pk__in=ultimos).only('id', 'ultima_localizacion')
+        )
+
+        # Repartidores eliminados entre el ping y el volcado se ignoran
+        existentes = {repartidor.pk for repartidor in repartidores}
+        HistorialUbicacion.objects.bulk_create(
+            [h for h in historial if h.repartidor_id in existentes],
+            batch_size=1000,
+        )
+
+        ahora = timezone.now()
+        cambiados = []
+
+        for repartidor in repartidores:
+            lat, lon, when = ultimos[repartidor.pk]
+            if repartidor.ultima_localizacion and repartidor.ultima_localizacion >= when:
+                continue
+
+            repartidor.latitud = lat
+            repartidor.longitud = lon
+            repartidor.ultima_localizacion = when
+            repartidor.actualizado_en = ahora
+            cambiados.append(repartidor)
+
+        Repartidor.objects.bulk_update(
+            cambiados,
+            ['latitud', 'longitud', 'ultima_localizacion', 'actualizado_en'],
+            batch_size=500,
+        )
+
+    return len(cambiados)
+
+
+# ==========================================================
+# 🛵 ASIGNACIÓN AUTOMÁTICA
+# ==========================================================
+
+@shared_task(name='repartidores.ofrecer_pedido')
+def ofrecer_pedido(pedido_id, ronda=1):
+    """
+    Ofrece un pedido a los repartidores más cercanos (una ronda).
+
+    Si el pedido sigue sin repartidor, programa la siguiente ronda con
+    un radio mayor, hasta MAX_RONDAS; al agotarlas el pedido queda en pausa
+    (PAUSA_AGOTADO_SEGUNDOS) con sus rechazos guardados. Se dispara desde
+    `pedidos.verificar_pedidos_sin_repartidor` vía `iniciar_asignacion`.
+    """
+    from pedidos.models import Pedido, EstadoPedido
+    from . import asignacion
+
+    pedido = Pedido.objects.filter(
+        pk=pedido_id,
+        estado=EstadoPedido.CONFIRMADO,
+        repartidor__isnull=True,
+    ).first()
+
+    if pedido is None:
+        asignacion.finalizar_asignacion(pedido_id)
+        return {'pedido_id': pedido_id, 'estado': 'asignado_o_cancelado'}
+
+    candidatos = asignacion.ofrecer_en_ronda(pedido, ronda)
+
+    if ronda >= asignacion.MAX_RONDAS:
+        logger.warning(f"Pedido #{pedido_id}: rondas de asignación agotadas")
+        asignacion.finalizar_asignacion(pedido_id, agotado=True)
+        return {'pedido_id': pedido_id, 'estado': 'agotado', 'ofertados': len(candidatos)}
+
+    ofrecer_pedido.apply_async(
+        args=[pedido_id, ronda + 1],
+        countdown=asignacion.SEGUNDOS_ENTRE_RONDAS,
+    )
+
+    return {'pedido_id': pedido_id, 'ronda': ronda, 'ofertados': len(candidatos)}
+
+
+@shared_task(name='repartidores.asignar_pedidos_lote')
+def asignar_pedidos_lote():
+    """
+    Asignación global de todos los pedidos pendientes a los repartidores
+    disponibles (matriz de costos + húngaro). Se ejecuta cada 20 segundos.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'asignar-pedidos-lote': {
+            'task': 'repartidores.asignar_pedidos_lote',
+            'schedule': 20.0,
+        },
+    }
+    """
+    from .asignacion_lote import ejecutar_pasada
+
+    resumen = ejecutar_pasada()
+    if resumen is None:
+        logger.info("Asignación por lote omitida: otra pasada en curso")
+        return {'omitida': True}
+
+    if resumen['asignados']:
+        logger.info(
+            f"Asignación por lote: {resumen['asignados']} ofertas "
+            f"({resumen['pedidos']} pedidos, {resumen['repartidores']} repartidores, "
+            f"solver {resumen['solver']})"
+        )
+
+    return resumen
+
+
+# ==========================================================
+# 🗺️ TRAYECTOS COMPRIMIDOS
+# ==========================================================
+
+@shared_task(name='repartidores.comprimir_trayectos')
+def comprimir_trayectos(horas_atras=48):
+    """
+    Comprime con Douglas-Peucker los trayectos de las entregas completadas
+    y de cada hora completa de las últimas `horas_atras` horas.
+    Se ejecuta cada hora.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'comprimir-trayectos': {
+            'task': 'repartidores.comprimir_trayectos',
+            'schedule': crontab(minute=5),
+        },
+    }
+    """
+    from .trayectos import comprimir_entregas, comprimir_horas
+
+    ahora = timezone.now()
+    desde = ahora - timedelta(hours=horas_atras)
+
+    entregas = comprimir_entregas(desde)
+    horas = comprimir_horas(desde, ahora)
+
+    logger.info(f"Trayectos comprimidos: {entregas} entregas, {horas} horas")
+    return {'entregas': entregas, 'horas': horas}
+
+
+@shared_task(name='repartidores.purgar_historial_ubicaciones')
+def purgar_historial_ubicaciones():
+    """
+    Elimina los puntos crudos de HistorialUbicacion más viejos que
+    HISTORIAL_UBICACION_RETENCION_DIAS (ya comprimidos en trayectos),
+    eliminando particiones semanales completas.
+    Se ejecuta diariamente a las 4 AM.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'purgar-historial-ubicaciones': {
+            'task': 'repartidores.purgar_historial_ubicaciones',
+            'schedule': crontab(hour=4, minute=0),
+        },
+    }
+    """
+    from .trayectos import purgar_historial
+
+    resultado = purgar_historial()
+    logger.info(
+        f"Historial de ubicaciones purgado: {resultado['particiones']} particiones, "
+        f"{resultado['puntos'] or 0} puntos sueltos"
+    )
+    return resultado
+
+
+@shared_task(name='repartidores.mantener_particiones_historial')
+def mantener_particiones_historial(semanas_adelante=12):
+    """
+    Crea por adelantado las particiones semanales de HistorialUbicacion.
+    Se ejecuta diariamente a las 3:30 AM.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'mantener-particiones-historial': {
+            'task': 'repartidores.mantener_particiones_historial',
+            'schedule': crontab(hour=3, minute=30),
+        },
+    }
+    """
+    from . import particiones
+
+    if not particiones.habilitado():
+        return {'creadas': []}
+
+    creadas = particiones.crear_particiones(semanas_adelante=semanas_adelante)
+    particiones.crear_particion_default()
+    return {'creadas': creadas}
+
+
+# ==========================================================
+# 👻 REPARTIDORES SIN SEÑAL
+# ==========================================================
+
+@shared_task(name='repartidores.desconectar_repartidores_inactivos')
+def desconectar_repartidores_inactivos(minutos=10):
+    """
+    Pasa a FUERA_SERVICIO a los repartidores DISPONIBLE que no envían
+    ubicación hace más de `minutos`, para que la asignación y el mapa
+    no los sigan considerando. Se ejecuta cada minuto.
+
+    Configurar en celery beat:
+    CELERY_BEAT_SCHEDULE = {
+        'desconectar-repartidores-inactivos': {
+            'task': 'repartidores.desconectar_repartidores_inactivos',
+            'schedule': 60.0,
+        },
+    }
+    """
+    from .models import Repartidor
+
+    limite = timezone.now() - timedelta(minutes=minutos)
+    desconectados = Repartidor.desconectar_inactivos(limite)
+
+    if desconectados:
+        logger.info(
+            f"{len(desconectados)} repartidores pasados a fuera de servicio "
+            f"por no enviar ubicación en {minutos} minutos"
+        )
+
+    return {'desconectados': len(desconectados)}
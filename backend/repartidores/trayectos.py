@@ -0,0 +1,211 @@
+# repartidores/trayectos.py
+"""
+Compresión de trayectos de repartidores.
+
+Los puntos crudos de HistorialUbicacion se simplifican con Douglas-Peucker
+y se guardan como polyline codificada (TrayectoComprimido):
+- Uno por cada entrega completada (desde la creación hasta la entrega)
+- Uno por repartidor y hora, para todo lo demás
+
+Pasada la retención, los puntos crudos se eliminan (en Postgres, por
+particiones semanales completas) y el historial se sirve solo desde los
+trayectos comprimidos.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from utils.geo import codificar_deltas, codificar_polyline, simplificar_trayecto
+
+logger = logging.getLogger('repartidores')
+
+TAMANO_LOTE = 500
+
+
+def tolerancia_metros():
+    return getattr(settings, 'TRAYECTO_TOLERANCIA_METROS', 10.0)
+
+
+def comprimir_puntos(puntos, tolerancia_m=None):
+    """
+    Simplifica y codifica una lista de puntos (lat, lon, timestamp) ordenada.
+
+    Returns:
+        dict | None: Campos de TrayectoComprimido (sin repartidor/pedido)
+    """
+    if not puntos:
+        return None
+
+    tolerancia_m = tolerancia_metros() if tolerancia_m is None else tolerancia_m
+    lats, lons, tiempos = zip(*puntos)
+    conservados = simplificar_trayecto(lats, lons, tolerancia_m)
+
+    inicio = tiempos[0]
+    return {
+        'inicio': inicio,
+        'fin': tiempos[-1],
+        'polyline': codificar_polyline([lats[i] for i in conservados], [lons[i] for i in conservados]),
+        'tiempos': codificar_deltas(
+            [round((tiempos[i] - inicio).total_seconds()) for i in conservados]
+        ),
+        'puntos_originales': len(puntos),
+        'puntos_comprimidos': len(conservados),
+        'tolerancia_m': tolerancia_m,
+    }
+
+
+def _puntos(repartidor_id, desde, hasta, incluir_hasta=True):
+    from .models import HistorialUbicacion
+
+    filtro = {'timestamp__lte': hasta} if incluir_hasta else {'timestamp__lt': hasta}
+    return list(
+        HistorialUbicacion.objects.filter(
+            repartidor_id=repartidor_id, timestamp__gte=desde, **filtro
+        ).order_by('timestamp').values_list('latitud', 'longitud', 'timestamp')
+    )
+
+
+def trayecto_en_vivo(repartidor_id, desde, hasta, pedido_id=None, tolerancia_m=None):
+    """Trayecto comprimido al vuelo desde los puntos crudos (no se guarda)."""
+    datos = comprimir_puntos(_puntos(repartidor_id, desde, hasta), tolerancia_m)
+    if datos is None:
+        return None
+
+    return {
+        'id': None,
+        'pedido_id': pedido_id,
+        'inicio': datos['inicio'].isoformat(),
+        'fin': datos['fin'].isoformat(),
+        'polyline': datos['polyline'],
+        'tiempos': datos['tiempos'],
+        'puntos': datos['puntos_comprimidos'],
+        'puntos_originales': datos['puntos_originales'],
+    }
+
+
+# ==========================================================
+# COMPRESIÓN POR ENTREGA
+# ==========================================================
+def comprimir_entregas(desde, tolerancia_m=None):
+    """
+    Comprime el trayecto de cada pedido entregado desde `desde` que aún
+    no tenga uno. Retorna la cantidad de trayectos creados.
+    """
+    from pedidos.models import Pedido, EstadoPedido
+    from .models import TrayectoComprimido
+
+    pedidos = Pedido.objects.filter(
+        estado=EstadoPedido.ENTREGADO,
+        repartidor__isnull=False,
+        fecha_entregado__gte=desde,
+        trayectos__isnull=True,
+    ).values_list('id', 'repartidor_id', 'creado_en', 'fecha_entregado')
+
+    nuevos = []
+    for pedido_id, repartidor_id, creado_en, entregado in pedidos.iterator():
+        datos = comprimir_puntos(_puntos(repartidor_id, creado_en, entregado), tolerancia_m)
+        if datos:
+            nuevos.append(TrayectoComprimido(repartidor_id=repartidor_id, pedido_id=pedido_id, **datos))
+
+    TrayectoComprimido.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE, ignore_conflicts=True)
+    return len(nuevos)
+
+
+# ==========================================================
+# COMPRESIÓN POR HORA
+# ==========================================================
+def comprimir_horas(desde, hasta, tolerancia_m=None):
+    """
+    Crea los trayectos horarios que falten entre `desde` y `hasta`
+    (solo horas completas). Retorna la cantidad creada.
+    """
+    from .models import HistorialUbicacion, TrayectoComprimido
+
+    hasta = hasta.replace(minute=0, second=0, microsecond=0)
+
+    horas = set(
+        HistorialUbicacion.objects.filter(timestamp__gte=desde, timestamp__lt=hasta)
+        .annotate(hora=TruncHour('timestamp'))
+        .values_list('repartidor_id', 'hora')
+        .distinct()
+    )
+    if not horas:
+        return 0
+
+    existentes = set(
+        TrayectoComprimido.objects.filter(
+            pedido__isnull=True, inicio__gte=desde - timedelta(hours=1), inicio__lt=hasta,
+        ).annotate(hora=TruncHour('inicio')).values_list('repartidor_id', 'hora')
+    )
+
+    creados = 0
+    nuevos = []
+    for repartidor_id, hora in sorted(horas - existentes):
+        datos = comprimir_puntos(
+            _puntos(repartidor_id, hora, hora + timedelta(hours=1), incluir_hasta=False),
+            tolerancia_m,
+        )
+        if datos:
+            nuevos.append(TrayectoComprimido(repartidor_id=repartidor_id, **datos))
+
+        if len(nuevos) >= TAMANO_LOTE:
+            TrayectoComprimido.objects.bulk_create(nuevos, ignore_conflicts=True)
+            creados += len(nuevos)
+            nuevos = []
+
+    TrayectoComprimido.objects.bulk_create(nuevos, ignore_conflicts=True)
+    return creados + len(nuevos)
+
+
+# ==========================================================
+# RETENCIÓN
+# ==========================================================
+def purgar_historial(retencion_dias=None):
+    """
+    Elimina los puntos crudos más viejos que la retención, comprimiendo
+    antes cualquier hora que todavía no tenga trayecto.
+
+    Con la tabla particionada se eliminan semanas completas (DROP de la
+    partición); si no, se borra por días.
+
+    Returns:
+        dict: particiones y puntos eliminados
+    """
+    from .models import HistorialUbicacion
+    from . import particiones
+
+    if retencion_dias is None:
+        retencion_dias = getattr(settings, 'HISTORIAL_UBICACION_RETENCION_DIAS', 7)
+
+    limite = (timezone.now() - timedelta(days=retencion_dias)).replace(
+        minute=0, second=0, microsecond=0
+    )
+
+    mas_antiguo = HistorialUbicacion.objects.filter(
+        timestamp__lt=limite
+    ).aggregate(minimo=Min('timestamp'))['minimo']
+    if mas_antiguo is None:
+        return {'particiones': 0, 'puntos': 0}
+
+    comprimir_horas(mas_antiguo, limite)
+
+    if particiones.habilitado():
+        eliminadas = particiones.eliminar_particiones_antiguas(limite)
+        return {'particiones': len(eliminadas), 'puntos': None}
+
+    # Borrado por días para no generar una sola transacción enorme
+    eliminados = 0
+    desde = mas_antiguo
+    while desde < limite:
+        hasta = min(desde + timedelta(days=1), limite)
+        borrados, _ = HistorialUbicacion.objects.filter(
+            timestamp__gte=desde, timestamp__lt=hasta
+        ).delete()
+        eliminados += borrados
+        desde = hasta
+
+    return {'particiones': 0, 'puntos': eliminados}
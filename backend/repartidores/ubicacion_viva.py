@@ -0,0 +1,284 @@
+# repartidores/ubicacion_viva.py
+"""
+Ubicación en vivo de repartidores (Redis, write-behind).
+
+Cada ping de ubicación se escribe primero aquí:
+- GEO set con la posición actual de cada repartidor (búsquedas por radio)
+- Hash por repartidor con latitud, longitud y timestamp
+- Lista de pendientes que la tarea `repartidores.volcar_ubicaciones`
+  vuelca por lotes a Postgres (Repartidor + HistorialUbicacion)
+
+Cada lote del volcado se mueve de forma atómica a una lista de reserva
+propia (`...:procesando:<id>`, registrada con su hora en un sorted set) y
+solo se borra al confirmar el INSERT. Si el worker muere a mitad de lote,
+`recuperar_reservas_vencidas` devuelve esos puntos a la cola: se pueden
+volcar dos veces, pero no se pierden.
+
+Si Redis no está disponible las funciones devuelven False/None y el
+llamador escribe directamente en la base de datos.
+"""
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+logger = logging.getLogger('repartidores')
+
+PREFIJO = 'deliber:repartidores'
+GEO_KEY = f'{PREFIJO}:geo'
+PENDIENTES_KEY = f'{PREFIJO}:ubicaciones_pendientes'
+PROCESANDO_PREFIJO = f'{PREFIJO}:ubicaciones_procesando'
+RESERVAS_KEY = f'{PREFIJO}:ubicaciones_reservas'
+
+# Una reserva más vieja que esto es de un worker muerto (supera el
+# time limit duro de Celery) y sus puntos vuelven a la cola
+SEGUNDOS_RESERVA = 60 * 15
+
+# Posiciones sin actualizar por más de este tiempo expiran solas
+TTL_POSICION_SEGUNDOS = 60 * 60 * 6
+
+# Escribe la posición solo si es más nueva que la guardada y, si se pide,
+# encola el punto para el volcado a Postgres. Todo de forma atómica.
+_SCRIPT_REGISTRAR = """
+local ts = tonumber(ARGV[3])
+local actual = tonumber(redis.call('HGET', KEYS[1], 'ts') or '0')
+if ts >= actual then
+    redis.call('HSET', KEYS[1], 'lat', ARGV[1], 'lon', ARGV[2], 'ts', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    redis.call('GEOADD', KEYS[2], ARGV[2], ARGV[1], ARGV[6])
+end
+if ARGV[4] ~= '' then
+    redis.call('RPUSH', KEYS[3], ARGV[4])
+end
+return 1
+"""
+
+# Mueve hasta ARGV[1] puntos de la cola a la lista de reserva y la registra
+_SCRIPT_RESERVAR = """
+local puntos = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #puntos == 0 then
+    return puntos
+end
+redis.call('LTRIM', KEYS[1], #puntos, -1)
+for i = 1, #puntos, 1000 do
+    redis.call('RPUSH', KEYS[2], unpack(puntos, i, math.min(i + 999, #puntos)))
+end
+redis.call('ZADD', KEYS[3], ARGV[2], KEYS[2])
+return puntos
+"""
+
+# Devuelve los puntos de una reserva al inicio de la cola, en su orden
+_SCRIPT_DEVOLVER = """
+local puntos = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = #puntos, 1, -1 do
+    redis.call('LPUSH', KEYS[2], puntos[i])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], KEYS[1])
+return #puntos
+"""
+
+_script = None
+_scripts = {}
+
+
+def _posicion_key(repartidor_id):
+    return f'{PREFIJO}:posicion:{repartidor_id}'
+
+
+def _conexion():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _script_registrar(conexion):
+    global _script
+    if _script is None:
+        _script = conexion.register_script(_SCRIPT_REGISTRAR)
+    return _script
+
+
+def _script_cola(conexion, fuente):
+    if fuente not in _scripts:
+        _scripts[fuente] = conexion.register_script(fuente)
+    return _scripts[fuente]
+
+
+def habilitado():
+    """El buffer se puede desactivar con UBICACION_WRITE_BEHIND=False."""
+    return getattr(settings, 'UBICACION_WRITE_BEHIND', True)
+
+
+# ==========================================================
+# ESCRITURA
+# ==========================================================
+def registrar(repartidor_id, lat, lon, when, encolar=True, guardar_historial=True):
+    """
+    Registra la posición actual del repartidor en Redis.
+
+    Args:
+        encolar (bool): Si True, el punto queda pendiente de volcar a Postgres
+        guardar_historial (bool): Si el volcado debe crear HistorialUbicacion
+
+    Returns:
+        bool: True si se registró; False si Redis no está disponible
+    """
+    if not habilitado():
+        return False
+
+    payload = ''
+    if encolar:
+        payload = json.dumps({
+            'r': repartidor_id,
+            'lat': float(lat),
+            'lon': float(lon),
+            'ts': when.timestamp(),
+            'h': 1 if guardar_historial else 0,
+        })
+
+    try:
+        conexion = _conexion()
+        _script_registrar(conexion)(
+            keys=[_posicion_key(repartidor_id), GEO_KEY, PENDIENTES_KEY],
+            args=[float(lat), float(lon), when.timestamp(), payload,
+                  TTL_POSICION_SEGUNDOS, repartidor_id],
+            client=conexion,
+        )
+        return True
+    except Exception as e:
+        logger.warning(f"Redis no disponible para ubicación en vivo: {e}")
+        return False
+
+
+def eliminar(repartidor_ids):
+    """Quita repartidores del índice en vivo (p. ej. al quedar fuera de servicio)."""
+    repartidor_ids = list(repartidor_ids)
+    if not repartidor_ids or not habilitado():
+        return
+
+    try:
+        conexion = _conexion()
+        pipe = conexion.pipeline(transaction=False)
+        pipe.zrem(GEO_KEY, *repartidor_ids)
+        pipe.delete(*[_posicion_key(rid) for rid in repartidor_ids])
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"No se pudo limpiar la ubicación en vivo: {e}")
+
+
+def extraer_pendientes(limite=5000):
+    """
+    Reserva hasta `limite` puntos pendientes de volcar: pasan de la cola a
+    una lista de reserva (atómico). Hay que cerrar la reserva con
+    `confirmar_pendientes` tras guardarlos o `devolver_pendientes` si falla.
+
+    Returns:
+        tuple: (reserva, list[dict] puntos con claves r, lat, lon, ts, h)
+    """
+    conexion = _conexion()
+    reserva = f'{PROCESANDO_PREFIJO}:{uuid.uuid4().hex}'
+    crudos = _script_cola(conexion, _SCRIPT_RESERVAR)(
+        keys=[PENDIENTES_KEY, reserva, RESERVAS_KEY],
+        args=[limite, time.time()],
+        client=conexion,
+    )
+    return reserva, [json.loads(crudo) for crudo in crudos]
+
+
+def confirmar_pendientes(reserva):
+    """Borra una reserva cuyos puntos ya están en Postgres."""
+    pipe = _conexion().pipeline(transaction=True)
+    pipe.delete(reserva)
+    pipe.zrem(RESERVAS_KEY, reserva)
+    pipe.execute()
+
+
+def devolver_pendientes(reserva):
+    """
+    Reencola los puntos de una reserva cuyo volcado falló (se reintentan
+    en la siguiente pasada).
+
+    Returns:
+        int: Puntos devueltos a la cola
+    """
+    conexion = _conexion()
+    return _script_cola(conexion, _SCRIPT_DEVOLVER)(
+        keys=[reserva, PENDIENTES_KEY, RESERVAS_KEY],
+        client=conexion,
+    )
+
+
+def recuperar_reservas_vencidas(segundos=SEGUNDOS_RESERVA):
+    """
+    Devuelve a la cola los puntos de reservas de más de `segundos`
+    (workers que murieron sin confirmar ni devolver).
+
+    Returns:
+        int: Puntos recuperados
+    """
+    conexion = _conexion()
+    vencidas = conexion.zrangebyscore(RESERVAS_KEY, '-inf', time.time() - segundos)
+
+    recuperados = 0
+    for reserva in vencidas:
+        reserva = reserva.decode() if isinstance(reserva, bytes) else reserva
+        recuperados += devolver_pendientes(reserva)
+
+    if recuperados:
+        logger.warning(f"{recuperados} ubicaciones recuperadas de {len(vencidas)} reservas vencidas")
+    return recuperados
+
+
+# ==========================================================
+# LECTURA
+# ==========================================================
+def _decodificar(datos):
+    if not datos:
+        return None
+
+    datos = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in datos.items()
+    }
+    return {
+        'latitud': float(datos['lat']),
+        'longitud': float(datos['lon']),
+        'timestamp': datetime.fromtimestamp(float(datos['ts']), tz=dt_timezone.utc),
+    }
+
+
+def obtener(repartidor_id):
+    """Posición en vivo de un repartidor, o None si no hay (o Redis falla)."""
+    if not habilitado():
+        return None
+
+    try:
+        return _decodificar(_conexion().hgetall(_posicion_key(repartidor_id)))
+    except Exception as e:
+        logger.warning(f"No se pudo leer la ubicación en vivo: {e}")
+        return None
+
+
+def obtener_varios(repartidor_ids):
+    """Posiciones en vivo de varios repartidores: {id: posicion}."""
+    repartidor_ids = list(repartidor_ids)
+    if not repartidor_ids or not habilitado():
+        return {}
+
+    try:
+        pipe = _conexion().pipeline(transaction=False)
+        for rid in repartidor_ids:
+            pipe.hgetall(_posicion_key(rid))
+        resultados = pipe.execute()
+    except Exception as e:
+        logger.warning(f"No se pudo leer la ubicación en vivo: {e}")
+        return {}
+
+    return {
+        rid: posicion
+        for rid, posicion in zip(repartidor_ids, map(_decodificar, resultados))
+        if posicion
+    }
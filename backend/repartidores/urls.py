@@ -46,11 +46,21 @@ urlpatterns = [
         views.actualizar_ubicacion,
         name="actualizar_ubicacion"
     ),
+    path(
+        "ubicacion/lote/",
+        views.actualizar_ubicacion_lote,
+        name="actualizar_ubicacion_lote"
+    ),
     path(
         "ubicacion/historial/",
         views.historial_ubicaciones,
         name="historial_ubicaciones"
     ),
+    path(
+        "ubicacion/trayectos/",
+        views.historial_trayectos,
+        name="historial_trayectos"
+    ),
 
     # ==========================================================
     # VEHÍCULOS
@@ -128,4 +138,9 @@ urlpatterns = [
         views.rechazar_pedido,
         name="rechazar_pedido"
     ),
+    path(
+        "ruta/",
+        views.obtener_mi_ruta,
+        name="mi_ruta"
+    ),
 ]
@@ -2,15 +2,17 @@ from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.apps import apps
 from django.core.exceptions import ValidationError
-from django.db.models import Count, Avg, Q
+from django.db.models import Q
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.throttling import UserRateThrottle
 from rest_framework.pagination import PageNumberPagination
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from decimal import Decimal
-from math import radians, cos, sin, sqrt, atan2
+from datetime import datetime, timedelta
 import logging
 
 from .models import (
@@ -20,12 +22,14 @@ from .models import (
     RepartidorEstadoLog,
     CalificacionRepartidor,
     CalificacionCliente,
+    TrayectoComprimido,
 )
 from .serializers import (
     RepartidorPerfilSerializer,
     RepartidorUpdateSerializer,
     RepartidorEstadoSerializer,
     RepartidorUbicacionSerializer,
+    RepartidorUbicacionLoteSerializer,
     RepartidorPublicoSerializer,
     RepartidorVehiculoSerializer,
     HistorialUbicacionSerializer,
@@ -34,9 +38,16 @@ from .serializers import (
     CalificacionClienteCreateSerializer,
 )
 from .permissions import IsRepartidor
+from .asignacion import registrar_rechazo
+from . import trayectos
+from pedidos import rutas, tiempos_viaje
+from utils.geo import bounding_box, celdas_geohash_cercanas, expresion_distancia_km
 
 logger = logging.getLogger("repartidores")
 
+# Pedidos más cercanos que devuelve el mapa de disponibles
+MAX_PEDIDOS_MAPA = 100
+
 
 # ==========================================================
 # THROTTLING – Limita frecuencia para evitar abusos
@@ -53,6 +64,10 @@ class UbicacionThrottle(UserRateThrottle):
     rate = "300/hour"   # 5 por minuto
 
 
+class UbicacionLoteThrottle(UserRateThrottle):
+    rate = "360/hour"   # 1 cada 10 segundos
+
+
 class VehiculoThrottle(UserRateThrottle):
     rate = "30/hour"    # ~0.5 por minuto
 
@@ -340,20 +355,8 @@ def obtener_estadisticas(request):
     try:
         repartidor = request.user.repartidor
 
-        # Calcular estadísticas de calificaciones
-        calificaciones_stats = repartidor.calificaciones.aggregate(
-            total=Count('id'),
-            promedio=Avg('puntuacion'),
-            cinco_estrellas=Count('id', filter=Q(puntuacion=5)),
-            cuatro_estrellas=Count('id', filter=Q(puntuacion=4)),
-            tres_estrellas=Count('id', filter=Q(puntuacion=3)),
-            dos_estrellas=Count('id', filter=Q(puntuacion=2)),
-            una_estrella=Count('id', filter=Q(puntuacion=1)),
-        )
-
-        # Calcular tasa de aceptación (si existe campo de pedidos rechazados)
-        # Ajustar según tu modelo de pedidos
-        total_calificaciones = calificaciones_stats['total'] or 0
+        # Contadores de calificaciones mantenidos en el propio repartidor
+        total_calificaciones = repartidor.total_calificaciones
         entregas = repartidor.entregas_completadas
 
         estadisticas = {
@@ -361,14 +364,14 @@ def obtener_estadisticas(request):
             "calificacion_promedio": float(repartidor.calificacion_promedio),
             "total_calificaciones": total_calificaciones,
             "desglose_calificaciones": {
-                "5_estrellas": calificaciones_stats['cinco_estrellas'] or 0,
-                "4_estrellas": calificaciones_stats['cuatro_estrellas'] or 0,
-                "3_estrellas": calificaciones_stats['tres_estrellas'] or 0,
-                "2_estrellas": calificaciones_stats['dos_estrellas'] or 0,
-                "1_estrella": calificaciones_stats['una_estrella'] or 0,
+                "5_estrellas": repartidor.calificaciones_5_estrellas,
+                "4_estrellas": repartidor.calificaciones_4_estrellas,
+                "3_estrellas": repartidor.calificaciones_3_estrellas,
+                "2_estrellas": repartidor.calificaciones_2_estrellas,
+                "1_estrella": repartidor.calificaciones_1_estrella,
             },
             "porcentaje_5_estrellas": round(
-                (calificaciones_stats['cinco_estrellas'] or 0) / total_calificaciones * 100, 2
+                repartidor.calificaciones_5_estrellas / total_calificaciones * 100, 2
             ) if total_calificaciones > 0 else 0,
             "estado_actual": repartidor.estado,
             "verificado": repartidor.verificado,
@@ -547,6 +550,63 @@ def actualizar_ubicacion(request):
         )
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated, IsRepartidor])
+@throttle_classes([UbicacionLoteThrottle])
+def actualizar_ubicacion_lote(request):
+    """
+    Registra un lote de ubicaciones con timestamp (acumuladas por la app
+    cada 15–30 s o mientras estuvo sin conexión).
+
+    Body: {"puntos": [{"latitud": -0.18, "longitud": -78.48, "timestamp": "..."}]}
+
+    El historial se inserta en bloque y la ubicación actual se actualiza
+    una sola vez con el punto más reciente.
+    """
+    try:
+        repartidor = request.user.repartidor
+        serializer = RepartidorUbicacionLoteSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        puntos = [
+            (punto["latitud"], punto["longitud"], punto["timestamp"])
+            for punto in serializer.validated_data["puntos"]
+        ]
+
+        with transaction.atomic():
+            registrados = repartidor.registrar_ubicaciones_lote(puntos)
+
+        logger.debug(f"Lote de ubicaciones: {repartidor.user.email} → {registrados} puntos")
+
+        return Response({
+            "mensaje": "Ubicaciones registradas correctamente",
+            "puntos_registrados": registrados,
+            "latitud": repartidor.latitud,
+            "longitud": repartidor.longitud,
+            "timestamp": repartidor.ultima_localizacion
+        }, status=status.HTTP_200_OK)
+
+    except ValidationError as e:
+        logger.warning(f"Validación fallida al registrar lote de ubicaciones: {e}")
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except AttributeError:
+        return Response(
+            {"error": "No tienes perfil de repartidor asociado."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        logger.error(f"Error al registrar lote de ubicaciones: {e}", exc_info=True)
+        return Response(
+            {"error": "Error interno al registrar ubicaciones."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated, IsRepartidor])
 @throttle_classes([UbicacionThrottle])
@@ -594,6 +654,117 @@ def historial_ubicaciones(request):
         )
 
 
+def _parsear_fecha(valor):
+    """
+    Fecha u hora ISO de un query param (sin zona horaria: hora local).
+
+    Raises:
+        ValueError: Si no es una fecha válida
+    """
+    if not valor:
+        return None
+
+    fecha = parse_datetime(valor)
+    if fecha is None:
+        dia = parse_date(valor)
+        if dia is None:
+            raise ValueError(valor)
+        fecha = datetime.combine(dia, datetime.min.time())
+
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsRepartidor])
+@throttle_classes([UbicacionThrottle])
+def historial_trayectos(request):
+    """
+    Historial de ubicaciones comprimido: una polyline por entrega u hora.
+
+    Query params opcionales:
+    - pedido_id: trayecto de una entrega concreta
+    - fecha_inicio / fecha_fin: rango (default: últimas 24 horas)
+
+    Las horas aún no comprimidas se comprimen al vuelo.
+    """
+    try:
+        repartidor = request.user.repartidor
+        tolerancia = trayectos.tolerancia_metros()
+
+        pedido_id = request.query_params.get('pedido_id')
+        if pedido_id:
+            if not pedido_id.isdigit():
+                return Response(
+                    {"error": "pedido_id inválido."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            Pedido = apps.get_model('pedidos', 'Pedido')
+            pedido = get_object_or_404(Pedido, pk=pedido_id, repartidor=repartidor)
+
+            guardado = TrayectoComprimido.objects.filter(pedido=pedido).first()
+            trayecto = guardado.como_dict() if guardado else trayectos.trayecto_en_vivo(
+                repartidor.id, pedido.creado_en, pedido.fecha_entregado or timezone.now(),
+                pedido_id=pedido.id, tolerancia_m=tolerancia,
+            )
+            return Response({
+                'tolerancia_m': tolerancia,
+                'trayectos': [trayecto] if trayecto else [],
+            }, status=status.HTTP_200_OK)
+
+        try:
+            fecha_fin = _parsear_fecha(request.query_params.get('fecha_fin')) or timezone.now()
+            fecha_inicio = (
+                _parsear_fecha(request.query_params.get('fecha_inicio'))
+                or fecha_fin - timedelta(hours=24)
+            )
+        except ValueError:
+            return Response(
+                {"error": "Formato de fecha inválido. Use YYYY-MM-DD o YYYY-MM-DDTHH:MM:SS"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if fecha_inicio > fecha_fin:
+            return Response(
+                {"error": "fecha_inicio debe ser anterior a fecha_fin."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        guardados = list(
+            TrayectoComprimido.objects.filter(
+                repartidor=repartidor,
+                pedido__isnull=True,
+                inicio__lte=fecha_fin,
+                fin__gte=fecha_inicio,
+            ).order_by('inicio')
+        )
+        resultado = [t.como_dict() for t in guardados]
+
+        # Tramo reciente todavía sin comprimir
+        desde_vivo = guardados[-1].fin + timedelta(microseconds=1) if guardados else fecha_inicio
+        reciente = trayectos.trayecto_en_vivo(repartidor.id, desde_vivo, fecha_fin, tolerancia_m=tolerancia)
+        if reciente:
+            resultado.append(reciente)
+
+        return Response({
+            'tolerancia_m': tolerancia,
+            'trayectos': resultado,
+        }, status=status.HTTP_200_OK)
+
+    except AttributeError:
+        return Response(
+            {"error": "No tienes perfil de repartidor asociado."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        logger.error(f"Error al obtener trayectos: {e}", exc_info=True)
+        return Response(
+            {"error": "Error interno al obtener trayectos."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 # ==========================================================
 # VEHÍCULOS
 # ==========================================================
@@ -997,34 +1168,13 @@ def info_repartidor_publico(request, repartidor_id):
 # ==========================================================
 # INSTRUCCIONES: Copiar este código AL FINAL de tu archivo views.py existente
 
-def calcular_distancia_haversine(lat1, lon1, lat2, lon2):
-    """
-    Calcula la distancia en kilómetros entre dos puntos usando Haversine.
-    """
-    if not all([lat1, lon1, lat2, lon2]):
-        return None
-
-    try:
-        R = 6371.0  # Radio de la Tierra en km
-        lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
-
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-
-        a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        return round(R * c, 2)
-    except (ValueError, TypeError):
-        return None
-
-
 @api_view(["GET"])
 @permission_classes([IsAuthenticated, IsRepartidor])
 def obtener_pedidos_disponibles_mapa(request):
     """
     Devuelve pedidos disponibles cercanos al repartidor con sus ubicaciones.
     Incluye distancia calculada desde la ubicación actual del repartidor.
+    Como máximo MAX_PEDIDOS_MAPA, los más cercanos primero.
 
     Query params opcionales:
     - radio: Radio de búsqueda en km (default: 15)
@@ -1065,12 +1215,12 @@ def obtener_pedidos_disponibles_mapa(request):
                     "pedidos": []
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-        # ✅ PRIORIDAD 2: Fallback a ubicación guardada en BD
-        elif repartidor.latitud and repartidor.longitud:
-            latitud_repartidor = float(repartidor.latitud)
-            longitud_repartidor = float(repartidor.longitud)
+        # ✅ PRIORIDAD 2: Fallback a ubicación en vivo (Redis) o guardada en BD
+        elif (ubicacion := repartidor.obtener_ubicacion_actual()):
+            latitud_repartidor = float(ubicacion['latitud'])
+            longitud_repartidor = float(ubicacion['longitud'])
             logger.debug(
-                f"Usando coordenadas de BD: ({latitud_repartidor}, {longitud_repartidor})"
+                f"Usando última ubicación conocida: ({latitud_repartidor}, {longitud_repartidor})"
             )
 
         # ❌ Sin ubicación disponible
@@ -1086,46 +1236,54 @@ def obtener_pedidos_disponibles_mapa(request):
         # Lazy loading del modelo Pedido
         Pedido = apps.get_model('pedidos', 'Pedido')
 
-        # ✅ CORREGIDO: Usar 'proveedor' en lugar de 'restaurante'
-        pedidos_query = Pedido.objects.filter(
-            repartidor__isnull=True,  # Sin repartidor asignado
-            # estado='pendiente',  # Descomenta y ajusta según tu modelo
-        ).select_related('cliente', 'proveedor')
-
-        # Filtrar por distancia y preparar respuesta
-        pedidos_cercanos = []
+        # ✅ Prefiltro espacial: celdas geohash que cubren el radio + bounding box
+        celdas = celdas_geohash_cercanas(latitud_repartidor, longitud_repartidor, radio_km)
+        filtro_celdas = Q()
+        for celda in celdas:
+            filtro_celdas |= Q(geohash_destino__startswith=celda)
 
-        for pedido in pedidos_query:
-            # Asume que el pedido tiene latitud_destino y longitud_destino
-            lat_destino = getattr(pedido, 'latitud_destino', None)
-            lon_destino = getattr(pedido, 'longitud_destino', None)
-
-            if not lat_destino or not lon_destino:
-                continue
+        lat_min, lat_max, lon_min, lon_max = bounding_box(
+            latitud_repartidor, longitud_repartidor, radio_km
+        )
 
-            # Calcular distancia usando las coordenadas del repartidor
-            distancia = calcular_distancia_haversine(
-                latitud_repartidor,
-                longitud_repartidor,
-                lat_destino,
-                lon_destino
+        # ✅ Distancia calculada, filtrada y ordenada en la base de datos
+        pedidos_query = list(Pedido.objects.filter(
+            filtro_celdas,
+            repartidor__isnull=True,  # Sin repartidor asignado
+            latitud_destino__range=(lat_min, lat_max),
+            longitud_destino__range=(lon_min, lon_max),
+        ).annotate(
+            distancia=expresion_distancia_km(
+                'latitud_destino', 'longitud_destino',
+                latitud_repartidor, longitud_repartidor
             )
+        ).filter(
+            distancia__lte=radio_km
+        ).select_related('cliente', 'proveedor').order_by('distancia')[:MAX_PEDIDOS_MAPA])
+
+        # ✅ Tiempos de la matriz aprendida: de la celda del repartidor a cada destino
+        tiempos = tiempos_viaje.minutos_viaje_pares(
+            latitud_repartidor, longitud_repartidor,
+            [p.latitud_destino for p in pedidos_query],
+            [p.longitud_destino for p in pedidos_query],
+            distancias_km=[p.distancia for p in pedidos_query],
+        )
 
-            if distancia and distancia <= radio_km:
-                pedidos_cercanos.append({
-                    'id': pedido.id,
-                    'cliente_nombre': pedido.cliente.get_full_name() if hasattr(pedido, 'cliente') else 'Cliente',
-                    'direccion_entrega': getattr(pedido, 'direccion_entrega', 'Dirección no disponible'),
-                    'latitud': float(lat_destino),
-                    'longitud': float(lon_destino),
-                    'distancia_km': distancia,
-                    'tiempo_estimado_min': max(int(distancia / 0.5), 5),  # ~30km/h
-                    'monto_total': float(getattr(pedido, 'total', 0)),
-                    'creado_en': pedido.creado_en.isoformat() if hasattr(pedido, 'creado_en') else None,
-                })
-
-        # Ordenar por distancia
-        pedidos_cercanos.sort(key=lambda x: x['distancia_km'])
+        pedidos_cercanos = []
+
+        for pedido, tiempo in zip(pedidos_query, tiempos):
+            distancia = round(pedido.distancia, 2)
+            pedidos_cercanos.append({
+                'id': pedido.id,
+                'cliente_nombre': pedido.cliente.get_full_name() if hasattr(pedido, 'cliente') else 'Cliente',
+                'direccion_entrega': getattr(pedido, 'direccion_entrega', 'Dirección no disponible'),
+                'latitud': float(pedido.latitud_destino),
+                'longitud': float(pedido.longitud_destino),
+                'distancia_km': distancia,
+                'tiempo_estimado_min': max(int(tiempo), 5),
+                'monto_total': float(getattr(pedido, 'total', 0)),
+                'creado_en': pedido.creado_en.isoformat() if hasattr(pedido, 'creado_en') else None,
+            })
 
         logger.info(
             f"Repartidor {repartidor.id} consultó mapa: "
@@ -1171,8 +1329,10 @@ def aceptar_pedido(request, pedido_id):
     try:
         repartidor = request.user.repartidor
 
-        # Validar que el repartidor esté disponible
-        if repartidor.estado != 'disponible':
+        # Validar que el repartidor esté disponible (u ocupado, si puede llevar varios)
+        if repartidor.estado != 'disponible' and not (
+            repartidor.estado == 'ocupado' and rutas.acepta_varios()
+        ):
             return Response(
                 {"error": "Debes estar en estado DISPONIBLE para aceptar pedidos."},
                 status=status.HTTP_400_BAD_REQUEST
@@ -1184,22 +1344,15 @@ def aceptar_pedido(request, pedido_id):
         # Buscar el pedido
         pedido = get_object_or_404(Pedido, pk=pedido_id)
 
-        # Validar que el pedido esté disponible
-        if pedido.repartidor is not None:
+        # Aceptación con UPDATE condicional: si otro repartidor ganó, ValidationError
+        try:
+            pedido.aceptar_por_repartidor(repartidor)
+        except ValidationError as e:
             return Response(
-                {"error": "Este pedido ya fue asignado a otro repartidor."},
+                {"error": e.messages[0]},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Asignar pedido al repartidor
-        with transaction.atomic():
-            pedido.repartidor = repartidor
-            # pedido.estado = 'aceptado'  # Descomenta y ajusta según tu modelo
-            pedido.save()
-
-            # Cambiar estado del repartidor a ocupado
-            repartidor.marcar_ocupado()
-
         logger.info(f"Repartidor {repartidor.id} aceptó pedido {pedido_id}")
 
         return Response({
@@ -1252,7 +1405,8 @@ def rechazar_pedido(request, pedido_id):
 
         logger.info(f"Repartidor {repartidor.id} rechazó pedido {pedido_id}")
 
-        # Aquí podrías registrar el rechazo en una tabla de auditoría si existe
+        # No volver a ofrecerle este pedido en la asignación automática
+        registrar_rechazo(pedido.id, repartidor.id)
 
         return Response({
             "mensaje": "Pedido rechazado",
@@ -1276,3 +1430,71 @@ def rechazar_pedido(request, pedido_id):
             {"error": "Error interno al rechazar pedido."},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsRepartidor])
+def obtener_mi_ruta(request):
+    """
+    Orden de paradas (recoger / entregar) de los pedidos activos del
+    repartidor desde su ubicación actual, con la llegada estimada a cada
+    parada y a la entrega de cada pedido (ver pedidos/rutas.py).
+
+    Query params opcionales:
+    - latitud, longitud: Ubicación actual (prioridad sobre la guardada)
+    """
+    try:
+        repartidor = request.user.repartidor
+
+        lat_param = request.query_params.get('latitud')
+        lon_param = request.query_params.get('longitud')
+
+        if lat_param and lon_param:
+            try:
+                latitud, longitud = float(lat_param), float(lon_param)
+            except ValueError:
+                return Response(
+                    {"error": "Coordenadas inválidas en los parámetros."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        elif (ubicacion := repartidor.obtener_ubicacion_actual()):
+            latitud, longitud = float(ubicacion['latitud']), float(ubicacion['longitud'])
+        else:
+            return Response(
+                {"error": "Debes activar tu ubicación para calcular la ruta."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        pedidos = list(rutas.pedidos_activos(repartidor.id).only(
+            'id', 'estado', 'latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino',
+        ).select_related(None))
+
+        ruta = rutas.secuenciar(latitud, longitud, pedidos)
+        ahora = timezone.now()
+
+        return Response({
+            'repartidor_ubicacion': {'latitud': latitud, 'longitud': longitud},
+            'paradas': ruta['paradas'],
+            'distancia_total_km': ruta['distancia_total_km'],
+            'minutos_total': ruta['minutos_total'],
+            'pedidos': [
+                {
+                    'pedido_id': pedido_id,
+                    'eta_minutos': minutos,
+                    'eta': (ahora + timedelta(minutes=minutos)).isoformat(),
+                }
+                for pedido_id, minutos in ruta['eta_minutos'].items()
+            ],
+        }, status=status.HTTP_200_OK)
+
+    except AttributeError:
+        return Response(
+            {"error": "No tienes perfil de repartidor asociado."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        logger.error(f"Error al calcular la ruta: {e}", exc_info=True)
+        return Response(
+            {"error": "Error interno al calcular la ruta."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -21,14 +21,14 @@ class PedidoReporteFilter(django_filters.FilterSet):
     # FILTROS DE FECHA
     # ============================================
     fecha_inicio = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__gte',
+        field_name='dia_creado',
+        lookup_expr='gte',
         label='Fecha inicio'
     )
 
     fecha_fin = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__lte',
+        field_name='dia_creado',
+        lookup_expr='lte',
         label='Fecha fin'
     )
 
@@ -170,26 +170,26 @@ class PedidoReporteFilter(django_filters.FilterSet):
         """
         Filtra por períodos predefinidos
         """
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
 
         if value == 'hoy':
-            return queryset.filter(creado_en__date=hoy)
+            return queryset.filter(dia_creado=hoy)
 
         elif value == 'ayer':
             ayer = hoy - timedelta(days=1)
-            return queryset.filter(creado_en__date=ayer)
+            return queryset.filter(dia_creado=ayer)
 
         elif value == 'ultima_semana':
             hace_semana = hoy - timedelta(days=7)
-            return queryset.filter(creado_en__date__gte=hace_semana)
+            return queryset.filter(dia_creado__gte=hace_semana)
 
         elif value == 'ultimo_mes':
             hace_mes = hoy - timedelta(days=30)
-            return queryset.filter(creado_en__date__gte=hace_mes)
+            return queryset.filter(dia_creado__gte=hace_mes)
 
         elif value == 'este_mes':
             primer_dia_mes = hoy.replace(day=1)
-            return queryset.filter(creado_en__date__gte=primer_dia_mes)
+            return queryset.filter(dia_creado__gte=primer_dia_mes)
 
         return queryset
 
@@ -258,14 +258,14 @@ class PedidoProveedorFilter(django_filters.FilterSet):
     Filtro simplificado para proveedores (solo ven sus pedidos)
     """
     fecha_inicio = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__gte',
+        field_name='dia_creado',
+        lookup_expr='gte',
         label='Fecha inicio'
     )
 
     fecha_fin = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__lte',
+        field_name='dia_creado',
+        lookup_expr='lte',
         label='Fecha fin'
     )
 
@@ -303,14 +303,14 @@ class PedidoRepartidorFilter(django_filters.FilterSet):
     Filtro simplificado para repartidores (solo ven sus entregas)
     """
     fecha_inicio = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__gte',
+        field_name='dia_creado',
+        lookup_expr='gte',
         label='Fecha inicio'
     )
 
     fecha_fin = django_filters.DateFilter(
-        field_name='creado_en',
-        lookup_expr='date__lte',
+        field_name='dia_creado',
+        lookup_expr='lte',
         label='Fecha fin'
     )
 
@@ -44,7 +44,6 @@ class PedidoReporteSerializer(serializers.ModelSerializer):
 
     # Propiedades calculadas
     tiempo_transcurrido = serializers.CharField(read_only=True)
-    distancia_estimada = serializers.FloatField(read_only=True, allow_null=True)
     tiempo_entrega_total = serializers.SerializerMethodField()
 
     # Porcentajes de comisión
@@ -8,13 +8,15 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Count, Avg, Q, F
+from django.db.models import Sum, Max, Q, F
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import timedelta, datetime
 from django.http import HttpResponse
 import logging
 
-from pedidos.models import Pedido, EstadoPedido, TipoPedido
+from pedidos.models import Pedido, EstadoPedido, TipoPedido, ResumenPedidoHora
+from pedidos.resumen import inicio_dia
 from .serializers import (
     PedidoReporteSerializer,
     PedidoReporteResumidoSerializer,
@@ -85,57 +87,44 @@ class ReporteAdminViewSet(viewsets.ReadOnlyModelViewSet):
 
         Estadísticas globales del sistema
         """
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
         primer_dia_mes = hoy.replace(day=1)
 
-        # Totales generales
-        total_pedidos = Pedido.objects.count()
-        pedidos_hoy = Pedido.objects.filter(creado_en__date=hoy).count()
-        pedidos_mes = Pedido.objects.filter(creado_en__date__gte=primer_dia_mes).count()
-
-        # Por estado
-        pedidos_confirmados = Pedido.objects.filter(estado=EstadoPedido.CONFIRMADO).count()
-        pedidos_en_preparacion = Pedido.objects.filter(estado=EstadoPedido.EN_PREPARACION).count()
-        pedidos_en_ruta = Pedido.objects.filter(estado=EstadoPedido.EN_RUTA).count()
-        pedidos_entregados = Pedido.objects.filter(estado=EstadoPedido.ENTREGADO).count()
-        pedidos_cancelados = Pedido.objects.filter(estado=EstadoPedido.CANCELADO).count()
-
-        # Por tipo
-        pedidos_proveedor = Pedido.objects.filter(tipo=TipoPedido.PROVEEDOR).count()
-        pedidos_directos = Pedido.objects.filter(tipo=TipoPedido.DIRECTO).count()
-
-        # Financiero - Totales
-        ingresos_data = Pedido.objects.filter(estado=EstadoPedido.ENTREGADO).aggregate(
-            total=Sum('total'),
-            ganancia=Sum('ganancia_app')
+        # Una sola lectura de los acumulados horarios
+        entregado = Q(estado=EstadoPedido.ENTREGADO)
+        del_dia = Q(hora__gte=inicio_dia(hoy))
+        del_mes = Q(hora__gte=inicio_dia(primer_dia_mes))
+
+        resumen = ResumenPedidoHora.objects.aggregate(
+            total_pedidos=Sum('pedidos'),
+            pedidos_hoy=Sum('pedidos', filter=del_dia),
+            pedidos_mes=Sum('pedidos', filter=del_mes),
+            pedidos_confirmados=Sum('pedidos', filter=Q(estado=EstadoPedido.CONFIRMADO)),
+            pedidos_en_preparacion=Sum('pedidos', filter=Q(estado=EstadoPedido.EN_PREPARACION)),
+            pedidos_en_ruta=Sum('pedidos', filter=Q(estado=EstadoPedido.EN_RUTA)),
+            pedidos_entregados=Sum('pedidos', filter=entregado),
+            pedidos_cancelados=Sum('pedidos', filter=Q(estado=EstadoPedido.CANCELADO)),
+            pedidos_proveedor=Sum('pedidos', filter=Q(tipo=TipoPedido.PROVEEDOR)),
+            pedidos_directos=Sum('pedidos', filter=Q(tipo=TipoPedido.DIRECTO)),
+            ingresos=Sum('total', filter=entregado),
+            ganancia=Sum('ganancia_app', filter=entregado),
+            ingresos_hoy=Sum('total', filter=entregado & del_dia),
+            ganancia_hoy=Sum('ganancia_app', filter=entregado & del_dia),
+            ingresos_mes=Sum('total', filter=entregado & del_mes),
+            ganancia_mes=Sum('ganancia_app', filter=entregado & del_mes),
+            comisiones_repartidor=Sum('comision_repartidor', filter=entregado),
         )
+        resumen = {clave: valor or 0 for clave, valor in resumen.items()}
 
-        # Financiero - Hoy
-        ingresos_hoy_data = Pedido.objects.filter(
-            estado=EstadoPedido.ENTREGADO,
-            creado_en__date=hoy
-        ).aggregate(
-            total=Sum('total'),
-            ganancia=Sum('ganancia_app')
-        )
-
-        # Financiero - Mes
-        ingresos_mes_data = Pedido.objects.filter(
-            estado=EstadoPedido.ENTREGADO,
-            creado_en__date__gte=primer_dia_mes
-        ).aggregate(
-            total=Sum('total'),
-            ganancia=Sum('ganancia_app')
-        )
+        total_pedidos = resumen['total_pedidos']
+        pedidos_entregados = resumen['pedidos_entregados']
+        pedidos_cancelados = resumen['pedidos_cancelados']
 
         # Promedios
-        ticket_promedio = ingresos_data['total'] / pedidos_entregados if pedidos_entregados > 0 else 0
-
-        comision_promedio = Pedido.objects.filter(
-            estado=EstadoPedido.ENTREGADO
-        ).aggregate(
-            promedio=Avg('comision_repartidor')
-        )['promedio'] or 0
+        ticket_promedio = resumen['ingresos'] / pedidos_entregados if pedidos_entregados > 0 else 0
+        comision_promedio = (
+            resumen['comisiones_repartidor'] / pedidos_entregados if pedidos_entregados > 0 else 0
+        )
 
         # Tasas
         tasa_entrega = (pedidos_entregados / total_pedidos * 100) if total_pedidos > 0 else 0
@@ -143,21 +132,21 @@ class ReporteAdminViewSet(viewsets.ReadOnlyModelViewSet):
 
         data = {
             'total_pedidos': total_pedidos,
-            'pedidos_hoy': pedidos_hoy,
-            'pedidos_mes_actual': pedidos_mes,
-            'pedidos_confirmados': pedidos_confirmados,
-            'pedidos_en_preparacion': pedidos_en_preparacion,
-            'pedidos_en_ruta': pedidos_en_ruta,
+            'pedidos_hoy': resumen['pedidos_hoy'],
+            'pedidos_mes_actual': resumen['pedidos_mes'],
+            'pedidos_confirmados': resumen['pedidos_confirmados'],
+            'pedidos_en_preparacion': resumen['pedidos_en_preparacion'],
+            'pedidos_en_ruta': resumen['pedidos_en_ruta'],
             'pedidos_entregados': pedidos_entregados,
             'pedidos_cancelados': pedidos_cancelados,
-            'pedidos_proveedor': pedidos_proveedor,
-            'pedidos_directos': pedidos_directos,
-            'ingresos_totales': ingresos_data['total'] or 0,
-            'ingresos_hoy': ingresos_hoy_data['total'] or 0,
-            'ingresos_mes_actual': ingresos_mes_data['total'] or 0,
-            'ganancia_app_total': ingresos_data['ganancia'] or 0,
-            'ganancia_app_hoy': ingresos_hoy_data['ganancia'] or 0,
-            'ganancia_app_mes': ingresos_mes_data['ganancia'] or 0,
+            'pedidos_proveedor': resumen['pedidos_proveedor'],
+            'pedidos_directos': resumen['pedidos_directos'],
+            'ingresos_totales': resumen['ingresos'],
+            'ingresos_hoy': resumen['ingresos_hoy'],
+            'ingresos_mes_actual': resumen['ingresos_mes'],
+            'ganancia_app_total': resumen['ganancia'],
+            'ganancia_app_hoy': resumen['ganancia_hoy'],
+            'ganancia_app_mes': resumen['ganancia_mes'],
             'ticket_promedio': round(ticket_promedio, 2),
             'comision_promedio_repartidor': round(comision_promedio, 2),
             'tasa_entrega': round(tasa_entrega, 2),
@@ -175,33 +164,41 @@ class ReporteAdminViewSet(viewsets.ReadOnlyModelViewSet):
         Métricas agregadas por día (para gráficos)
         """
         dias = int(request.query_params.get('dias', 30))
-        fecha_inicio = timezone.now().date() - timedelta(days=dias)
+        hoy = timezone.localdate()
+        fecha_inicio = hoy - timedelta(days=dias)
+
+        # Agrupar por fecha local en una sola consulta sobre los acumulados
+        entregado = Q(estado=EstadoPedido.ENTREGADO)
+        por_fecha = {
+            fila['fecha']: fila
+            for fila in ResumenPedidoHora.objects.filter(
+                hora__gte=inicio_dia(fecha_inicio)
+            ).annotate(
+                fecha=TruncDate('hora')
+            ).values('fecha').annotate(
+                total_pedidos=Sum('pedidos'),
+                entregados=Sum('pedidos', filter=entregado),
+                cancelados=Sum('pedidos', filter=Q(estado=EstadoPedido.CANCELADO)),
+                ingresos=Sum('total', filter=entregado),
+                ganancia=Sum('ganancia_app', filter=entregado)
+            ).order_by('fecha')
+        }
 
-        # Agrupar por fecha
         metricas = []
         fecha_actual = fecha_inicio
-        hoy = timezone.now().date()
 
         while fecha_actual <= hoy:
-            pedidos_dia = Pedido.objects.filter(creado_en__date=fecha_actual)
-
-            stats = pedidos_dia.aggregate(
-                total=Count('id'),
-                entregados=Count('id', filter=Q(estado=EstadoPedido.ENTREGADO)),
-                cancelados=Count('id', filter=Q(estado=EstadoPedido.CANCELADO)),
-                ingresos=Sum('total', filter=Q(estado=EstadoPedido.ENTREGADO)),
-                ganancia=Sum('ganancia_app', filter=Q(estado=EstadoPedido.ENTREGADO))
-            )
+            stats = por_fecha.get(fecha_actual, {})
 
-            ticket_prom = (stats['ingresos'] / stats['entregados']) if stats['entregados'] and stats['ingresos'] else 0
+            ticket_prom = (stats['ingresos'] / stats['entregados']) if stats.get('entregados') and stats.get('ingresos') else 0
 
             metricas.append({
                 'fecha': fecha_actual,
-                'total_pedidos': stats['total'] or 0,
-                'pedidos_entregados': stats['entregados'] or 0,
-                'pedidos_cancelados': stats['cancelados'] or 0,
-                'ingresos': stats['ingresos'] or 0,
-                'ganancia_app': stats['ganancia'] or 0,
+                'total_pedidos': stats.get('total_pedidos') or 0,
+                'pedidos_entregados': stats.get('entregados') or 0,
+                'pedidos_cancelados': stats.get('cancelados') or 0,
+                'ingresos': stats.get('ingresos') or 0,
+                'ganancia_app': stats.get('ganancia') or 0,
                 'ticket_promedio': round(ticket_prom, 2),
             })
 
@@ -219,7 +216,7 @@ class ReporteAdminViewSet(viewsets.ReadOnlyModelViewSet):
         """
         limit = int(request.query_params.get('limit', 10))
 
-        proveedores = Pedido.objects.filter(
+        proveedores = ResumenPedidoHora.objects.filter(
             proveedor__isnull=False,
             estado=EstadoPedido.ENTREGADO
         ).values(
@@ -227,7 +224,7 @@ class ReporteAdminViewSet(viewsets.ReadOnlyModelViewSet):
             'proveedor__nombre',
             'proveedor__tipo_proveedor'
         ).annotate(
-            total_pedidos=Count('id'),
+            total_pedidos=Sum('pedidos'),
             ingresos_totales=Sum('total')
         ).order_by('-ingresos_totales')[:limit]
 
@@ -251,7 +248,7 @@ class ReporteAdminViewSet(viewsets.ReadOnlyModelViewSet):
         """
         limit = int(request.query_params.get('limit', 10))
 
-        repartidores = Pedido.objects.filter(
+        repartidores = ResumenPedidoHora.objects.filter(
             repartidor__isnull=False,
             estado=EstadoPedido.ENTREGADO
         ).values(
@@ -259,9 +256,9 @@ class ReporteAdminViewSet(viewsets.ReadOnlyModelViewSet):
             'repartidor__user__first_name',
             'repartidor__user__last_name'
         ).annotate(
-            total_entregas=Count('id'),
+            total_entregas=Sum('pedidos'),
             comisiones_totales=Sum('comision_repartidor'),
-            calificacion_promedio=Avg('repartidor__calificacion_promedio')
+            calificacion_promedio=Max('repartidor__calificacion_promedio')
         ).order_by('-total_entregas')[:limit]
 
         data = [{
@@ -343,19 +340,23 @@ class ReporteProveedorViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             proveedor = request.user.proveedor
 
-            queryset = Pedido.objects.filter(proveedor=proveedor)
-
-            total_pedidos = queryset.count()
-            pedidos_entregados = queryset.filter(estado=EstadoPedido.ENTREGADO).count()
-            pedidos_cancelados = queryset.filter(estado=EstadoPedido.CANCELADO).count()
-            pedidos_activos = queryset.filter(
-                estado__in=[EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION, EstadoPedido.EN_RUTA]
-            ).count()
-
-            financiero = queryset.filter(estado=EstadoPedido.ENTREGADO).aggregate(
-                ingresos=Sum('total'),
-                comisiones=Sum('comision_proveedor')
+            entregado = Q(estado=EstadoPedido.ENTREGADO)
+            resumen = ResumenPedidoHora.objects.filter(proveedor=proveedor).aggregate(
+                total_pedidos=Sum('pedidos'),
+                pedidos_entregados=Sum('pedidos', filter=entregado),
+                pedidos_cancelados=Sum('pedidos', filter=Q(estado=EstadoPedido.CANCELADO)),
+                pedidos_activos=Sum('pedidos', filter=Q(
+                    estado__in=[EstadoPedido.CONFIRMADO, EstadoPedido.EN_PREPARACION, EstadoPedido.EN_RUTA]
+                )),
+                ingresos=Sum('total', filter=entregado),
+                comisiones=Sum('comision_proveedor', filter=entregado),
             )
+            financiero = {clave: valor or 0 for clave, valor in resumen.items()}
+
+            total_pedidos = financiero['total_pedidos']
+            pedidos_entregados = financiero['pedidos_entregados']
+            pedidos_cancelados = financiero['pedidos_cancelados']
+            pedidos_activos = financiero['pedidos_activos']
 
             ticket_promedio = (financiero['ingresos'] / pedidos_entregados) if pedidos_entregados > 0 else 0
             tasa_entrega = (pedidos_entregados / total_pedidos * 100) if total_pedidos > 0 else 0
@@ -445,24 +446,30 @@ class ReporteRepartidorViewSet(viewsets.ReadOnlyModelViewSet):
         """
         try:
             repartidor = request.user.repartidor
-            hoy = timezone.now().date()
+            hoy = timezone.localdate()
             primer_dia_mes = hoy.replace(day=1)
-
-            queryset = Pedido.objects.filter(repartidor=repartidor)
-
-            total_entregas = queryset.filter(estado=EstadoPedido.ENTREGADO).count()
-            entregas_hoy = queryset.filter(estado=EstadoPedido.ENTREGADO, creado_en__date=hoy).count()
-            entregas_mes = queryset.filter(estado=EstadoPedido.ENTREGADO, creado_en__date__gte=primer_dia_mes).count()
-
-            comisiones = queryset.filter(estado=EstadoPedido.ENTREGADO).aggregate(
+            del_dia = Q(hora__gte=inicio_dia(hoy))
+            del_mes = Q(hora__gte=inicio_dia(primer_dia_mes))
+
+            resumen = ResumenPedidoHora.objects.filter(
+                repartidor=repartidor,
+                estado=EstadoPedido.ENTREGADO
+            ).aggregate(
+                total_entregas=Sum('pedidos'),
+                entregas_hoy=Sum('pedidos', filter=del_dia),
+                entregas_mes=Sum('pedidos', filter=del_mes),
+                ingresos=Sum('total'),
                 total=Sum('comision_repartidor'),
-                hoy=Sum('comision_repartidor', filter=Q(creado_en__date=hoy)),
-                mes=Sum('comision_repartidor', filter=Q(creado_en__date__gte=primer_dia_mes))
+                hoy=Sum('comision_repartidor', filter=del_dia),
+                mes=Sum('comision_repartidor', filter=del_mes)
             )
 
-            ticket_promedio = queryset.filter(estado=EstadoPedido.ENTREGADO).aggregate(
-                promedio=Avg('total')
-            )['promedio'] or 0
+            total_entregas = resumen['total_entregas'] or 0
+            entregas_hoy = resumen['entregas_hoy'] or 0
+            entregas_mes = resumen['entregas_mes'] or 0
+            comisiones = resumen
+
+            ticket_promedio = (resumen['ingresos'] / total_entregas) if total_entregas > 0 else 0
 
             data = {
                 'repartidor_id': repartidor.id,
@@ -171,6 +171,31 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_TIMEZONE = "America/Guayaquil"
 
+# Ubicación en vivo de repartidores: Redis primero, volcado por lotes a Postgres.
+# Requiere celery beat con la tarea repartidores.volcar_ubicaciones cada 5 s
+# (la programa la migración repartidores 0006); sin ella los pings se acumulan
+# en Redis y no llegan a Postgres (historial, trayectos, matriz de tiempos).
+UBICACION_WRITE_BEHIND = get_env_bool("UBICACION_WRITE_BEHIND", True)
+
+# Compresión de trayectos (Douglas-Peucker) y retención de puntos crudos
+TRAYECTO_TOLERANCIA_METROS = float(os.getenv("TRAYECTO_TOLERANCIA_METROS", "10"))
+HISTORIAL_UBICACION_RETENCION_DIAS = int(os.getenv("HISTORIAL_UBICACION_RETENCION_DIAS", "7"))
+
+# Seguimiento en vivo de pedidos (SSE): "redis" (pub/sub) o "memoria" (tests)
+PEDIDOS_SEGUIMIENTO_BROKER = os.getenv("PEDIDOS_SEGUIMIENTO_BROKER", "redis")
+PEDIDOS_SEGUIMIENTO_DURACION = int(os.getenv("PEDIDOS_SEGUIMIENTO_DURACION", "300"))
+PEDIDOS_SEGUIMIENTO_INTERVALO_UBICACION = float(os.getenv("PEDIDOS_SEGUIMIENTO_INTERVALO_UBICACION", "5"))
+# Radio de las geocercas de llegada a origen y destino (pedidos/geocercas.py)
+PEDIDOS_GEOCERCA_RADIO_METROS = int(os.getenv("PEDIDOS_GEOCERCA_RADIO_METROS", "100"))
+
+# Varios pedidos por repartidor (1 = uno a la vez) y distancia máxima entre sus orígenes
+PEDIDOS_MAX_POR_REPARTIDOR = int(os.getenv("PEDIDOS_MAX_POR_REPARTIDOR", "1"))
+PEDIDOS_LOTE_RADIO_KM = float(os.getenv("PEDIDOS_LOTE_RADIO_KM", "2"))
+
+# Matriz de tiempos de viaje entre celdas geohash (directorio compartido web/Celery)
+PEDIDOS_MATRIZ_TIEMPOS_DIR = os.getenv("PEDIDOS_MATRIZ_TIEMPOS_DIR", str(BASE_DIR / "datos" / "matriz_tiempos"))
+PEDIDOS_MATRIZ_TIEMPOS_DIAS = int(os.getenv("PEDIDOS_MATRIZ_TIEMPOS_DIAS", "30"))
+
 # ==========================================
 # AUTH & SEGURIDAD
 # ==========================================
@@ -447,38 +447,80 @@ def tarea_enviar_recordatorio_pedidos_pendientes():
     """
     Envía recordatorio a usuarios con pedidos pendientes hace más de X horas
 
+    Solo lee los IDs de los pedidos y reparte el envío en lotes
+    (`tarea_enviar_recordatorios_lote`), una tarea por lote.
+
     Configura en Celery Beat para ejecutar cada cierto tiempo
     """
     try:
-        from pedidos.models import Pedido
+        from pedidos.models import Pedido, EstadoPedido
         from django.utils import timezone
         from datetime import timedelta
+        from utils.tareas import TAMANO_LOTE, medir, repartir
 
         logger.info('🔔 Verificando pedidos pendientes')
 
         # Pedidos pendientes con más de 2 horas
         hace_2_horas = timezone.now() - timedelta(hours=2)
 
-        pedidos_pendientes = Pedido.objects.filter(
-            estado='pendiente',
-            fecha_creacion__lt=hace_2_horas
-        ).select_related('usuario')
-
-        for pedido in pedidos_pendientes:
-            tarea_enviar_notificacion.delay(
-                user_id=pedido.usuario.id,
-                titulo='Pedido pendiente de confirmación',
-                mensaje=f'Tu pedido #{pedido.numero_pedido} está esperando confirmación',
-                data={
-                    'tipo': 'recordatorio',
-                    'pedido_id': str(pedido.id),
-                    'accion': 'ver_detalle'
-                }
+        with medir('usuarios.recordatorio_pedidos_pendientes') as resultado:
+            ids = (
+                Pedido.objects.filter(
+                    estado=EstadoPedido.CONFIRMADO,
+                    creado_en__lt=hace_2_horas
+                )
+                .order_by()
+                .values_list('id', flat=True)
+                .iterator(chunk_size=TAMANO_LOTE)
+            )
+            resultado['recordatorios_enviados'], resultado['lotes'] = repartir(
+                tarea_enviar_recordatorios_lote, ids
             )
 
-        logger.info(f'✅ {pedidos_pendientes.count()} recordatorios enviados')
+        logger.info(f'✅ {resultado["recordatorios_enviados"]} recordatorios encolados')
 
-        return {'recordatorios_enviados': pedidos_pendientes.count()}
+        return resultado
 
     except Exception as e:
         logger.error(f'❌ Error enviando recordatorios: {e}', exc_info=True)
+
+
+@shared_task
+def tarea_enviar_recordatorios_lote(pedido_ids):
+    """
+    Envía el recordatorio de un lote de pedidos que siguen pendientes
+
+    Args:
+        pedido_ids (list): IDs de pedidos
+    """
+    from pedidos.models import Pedido, EstadoPedido
+    from utils.tareas import medir
+
+    with medir('usuarios.recordatorios_lote') as resultado:
+        pendientes = Pedido.objects.filter(
+            id__in=pedido_ids,
+            estado=EstadoPedido.CONFIRMADO
+        ).values_list('id', 'cliente__user_id')
+
+        enviados = 0
+        for pedido_id, user_id in pendientes:
+            try:
+                envio = FirebaseService.enviar_a_usuario(
+                    user_id=user_id,
+                    titulo='Pedido pendiente de confirmación',
+                    mensaje=f'Tu pedido #{pedido_id} está esperando confirmación',
+                    data={
+                        'tipo': 'recordatorio',
+                        'pedido_id': str(pedido_id),
+                        'accion': 'ver_detalle'
+                    }
+                )
+                if envio.get('success'):
+                    enviados += 1
+            except Exception as e:
+                logger.warning(f'⚠️ Recordatorio del pedido #{pedido_id} no enviado: {e}')
+
+        resultado['lote'] = len(pedido_ids)
+        resultado['enviados'] = enviados
+
+    return resultado
@@ -0,0 +1,25 @@
+# utils/fechas.py
+"""
+Fechas locales (America/Guayaquil) para consultas por día.
+
+Filtrar con `creado_en__date=hoy` convierte la zona horaria fila por fila y
+no aprovecha el índice de `creado_en`. Los modelos con consultas por día
+guardan la fecha local en columnas generadas (`dia_creado`, ...) con
+`DiaLocal` como expresión, indexadas como cualquier DateField.
+"""
+from zoneinfo import ZoneInfo
+
+from django.db.models.functions import TruncDate
+
+# Ecuador continental no tiene horario de verano: la conversión es estable
+ZONA_LOCAL = ZoneInfo('America/Guayaquil')
+
+
+class DiaLocal(TruncDate):
+    """
+    Fecha local de un DateTimeField. La zona queda fija en la clase para
+    que las migraciones de las columnas generadas puedan serializarla.
+    """
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, tzinfo=ZONA_LOCAL, **extra)
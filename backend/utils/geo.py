@@ -0,0 +1,398 @@
+# utils/geo.py
+"""
+Utilidades geográficas compartidas.
+
+Incluye:
+- Distancia Haversine escalar y vectorizada con NumPy
+  (uno a muchos, pares elemento a elemento y muchos a muchos)
+- Expresión ORM de distancia para filtrar y ordenar en SQL
+- Codificación geohash (celdas para indexar coordenadas)
+- Bounding boxes alrededor de un punto
+- Simplificación de trayectos (Douglas-Peucker) y polylines codificadas
+"""
+from math import radians, cos, sin, sqrt, atan2, floor
+
+import numpy as np
+from django.db.models import F, FloatField, Value, ExpressionWrapper
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+RADIO_TIERRA_KM = 6371.0
+KM_POR_GRADO_LAT = 111.32
+
+# Precisión con la que se guardan los geohash en la BD (~150 m)
+PRECISION_GEOHASH = 7
+
+# Máximo de celdas a combinar en un filtro por prefijo
+MAX_CELDAS_FILTRO = 16
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+# ==========================================================
+# DISTANCIA
+# ==========================================================
+def distancia_haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distancia en kilómetros entre dos puntos (Haversine).
+
+    Returns:
+        float: Distancia sin redondear, o None si faltan coordenadas
+    """
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+
+    try:
+        lat1, lon1, lat2, lon2 = map(float, (lat1, lon1, lat2, lon2))
+    except (ValueError, TypeError):
+        return None
+
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+
+    return RADIO_TIERRA_KM * c
+
+
+def _haversine_np(lat1, lon1, lat2, lon2):
+    """Haversine sobre arrays (con broadcasting). Coordenadas en grados."""
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2)
+    )
+
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distancias_km_desde(lat, lon, lats, lons):
+    """
+    Distancias (km) desde un punto hasta muchos.
+
+    Returns:
+        np.ndarray: Un valor por cada punto de (lats, lons)
+    """
+    return _haversine_np(lat, lon, lats, lons)
+
+
+def distancias_km_pares(lats1, lons1, lats2, lons2):
+    """Distancia (km) entre cada par i: (lats1[i], lons1[i]) -> (lats2[i], lons2[i])."""
+    return _haversine_np(lats1, lons1, lats2, lons2)
+
+
+def matriz_distancias_km(lats_a, lons_a, lats_b, lons_b):
+    """Distancias de todos contra todos: matriz (len(a), len(b)) en km."""
+    return _haversine_np(
+        np.asarray(lats_a, dtype=float)[:, None], np.asarray(lons_a, dtype=float)[:, None],
+        np.asarray(lats_b, dtype=float)[None, :], np.asarray(lons_b, dtype=float)[None, :],
+    )
+
+
+def expresion_distancia_km(campo_lat, campo_lon, lat, lon):
+    """
+    Expresión ORM con la distancia Haversine (km) desde (lat, lon)
+    hasta las columnas indicadas. Permite filtrar y ordenar en SQL.
+    """
+    lat_rad = radians(float(lat))
+    lon_rad = radians(float(lon))
+
+    dlat = Radians(F(campo_lat)) - Value(lat_rad)
+    dlon = Radians(F(campo_lon)) - Value(lon_rad)
+
+    a = (
+        Power(Sin(dlat / 2), 2)
+        + Value(cos(lat_rad)) * Cos(Radians(F(campo_lat))) * Power(Sin(dlon / 2), 2)
+    )
+
+    return ExpressionWrapper(
+        Value(2 * RADIO_TIERRA_KM) * ASin(Sqrt(a)),
+        output_field=FloatField()
+    )
+
+
+# ==========================================================
+# BOUNDING BOX
+# ==========================================================
+def bounding_box(lat, lon, radio_km):
+    """
+    Rectángulo (lat_min, lat_max, lon_min, lon_max) que contiene
+    el círculo de radio `radio_km` alrededor de (lat, lon).
+    """
+    delta_lat = radio_km / KM_POR_GRADO_LAT
+    cos_lat = max(cos(radians(lat)), 1e-6)
+    delta_lon = radio_km / (KM_POR_GRADO_LAT * cos_lat)
+
+    return (
+        max(lat - delta_lat, -90.0),
+        min(lat + delta_lat, 90.0),
+        max(lon - delta_lon, -180.0),
+        min(lon + delta_lon, 180.0),
+    )
+
+
+def en_bounding_box(lats, lons, bbox):
+    """Máscara booleana de los puntos dentro del rectángulo `bbox`."""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    return (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+
+
+def filtrar_por_radio(lat, lon, lats, lons, radio_km):
+    """
+    Índices y distancias de los puntos a menos de `radio_km`, del más
+    cercano al más lejano. Descarta primero por bounding box.
+
+    Returns:
+        tuple: (indices, distancias_km) como arrays NumPy
+    """
+    candidatos = np.flatnonzero(en_bounding_box(lats, lons, bounding_box(lat, lon, radio_km)))
+    distancias = distancias_km_desde(
+        lat, lon, np.asarray(lats, dtype=float)[candidatos], np.asarray(lons, dtype=float)[candidatos]
+    )
+
+    dentro = distancias <= radio_km
+    candidatos, distancias = candidatos[dentro], distancias[dentro]
+
+    orden = np.argsort(distancias, kind='stable')
+    return candidatos[orden], distancias[orden]
+
+
+# ==========================================================
+# GEOHASH
+# ==========================================================
+def codificar_geohash(lat, lon, precision=PRECISION_GEOHASH):
+    """Codifica (lat, lon) como geohash de `precision` caracteres."""
+    lat_int = [-90.0, 90.0]
+    lon_int = [-180.0, 180.0]
+    resultado = []
+    bits = 0
+    bit = 0
+    par = True
+
+    while len(resultado) < precision:
+        intervalo, valor = (lon_int, lon) if par else (lat_int, lat)
+        medio = (intervalo[0] + intervalo[1]) / 2
+
+        if valor >= medio:
+            bits = (bits << 1) | 1
+            intervalo[0] = medio
+        else:
+            bits = bits << 1
+            intervalo[1] = medio
+
+        par = not par
+        bit += 1
+
+        if bit == 5:
+            resultado.append(_BASE32[bits])
+            bits = 0
+            bit = 0
+
+    return ''.join(resultado)
+
+
+def geohash_enteros(lats, lons, precision):
+    """
+    Geohash de `precision` caracteres como enteros (5 bits por carácter),
+    vectorizado. Mismo orden de bits que codificar_geohash: el entero de
+    una celda es el valor de su cadena en base 32.
+
+    Returns:
+        np.ndarray: int64 por cada punto (precision <= 12)
+    """
+    total_bits = 5 * precision
+    bits_lon = (total_bits + 1) // 2
+    bits_lat = total_bits // 2
+
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    fila = np.clip(
+        np.floor((lats + 90.0) / 180.0 * (1 << bits_lat)), 0, (1 << bits_lat) - 1
+    ).astype(np.int64)
+    col = np.clip(
+        np.floor((lons + 180.0) / 360.0 * (1 << bits_lon)), 0, (1 << bits_lon) - 1
+    ).astype(np.int64)
+
+    # Intercala bits empezando por la longitud (bit más significativo)
+    resultado = np.zeros(np.broadcast(fila, col).shape, dtype=np.int64)
+    for i in range(total_bits):
+        if i % 2 == 0:
+            bit = (col >> (bits_lon - 1 - i // 2)) & 1
+        else:
+            bit = (fila >> (bits_lat - 1 - i // 2)) & 1
+        resultado = (resultado << 1) | bit
+
+    return resultado
+
+
+def tamano_celda_geohash(precision):
+    """Tamaño (alto, ancho) en grados de una celda geohash."""
+    total_bits = 5 * precision
+    bits_lon = (total_bits + 1) // 2
+    bits_lat = total_bits // 2
+    return 180.0 / (2 ** bits_lat), 360.0 / (2 ** bits_lon)
+
+
+def celdas_geohash_en_bbox(lat_min, lat_max, lon_min, lon_max, precision):
+    """Conjunto de celdas geohash de `precision` que cubren el rectángulo."""
+    alto, ancho = tamano_celda_geohash(precision)
+
+    fila_inicio = floor((lat_min + 90.0) / alto)
+    fila_fin = floor((lat_max + 90.0) / alto)
+    col_inicio = floor((lon_min + 180.0) / ancho)
+    col_fin = floor((lon_max + 180.0) / ancho)
+
+    celdas = set()
+    for fila in range(fila_inicio, fila_fin + 1):
+        lat_centro = -90.0 + (fila + 0.5) * alto
+        for col in range(col_inicio, col_fin + 1):
+            lon_centro = -180.0 + (col + 0.5) * ancho
+            celdas.add(codificar_geohash(lat_centro, lon_centro, precision))
+
+    return celdas
+
+
+def celdas_geohash_cercanas(lat, lon, radio_km, max_celdas=MAX_CELDAS_FILTRO):
+    """
+    Prefijos geohash que cubren el círculo (lat, lon, radio_km).
+
+    Usa la mayor precisión posible sin superar `max_celdas`, para que el
+    filtro por prefijo toque el menor número de filas del índice.
+    """
+    bbox = bounding_box(lat, lon, radio_km)
+    mejor = None
+
+    for precision in range(1, PRECISION_GEOHASH + 1):
+        celdas = celdas_geohash_en_bbox(*bbox, precision)
+        if len(celdas) > max_celdas:
+            break
+        mejor = celdas
+
+    return mejor or {codificar_geohash(lat, lon, 1)}
+
+
+# ==========================================================
+# TRAYECTOS: DOUGLAS-PEUCKER Y POLYLINE
+# ==========================================================
+def simplificar_trayecto(lats, lons, tolerancia_m):
+    """
+    Douglas-Peucker: índices de los puntos que se conservan para que
+    ningún punto descartado quede a más de `tolerancia_m` metros del
+    trayecto simplificado. Siempre conserva el primero y el último.
+
+    Returns:
+        np.ndarray: Índices ordenados de los puntos conservados
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    n = len(lats)
+    if n <= 2:
+        return np.arange(n)
+
+    # Proyección equirectangular local en metros (suficiente a escala de ciudad)
+    metros_por_grado = KM_POR_GRADO_LAT * 1000
+    y = lats * metros_por_grado
+    x = lons * metros_por_grado * np.cos(np.radians(lats.mean()))
+
+    conservar = np.zeros(n, dtype=bool)
+    conservar[[0, n - 1]] = True
+    pendientes = [(0, n - 1)]
+
+    while pendientes:
+        inicio, fin = pendientes.pop()
+        if fin - inicio < 2:
+            continue
+
+        dx, dy = x[fin] - x[inicio], y[fin] - y[inicio]
+        px, py = x[inicio + 1:fin] - x[inicio], y[inicio + 1:fin] - y[inicio]
+        largo2 = dx * dx + dy * dy
+
+        if largo2 == 0:
+            distancias = np.hypot(px, py)
+        else:
+            # Distancia al segmento (no a la recta), con proyección acotada
+            t = np.clip((px * dx + py * dy) / largo2, 0.0, 1.0)
+            distancias = np.hypot(px - t * dx, py - t * dy)
+
+        mayor = int(np.argmax(distancias))
+        if distancias[mayor] > tolerancia_m:
+            medio = inicio + 1 + mayor
+            conservar[medio] = True
+            pendientes.append((inicio, medio))
+            pendientes.append((medio, fin))
+
+    return np.flatnonzero(conservar)
+
+
+def _codificar_enteros(valores):
+    """Codifica enteros con signo en el formato de polyline de Google."""
+    partes = []
+    for valor in valores:
+        valor = ~(valor << 1) if valor < 0 else valor << 1
+        while valor >= 0x20:
+            partes.append(chr((0x20 | (valor & 0x1f)) + 63))
+            valor >>= 5
+        partes.append(chr(valor + 63))
+    return ''.join(partes)
+
+
+def _decodificar_enteros(texto):
+    valores = []
+    valor = desplazamiento = 0
+    for caracter in texto:
+        byte = ord(caracter) - 63
+        valor |= (byte & 0x1f) << desplazamiento
+        desplazamiento += 5
+        if byte < 0x20:
+            valores.append(~(valor >> 1) if valor & 1 else valor >> 1)
+            valor = desplazamiento = 0
+    return valores
+
+
+def codificar_polyline(lats, lons, precision=5):
+    """Codifica coordenadas como polyline de Google (deltas, base64 propia)."""
+    factor = 10 ** precision
+    valores = []
+    lat_previa = lon_previa = 0
+    for lat, lon in zip(lats, lons):
+        lat_e, lon_e = int(round(lat * factor)), int(round(lon * factor))
+        valores.extend((lat_e - lat_previa, lon_e - lon_previa))
+        lat_previa, lon_previa = lat_e, lon_e
+    return _codificar_enteros(valores)
+
+
+def decodificar_polyline(texto, precision=5):
+    """Inverso de codificar_polyline: lista de (lat, lon)."""
+    factor = 10 ** precision
+    valores = _decodificar_enteros(texto)
+    puntos = []
+    lat = lon = 0
+    for i in range(0, len(valores) - 1, 2):
+        lat += valores[i]
+        lon += valores[i + 1]
+        puntos.append((lat / factor, lon / factor))
+    return puntos
+
+
+def codificar_deltas(enteros):
+    """Codifica una serie creciente de enteros (p. ej. segundos) por diferencias."""
+    previo = 0
+    deltas = []
+    for valor in enteros:
+        deltas.append(int(valor) - previo)
+        previo = int(valor)
+    return _codificar_enteros(deltas)
+
+
+def decodificar_deltas(texto):
+    """Inverso de codificar_deltas."""
+    total = 0
+    enteros = []
+    for delta in _decodificar_enteros(texto):
+        total += delta
+        enteros.append(total)
+    return enteros
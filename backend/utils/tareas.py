@@ -0,0 +1,59 @@
+# utils/tareas.py
+"""
+Utilidades para tareas periódicas que recorren muchos pedidos.
+
+- `medir`: cronometra una ejecución y deja `duracion_ms` en el resultado
+  (y en el log) para seguir cómo escala cada monitor.
+- `en_lotes`: parte un iterable de IDs en listas de tamaño fijo.
+- `repartir`: reparte los lotes entre workers con un `group` de Celery,
+  una tarea por lote en lugar de una por pedido.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from celery import group
+
+logger = logging.getLogger('tareas')
+
+# IDs por lote (y por página de .iterator())
+TAMANO_LOTE = 500
+
+
+@contextmanager
+def medir(nombre):
+    """
+    Uso:
+        with medir('pedidos.verificar_pedidos_retrasados') as resultado:
+            resultado['pedidos'] = ...
+        return resultado   # incluye duracion_ms
+    """
+    resultado = {}
+    inicio = time.perf_counter()
+    try:
+        yield resultado
+    finally:
+        resultado['duracion_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+        detalle = ', '.join(f'{clave}={valor}' for clave, valor in resultado.items())
+        logger.info(f"⏱️ {nombre}: {detalle}")
+
+
+def en_lotes(iterable, tamano=TAMANO_LOTE):
+    """Listas de hasta `tamano` elementos, sin cargar todo el iterable."""
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+
+def repartir(tarea, ids, tamano=TAMANO_LOTE, **kwargs):
+    """
+    Encola `tarea(lote, **kwargs)` por cada lote de `ids` en un solo group.
+
+    Returns:
+        tuple: (elementos, lotes) encolados
+    """
+    lotes = list(en_lotes(ids, tamano))
+    if lotes:
+        group(tarea.s(lote, **kwargs) for lote in lotes).apply_async()
+    return sum(len(lote) for lote in lotes), len(lotes)